@@ -0,0 +1,114 @@
+"""LoRA adapter state on modules that several pipelines share."""
+import threading
+import weakref
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional, Tuple
+
+# Pipeline attributes holding the modules LoRA adapters are loaded into
+ADAPTER_MODULES = ("unet", "transformer", "text_encoder", "text_encoder_2")
+
+# Adapter key of a generation without LoRAs (and of modules never given any)
+NO_ADAPTERS: Tuple = ()
+
+
+def adapter_key(lora_specs: Optional[List[Dict[str, Any]]]) -> Hashable:
+    """Identify the adapters and weights a generation wants, for comparing generations."""
+    return tuple((spec.get("key"), spec.get("weight")) for spec in lora_specs or [] if spec.get("key"))
+
+
+class AdapterGate:
+    """Admits generations to one module only while they want the same adapters.
+
+    LoRA adapters are switched with set_adapters/disable_lora on the modules
+    themselves, so every pipeline sharing a module (txt2img and img2img of a
+    model, or deduplicated models) sees the same adapters. Generations with
+    the same adapter key use the module together; one with a different key
+    waits until they have all finished, and newcomers queue behind it so it
+    is not starved.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._holders = 0
+        self._waiting = 0
+        self._key: Hashable = NO_ADAPTERS  # Key of the current holders
+        self.applied: Hashable = NO_ADAPTERS  # Key whose adapters the module has now
+        self.result: Any = []  # What applying self.applied returned
+
+    def acquire(self, key: Hashable):
+        with self._condition:
+            queued = False
+            while self._holders and (self._key != key or (self._waiting and not queued)):
+                if not queued:
+                    self._waiting += 1
+                    queued = True
+                self._condition.wait()
+            if queued:
+                self._waiting -= 1
+            self._key = key
+            self._holders += 1
+
+    def release(self):
+        with self._condition:
+            self._holders -= 1
+            if not self._holders:
+                self._condition.notify_all()
+
+
+class AdapterGates:
+    """The AdapterGate of each shared module, dropped with the module."""
+
+    def __init__(self):
+        self._gates: "weakref.WeakKeyDictionary[Any, AdapterGate]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        # Applies run one at a time, so same-key generations never see a half-applied set
+        self._apply_lock = threading.Lock()
+
+    def _gates_of(self, pipeline) -> List[AdapterGate]:
+        """Gates of a pipeline's adapter modules, in a fixed order across pipelines."""
+        modules = {}
+        for name in ADAPTER_MODULES:
+            module = getattr(pipeline, name, None)
+            if module is not None:
+                modules[id(module)] = module
+        with self._lock:
+            return [
+                self._gates.setdefault(modules[module_id], AdapterGate())
+                for module_id in sorted(modules)
+            ]
+
+    @contextmanager
+    def hold(self, pipeline, key: Hashable, apply: Callable[[], Any]) -> Iterator[Any]:
+        """Keep a pipeline's modules on one set of adapters for a whole generation.
+
+        Waits for generations using any of the pipeline's modules with other
+        adapters to finish, then runs ``apply`` unless every module already
+        has these adapters. Gates are entered in module ID order, so
+        generations sharing only some modules cannot deadlock.
+
+        Args:
+            pipeline: Pipeline about to generate
+            key: adapter_key of the generation's LoRAs
+            apply: Sets the generation's adapters on the pipeline
+
+        Yields:
+            What apply returned for this key (e.g. LoRA trigger words)
+        """
+        gates = self._gates_of(pipeline)
+        held = []
+        try:
+            for gate in gates:
+                gate.acquire(key)
+                held.append(gate)
+            with self._apply_lock:
+                if any(gate.applied != key for gate in gates):
+                    for gate in gates:
+                        gate.applied = None  # Unknown until apply succeeds
+                    result = apply()
+                    for gate in gates:
+                        gate.applied, gate.result = key, result
+                result = gates[0].result if gates else apply()
+            yield result
+        finally:
+            for gate in reversed(held):
+                gate.release()
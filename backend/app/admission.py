@@ -0,0 +1,104 @@
+"""Admission control: refuse work the node cannot start soon enough."""
+import logging
+import math
+import threading
+from typing import Any, Dict
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """Raised when a job is refused; ``retry_after`` is a hint in seconds."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class AdmissionController:
+    """Decides whether a new job may enter the queue.
+
+    A job is refused when the estimated wait before a worker could start it
+    exceeds ``max_wait_seconds`` (0 disables the check), or when accepting
+    its uploaded images would keep more than ``max_upload_images`` decoded
+    uploads in memory at once.
+    """
+
+    def __init__(self, max_wait_seconds: float, max_upload_images: int):
+        self.max_wait_seconds = max_wait_seconds
+        self.max_upload_images = max_upload_images
+        self.admitted = 0
+        self.rejected_wait = 0
+        self.rejected_uploads = 0
+        self._uploads: Dict[str, int] = {}  # job_id -> images held
+        self._lock = threading.Lock()
+
+    @property
+    def upload_images_held(self) -> int:
+        """Decoded upload images currently held by queued or running jobs."""
+        return sum(self._uploads.values())
+
+    def check_wait(self, estimated_wait: float):
+        """Admit or refuse a job based on the estimated queue wait.
+
+        Args:
+            estimated_wait: Seconds until a worker could start the job
+
+        Raises:
+            AdmissionRejected: If the wait exceeds max_wait_seconds
+        """
+        with self._lock:
+            if self.max_wait_seconds and estimated_wait > self.max_wait_seconds:
+                self.rejected_wait += 1
+                raise AdmissionRejected(
+                    f"Server is busy (estimated wait {estimated_wait:.0f}s exceeds "
+                    f"{self.max_wait_seconds:.0f}s). Try again later.",
+                    retry_after=estimated_wait - self.max_wait_seconds,
+                )
+            self.admitted += 1
+
+    def reserve_uploads(self, job_id: str, count: int, retry_after: float):
+        """Reserve room for a job's decoded upload images.
+
+        Args:
+            job_id: Job that will hold the images until release_uploads
+            count: Number of images the job holds
+            retry_after: Hint returned to the client if refused
+
+        Raises:
+            AdmissionRejected: If the reservation would exceed max_upload_images
+        """
+        with self._lock:
+            if self.upload_images_held + count > self.max_upload_images:
+                self.rejected_uploads += 1
+                raise AdmissionRejected(
+                    f"Too many image uploads in progress ({self.max_upload_images} max). Try again later.",
+                    retry_after=retry_after,
+                )
+            self._uploads[job_id] = self._uploads.get(job_id, 0) + count
+
+    def release_uploads(self, job_id: str):
+        """Release a job's upload reservation (no-op if it holds none)."""
+        with self._lock:
+            self._uploads.pop(job_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Admission limits and counters."""
+        with self._lock:
+            return {
+                "max_wait_seconds": self.max_wait_seconds,
+                "max_upload_images": self.max_upload_images,
+                "upload_images_held": self.upload_images_held,
+                "admitted": self.admitted,
+                "rejected_wait": self.rejected_wait,
+                "rejected_uploads": self.rejected_uploads,
+            }
+
+
+# Global admission controller
+admission = AdmissionController(
+    max_wait_seconds=settings.admission_max_wait_seconds,
+    max_upload_images=settings.max_upload_images,
+)
@@ -0,0 +1,144 @@
+"""In-flight de-duplication of identical seeded generation requests."""
+import hashlib
+import json
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+
+def request_fingerprint(mode: str, params: Dict[str, Any], images: Optional[List[bytes]] = None) -> Optional[str]:
+    """Canonical hash of a generation request.
+
+    Only seeded requests are deterministic, so unseeded ones get no
+    fingerprint and are never coalesced.
+
+    Args:
+        mode: txt2img, img2img or inpaint
+        params: Generation parameters (model_key, prompt, seed, ...)
+        images: Raw bytes of uploaded images, in a fixed order
+
+    Returns:
+        Hex SHA-256 digest, or None if the request has no seed
+    """
+    if params.get("seed") is None:
+        return None
+    canonical = {
+        "mode": mode,
+        "params": params,
+        "images": [hashlib.sha256(data).hexdigest() for data in images or []],
+    }
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class InFlightRegistry:
+    """Tracks queued/running jobs by fingerprint so duplicates can share them.
+
+    The first job for a fingerprint is the leader and does the work. Later
+    duplicates attach as subscribers and receive every status update the
+    leader's task writes. A subscriber (including the leader itself) that is
+    cancelled just detaches while others are still waiting; only the last
+    subscriber actually cancels the work.
+    """
+
+    def __init__(self):
+        self._leader_by_key: Dict[str, str] = {}
+        self._key_by_leader: Dict[str, str] = {}
+        self._subscribers: Dict[str, List[str]] = {}  # leader -> job IDs receiving its result
+        self._leader_of: Dict[str, str] = {}  # subscriber -> leader
+        self.coalesced = 0  # Duplicate requests that attached instead of running
+        self._lock = threading.Lock()
+
+    def register(self, fingerprint: Optional[str], job_id: str):
+        """Make a newly queued job the leader for its fingerprint."""
+        if fingerprint is None:
+            return
+        with self._lock:
+            if fingerprint in self._leader_by_key:
+                return
+            self._leader_by_key[fingerprint] = job_id
+            self._key_by_leader[job_id] = fingerprint
+            self._subscribers[job_id] = [job_id]
+            self._leader_of[job_id] = job_id
+
+    def attach(
+        self,
+        fingerprint: Optional[str],
+        job_id: str,
+        on_attach: Callable[[str], None],
+    ) -> Optional[str]:
+        """Attach a new job to an in-flight leader with the same fingerprint.
+
+        Args:
+            fingerprint: Request fingerprint (None never attaches)
+            job_id: The duplicate job's ID
+            on_attach: Called with the leader ID before the job starts receiving
+                updates; use it to create the job's record
+
+        Returns:
+            The leader's job ID, or None if there is nothing to attach to
+        """
+        if fingerprint is None:
+            return None
+        with self._lock:
+            leader_id = self._leader_by_key.get(fingerprint)
+            if leader_id is None:
+                return None
+            on_attach(leader_id)
+            self._subscribers[leader_id].append(job_id)
+            self._leader_of[job_id] = leader_id
+            self.coalesced += 1
+            return leader_id
+
+    def leader_of(self, job_id: str) -> str:
+        """Job whose work a job is waiting on (itself if not attached)."""
+        with self._lock:
+            return self._leader_of.get(job_id, job_id)
+
+    def subscribers(self, leader_id: str) -> List[str]:
+        """Job IDs that should receive a leader's updates."""
+        with self._lock:
+            return list(self._subscribers.get(leader_id, [leader_id]))
+
+    def detach(self, job_id: str) -> bool:
+        """Stop a job receiving updates if others still want the result.
+
+        Returns:
+            True if the job was detached, False if it is the last (or only)
+            subscriber and the work itself should be cancelled
+        """
+        with self._lock:
+            leader_id = self._leader_of.get(job_id)
+            if leader_id is None or len(self._subscribers[leader_id]) <= 1:
+                return False
+            self._subscribers[leader_id].remove(job_id)
+            del self._leader_of[job_id]
+            return True
+
+    def finish(self, leader_id: str) -> List[str]:
+        """Forget a finished leader so new duplicates start fresh work.
+
+        Returns:
+            Job IDs that should receive the final update
+        """
+        with self._lock:
+            fingerprint = self._key_by_leader.pop(leader_id, None)
+            if fingerprint is None:
+                return [leader_id]
+            if self._leader_by_key.get(fingerprint) == leader_id:
+                del self._leader_by_key[fingerprint]
+            subscribers = self._subscribers.pop(leader_id, [])
+            for job_id in subscribers:
+                self._leader_of.pop(job_id, None)
+            return subscribers
+
+    def stats(self) -> Dict[str, Any]:
+        """In-flight fingerprints and how many duplicates were coalesced."""
+        with self._lock:
+            return {
+                "in_flight": len(self._leader_by_key),
+                "attached": sum(len(subs) - 1 for subs in self._subscribers.values()),
+                "coalesced_total": self.coalesced,
+            }
+
+
+# Global in-flight registry
+coalescer = InFlightRegistry()
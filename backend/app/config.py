@@ -14,6 +14,7 @@ MODEL_CONFIGS: Dict[str, Dict[str, Any]] = {
         "strengths": ["Speed", "Low memory usage", "General objects"],
         "weaknesses": ["Limited artistic styles", "Lower quality details"],
         "ram_required_gb": 4,
+        "cost_factor": 1.0,  # Per-step compute relative to SD 1.5 at the same resolution
         "txt2img": True,
         "img2img": True,
         "inpaint": True,
@@ -27,6 +28,7 @@ MODEL_CONFIGS: Dict[str, Dict[str, Any]] = {
         "strengths": ["Artistic style", "Beautiful renders", "No license required"],
         "weaknesses": ["Less photorealistic", "Specific style"],
         "ram_required_gb": 4,
+        "cost_factor": 1.0,
         "txt2img": True,
         "img2img": True,
         "inpaint": True,
@@ -40,6 +42,7 @@ MODEL_CONFIGS: Dict[str, Dict[str, Any]] = {
         "strengths": ["Exceptional quality", "Artistic styles", "1024x1024 resolution", "Detail preservation"],
         "weaknesses": ["Slow generation", "High memory usage", "Requires GPU"],
         "ram_required_gb": 12,
+        "cost_factor": 2.5,
         "txt2img": True,
         "img2img": True,
         "inpaint": True,
@@ -54,6 +57,7 @@ MODEL_CONFIGS: Dict[str, Dict[str, Any]] = {
         "strengths": ["Photorealism", "Portraits", "Skin textures", "Natural lighting"],
         "weaknesses": ["Less artistic/stylized", "Can look too perfect"],
         "ram_required_gb": 4,
+        "cost_factor": 1.0,
         "txt2img": True,
         "img2img": True,
         "inpaint": True,
@@ -67,6 +71,7 @@ MODEL_CONFIGS: Dict[str, Dict[str, Any]] = {
         "strengths": ["Artistic style", "Fantasy themes", "Beautiful colors", "Detailed backgrounds"],
         "weaknesses": ["Less photorealistic", "Specific artistic style"],
         "ram_required_gb": 4,
+        "cost_factor": 1.0,
         "txt2img": True,
         "img2img": True,
         "inpaint": True,
@@ -80,6 +85,7 @@ MODEL_CONFIGS: Dict[str, Dict[str, Any]] = {
         "strengths": ["Film grain", "Vintage colors", "Nostalgic mood", "Natural imperfections"],
         "weaknesses": ["Specific style only", "Add 'analog style' to prompt"],
         "ram_required_gb": 4,
+        "cost_factor": 1.0,
         "txt2img": True,
         "img2img": True,
         "inpaint": True,
@@ -94,6 +100,7 @@ MODEL_CONFIGS: Dict[str, Dict[str, Any]] = {
         "strengths": ["Best quality", "Text rendering", "Prompt following", "Fast for its quality"],
         "weaknesses": ["Large model (~12GB)", "Higher memory usage", "No inpainting support"],
         "ram_required_gb": 12,
+        "cost_factor": 6.0,
         "txt2img": True,
         "img2img": False,
         "inpaint": False,
@@ -186,6 +193,13 @@ class Settings(BaseSettings):
     model_id: str = "runwayml/stable-diffusion-v1-5"
     model_precision: str = "fp32"  # fp32 or fp16
     device: str = "cpu"  # cpu, cuda, or mps (Apple Silicon)
+    model_cache_budget_gb: float = 16.0  # Loaded pipelines per process; least recently used evicted beyond it (0 = unlimited)
+    model_dedup_components: str = "text_encoder,text_encoder_2,vae"  # Content-hashed and shared across models; empty disables
+
+    # Warm preload at startup: comma-separated model_key[:mode+mode][:lora+lora]
+    # entries, e.g. "sd-v1-5:txt2img+img2img:watercolor,sdxl" (modes default to txt2img)
+    preload_models: str = ""
+    preload_warmup_steps: int = 2  # Denoising steps of the tiny generation that loads and warms each entry
 
     # Generation defaults
     default_steps: int = 30
@@ -197,7 +211,83 @@ class Settings(BaseSettings):
     output_dir: str = "./generated_images"
 
     # Concurrency
-    max_concurrent_jobs: int = 2
+    max_concurrent_jobs: int = 2  # Inference worker threads
+    max_queue_size: int = 50  # Jobs allowed to wait for a worker before rejecting
+    max_batch_size: int = 4  # Compatible txt2img jobs run together in one pipeline call
+    batch_wait_ms: int = 250  # How long an idle worker holds a batch open for more jobs
+    max_batch_request_items: int = 500  # Prompts accepted by one /api/generate_batch call
+    max_sweep_images: int = 16  # Images (seeds x grid cells) rendered by one /api/generate_sweep call
+    max_bulk_status_jobs: int = 500  # Job IDs accepted by one /api/status/bulk call
+
+    # Live latent previews over /api/jobs/{job_id}/previews
+    preview_interval_steps: int = 2  # Default denoising steps between previews
+    preview_max_cost_fraction: float = 0.03  # Preview cost budget as a fraction of denoising time
+
+    # Inference worker processes (0 = run the pipelines inside the API process)
+    inference_processes: int = 1
+    # Restart a worker that sends no heartbeat, or no progress outside model loads, for this long
+    worker_stall_timeout_seconds: float = 120.0
+
+    # Admission control (refuse with 429 + Retry-After instead of queueing for too long)
+    admission_max_wait_seconds: float = 600.0  # Max estimated queue wait; 0 disables
+    max_upload_images: int = 8  # Decoded img2img/inpaint uploads held by queued/running jobs
+    default_step_seconds: float = 1.0  # Per-step time at 512x512 until real timings are measured
+
+    # Result cache for seeded requests (content-addressed, LRU by bytes)
+    result_cache_dir: str = "./result_cache"
+    result_cache_max_mb: int = 2048  # 0 disables storing new results
+
+    # Scheduling policy: fifo, or sjf (cheapest job first by steps x resolution x
+    # cost_factor, with aging so expensive jobs are not starved)
+    scheduling_policy: str = "fifo"
+    sjf_aging_rate: float = 1.0  # Cost units a job's priority improves per second waited
+
+    # Fair share: weighted fair queuing across owners on measured compute-seconds
+    fair_share: bool = False
+    tier_weights: str = "free:1,maker:2,pro:4,enterprise:8"  # Share of compute per tier
+    fair_share_half_life_seconds: float = 3600.0  # How quickly past usage stops counting
+    # Shared with trusted callers (the Rails app); only requests sending it in the
+    # X-Identity-Token header may set owner and tier, which are ignored otherwise
+    identity_token: str = ""
+
+    # Model-affinity scheduling (prefer queued jobs whose pipeline is already loaded)
+    affinity_scheduling: bool = True
+    affinity_max_skips: int = 3  # A job can be jumped at most this many times
+    affinity_max_wait_seconds: float = 120.0  # ...or until it has waited this long
+
+    # Job store
+    job_store_backend: str = "memory"  # memory, sqlite or redis
+    job_store_path: str = "./jobs.db"  # SQLite database file (sqlite backend only)
+    job_ttl_seconds: int = 86400  # Finished jobs are purged after this many seconds
+
+    # Multi-node work distribution: local keeps the queue in this process; redis
+    # shares it (and, with JOB_STORE_BACKEND=redis, job status) through a Redis
+    # server that nodes on any host can reach; sqlite shares it through a database
+    # file that only nodes on the same host can open (WAL mode)
+    queue_backend: str = "local"  # local, sqlite or redis
+    shared_queue_path: str = "./shared_queue.db"  # sqlite backend only
+    shared_upload_dir: str = "./shared_uploads"  # img2img/inpaint uploads handed between nodes (sqlite only)
+    node_id: str = ""  # Defaults to hostname:pid
+    node_role: str = "both"  # api (enqueue only), worker (lease only) or both
+    lease_seconds: float = 60.0  # A job is re-delivered if its node misses heartbeats this long
+    heartbeat_seconds: float = 15.0
+    max_delivery_attempts: int = 3  # Fail a job whose node died this many times
+    # Fernet key (the same on every node) encrypting webhook signing secrets in the
+    # shared queue; without it, a shared queue refuses requests with a callback_secret
+    shared_queue_secret_key: str = ""
+
+    # Redis server for the redis job store and shared queue
+    redis_url: str = "redis://localhost:6379/0"
+    redis_key_prefix: str = "sd:"  # Lets several deployments share one server
+
+    # Completion webhooks (callback_url on generate requests)
+    webhook_max_queue_size: int = 1000  # Deliveries pending or awaiting retry before new ones are dropped
+    webhook_max_attempts: int = 6
+    webhook_timeout_seconds: float = 10.0
+    webhook_backoff_seconds: float = 2.0  # First retry delay; doubles with each attempt
+    webhook_max_backoff_seconds: float = 300.0
+    webhook_workers: int = 2
+    webhook_allowed_hosts: str = ""  # Comma-separated callback hosts; empty allows any public host
 
     # Hugging Face token (optional, required for some models)
     hf_token: str | None = None
@@ -210,6 +300,16 @@ class Settings(BaseSettings):
         """Parse CORS origins from comma-separated string."""
         return [origin.strip() for origin in self.cors_origins.split(",")]
 
+    @property
+    def model_dedup_components_list(self) -> List[str]:
+        """Parse deduplicated pipeline components from comma-separated string."""
+        return [name.strip() for name in self.model_dedup_components.split(",") if name.strip()]
+
+    @property
+    def webhook_allowed_hosts_list(self) -> List[str]:
+        """Parse allowed webhook hosts from comma-separated string."""
+        return [host.strip() for host in self.webhook_allowed_hosts.split(",") if host.strip()]
+
     def get_model_config(self, model_key: str) -> Dict[str, Any]:
         """Get model configuration by key."""
         if model_key not in MODEL_CONFIGS:
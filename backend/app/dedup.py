@@ -0,0 +1,181 @@
+"""Content-hash deduplication of component weights across loaded models.
+
+This module must not import torch at module level, so the sharing logic can
+be tested with stub modules and tensors.
+"""
+import hashlib
+import itertools
+import logging
+import threading
+import weakref
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+def _named_tensors(module) -> Dict[str, Any]:
+    """Parameters and buffers of a module by name.
+
+    LoRA adapters wrap layers, renaming their weights from ``x.weight`` to
+    ``x.base_layer.weight``; the original names are restored so a module
+    with adapters still lines up with a fresh copy of itself.
+    """
+    return {
+        name.replace(".base_layer.", "."): tensor
+        for name, tensor in itertools.chain(module.named_parameters(), module.named_buffers())
+        if "lora_" not in name
+    }
+
+
+def module_fingerprint(module) -> str:
+    """SHA-256 over a module's class and every tensor's name, dtype, shape and bytes."""
+    import torch
+
+    digest = hashlib.sha256(type(module).__name__.encode())
+    with torch.no_grad():
+        for name, tensor in sorted(_named_tensors(module).items()):
+            digest.update(f"{name}:{tensor.dtype}:{tuple(tensor.shape)};".encode())
+            data = tensor.detach().reshape(-1).cpu().contiguous().view(torch.uint8)
+            digest.update(data.numpy())
+    return digest.hexdigest()
+
+
+def share_tensors(module, source) -> int:
+    """Point a module's parameters and buffers at the storage of an identical module.
+
+    The module keeps its own layer objects (and so its own LoRA adapters);
+    only the underlying weights are shared.
+
+    Both modules must already be on the device they run on: moving a module
+    afterwards gives its tensors fresh storage on the new device, silently
+    undoing the sharing.
+
+    Returns:
+        Bytes no longer held separately by the module
+    """
+    source_tensors = _named_tensors(source)
+    saved = 0
+    for name, tensor in _named_tensors(module).items():
+        shared = source_tensors.get(name)
+        if shared is None or shared.dtype != tensor.dtype or shared.shape != tensor.shape:
+            continue
+        if shared.device != tensor.device:
+            continue
+        if tensor.untyped_storage().data_ptr() == shared.untyped_storage().data_ptr():
+            continue
+        saved += tensor.untyped_storage().nbytes()
+        # Replacing .data is invisible to autograd, so no torch.no_grad() is needed
+        tensor.data = shared.data
+    return saved
+
+
+def shared_bytes(module, source) -> int:
+    """Bytes of a module's tensor storages that are storages of another module.
+
+    Measured from the storages themselves, so sharing undone since (for
+    example by moving either module to another device) is not counted.
+    """
+    source_storages = {
+        (str(tensor.device), tensor.untyped_storage().data_ptr())
+        for tensor in _named_tensors(source).values()
+    }
+    storages = {}
+    for tensor in _named_tensors(module).values():
+        storage = tensor.untyped_storage()
+        key = (str(tensor.device), storage.data_ptr())
+        if key in source_storages:
+            storages[key] = storage.nbytes()
+    return sum(storages.values())
+
+
+class ComponentDeduplicator:
+    """Shares byte-identical component weights between pipelines of different models.
+
+    Fine-tunes of one base model (the SD 1.5 family, the SD 1.5 inpainting
+    model) often ship identical text encoders or VAEs. Each freshly loaded
+    pipeline's components are content-hashed, and a component identical to
+    one already loaded has its tensors pointed at the loaded copy. Loaded
+    components are tracked through weak references, so sharing ends on its
+    own once every pipeline holding a copy has been evicted. Reported
+    savings are measured from the storages the components actually share
+    when stats() is called.
+    """
+
+    def __init__(self, components: List[str]):
+        """
+        Args:
+            components: Pipeline attributes to hash (e.g. text_encoder, vae)
+        """
+        self.components = components
+        # fingerprint -> [(weakref to module, model_id, mode, component)]
+        self._loaded: Dict[str, List[tuple]] = {}
+        self._lock = threading.Lock()
+
+    def deduplicate(self, model_id: str, mode: str, pipeline) -> int:
+        """Share a freshly loaded pipeline's components with identical loaded ones.
+
+        Call after moving the pipeline to its device. Sharing made before
+        the move would not survive it (see share_tensors).
+
+        Args:
+            model_id: Model the pipeline is cached under
+            mode: Pipeline mode
+            pipeline: The pipeline just loaded
+
+        Returns:
+            Bytes saved
+        """
+        total = 0
+        for component in self.components:
+            module = getattr(pipeline, component, None)
+            if module is None or not callable(getattr(module, "named_parameters", None)):
+                continue
+            fingerprint = module_fingerprint(module)
+            with self._lock:
+                holders = self._live_holders(fingerprint)
+                source = holders[0][0]() if holders else None
+            if source is not None and source is not module:
+                saved = share_tensors(module, source)
+                total += saved
+                logger.info(
+                    f"{component} of {model_id} ({mode}) is identical to the one loaded for "
+                    f"{holders[0][1]}; sharing {saved / 1024 ** 2:.0f} MB"
+                )
+            with self._lock:
+                self._loaded.setdefault(fingerprint, []).append(
+                    (weakref.ref(module), model_id, mode, component)
+                )
+        return total
+
+    def _live_holders(self, fingerprint: str) -> List[tuple]:
+        """Holders of a fingerprint whose module is still alive, oldest first (lock held)."""
+        holders = [holder for holder in self._loaded.get(fingerprint, []) if holder[0]() is not None]
+        if holders:
+            self._loaded[fingerprint] = holders
+        else:
+            self._loaded.pop(fingerprint, None)
+        return holders
+
+    def stats(self) -> Dict[str, Any]:
+        """Bytes saved per loaded pipeline, and which model each shared component comes from."""
+        pipelines: Dict[tuple, Dict[str, Any]] = {}
+        with self._lock:
+            for fingerprint in list(self._loaded):
+                holders = self._live_holders(fingerprint)
+                source = holders[0][0]() if holders else None
+                for module_ref, model_id, mode, component in holders[1:]:
+                    module = module_ref()
+                    saved = shared_bytes(module, source) if module is not None and source is not None else 0
+                    if not saved:
+                        continue
+                    report = pipelines.setdefault(
+                        (model_id, mode),
+                        {"model_id": model_id, "mode": mode, "bytes_saved": 0, "components": {}},
+                    )
+                    report["bytes_saved"] += saved
+                    report["components"][component] = {"shared_with": holders[0][1], "bytes": saved}
+        return {
+            "components": self.components,
+            "bytes_saved": sum(report["bytes_saved"] for report in pipelines.values()),
+            "pipelines": list(pipelines.values()),
+        }
@@ -0,0 +1,106 @@
+"""In-process publish/subscribe of job updates for streaming endpoints."""
+import asyncio
+import json
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Set
+
+logger = logging.getLogger(__name__)
+
+# Undelivered updates kept per subscriber; the oldest are dropped beyond this
+SUBSCRIBER_QUEUE_SIZE = 256
+
+# How often a stream re-reads the job store, catching updates made by other
+# processes or nodes, which this broker never sees
+STORE_CHECK_SECONDS = 2.0
+
+# Idle streams send an SSE comment this often so proxies keep them open
+KEEPALIVE_SECONDS = 15.0
+
+# Most jobs one multiplexed stream may watch
+MAX_STREAM_JOBS = 500
+
+
+class Subscription:
+    """A consumer's queue of updates for a set of job IDs.
+
+    Updates are published from worker threads and delivered on the event
+    loop the subscription was created on.
+    """
+
+    def __init__(self, job_ids: Iterable[str], loop: asyncio.AbstractEventLoop):
+        self.job_ids: Set[str] = set(job_ids)
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.dropped = 0
+
+    def _put(self, job_id: str, fields: Dict[str, Any]):
+        """Enqueue an update (runs on the subscriber's loop)."""
+        if self.queue.qsize() >= SUBSCRIBER_QUEUE_SIZE:
+            # A slow client only needs the latest state; stream code re-reads the store
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait((job_id, fields))
+
+
+class EventBroker:
+    """Fans job updates out to subscribed streams.
+
+    ``publish`` is cheap and thread-safe, so task functions can call it on
+    every progress step; jobs nobody watches cost one dict lookup.
+    """
+
+    def __init__(self):
+        self._by_job: Dict[str, List[Subscription]] = {}
+        self._lock = threading.Lock()
+        self.published = 0
+
+    def subscribe(self, job_ids: Iterable[str]) -> Subscription:
+        """Start receiving updates for job IDs (call from the event loop)."""
+        subscription = Subscription(job_ids, asyncio.get_running_loop())
+        with self._lock:
+            for job_id in subscription.job_ids:
+                self._by_job.setdefault(job_id, []).append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        """Stop delivering updates to a subscription."""
+        with self._lock:
+            for job_id in subscription.job_ids:
+                subscribers = self._by_job.get(job_id, [])
+                if subscription in subscribers:
+                    subscribers.remove(subscription)
+                if not subscribers:
+                    self._by_job.pop(job_id, None)
+
+    def publish(self, job_id: str, fields: Dict[str, Any]):
+        """Deliver an update of a job's fields to everyone watching it."""
+        with self._lock:
+            subscribers = list(self._by_job.get(job_id, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._put, job_id, fields)
+            except RuntimeError:
+                # The subscriber's loop has closed; it unsubscribes on the way out
+                pass
+        if subscribers:
+            self.published += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Watched jobs and open subscriptions."""
+        with self._lock:
+            subscriptions = {id(s) for subscribers in self._by_job.values() for s in subscribers}
+            return {
+                "watched_jobs": len(self._by_job),
+                "subscriptions": len(subscriptions),
+                "published": self.published,
+            }
+
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """Encode one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+# Global event broker
+event_broker = EventBroker()
@@ -0,0 +1,632 @@
+"""Inference backends: in-process or isolated worker processes.
+
+The API process talks to the diffusion models only through the backend
+returned by ``create_inference_backend``. This module (and therefore the API
+process in ``process`` mode) never imports torch; ``app.models`` is only
+imported by whichever process actually runs the pipelines.
+"""
+import itertools
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from PIL import Image
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Pipeline mode used by each StableDiffusionModel generation method
+METHOD_MODES = {
+    "generate_image": "txt2img",
+    "generate_image_batch": "txt2img",
+    "generate_image_sweep": "txt2img",
+    "generate_image_from_image": "img2img",
+    "generate_image_inpaint": "inpaint",
+}
+
+# How often (seconds) a waiting caller checks for cancellation and worker health
+POLL_INTERVAL_SECONDS = 0.25
+
+# How often (seconds) a worker process reports that it is alive, and whether it is loading
+WORKER_HEARTBEAT_SECONDS = 5.0
+
+# A worker that exits sooner than this after starting is restarted with backoff
+MIN_HEALTHY_UPTIME_SECONDS = 30
+MAX_RESTART_BACKOFF_SECONDS = 60
+
+
+class GenerationCancelled(Exception):
+    """Raised from the step callback when a job is cancelled mid-generation."""
+
+
+class WorkerCrashed(RuntimeError):
+    """Raised when an inference worker process dies or stalls during a request."""
+
+
+def image_to_shm(image: Image.Image) -> Dict[str, Any]:
+    """Copy an image's pixel buffer into a new shared memory block.
+
+    The receiver owns the block and must release it with image_from_shm.
+
+    Args:
+        image: PIL Image to share
+
+    Returns:
+        Picklable descriptor with the block name, image mode and size
+    """
+    data = image.tobytes()
+    shm = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+    try:
+        shm.buf[:len(data)] = data
+        return {"shm": shm.name, "mode": image.mode, "size": image.size, "nbytes": len(data)}
+    finally:
+        shm.close()
+
+
+def image_from_shm(descriptor: Dict[str, Any]) -> Image.Image:
+    """Rebuild an image from a shared memory descriptor and free the block.
+
+    Args:
+        descriptor: Descriptor returned by image_to_shm
+
+    Returns:
+        PIL Image that owns a private copy of the pixels
+    """
+    shm = shared_memory.SharedMemory(name=descriptor["shm"])
+    try:
+        return Image.frombytes(
+            descriptor["mode"],
+            tuple(descriptor["size"]),
+            bytes(shm.buf[:descriptor["nbytes"]]),
+        )
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def _encode_images(value: Any) -> Any:
+    """Replace PIL images (also inside lists) with shared memory descriptors."""
+    if isinstance(value, Image.Image):
+        return {"__shm_image__": image_to_shm(value)}
+    if isinstance(value, list):
+        return [_encode_images(item) for item in value]
+    return value
+
+
+def _decode_images(value: Any) -> Any:
+    """Inverse of _encode_images."""
+    if isinstance(value, dict) and "__shm_image__" in value:
+        return image_from_shm(value["__shm_image__"])
+    if isinstance(value, list):
+        return [_decode_images(item) for item in value]
+    return value
+
+
+def _release_images(value: Any):
+    """Free shared memory blocks that will never be decoded."""
+    if isinstance(value, dict) and "__shm_image__" in value:
+        try:
+            shm = shared_memory.SharedMemory(name=value["__shm_image__"]["shm"])
+            shm.close()
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+    elif isinstance(value, list):
+        for item in value:
+            _release_images(item)
+
+
+def _cache_state(model) -> Dict[str, Any]:
+    """The (model_id, mode) pipelines cached by a StableDiffusionModel, and its cache stats."""
+    return {"loaded": model.model_cache.keys(), "cache": model.cache_stats()}
+
+
+class LocalInference:
+    """Runs generation in the API process on the global sd_model."""
+
+    def __init__(self):
+        self._model = None
+
+    @property
+    def model(self):
+        """The global StableDiffusionModel, imported on first use."""
+        if self._model is None:
+            from .models import sd_model
+            self._model = sd_model
+        return self._model
+
+    def start(self):
+        """Nothing to start; the model is used in-process."""
+
+    def stop(self):
+        """Unload all cached models."""
+        if self._model is not None:
+            self._model.unload_model()
+
+    def call(self, method: str, **kwargs):
+        """Call a StableDiffusionModel generation method.
+
+        Args:
+            method: Method name (see METHOD_MODES)
+            **kwargs: Method arguments, including progress_callback and cancel_check
+
+        Returns:
+            Whatever the method returns (an image or list of images)
+        """
+        return getattr(self.model, method)(**kwargs)
+
+    def call_each(self, method: str, **kwargs) -> List[Any]:
+        """Run a generation method once per process holding models (here just one)."""
+        return [self.call(method, **kwargs)]
+
+    def is_pipeline_loaded(self, model_id: str, mode: str) -> bool:
+        """Check if a pipeline is already cached."""
+        return self._model is not None and self._model.is_pipeline_loaded(model_id, mode)
+
+    @property
+    def is_loaded(self) -> bool:
+        """Check if any model is currently loaded."""
+        return self._model is not None and self._model.is_loaded
+
+    def stats(self) -> Dict[str, Any]:
+        """Backend description for monitoring."""
+        if self._model is None:
+            return {"mode": "thread", "loaded": [], "cache": None}
+        return {"mode": "thread", **_cache_state(self._model)}
+
+    def cache_stats(self) -> List[Dict[str, Any]]:
+        """Model cache contents and counters (one entry: the API process)."""
+        return [self._model.cache_stats()] if self._model is not None else []
+
+
+def _worker_main(conn, worker_index: int):
+    """Entry point of an inference worker process.
+
+    Owns a StableDiffusionModel and serves requests from the API process.
+    Each request runs on its own thread so cancel messages are handled while
+    a generation is in progress. A heartbeat thread reports every
+    WORKER_HEARTBEAT_SECONDS that the process is alive and whether it is
+    importing or loading models, the phases in which requests report nothing.
+    """
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f"%(asctime)s - worker{worker_index} - %(name)s - %(levelname)s - %(message)s",
+    )
+    send_lock = threading.Lock()
+    cancel_events: Dict[int, threading.Event] = {}
+    # Steps between latent previews per request, as last set by the API process
+    preview_intervals: Dict[int, int] = {}
+    model = None  # Set once app.models (and torch) is imported
+
+    def send(message):
+        with send_lock:
+            conn.send(message)
+
+    def heartbeat():
+        while True:
+            loading = model is None or model.model_cache.is_loading
+            try:
+                send(("heartbeat", None, loading))
+            except (OSError, ValueError):
+                return
+            time.sleep(WORKER_HEARTBEAT_SECONDS)
+
+    threading.Thread(target=heartbeat, name="heartbeat", daemon=True).start()
+    from .models import sd_model
+    model = sd_model
+
+    def run_request(request_id: int, method: str, kwargs: Dict[str, Any]):
+        event = cancel_events[request_id]
+        try:
+            kwargs = {key: _decode_images(value) for key, value in kwargs.items()}
+            result = getattr(sd_model, method)(
+                progress_callback=lambda progress: send(("progress", request_id, progress)),
+                cancel_check=event.is_set,
+                preview_callback=lambda preview: send(("preview", request_id, preview)),
+                preview_interval=lambda: preview_intervals.get(request_id, 0),
+                **kwargs,
+            )
+            send(("result", request_id, _encode_images(result), _cache_state(sd_model)))
+        except GenerationCancelled as e:
+            send(("cancelled", request_id, str(e), _cache_state(sd_model)))
+        except Exception as e:
+            send(("error", request_id, f"{type(e).__name__}: {e}", _cache_state(sd_model)))
+        finally:
+            cancel_events.pop(request_id, None)
+            preview_intervals.pop(request_id, None)
+
+    logger.info(f"Inference worker {worker_index} ready")
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        kind = message[0]
+        if kind == "run":
+            _, request_id, method, kwargs = message
+            cancel_events[request_id] = threading.Event()
+            threading.Thread(
+                target=run_request,
+                args=(request_id, method, kwargs),
+                name=f"request-{request_id}",
+                daemon=True,
+            ).start()
+        elif kind == "cancel":
+            event = cancel_events.get(message[1])
+            if event is not None:
+                event.set()
+        elif kind == "preview_interval":
+            if message[1] in cancel_events:
+                preview_intervals[message[1]] = message[2]
+        elif kind == "unload":
+            sd_model.unload_model()
+        elif kind == "stop":
+            break
+
+    sd_model.unload_model()
+
+
+class _WorkerProcess:
+    """API-side handle for one inference worker process.
+
+    A reader thread routes messages from the process to per-request queues.
+    If the process exits, every in-flight request is failed and a fresh
+    process is spawned in its place.
+    """
+
+    def __init__(self, index: int, context):
+        self.index = index
+        self._context = context
+        self._send_lock = threading.Lock()
+        self._requests: Dict[int, queue.Queue] = {}
+        self._lock = threading.Lock()
+        self.loaded: Set[Tuple[str, str]] = set()
+        self.cache: Optional[Dict[str, Any]] = None  # Model cache stats as of the last finished request
+        self.restarts = 0
+        self._rapid_failures = 0  # Consecutive exits shortly after starting
+        self._started_at = 0.0
+        self.last_heartbeat = 0.0
+        self.last_loading = 0.0  # Last heartbeat sent while the worker was loading
+        self._stopping = False
+        self.process = None
+        self.conn = None
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._requests)
+
+    def spawn(self):
+        """Start (or restart) the worker process and its reader thread."""
+        parent_conn, child_conn = self._context.Pipe(duplex=True)
+        process = self._context.Process(
+            target=_worker_main,
+            args=(child_conn, self.index),
+            name=f"inference-worker-{self.index}",
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        self._started_at = self.last_heartbeat = self.last_loading = time.time()
+        self.process, self.conn = process, parent_conn
+        self.loaded = set()
+        self.cache = None
+        threading.Thread(
+            target=self._read_loop,
+            args=(process, parent_conn),
+            name=f"inference-reader-{self.index}",
+            daemon=True,
+        ).start()
+        logger.info(f"Inference worker process {self.index} started (pid {process.pid})")
+
+    def stop(self, timeout: float = 5.0):
+        """Ask the process to exit, killing it if it does not."""
+        self._stopping = True
+        try:
+            self.send(("stop",))
+        except (OSError, ValueError):
+            pass
+        if self.process is not None:
+            self.process.join(timeout)
+            if self.process.is_alive():
+                self.process.kill()
+
+    def kill(self):
+        """Kill a stuck process; the reader thread restarts it."""
+        if self.process is not None and self.process.is_alive():
+            logger.warning(f"Killing stuck inference worker {self.index} (pid {self.process.pid})")
+            self.process.kill()
+
+    def send(self, message):
+        with self._send_lock:
+            self.conn.send(message)
+
+    def register(self, request_id: int) -> queue.Queue:
+        inbox: queue.Queue = queue.Queue()
+        with self._lock:
+            self._requests[request_id] = inbox
+        return inbox
+
+    def unregister(self, request_id: int):
+        with self._lock:
+            self._requests.pop(request_id, None)
+
+    def _read_loop(self, process, conn):
+        """Route worker messages to waiting callers until the process exits."""
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                break
+            kind, request_id = message[0], message[1]
+            if kind == "heartbeat":
+                self.last_heartbeat = time.time()
+                if message[2]:
+                    self.last_loading = self.last_heartbeat
+                continue
+            if kind in ("result", "cancelled", "error"):
+                self.loaded = set(map(tuple, message[-1]["loaded"]))
+                self.cache = message[-1]["cache"]
+            with self._lock:
+                inbox = self._requests.get(request_id)
+            if inbox is not None:
+                inbox.put(message)
+            elif kind == "result":
+                _release_images(message[2])
+
+        process.join(1)
+        with self._lock:
+            orphaned = list(self._requests.values())
+        for inbox in orphaned:
+            inbox.put(("crashed", None, f"Inference worker exited (code {process.exitcode})"))
+        if not self._stopping:
+            if time.time() - self._started_at < MIN_HEALTHY_UPTIME_SECONDS:
+                self._rapid_failures += 1
+            else:
+                self._rapid_failures = 0
+            delay = min(MAX_RESTART_BACKOFF_SECONDS, 2 ** self._rapid_failures - 1)
+            logger.error(
+                f"Inference worker {self.index} exited (code {process.exitcode}); "
+                f"restarting in {delay}s"
+            )
+            time.sleep(delay)
+            self.restarts += 1
+            if not self._stopping:
+                self.spawn()
+
+
+class ProcessInference:
+    """Runs generation in dedicated worker processes.
+
+    Requests and results travel over a multiprocessing Pipe; image pixel
+    buffers are handed over through shared memory instead of being pickled.
+    A worker that dies is restarted automatically. One is killed and restarted
+    if it sends no heartbeat for ``stall_timeout`` seconds, or if a request
+    hears nothing from it for that long while it is not loading a model.
+    """
+
+    def __init__(self, num_processes: int, stall_timeout: float):
+        self.num_processes = max(1, num_processes)
+        self.stall_timeout = stall_timeout
+        self._context = multiprocessing.get_context("spawn")
+        self._workers: List[_WorkerProcess] = []
+        self._request_ids = itertools.count(1)
+        self._pick_lock = threading.Lock()
+
+    def start(self):
+        """Spawn the worker processes."""
+        if self._workers:
+            return
+        for index in range(self.num_processes):
+            worker = _WorkerProcess(index, self._context)
+            worker.spawn()
+            self._workers.append(worker)
+
+    def stop(self):
+        """Stop all worker processes."""
+        for worker in self._workers:
+            worker.stop()
+        self._workers = []
+
+    def _pick_worker(self, model_id: Optional[str], mode: Optional[str]) -> _WorkerProcess:
+        """Prefer the least busy worker that already has the pipeline loaded."""
+        model_id = model_id or settings.model_id
+        with self._pick_lock:
+            return min(
+                self._workers,
+                key=lambda worker: ((model_id, mode) not in worker.loaded, worker.in_flight),
+            )
+
+    def call(
+        self,
+        method: str,
+        progress_callback: Optional[callable] = None,
+        cancel_check: Optional[callable] = None,
+        preview_callback: Optional[callable] = None,
+        preview_interval: Optional[callable] = None,
+        **kwargs,
+    ):
+        """Run a StableDiffusionModel generation method in a worker process.
+
+        Args:
+            method: Method name (see METHOD_MODES)
+            progress_callback: Called with progress percent as the worker reports it
+            cancel_check: Polled while waiting; True sends a cancel to the worker
+            preview_callback: Called with latent previews as the worker sends them
+            preview_interval: Polled while waiting; changes are forwarded to the worker
+            **kwargs: Method arguments (PIL images are passed via shared memory)
+
+        Returns:
+            Whatever the method returns (an image or list of images)
+
+        Raises:
+            GenerationCancelled: If the worker aborted after a cancel request
+            WorkerCrashed: If the worker died or stalled
+            RuntimeError: If generation failed in the worker
+        """
+        worker = self._pick_worker(kwargs.get("model_id"), METHOD_MODES.get(method))
+        return self._call_worker(
+            worker, method, progress_callback, cancel_check, preview_callback, preview_interval, **kwargs
+        )
+
+    def call_each(self, method: str, **kwargs) -> List[Any]:
+        """Run a generation method once in every worker process, in parallel.
+
+        Used to warm a pipeline up everywhere, since requests go to whichever
+        worker has their pipeline loaded.
+
+        Returns:
+            Each worker's result
+
+        Raises:
+            The first worker error, once every worker has finished
+        """
+        results: List[Any] = [None] * len(self._workers)
+        errors: List[Exception] = []
+
+        def run(index: int, worker: _WorkerProcess):
+            try:
+                results[index] = self._call_worker(worker, method, **kwargs)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [
+            threading.Thread(target=run, args=(index, worker), name=f"call-each-{index}", daemon=True)
+            for index, worker in enumerate(self._workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+        return results
+
+    def _call_worker(
+        self,
+        worker: _WorkerProcess,
+        method: str,
+        progress_callback: Optional[callable] = None,
+        cancel_check: Optional[callable] = None,
+        preview_callback: Optional[callable] = None,
+        preview_interval: Optional[callable] = None,
+        **kwargs,
+    ):
+        """Run a generation method in one worker process (see call)."""
+        request_id = next(self._request_ids)
+        inbox = worker.register(request_id)
+        encoded = {key: _encode_images(value) for key, value in kwargs.items()}
+        try:
+            try:
+                worker.send(("run", request_id, method, encoded))
+            except (OSError, ValueError) as e:
+                for value in encoded.values():
+                    _release_images(value)
+                raise WorkerCrashed(f"Inference worker {worker.index} unavailable: {e}")
+
+            cancel_sent = False
+            interval_sent = 0
+            last_message = time.time()
+            while True:
+                if cancel_check and not cancel_sent and cancel_check():
+                    worker.send(("cancel", request_id))
+                    cancel_sent = True
+                if preview_callback and preview_interval:
+                    interval = preview_interval()
+                    if interval != interval_sent:
+                        worker.send(("preview_interval", request_id, interval))
+                        interval_sent = interval
+                try:
+                    message = inbox.get(timeout=POLL_INTERVAL_SECONDS)
+                except queue.Empty:
+                    now = time.time()
+                    if now - worker.last_heartbeat > self.stall_timeout:
+                        worker.kill()
+                        raise WorkerCrashed(
+                            f"Inference worker {worker.index} sent no heartbeat for {self.stall_timeout:.0f}s"
+                        )
+                    # Loads report no progress; only silence outside them counts as a stall
+                    if now - max(last_message, worker.last_loading) > self.stall_timeout:
+                        worker.kill()
+                        raise WorkerCrashed(
+                            f"Inference worker {worker.index} stalled for {self.stall_timeout:.0f}s"
+                        )
+                    continue
+
+                last_message = time.time()
+                kind = message[0]
+                if kind == "progress":
+                    if progress_callback:
+                        progress_callback(message[2])
+                elif kind == "preview":
+                    if preview_callback:
+                        preview_callback(message[2])
+                elif kind == "result":
+                    return _decode_images(message[2])
+                elif kind == "cancelled":
+                    raise GenerationCancelled(message[2])
+                elif kind == "error":
+                    raise RuntimeError(message[2])
+                elif kind == "crashed":
+                    raise WorkerCrashed(message[2])
+        finally:
+            worker.unregister(request_id)
+
+    def is_pipeline_loaded(self, model_id: str, mode: str) -> bool:
+        """Check if any worker has the pipeline cached."""
+        return any((model_id, mode) in worker.loaded for worker in self._workers)
+
+    @property
+    def is_loaded(self) -> bool:
+        """Check if any worker has a model loaded."""
+        return any(worker.loaded for worker in self._workers)
+
+    def stats(self) -> Dict[str, Any]:
+        """Worker process health and cached pipelines."""
+        return {
+            "mode": "process",
+            "workers": [
+                {
+                    "index": worker.index,
+                    "pid": worker.process.pid if worker.process else None,
+                    "alive": bool(worker.process and worker.process.is_alive()),
+                    "in_flight": worker.in_flight,
+                    "restarts": worker.restarts,
+                    "last_heartbeat_seconds_ago": round(time.time() - worker.last_heartbeat, 1),
+                    "loaded": sorted(worker.loaded),
+                    "cache": worker.cache,
+                }
+                for worker in self._workers
+            ],
+        }
+
+    def cache_stats(self) -> List[Dict[str, Any]]:
+        """Model cache contents and counters of each worker, as of its last finished request."""
+        return [{"worker": worker.index, **worker.cache} for worker in self._workers if worker.cache]
+
+
+def create_inference_backend(num_processes: int, stall_timeout: float):
+    """Create the configured inference backend.
+
+    Args:
+        num_processes: Worker processes to spawn; 0 runs inference in the API process
+        stall_timeout: Seconds without a heartbeat, or without progress outside
+            model loads, before a worker is restarted
+
+    Returns:
+        LocalInference or ProcessInference
+    """
+    if num_processes <= 0:
+        return LocalInference()
+    return ProcessInference(num_processes, stall_timeout)
+
+
+# Global inference backend
+inference = create_inference_backend(
+    num_processes=settings.inference_processes,
+    stall_timeout=settings.worker_stall_timeout_seconds,
+)
@@ -0,0 +1,430 @@
+"""Bounded inference job queue with dedicated worker threads."""
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .config import settings
+from .scheduling import SchedulingPolicy, FifoPolicy, scheduling_policy
+from .usage import UsageTracker, usage_tracker
+
+logger = logging.getLogger(__name__)
+
+# Longest a policy order is reused for positions and wait estimates while the
+# queue is unchanged (fair share ages owners' usage as time passes)
+ORDER_CACHE_SECONDS = 1.0
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at its depth limit."""
+
+
+@dataclass
+class QueuedJob:
+    """A unit of work waiting for an inference worker.
+
+    Jobs with the same non-None ``batch_key`` can be run together by
+    ``batch_task``, which receives the list of jobs instead of one job's kwargs.
+    ``model_id`` and ``mode`` identify the pipeline the job needs, which the
+    scheduler uses to prefer jobs whose pipeline is already loaded.
+    """
+
+    job_id: str
+    task: Callable[..., None]
+    kwargs: Dict[str, Any] = field(default_factory=dict)
+    enqueued_at: float = field(default_factory=time.time)
+    batch_key: Optional[tuple] = None
+    batch_task: Optional[Callable[[List["QueuedJob"]], None]] = None
+    model_id: Optional[str] = None
+    mode: Optional[str] = None
+    skips: int = 0  # Times a later job was scheduled ahead of this one
+    estimated_seconds: float = 0.0  # Expected run time, used to estimate queue wait
+    cost: float = 0.0  # Relative compute cost, used by cost-aware scheduling policies
+    owner: Optional[str] = None  # Who submitted the job, for fair share and usage accounting
+    tier: Optional[str] = None
+    started_at: Optional[float] = None
+    callback_secret: Optional[str] = None  # Webhook signing secret, carried to the node that runs a shared job
+
+
+class JobQueue:
+    """Job queue drained by a fixed pool of inference worker threads.
+
+    The number of workers caps how many diffusion loops run at once, so the
+    model never sees more than ``num_workers`` concurrent calls. Jobs beyond
+    ``max_queue_size`` are rejected instead of piling up in memory. The
+    ``policy`` decides which queued job runs next (FIFO by default).
+
+    When a worker takes a batchable job it also takes up to
+    ``max_batch_size - 1`` queued jobs with the same batch key. If the queue
+    has nothing else waiting it holds the batch open for up to
+    ``batch_wait_seconds`` so that compatible requests arriving together can
+    share one pipeline call.
+
+    If ``warm_check`` is set, a worker whose next job would need a cold
+    pipeline load first looks, in policy order, for a queued job whose
+    pipeline is already loaded. A job is never skipped more than ``affinity_max_skips`` times or
+    once it has waited ``affinity_max_wait_seconds``, which bounds starvation.
+    """
+
+    def __init__(
+        self,
+        num_workers: int,
+        max_queue_size: int,
+        max_batch_size: int = 1,
+        batch_wait_seconds: float = 0.0,
+        warm_check: Optional[Callable[[QueuedJob], bool]] = None,
+        affinity_max_skips: int = 3,
+        affinity_max_wait_seconds: float = 120.0,
+        policy: Optional[SchedulingPolicy] = None,
+        usage: Optional[UsageTracker] = None,
+    ):
+        self.num_workers = max(1, num_workers)
+        self.max_queue_size = max_queue_size
+        self.max_batch_size = max(1, max_batch_size)
+        self.batch_wait_seconds = batch_wait_seconds
+        self.warm_check = warm_check
+        self.affinity_max_skips = affinity_max_skips
+        self.affinity_max_wait_seconds = affinity_max_wait_seconds
+        self.policy = policy or FifoPolicy()
+        self.usage = usage
+        # Scheduling counters exposed through stats()
+        self.scheduled_warm = 0  # Picked job's pipeline was already loaded
+        self.scheduled_cold = 0  # Picked job needed a pipeline load
+        self.reordered = 0  # A warm job was run ahead of the policy's first choice
+        self.forced_by_starvation = 0  # Head ran cold because it hit the skip/wait bound
+        self._pending: deque = deque()
+        self._running: Dict[int, List[QueuedJob]] = {}
+        self._cancelled: set = set()  # Running job IDs asked to stop at the next step
+        # (computed at, jobs in policy order, {job_id: 1-based position}); None once the queue changes
+        self._order_cache: Optional[Tuple[float, List[QueuedJob], Dict[str, int]]] = None
+        self._cond = threading.Condition()
+        self._workers: List[threading.Thread] = []
+        self._shutdown = False
+
+    def start(self):
+        """Start the worker threads (idempotent)."""
+        with self._cond:
+            if self._workers:
+                return
+            self._shutdown = False
+            for worker_id in range(self.num_workers):
+                thread = threading.Thread(
+                    target=self._worker_loop,
+                    args=(worker_id,),
+                    name=f"inference-worker-{worker_id}",
+                    daemon=True,
+                )
+                self._workers.append(thread)
+                thread.start()
+        logger.info(f"Job queue started with {self.num_workers} worker(s), max depth {self.max_queue_size}")
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop accepting work and wait for the workers to finish their current job.
+
+        Args:
+            timeout: Seconds to wait for each worker thread (None waits forever)
+        """
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+        for thread in self._workers:
+            thread.join(timeout)
+        self._workers = []
+        if self._pending:
+            logger.warning(f"Job queue stopped with {len(self._pending)} job(s) still queued")
+
+    def submit(self, job: QueuedJob):
+        """Append a job to the back of the queue.
+
+        Args:
+            job: The job to run
+
+        Raises:
+            QueueFullError: If the queue already holds max_queue_size jobs
+        """
+        with self._cond:
+            if len(self._pending) >= self.max_queue_size:
+                raise QueueFullError(
+                    f"Queue is full ({self.max_queue_size} jobs waiting). Try again later."
+                )
+            self._pending.append(job)
+            self._order_cache = None
+            # Wake every worker: one may be holding a batch open for this job
+            self._cond.notify_all()
+
+    def position(self, job_id: str) -> Optional[int]:
+        """Get a job's 1-based position in run order, or None if it is not queued."""
+        with self._cond:
+            return self._cached_order(time.time())[1].get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        """Cancel a queued or running job.
+
+        Queued jobs are removed immediately. Running jobs are flagged so that
+        is_cancelled() turns True and the generation aborts at the next
+        denoising step.
+
+        Args:
+            job_id: The job to cancel
+
+        Returns:
+            'removed' if the job was dequeued, 'cancelling' if it is running,
+            or None if the queue does not hold the job
+        """
+        with self._cond:
+            for job in self._pending:
+                if job.job_id == job_id:
+                    self._pending.remove(job)
+                    self._order_cache = None
+                    return "removed"
+            for batch in self._running.values():
+                if any(job.job_id == job_id for job in batch):
+                    self._cancelled.add(job_id)
+                    return "cancelling"
+        return None
+
+    def holds(self, job_id: str) -> bool:
+        """Check whether a job is queued or running here."""
+        with self._cond:
+            return any(job.job_id == job_id for job in self._pending) or any(
+                job.job_id == job_id for batch in self._running.values() for job in batch
+            )
+
+    def is_cancelled(self, job_id: str) -> bool:
+        """Check whether a running job has been asked to stop."""
+        return job_id in self._cancelled
+
+    @property
+    def depth(self) -> int:
+        """Number of jobs waiting for a worker."""
+        return len(self._pending)
+
+    @property
+    def running_count(self) -> int:
+        """Number of jobs currently held by a worker."""
+        return sum(len(batch) for batch in self._running.values())
+
+    def _running_remaining(self, now: float) -> float:
+        """Estimated seconds of work left in running jobs (condition lock held)."""
+        return sum(
+            max(0.0, sum(job.estimated_seconds for job in batch) - (now - (batch[0].started_at or now)))
+            for batch in self._running.values()
+        )
+
+    def backlog_seconds(self) -> float:
+        """Estimated seconds until a worker could start a newly submitted job.
+
+        Sums the estimated run time of every queued job and the remaining
+        time of every running one, spread across the workers.
+        """
+        with self._cond:
+            if not self._pending and len(self._running) < self.num_workers:
+                return 0.0
+            queued = sum(job.estimated_seconds for job in self._pending)
+            return (queued + self._running_remaining(time.time())) / self.num_workers
+
+    def wait_estimate(self, job_id: str) -> Optional[Tuple[int, float]]:
+        """Queue position and estimated seconds until a queued job starts.
+
+        Follows the current policy order; later arrivals, affinity
+        reordering and batching can make the real wait shorter or longer.
+
+        Returns:
+            (1-based position, seconds until start), or None if the job is not queued
+        """
+        return self.wait_estimates().get(job_id)
+
+    def wait_estimates(self) -> Dict[str, Tuple[int, float]]:
+        """wait_estimate of every queued job, from one pass over the policy order.
+
+        Returns:
+            {job_id: (1-based position, seconds until start)}
+        """
+        with self._cond:
+            now = time.time()
+            idle_workers = self.num_workers - len(self._running)
+            running_remaining = self._running_remaining(now)
+            estimates = {}
+            ahead = 0.0
+            for rank, job in enumerate(self._cached_order(now)[0]):
+                if rank < idle_workers:
+                    estimates[job.job_id] = (rank + 1, 0.0)
+                else:
+                    estimates[job.job_id] = (rank + 1, (ahead + running_remaining) / self.num_workers)
+                ahead += job.estimated_seconds
+            return estimates
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and scheduling counters.
+
+        ``loads_avoided`` counts jobs run ahead of the policy's cold first
+        choice because their pipeline was already loaded.
+        """
+        with self._cond:
+            return {
+                "workers": self.num_workers,
+                "policy": self.policy.name,
+                "queued": len(self._pending),
+                "running": sum(len(batch) for batch in self._running.values()),
+                "max_queue_size": self.max_queue_size,
+                "max_batch_size": self.max_batch_size,
+                "affinity": {
+                    "enabled": self.warm_check is not None,
+                    "max_skips": self.affinity_max_skips,
+                    "max_wait_seconds": self.affinity_max_wait_seconds,
+                    "scheduled_warm": self.scheduled_warm,
+                    "scheduled_cold": self.scheduled_cold,
+                    "loads_avoided": self.reordered,
+                    "forced_by_starvation": self.forced_by_starvation,
+                },
+            }
+
+    def _is_warm(self, job: QueuedJob) -> bool:
+        """Check whether a job's pipeline is loaded, treating check errors as cold."""
+        try:
+            return bool(self.warm_check(job))
+        except Exception as e:
+            logger.debug(f"Warm check failed for job {job.job_id}: {e}")
+            return False
+
+    def _ordered(self, now: float) -> List[QueuedJob]:
+        """Queued jobs in policy order (condition lock held)."""
+        return [self._pending[index] for index in self.policy.order(self._pending, now)]
+
+    def _cached_order(self, now: float) -> Tuple[List[QueuedJob], Dict[str, int]]:
+        """Queued jobs in policy order and their positions, reused until the queue changes.
+
+        Status polling asks for positions far more often than jobs arrive or
+        start, so the policy sorts the queue once per change instead of once
+        per lookup. Must be called with the condition lock held.
+        """
+        if self._order_cache is None or now - self._order_cache[0] >= ORDER_CACHE_SECONDS:
+            ordered = self._ordered(now)
+            self._order_cache = (now, ordered, {job.job_id: rank + 1 for rank, job in enumerate(ordered)})
+        return self._order_cache[1], self._order_cache[2]
+
+    def _select_next(self) -> QueuedJob:
+        """Remove and return the next job to run.
+
+        Must be called with the condition lock held and a non-empty queue.
+        """
+        ordered = self._ordered(time.time())
+        head = ordered[0]
+        chosen = head
+        if self.warm_check is not None:
+            if self._is_warm(head):
+                self.scheduled_warm += 1
+            else:
+                starving = (
+                    head.skips >= self.affinity_max_skips
+                    or time.time() - head.enqueued_at >= self.affinity_max_wait_seconds
+                )
+                if starving:
+                    self.forced_by_starvation += 1
+                else:
+                    for rank, job in enumerate(ordered[1:], start=1):
+                        if self._is_warm(job):
+                            # Every job jumped over counts one skip towards its bound
+                            for skipped in ordered[:rank]:
+                                skipped.skips += 1
+                            chosen = job
+                            self.reordered += 1
+                            logger.info(
+                                f"Scheduling job {job.job_id} ahead of {rank} queued job(s): "
+                                f"{job.model_id} ({job.mode}) is already loaded"
+                            )
+                            break
+                if chosen is head:
+                    self.scheduled_cold += 1
+                else:
+                    self.scheduled_warm += 1
+
+        self._pending.remove(chosen)
+        self._order_cache = None
+        return chosen
+
+    def _take_compatible(self, batch: List[QueuedJob]):
+        """Move queued jobs sharing the batch head's key into the batch.
+
+        Must be called with the condition lock held.
+        """
+        head = batch[0]
+        for job in list(self._pending):
+            if len(batch) >= self.max_batch_size:
+                break
+            if job.batch_key == head.batch_key:
+                self._pending.remove(job)
+                self._order_cache = None
+                batch.append(job)
+
+    def _collect_batch(self, head: QueuedJob) -> List[QueuedJob]:
+        """Build a batch starting from head, waiting briefly for more jobs if idle.
+
+        Must be called with the condition lock held.
+        """
+        batch = [head]
+        if head.batch_key is None or head.batch_task is None or self.max_batch_size == 1:
+            return batch
+
+        self._take_compatible(batch)
+        deadline = time.time() + self.batch_wait_seconds
+        # Only hold the batch open while nothing else is waiting for a worker
+        while len(batch) < self.max_batch_size and not self._pending and not self._shutdown:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            self._cond.wait(remaining)
+            self._take_compatible(batch)
+        return batch
+
+    def _worker_loop(self, worker_id: int):
+        """Pull jobs off the queue until shutdown."""
+        while True:
+            with self._cond:
+                while not self._pending and not self._shutdown:
+                    self._cond.wait()
+                if self._shutdown:
+                    return
+                batch = self._collect_batch(self._select_next())
+                started_at = time.time()
+                for job in batch:
+                    job.started_at = started_at
+                self._running[worker_id] = batch
+
+            try:
+                if len(batch) > 1:
+                    logger.info(f"Worker {worker_id} running batch of {len(batch)} jobs")
+                    batch[0].batch_task(batch)
+                else:
+                    job = batch[0]
+                    job.task(job_id=job.job_id, **job.kwargs)
+            except Exception as e:
+                # Tasks record their own failures; this only guards the worker thread
+                logger.error(f"Worker {worker_id} crashed on job(s) {[job.job_id for job in batch]}: {e}")
+            finally:
+                # Charge owners the measured worker time, split evenly across a batch
+                if self.usage is not None:
+                    elapsed = time.time() - batch[0].started_at
+                    for job in batch:
+                        self.usage.record(job.owner, job.tier, elapsed / len(batch))
+                with self._cond:
+                    self._running.pop(worker_id, None)
+                    # The owners' usage changed, which moves jobs under fair share
+                    self._order_cache = None
+                    for job in batch:
+                        self._cancelled.discard(job.job_id)
+
+
+# Global job queue instance
+job_queue = JobQueue(
+    num_workers=settings.max_concurrent_jobs,
+    max_queue_size=settings.max_queue_size,
+    max_batch_size=settings.max_batch_size,
+    batch_wait_seconds=settings.batch_wait_ms / 1000.0,
+    affinity_max_skips=settings.affinity_max_skips,
+    affinity_max_wait_seconds=settings.affinity_max_wait_seconds,
+    policy=scheduling_policy,
+    usage=usage_tracker,
+)
@@ -0,0 +1,451 @@
+"""Job state storage with in-memory, SQLite and Redis backends."""
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Statuses after which a job never changes again and becomes eligible for expiry
+# ("partial" only applies to batch records: some children completed, some did not)
+FINISHED_STATUSES = ("completed", "failed", "cancelled", "partial")
+
+# How often (seconds) writes opportunistically purge expired jobs
+PURGE_INTERVAL_SECONDS = 60
+
+# Job IDs per SQLite query in get_many (stays under SQLite's bound-parameter limit)
+GET_MANY_CHUNK_SIZE = 500
+
+
+class JobStore:
+    """Interface for storing job state records.
+
+    A job record is a flat, JSON-serializable dict keyed by ``job_id``. Stores
+    add ``created_at``, ``updated_at`` and ``finished_at`` timestamps and
+    expire finished jobs once they are older than ``ttl_seconds``.
+    """
+
+    def __init__(self, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+        self._last_purge = time.time()
+
+    def create(self, job_id: str, fields: Dict[str, Any]):
+        """Insert a new job record.
+
+        A record created in a finished status (e.g. served from the result
+        cache) gets its ``finished_at`` at once, so it expires like any other.
+        """
+        raise NotImplementedError
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Get a job record, or None if it does not exist or has expired."""
+        raise NotImplementedError
+
+    def get_many(self, job_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Get several job records at once; unknown or expired IDs are left out."""
+        raise NotImplementedError
+
+    def update(self, job_id: str, **fields):
+        """Merge fields into an existing job record (no-op if missing)."""
+        raise NotImplementedError
+
+    def delete(self, job_id: str):
+        """Remove a job record."""
+        raise NotImplementedError
+
+    def list_jobs(self, status: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """List job records, newest first, optionally filtered by status."""
+        raise NotImplementedError
+
+    def purge_expired(self) -> int:
+        """Delete finished jobs older than the TTL.
+
+        Returns:
+            Number of jobs removed
+        """
+        raise NotImplementedError
+
+    def __contains__(self, job_id: str) -> bool:
+        return self.get(job_id) is not None
+
+    def _maybe_purge(self):
+        """Run purge_expired at most once per PURGE_INTERVAL_SECONDS."""
+        now = time.time()
+        if now - self._last_purge < PURGE_INTERVAL_SECONDS:
+            return
+        self._last_purge = now
+        removed = self.purge_expired()
+        if removed:
+            logger.info(f"Purged {removed} expired job(s)")
+
+
+class MemoryJobStore(JobStore):
+    """Process-local job store backed by dicts.
+
+    Records are kept in insertion (creation) order and indexed by status, so
+    lookups are O(1) and expiry only scans finished jobs.
+    """
+
+    def __init__(self, ttl_seconds: int):
+        super().__init__(ttl_seconds)
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._by_status: Dict[str, set] = {}
+        self._lock = threading.Lock()
+
+    def create(self, job_id: str, fields: Dict[str, Any]):
+        now = time.time()
+        finished_at = now if fields.get("status") in FINISHED_STATUSES else None
+        record = {**fields, "job_id": job_id, "created_at": now, "updated_at": now, "finished_at": finished_at}
+        with self._lock:
+            self._jobs[job_id] = record
+            self._by_status.setdefault(record.get("status"), set()).add(job_id)
+        self._maybe_purge()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            record = self._jobs.get(job_id)
+            return dict(record) if record is not None else None
+
+    def get_many(self, job_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {job_id: dict(self._jobs[job_id]) for job_id in job_ids if job_id in self._jobs}
+
+    def update(self, job_id: str, **fields):
+        with self._lock:
+            record = self._jobs.get(job_id)
+            if record is None:
+                return
+            old_status = record.get("status")
+            record.update(fields)
+            record["updated_at"] = time.time()
+            new_status = record.get("status")
+            if new_status != old_status:
+                self._by_status.get(old_status, set()).discard(job_id)
+                self._by_status.setdefault(new_status, set()).add(job_id)
+                if new_status in FINISHED_STATUSES:
+                    record["finished_at"] = record["updated_at"]
+
+    def delete(self, job_id: str):
+        with self._lock:
+            record = self._jobs.pop(job_id, None)
+            if record is not None:
+                self._by_status.get(record.get("status"), set()).discard(job_id)
+
+    def list_jobs(self, status: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        with self._lock:
+            if status is None:
+                job_ids = list(self._jobs.keys())
+            else:
+                job_ids = [job_id for job_id in self._jobs if job_id in self._by_status.get(status, ())]
+            return [dict(self._jobs[job_id]) for job_id in reversed(job_ids[-limit:])]
+
+    def purge_expired(self) -> int:
+        cutoff = time.time() - self.ttl_seconds
+        removed = 0
+        with self._lock:
+            for status in FINISHED_STATUSES:
+                expired = [
+                    job_id for job_id in self._by_status.get(status, ())
+                    if self._jobs[job_id]["finished_at"] < cutoff
+                ]
+                for job_id in expired:
+                    del self._jobs[job_id]
+                    self._by_status[status].discard(job_id)
+                removed += len(expired)
+        return removed
+
+
+class SQLiteJobStore(JobStore):
+    """Job store backed by a SQLite database in WAL mode.
+
+    WAL lets several API worker processes read concurrently while one writes,
+    and job state survives restarts. Each thread gets its own connection.
+    """
+
+    def __init__(self, path: str, ttl_seconds: int):
+        super().__init__(ttl_seconds)
+        self.path = path
+        self._local = threading.local()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                status TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                finished_at REAL,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status);
+            CREATE INDEX IF NOT EXISTS idx_jobs_created_at ON jobs (created_at);
+            CREATE INDEX IF NOT EXISTS idx_jobs_finished_at ON jobs (finished_at);
+            """
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        """Get this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=10000")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _to_record(row) -> Dict[str, Any]:
+        record = json.loads(row[5])
+        record.update({
+            "job_id": row[0],
+            "status": row[1],
+            "created_at": row[2],
+            "updated_at": row[3],
+            "finished_at": row[4],
+        })
+        return record
+
+    def create(self, job_id: str, fields: Dict[str, Any]):
+        now = time.time()
+        finished_at = now if fields.get("status") in FINISHED_STATUSES else None
+        data = {k: v for k, v in fields.items() if k not in ("job_id", "status")}
+        self._conn().execute(
+            "INSERT OR REPLACE INTO jobs (job_id, status, created_at, updated_at, finished_at, data) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, fields.get("status"), now, now, finished_at, json.dumps(data)),
+        )
+        self._maybe_purge()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT job_id, status, created_at, updated_at, finished_at, data FROM jobs WHERE job_id = ?",
+            (job_id,),
+        ).fetchone()
+        return self._to_record(row) if row else None
+
+    def get_many(self, job_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        conn = self._conn()
+        records = {}
+        for start in range(0, len(job_ids), GET_MANY_CHUNK_SIZE):
+            chunk = job_ids[start:start + GET_MANY_CHUNK_SIZE]
+            rows = conn.execute(
+                "SELECT job_id, status, created_at, updated_at, finished_at, data FROM jobs "
+                f"WHERE job_id IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ).fetchall()
+            for row in rows:
+                records[row[0]] = self._to_record(row)
+        return records
+
+    def update(self, job_id: str, **fields):
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT status, finished_at, data FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return
+            status, finished_at, data = row[0], row[1], json.loads(row[2])
+            new_status = fields.get("status", status)
+            if new_status != status and new_status in FINISHED_STATUSES:
+                finished_at = now
+            data.update({k: v for k, v in fields.items() if k not in ("job_id", "status")})
+            conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ?, finished_at = ?, data = ? WHERE job_id = ?",
+                (new_status, now, finished_at, json.dumps(data), job_id),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def delete(self, job_id: str):
+        self._conn().execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+
+    def list_jobs(self, status: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        query = "SELECT job_id, status, created_at, updated_at, finished_at, data FROM jobs"
+        params: tuple = ()
+        if status is not None:
+            query += " WHERE status = ?"
+            params = (status,)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        rows = self._conn().execute(query, params + (limit,)).fetchall()
+        return [self._to_record(row) for row in rows]
+
+    def purge_expired(self) -> int:
+        cutoff = time.time() - self.ttl_seconds
+        cursor = self._conn().execute(
+            "DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (cutoff,)
+        )
+        return cursor.rowcount
+
+
+class RedisJobStore(JobStore):
+    """Job store backed by a Redis server, shared by nodes on any number of hosts.
+
+    Each record is a JSON string under ``<prefix>job:<job_id>``. Sorted sets
+    index records by creation time (all of them, and per status) for
+    list_jobs, and finished records by finish time for expiry. Updates are
+    read-modify-write transactions guarded by WATCH.
+
+    Args:
+        client: Redis client created with decode_responses=True
+        ttl_seconds: How long finished jobs are kept
+        prefix: Prefix of every key, so several deployments can share a server
+    """
+
+    def __init__(self, client, ttl_seconds: int, prefix: str = "sd:"):
+        super().__init__(ttl_seconds)
+        self._redis = client
+        self.prefix = prefix
+        self._created_key = f"{prefix}jobs:created"
+        self._finished_key = f"{prefix}jobs:finished"
+
+    def _key(self, job_id: str) -> str:
+        return f"{self.prefix}job:{job_id}"
+
+    def _status_key(self, status: Optional[str]) -> str:
+        return f"{self.prefix}jobs:status:{status}"
+
+    def create(self, job_id: str, fields: Dict[str, Any]):
+        now = time.time()
+        finished_at = now if fields.get("status") in FINISHED_STATUSES else None
+        record = {**fields, "job_id": job_id, "created_at": now, "updated_at": now, "finished_at": finished_at}
+        pipe = self._redis.pipeline()
+        pipe.set(self._key(job_id), json.dumps(record))
+        pipe.zadd(self._created_key, {job_id: now})
+        pipe.zadd(self._status_key(record.get("status")), {job_id: now})
+        if finished_at is not None:
+            pipe.zadd(self._finished_key, {job_id: finished_at})
+        pipe.execute()
+        self._maybe_purge()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        raw = self._redis.get(self._key(job_id))
+        return json.loads(raw) if raw is not None else None
+
+    def get_many(self, job_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        records = {}
+        for start in range(0, len(job_ids), GET_MANY_CHUNK_SIZE):
+            chunk = job_ids[start:start + GET_MANY_CHUNK_SIZE]
+            for job_id, raw in zip(chunk, self._redis.mget([self._key(job_id) for job_id in chunk])):
+                if raw is not None:
+                    records[job_id] = json.loads(raw)
+        return records
+
+    def update(self, job_id: str, **fields):
+        key = self._key(job_id)
+
+        def apply(pipe):
+            raw = pipe.get(key)
+            if raw is None:
+                return
+            record = json.loads(raw)
+            old_status = record.get("status")
+            record.update(fields)
+            record["updated_at"] = time.time()
+            new_status = record.get("status")
+            finished = new_status != old_status and new_status in FINISHED_STATUSES
+            if finished:
+                record["finished_at"] = record["updated_at"]
+            pipe.multi()
+            pipe.set(key, json.dumps(record))
+            if new_status != old_status:
+                pipe.zrem(self._status_key(old_status), job_id)
+                pipe.zadd(self._status_key(new_status), {job_id: record["created_at"]})
+            if finished:
+                pipe.zadd(self._finished_key, {job_id: record["finished_at"]})
+
+        self._redis.transaction(apply, key)
+
+    def delete(self, job_id: str):
+        record = self.get(job_id)
+        pipe = self._redis.pipeline()
+        pipe.delete(self._key(job_id))
+        pipe.zrem(self._created_key, job_id)
+        pipe.zrem(self._finished_key, job_id)
+        if record is not None:
+            pipe.zrem(self._status_key(record.get("status")), job_id)
+        pipe.execute()
+
+    def list_jobs(self, status: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        index = self._status_key(status) if status is not None else self._created_key
+        job_ids = self._redis.zrevrange(index, 0, limit - 1)
+        records = self.get_many(job_ids)
+        return [
+            records[job_id] for job_id in job_ids
+            if job_id in records and (status is None or records[job_id].get("status") == status)
+        ]
+
+    def purge_expired(self) -> int:
+        cutoff = time.time() - self.ttl_seconds
+        job_ids = self._redis.zrangebyscore(self._finished_key, "-inf", f"({cutoff}")
+        if not job_ids:
+            return 0
+        records = self.get_many(job_ids)
+        pipe = self._redis.pipeline()
+        for job_id in job_ids:
+            pipe.delete(self._key(job_id))
+            pipe.zrem(self._created_key, job_id)
+            pipe.zrem(self._finished_key, job_id)
+            if job_id in records:
+                pipe.zrem(self._status_key(records[job_id].get("status")), job_id)
+        pipe.execute()
+        return len(records)
+
+
+def redis_client(url: str):
+    """Connect to the Redis server shared by every node (redis backends only).
+
+    Args:
+        url: Server URL, e.g. redis://localhost:6379/0
+
+    Returns:
+        A redis.Redis client that decodes responses to str
+    """
+    import redis
+
+    return redis.Redis.from_url(url, decode_responses=True)
+
+
+def create_job_store(backend: str, path: str, ttl_seconds: int) -> JobStore:
+    """Create a job store for the configured backend.
+
+    Args:
+        backend: 'memory', 'sqlite' or 'redis' (at settings.redis_url)
+        path: Database file path (sqlite only)
+        ttl_seconds: How long finished jobs are kept
+
+    Returns:
+        A JobStore instance
+
+    Raises:
+        ValueError: If the backend is unknown
+    """
+    if backend == "memory":
+        return MemoryJobStore(ttl_seconds)
+    if backend == "sqlite":
+        logger.info(f"Using SQLite job store at {path}")
+        return SQLiteJobStore(path, ttl_seconds)
+    if backend == "redis":
+        logger.info("Using Redis job store")
+        return RedisJobStore(redis_client(settings.redis_url), ttl_seconds, prefix=settings.redis_key_prefix)
+    raise ValueError(f"Unknown job store backend: {backend}. Available: memory, sqlite, redis")
+
+
+# Global job store instance
+job_store = create_job_store(
+    backend=settings.job_store_backend,
+    path=settings.job_store_path,
+    ttl_seconds=settings.job_ttl_seconds,
+)
@@ -1,7 +1,10 @@
 """FastAPI application for Stable Diffusion image generation."""
 import os
 import uuid
+import asyncio
 import base64
+import hashlib
+import hmac
 import logging
 import subprocess
 from io import BytesIO
@@ -15,15 +18,30 @@ try:
     register_heif_opener()
 except ImportError:
     pass  # HEIC support not available
-from fastapi import FastAPI, HTTPException, BackgroundTasks, File, UploadFile, Form
+from fastapi import FastAPI, HTTPException, File, UploadFile, Form, Query, Header, WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from starlette.responses import Response
+from starlette.concurrency import run_in_threadpool
 from contextlib import asynccontextmanager
 
 from .config import settings, MODEL_CONFIGS, LORA_CONFIGS
-from .models import sd_model
+from .inference import inference, GenerationCancelled
+from .job_queue import job_queue, QueuedJob, QueueFullError
+from .job_store import job_store, FINISHED_STATUSES
+from .admission import admission, AdmissionRejected
+from .timings import step_timings, effective_steps, predict_remaining
+from .coalescing import coalescer, request_fingerprint
+from .scheduling import job_cost
+from .result_cache import result_cache, versioned_cache_key
+from .usage import usage_tracker
+from .shared_queue import shared_queue, QueueNode, node_id
+from .events import event_broker, format_sse, STORE_CHECK_SECONDS, KEEPALIVE_SECONDS, MAX_STREAM_JOBS
+from .previews import preview_hub, preview_message, MAX_INTERVAL_STEPS
+from .webhooks import webhook_dispatcher, check_callback_url
+from .preload import preloader
 from .schemas import (
     GenerateRequest,
     GenerateResponse,
@@ -33,6 +51,13 @@ from .schemas import (
     Img2ImgRequest,
     InpaintRequest,
     LoraSpec,
+    BatchGenerateRequest,
+    BatchResponse,
+    BatchStatusResponse,
+    BulkStatusRequest,
+    BulkStatusItem,
+    BulkStatusResponse,
+    SweepRequest,
 )
 
 # Configure logging
@@ -42,9 +67,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Job storage (in production, use Redis or database)
-jobs = {}
-
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -54,16 +76,28 @@ async def lifespan(app: FastAPI):
     # Create output directory
     Path(settings.output_dir).mkdir(parents=True, exist_ok=True)
 
-    # Optionally preload model (commented out for faster startup)
-    # logger.info("Preloading Stable Diffusion model...")
-    # sd_model.load_model()
-    # logger.info("Model preloaded")
+    # Start inference workers (capped at settings.max_concurrent_jobs);
+    # API-only nodes of a shared queue leave generation to the worker nodes
+    if settings.affinity_scheduling:
+        job_queue.warm_check = lambda job: inference.is_pipeline_loaded(job.model_id, job.mode)
+    if shared_queue is None or settings.node_role != "api":
+        inference.start()
+        job_queue.start()
+        # Load settings.preload_models in the background; /api/health reports readiness
+        preloader.start(inference)
+    if queue_node is not None:
+        queue_node.start()
+    webhook_dispatcher.start()
 
     yield
 
     # Cleanup on shutdown
     logger.info("Shutting down...")
-    sd_model.unload_model()
+    if queue_node is not None:
+        queue_node.stop()
+    job_queue.stop(timeout=5)
+    inference.stop()
+    webhook_dispatcher.stop()
 
 
 # Initialize FastAPI app
@@ -305,6 +339,299 @@ def set_finder_comment(filepath: str, metadata: dict):
         pass
 
 
+def build_generation_metadata(
+    generation_time: float,
+    model_key: str,
+    prompt: str,
+    negative_prompt: str | None,
+    num_inference_steps: int,
+    guidance_scale: float,
+    seed: int | None,
+    width: int,
+    height: int,
+    batch_size: int = 1,
+) -> dict:
+    """
+    Build the energy and generation metadata embedded in output images.
+
+    Args:
+        generation_time: Seconds spent generating the image
+        model_key: Model key used for generation
+        prompt: Prompt as submitted
+        negative_prompt: Negative prompt as submitted
+        num_inference_steps: Number of denoising steps
+        guidance_scale: Prompt adherence strength
+        seed: Random seed (None for random)
+        width: Image width in pixels
+        height: Image height in pixels
+        batch_size: Number of images generated in the same pipeline call
+
+    Returns:
+        Dict containing energy and generation info
+    """
+    # Calculate energy consumption (65W base, split across a batched call)
+    energy_wh = round((65.0 * (generation_time / 3600.0)) / batch_size, 2)
+
+    # Determine energy source based on time of day
+    # TODO: Replace with dragon_minds_os API call
+    hour = datetime.now().hour
+    energy_source = "Solar" if 6 <= hour < 18 else "Stored Solar"
+
+    return {
+        "unit": "DW1.24",
+        "generation_time": round(generation_time, 2),
+        "energy_wh": energy_wh,
+        "energy_source": energy_source,
+        "timestamp": datetime.utcnow().isoformat(),
+        "model_key": model_key,
+        "prompt": prompt,
+        "negative_prompt": negative_prompt,
+        "num_inference_steps": num_inference_steps,
+        "guidance_scale": guidance_scale,
+        "seed": seed if seed else "random",
+        "width": width,
+        "height": height,
+    }
+
+
+def save_image_outputs(job_id: str, image, metadata: dict) -> str:
+    """
+    Write the generated image to the output directory.
+
+    Saves the PNG (with energy metadata) for the UI, a clean JPEG with EXIF
+    for paid downloads and a watermarked JPEG for free tier downloads. Each
+    file is encoded exactly once; nothing is kept in memory afterwards.
+
+    Args:
+        job_id: Job identifier used for the output filenames
+        image: PIL Image object
+        metadata: Dict containing energy and generation info
+
+    Returns:
+        URL path of the PNG image
+    """
+    # Add energy metadata to PNG
+    pnginfo = add_energy_metadata(image, metadata)
+
+    # Save PNG for UI/preview
+    filename = f"{job_id}.png"
+    filepath = os.path.join(settings.output_dir, filename)
+    image.save(filepath, pnginfo=pnginfo)
+
+    # Also save JPEG with EXIF for downloads
+    jpeg_filename = f"{job_id}.jpg"
+    jpeg_filepath = os.path.join(settings.output_dir, jpeg_filename)
+
+    # Convert to RGB if needed (JPEG doesn't support RGBA)
+    jpeg_image = image
+    if image.mode in ('RGBA', 'LA', 'P'):
+        rgb_image = Image.new('RGB', image.size, (255, 255, 255))
+        if image.mode == 'P':
+            image_temp = image.convert('RGBA')
+        else:
+            image_temp = image
+        rgb_image.paste(image_temp, mask=image_temp.split()[-1] if image_temp.mode in ('RGBA', 'LA') else None)
+        jpeg_image = rgb_image
+
+    # Save clean JPEG with EXIF (for paid users)
+    exif_bytes = add_energy_metadata_jpeg(metadata)
+    jpeg_image.save(jpeg_filepath, format="JPEG", quality=95, exif=exif_bytes)
+
+    # Also save watermarked version (for free tier users)
+    watermarked_filename = f"{job_id}_watermark.jpg"
+    watermarked_filepath = os.path.join(settings.output_dir, watermarked_filename)
+    watermarked_image = add_watermark(jpeg_image, metadata)
+    watermarked_image.save(watermarked_filepath, format="JPEG", quality=95, exif=exif_bytes)
+
+    return f"/images/{filename}"
+
+
+def build_contact_sheet(images: list, labels: list[str], columns: int, tile_size: int = 256):
+    """
+    Tile images into one labelled overview image.
+
+    Args:
+        images: PIL Images, row by row
+        labels: Caption drawn under each image
+        columns: Images per row
+        tile_size: Longest side of each tile in pixels
+
+    Returns:
+        PIL Image of the contact sheet
+    """
+    from PIL import ImageDraw, ImageFont
+
+    font = ImageFont.load_default()
+    label_height = 20
+    scale = tile_size / max(images[0].size)
+    tile_width, tile_height = int(images[0].width * scale), int(images[0].height * scale)
+    rows = (len(images) + columns - 1) // columns
+
+    sheet = Image.new("RGB", (columns * tile_width, rows * (tile_height + label_height)), (17, 17, 17))
+    draw = ImageDraw.Draw(sheet)
+    for index, (image, label) in enumerate(zip(images, labels)):
+        x = (index % columns) * tile_width
+        y = (index // columns) * (tile_height + label_height)
+        sheet.paste(image.convert("RGB").resize((tile_width, tile_height), Image.Resampling.LANCZOS), (x, y))
+        draw.text((x + 4, y + tile_height + 4), label, fill=(230, 230, 230), font=font)
+    return sheet
+
+
+def read_image_base64(image_url: str) -> str | None:
+    """
+    Base64-encode a generated image from disk.
+
+    Args:
+        image_url: URL path returned by save_image_outputs (e.g. /images/<job_id>.png)
+
+    Returns:
+        Base64 string, or None if the file no longer exists
+    """
+    filepath = os.path.join(settings.output_dir, os.path.basename(image_url))
+    try:
+        with open(filepath, "rb") as f:
+            return base64.b64encode(f.read()).decode("utf-8")
+    except FileNotFoundError:
+        return None
+
+
+def update_job(job_id: str, **fields):
+    """
+    Update a job and every identical request attached to it.
+
+    Task functions write through this so coalesced duplicates (see
+    app.coalescing) see the leader's progress and share its result, open
+    event and preview streams (see app.events, app.previews) are notified,
+    and finished jobs send their completion webhook.
+    """
+    finished = fields.get("status") in FINISHED_STATUSES
+    if finished:
+        job_ids = coalescer.finish(job_id)
+    else:
+        job_ids = coalescer.subscribers(job_id)
+    for subscriber_id in job_ids:
+        job_store.update(subscriber_id, **fields)
+        event_broker.publish(subscriber_id, fields)
+        if finished:
+            preview_hub.finish(subscriber_id)
+            notify_webhook(subscriber_id)
+
+
+def trusted_identity(
+    owner: str | None,
+    tier: str | None,
+    identity_token: str | None,
+) -> tuple[str | None, str | None]:
+    """
+    Owner and tier of a request, honored only from a trusted caller.
+
+    Both decide a job's share of compute, so clients must not choose them.
+    Only callers sending the configured identity token (the Rails app, which
+    knows its users and their subscriptions) may set them; other requests
+    run as the anonymous owner at the default tier weight.
+
+    Returns:
+        (owner, tier), or (None, None) for an untrusted caller
+    """
+    if owner is None and tier is None:
+        return None, None
+    if settings.identity_token and identity_token and hmac.compare_digest(
+        identity_token.encode(), settings.identity_token.encode()
+    ):
+        return owner, tier
+    logger.debug("Ignoring owner and tier of a request without a valid identity token")
+    return None, None
+
+
+def callback_fields(callback_url: str | None, callback_secret: str | None) -> dict:
+    """
+    Validate a request's completion webhook (empty without a callback_url).
+
+    Returns:
+        Dict with callback_url and callback_secret, for callback_record
+
+    Raises:
+        HTTPException: 400 if the URL is not http(s) or its host is not allowed,
+            or a secret is given but the shared queue cannot carry it
+    """
+    if not callback_url:
+        return {}
+    try:
+        check_callback_url(callback_url, settings.webhook_allowed_hosts_list)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if callback_secret and shared_queue is not None and not shared_queue.carries_secrets:
+        raise HTTPException(
+            status_code=400,
+            detail="callback_secret needs SHARED_QUEUE_SECRET_KEY on this server when jobs go through a shared queue",
+        )
+    return {"callback_url": callback_url, "callback_secret": callback_secret}
+
+
+def callback_record(job_id: str, callback: dict | None) -> dict:
+    """
+    Job record fields for a webhook from callback_fields.
+
+    The signing secret is not stored in the record (status endpoints return
+    records, and the SQLite and Redis job stores persist them); the webhook
+    dispatcher keeps it until the job's webhook is sent.
+    """
+    if not callback:
+        return {}
+    webhook_dispatcher.remember_secret(job_id, callback.get("callback_secret"))
+    return {"callback_url": callback["callback_url"]}
+
+
+def notify_webhook(job_id: str):
+    """Queue the completion webhook of a finished job, if its request asked for one."""
+    job = job_store.get(job_id)
+    if job is None or not job.get("callback_url"):
+        return
+    started_at = job.get("started_at")
+    event = f"job.{job['status']}"
+    webhook_dispatcher.enqueue(job["callback_url"], webhook_dispatcher.pop_secret(job_id), event, {
+        "event": event,
+        "job_id": job_id,
+        "status": job["status"],
+        "message": job.get("message"),
+        "image_url": job.get("image_url"),
+        "images": job.get("images"),
+        "contact_sheet_url": job.get("contact_sheet_url"),
+        "generation_time": job.get("generation_time"),
+        "created_at": job["created_at"],
+        "started_at": started_at,
+        "finished_at": job.get("finished_at"),
+        "queue_seconds": round(started_at - job["created_at"], 2) if started_at else None,
+        "owner": job.get("owner"),
+        "batch_id": job.get("batch_id"),
+    })
+
+
+def preview_hooks(job_ids: list[str]) -> dict:
+    """
+    preview_callback and preview_interval arguments for inference.call.
+
+    Sample i of a batched call previews job_ids[i]; a single job gets every
+    sample (all seeds of a sweep cell). Coalesced duplicates get the
+    leader's previews. Previews are only computed while someone watches.
+    """
+    def watchers(job_id: str) -> list[str]:
+        return coalescer.subscribers(job_id)
+
+    def interval() -> int:
+        return preview_hub.interval(
+            subscriber_id for job_id in job_ids for subscriber_id in watchers(job_id)
+        )
+
+    def publish(preview: dict):
+        for index, job_id in enumerate(job_ids):
+            images = preview["images"] if len(job_ids) == 1 else preview["images"][index:index + 1]
+            for subscriber_id in watchers(job_id):
+                preview_hub.publish(subscriber_id, {**preview, "images": images})
+
+    return {"preview_callback": publish, "preview_interval": interval}
+
+
 def generate_image_task(
     job_id: str,
     prompt: str,
@@ -316,27 +643,31 @@ def generate_image_task(
     height: int,
     seed: int | None,
     lora_specs: list | None = None,
+    cache_key: str | None = None,
 ):
-    """Background task for image generation."""
+    """Inference worker task for image generation."""
     try:
         logger.info(f"Starting generation for job {job_id} with model {model_key}")
         if lora_specs:
             logger.info(f"  LoRAs: {lora_specs}")
-        jobs[job_id]["status"] = "processing"
-        jobs[job_id]["progress_percent"] = 0
-
         import time
         start_time = time.time()
 
+        update_job(job_id, status="processing", progress_percent=0, started_at=start_time)
+
         # Convert model_key to model_id
         model_id = settings.get_model_id_from_key(model_key)
 
+        # Only time warm runs; a cold start also includes the pipeline load
+        was_warm = inference.is_pipeline_loaded(model_id, "txt2img")
+
         # Progress callback to update job status
         def update_progress(progress: float):
-            jobs[job_id]["progress_percent"] = round(progress, 1)
+            update_job(job_id, progress_percent=round(progress, 1))
 
         # Generate image
-        image = sd_model.generate_image(
+        image = inference.call(
+            "generate_image",
             prompt=prompt,
             model_id=model_id,
             negative_prompt=negative_prompt,
@@ -346,92 +677,331 @@ def generate_image_task(
             height=height,
             seed=seed,
             progress_callback=update_progress,
+            cancel_check=lambda: job_queue.is_cancelled(job_id),
+            **preview_hooks([job_id]),
             lora_specs=lora_specs,
         )
 
         generation_time = time.time() - start_time
-
-        # Calculate energy consumption (65W base, adjust for concurrent jobs)
-        energy_wh = round((65.0 * (generation_time / 3600.0)), 2)
-
-        # Determine energy source based on time of day
-        # TODO: Replace with dragon_minds_os API call
-        hour = datetime.now().hour
-        energy_source = "Solar" if 6 <= hour < 18 else "Stored Solar"
+        step_timings.record_latency(model_key, generation_time)
+        if was_warm:
+            step_timings.record(
+                model_key,
+                "txt2img",
+                width,
+                height,
+                effective_steps(num_inference_steps),
+                generation_time,
+                lora_count=len(lora_specs or []),
+            )
 
         # Prepare metadata
-        metadata = {
-            "unit": "DW1.24",
-            "generation_time": round(generation_time, 2),
-            "energy_wh": energy_wh,
-            "energy_source": energy_source,
-            "timestamp": datetime.utcnow().isoformat(),
-            "model_key": model_key,
-            "prompt": prompt,
-            "negative_prompt": negative_prompt,
-            "num_inference_steps": num_inference_steps,
-            "guidance_scale": guidance_scale,
-            "seed": seed if seed else "random",
-            "width": width,
-            "height": height,
-        }
+        metadata = build_generation_metadata(
+            generation_time=generation_time,
+            model_key=model_key,
+            prompt=prompt,
+            negative_prompt=negative_prompt,
+            num_inference_steps=num_inference_steps,
+            guidance_scale=guidance_scale,
+            seed=seed,
+            width=width,
+            height=height,
+        )
 
-        # Add energy metadata to PNG
-        pnginfo = add_energy_metadata(image, metadata)
-
-        # Save PNG for UI/preview
-        filename = f"{job_id}.png"
-        filepath = os.path.join(settings.output_dir, filename)
-        image.save(filepath, pnginfo=pnginfo)
-
-        # Also save JPEG with EXIF for downloads
-        jpeg_filename = f"{job_id}.jpg"
-        jpeg_filepath = os.path.join(settings.output_dir, jpeg_filename)
-
-        # Convert to RGB if needed (JPEG doesn't support RGBA)
-        jpeg_image = image
-        if image.mode in ('RGBA', 'LA', 'P'):
-            rgb_image = Image.new('RGB', image.size, (255, 255, 255))
-            if image.mode == 'P':
-                image_temp = image.convert('RGBA')
-            else:
-                image_temp = image
-            rgb_image.paste(image_temp, mask=image_temp.split()[-1] if image_temp.mode in ('RGBA', 'LA') else None)
-            jpeg_image = rgb_image
-
-        # Save clean JPEG with EXIF (for paid users)
-        exif_bytes = add_energy_metadata_jpeg(metadata)
-        jpeg_image.save(jpeg_filepath, format="JPEG", quality=95, exif=exif_bytes)
-
-        # Also save watermarked version (for free tier users)
-        watermarked_filename = f"{job_id}_watermark.jpg"
-        watermarked_filepath = os.path.join(settings.output_dir, watermarked_filename)
-        watermarked_image = add_watermark(jpeg_image, metadata)
-        watermarked_image.save(watermarked_filepath, format="JPEG", quality=95, exif=exif_bytes)
-
-        # Convert to base64 (PNG for preview)
-        buffered = BytesIO()
-        image.save(buffered, format="PNG", pnginfo=pnginfo)
-        image_base64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
+        # Write PNG, JPEG and watermarked JPEG outputs
+        image_url = save_image_outputs(job_id, image, metadata)
+        result_cache.store(cache_key, job_id, round(generation_time, 2))
 
         # Update job status
-        jobs[job_id].update({
-            "status": "completed",
-            "image_url": f"/images/{filename}",
-            "image_base64": image_base64,
-            "generation_time": round(generation_time, 2),
-            "message": "Image generated successfully",
-            "progress_percent": 100,
-        })
+        update_job(
+            job_id,
+            status="completed",
+            image_url=image_url,
+            generation_time=round(generation_time, 2),
+            message="Image generated successfully",
+            progress_percent=100,
+        )
 
         logger.info(f"Job {job_id} completed in {generation_time:.2f}s")
 
+    except GenerationCancelled:
+        logger.info(f"Job {job_id} cancelled")
+        update_job(job_id, status="cancelled", message="Job cancelled")
+
     except Exception as e:
         logger.error(f"Job {job_id} failed: {e}")
-        jobs[job_id].update({
-            "status": "failed",
-            "message": f"Generation failed: {str(e)}",
-        })
+        update_job(
+            job_id,
+            status="failed",
+            message=f"Generation failed: {str(e)}",
+        )
+
+
+def generate_image_batch_task(batch: list[QueuedJob]):
+    """Inference worker task for a batch of compatible txt2img jobs.
+
+    The jobs share a batch key (see txt2img_batch_key), so they run as one
+    batched pipeline call with per-job prompts, negative prompts and seeds.
+    Each job still gets its own output files and status.
+    """
+    job_ids = [job.job_id for job in batch]
+    params = batch[0].kwargs
+    try:
+        logger.info(f"Starting batched generation for jobs {job_ids} with model {params['model_key']}")
+        if params["lora_specs"]:
+            logger.info(f"  LoRAs: {params['lora_specs']}")
+        import time
+        start_time = time.time()
+
+        # The whole batch finishes together, so each job's ETA covers all of it
+        batch_seconds = sum(job.estimated_seconds for job in batch)
+        for job_id in job_ids:
+            update_job(
+                job_id,
+                status="processing",
+                progress_percent=0,
+                started_at=start_time,
+                estimated_seconds=batch_seconds,
+            )
+
+        # Convert model_key to model_id
+        model_id = settings.get_model_id_from_key(params["model_key"])
+
+        # Only time warm runs; a cold start also includes the pipeline load
+        was_warm = inference.is_pipeline_loaded(model_id, "txt2img")
+
+        # Progress callback to update every job in the batch
+        def update_progress(progress: float):
+            for job_id in job_ids:
+                update_job(job_id, progress_percent=round(progress, 1))
+
+        # Generate all images in one pipeline call
+        images = inference.call(
+            "generate_image_batch",
+            prompts=[job.kwargs["prompt"] for job in batch],
+            model_id=model_id,
+            negative_prompts=[job.kwargs["negative_prompt"] for job in batch],
+            num_inference_steps=params["num_inference_steps"],
+            guidance_scale=params["guidance_scale"],
+            width=params["width"],
+            height=params["height"],
+            seeds=[job.kwargs["seed"] for job in batch],
+            progress_callback=update_progress,
+            lora_specs=params["lora_specs"],
+            # Only abort the shared call once every job in the batch is cancelled
+            cancel_check=lambda: all(job_queue.is_cancelled(job_id) for job_id in job_ids),
+            **preview_hooks(job_ids),
+        )
+
+        generation_time = time.time() - start_time
+        step_timings.record_latency(params["model_key"], generation_time)
+        if was_warm:
+            # Record the amortized per-image time so estimates reflect batching
+            step_timings.record(
+                params["model_key"],
+                "txt2img",
+                params["width"],
+                params["height"],
+                effective_steps(params["num_inference_steps"]),
+                generation_time / len(batch),
+                lora_count=len(params["lora_specs"] or []),
+            )
+
+    except GenerationCancelled:
+        logger.info(f"Batch {job_ids} cancelled")
+        for job_id in job_ids:
+            update_job(job_id, status="cancelled", message="Job cancelled")
+        return
+
+    except Exception as e:
+        logger.error(f"Batch {job_ids} failed: {e}")
+        for job_id in job_ids:
+            update_job(
+                job_id,
+                status="failed",
+                message=f"Generation failed: {str(e)}",
+            )
+        return
+
+    for job, image in zip(batch, images):
+        if job_queue.is_cancelled(job.job_id):
+            # Cancelled after the shared call started; discard this sample
+            update_job(job.job_id, status="cancelled", message="Job cancelled")
+            continue
+        try:
+            # Prepare metadata
+            metadata = build_generation_metadata(
+                generation_time=generation_time,
+                model_key=job.kwargs["model_key"],
+                prompt=job.kwargs["prompt"],
+                negative_prompt=job.kwargs["negative_prompt"],
+                num_inference_steps=job.kwargs["num_inference_steps"],
+                guidance_scale=job.kwargs["guidance_scale"],
+                seed=job.kwargs["seed"],
+                width=job.kwargs["width"],
+                height=job.kwargs["height"],
+                batch_size=len(batch),
+            )
+
+            # Write PNG, JPEG and watermarked JPEG outputs
+            image_url = save_image_outputs(job.job_id, image, metadata)
+            result_cache.store(job.kwargs.get("cache_key"), job.job_id, round(generation_time, 2))
+
+            # Update job status
+            update_job(
+                job.job_id,
+                status="completed",
+                image_url=image_url,
+                generation_time=round(generation_time, 2),
+                message=f"Image generated successfully (batch of {len(batch)})",
+                progress_percent=100,
+            )
+
+        except Exception as e:
+            logger.error(f"Job {job.job_id} failed: {e}")
+            update_job(
+                job.job_id,
+                status="failed",
+                message=f"Generation failed: {str(e)}",
+            )
+
+    logger.info(f"Batch of {len(batch)} jobs completed in {generation_time:.2f}s")
+
+
+def txt2img_batch_key(
+    model_key: str,
+    width: int,
+    height: int,
+    num_inference_steps: int,
+    guidance_scale: float,
+    lora_specs: list | None,
+) -> tuple:
+    """
+    Key under which txt2img jobs may share one batched pipeline call.
+
+    Each cached pipeline has a fixed scheduler, so the model key also pins
+    the scheduler. LoRAs are compared as a set of (key, weight) pairs.
+    """
+    loras = tuple(sorted((spec["key"], spec["weight"]) for spec in lora_specs or []))
+    return ("txt2img", model_key, width, height, num_inference_steps, guidance_scale, loras)
+
+
+def generate_sweep_task(
+    job_id: str,
+    prompt: str,
+    model_key: str,
+    negative_prompt: str | None,
+    seeds: list[int],
+    grid: list[dict],
+    width: int,
+    height: int,
+    lora_specs: list | None,
+    contact_sheet: bool,
+):
+    """
+    Inference worker task for a seed sweep over a guidance/steps grid.
+
+    One pipeline call per grid cell renders every seed together, with the
+    prompt encoded once. Each image is saved as its own output, and a
+    contact sheet (one row per cell, one column per seed) is saved if
+    requested.
+    """
+    try:
+        logger.info(f"Starting sweep for job {job_id}: {len(seeds)} seed(s) x {len(grid)} cell(s) with model {model_key}")
+        import time
+        start_time = time.time()
+
+        update_job(job_id, status="processing", progress_percent=0, started_at=start_time)
+
+        # Convert model_key to model_id
+        model_id = settings.get_model_id_from_key(model_key)
+
+        # Only time warm runs; a cold start also includes the pipeline load
+        was_warm = inference.is_pipeline_loaded(model_id, "txt2img")
+
+        def update_progress(progress: float):
+            update_job(job_id, progress_percent=round(progress, 1))
+
+        images = inference.call(
+            "generate_image_sweep",
+            prompt=prompt,
+            model_id=model_id,
+            negative_prompt=negative_prompt,
+            grid=grid,
+            width=width,
+            height=height,
+            seeds=seeds,
+            progress_callback=update_progress,
+            lora_specs=lora_specs,
+            cancel_check=lambda: job_queue.is_cancelled(job_id),
+            **preview_hooks([job_id]),
+        )
+
+        generation_time = time.time() - start_time
+        step_timings.record_latency(model_key, generation_time)
+        if was_warm:
+            # Record per-image step time, amortized over the whole sweep
+            step_timings.record(
+                model_key,
+                "txt2img",
+                width,
+                height,
+                sum(effective_steps(cell["num_inference_steps"]) for cell in grid) * len(seeds),
+                generation_time,
+                lora_count=len(lora_specs or []),
+            )
+
+        results = []
+        labels = []
+        for index, image in enumerate(images):
+            cell = grid[index // len(seeds)]
+            seed = seeds[index % len(seeds)]
+            metadata = build_generation_metadata(
+                generation_time=generation_time,
+                model_key=model_key,
+                prompt=prompt,
+                negative_prompt=negative_prompt,
+                num_inference_steps=cell["num_inference_steps"],
+                guidance_scale=cell["guidance_scale"],
+                seed=seed,
+                width=width,
+                height=height,
+                batch_size=len(images),
+            )
+            image_url = save_image_outputs(f"{job_id}_{index}", image, metadata)
+            results.append({"image_url": image_url, "seed": seed, **cell})
+            labels.append(f"seed {seed} / cfg {cell['guidance_scale']} / {cell['num_inference_steps']} steps")
+
+        contact_sheet_url = None
+        if contact_sheet:
+            filename = f"{job_id}_sheet.png"
+            build_contact_sheet(images, labels, columns=len(seeds)).save(os.path.join(settings.output_dir, filename))
+            contact_sheet_url = f"/images/{filename}"
+
+        update_job(
+            job_id,
+            status="completed",
+            image_url=contact_sheet_url or results[0]["image_url"],
+            images=results,
+            contact_sheet_url=contact_sheet_url,
+            generation_time=round(generation_time, 2),
+            message=f"Sweep of {len(images)} images generated successfully",
+            progress_percent=100,
+        )
+
+        logger.info(f"Sweep job {job_id} completed: {len(images)} images in {generation_time:.2f}s")
+
+    except GenerationCancelled:
+        logger.info(f"Job {job_id} cancelled")
+        update_job(job_id, status="cancelled", message="Job cancelled")
+
+    except Exception as e:
+        logger.error(f"Job {job_id} failed: {e}")
+        update_job(
+            job_id,
+            status="failed",
+            message=f"Generation failed: {str(e)}",
+        )
 
 
 def generate_img2img_task(
@@ -444,25 +1014,29 @@ def generate_img2img_task(
     num_inference_steps: int,
     guidance_scale: float,
     seed: int | None,
+    cache_key: str | None = None,
 ):
-    """Background task for img2img generation."""
+    """Inference worker task for img2img generation."""
     try:
         logger.info(f"Starting img2img generation for job {job_id} with model {model_key}")
-        jobs[job_id]["status"] = "processing"
-        jobs[job_id]["progress_percent"] = 0
-
         import time
         start_time = time.time()
 
+        update_job(job_id, status="processing", progress_percent=0, started_at=start_time)
+
         # Convert model_key to model_id
         model_id = settings.get_model_id_from_key(model_key)
 
+        # Only time warm runs; a cold start also includes the pipeline load
+        was_warm = inference.is_pipeline_loaded(model_id, "img2img")
+
         # Progress callback to update job status
         def update_progress(progress: float):
-            jobs[job_id]["progress_percent"] = round(progress, 1)
+            update_job(job_id, progress_percent=round(progress, 1))
 
         # Generate image from image
-        image = sd_model.generate_image_from_image(
+        image = inference.call(
+            "generate_image_from_image",
             init_image=init_image,
             prompt=prompt,
             model_id=model_id,
@@ -472,91 +1046,65 @@ def generate_img2img_task(
             guidance_scale=guidance_scale,
             seed=seed,
             progress_callback=update_progress,
+            cancel_check=lambda: job_queue.is_cancelled(job_id),
+            **preview_hooks([job_id]),
         )
 
         generation_time = time.time() - start_time
-
-        # Calculate energy consumption (65W base, adjust for concurrent jobs)
-        energy_wh = round((65.0 * (generation_time / 3600.0)), 2)
-
-        # Determine energy source based on time of day
-        # TODO: Replace with dragon_minds_os API call
-        hour = datetime.now().hour
-        energy_source = "Solar" if 6 <= hour < 18 else "Stored Solar"
+        step_timings.record_latency(model_key, generation_time)
+        if was_warm:
+            step_timings.record(
+                model_key,
+                "img2img",
+                init_image.width,
+                init_image.height,
+                effective_steps(num_inference_steps, strength),
+                generation_time,
+            )
 
         # Prepare metadata
-        metadata = {
-            "unit": "DW1.24",
-            "generation_time": round(generation_time, 2),
-            "energy_wh": energy_wh,
-            "energy_source": energy_source,
-            "timestamp": datetime.utcnow().isoformat(),
-            "model_key": model_key,
-            "prompt": prompt,
-            "negative_prompt": negative_prompt,
-            "num_inference_steps": num_inference_steps,
-            "guidance_scale": guidance_scale,
-            "seed": seed if seed else "random",
-            "width": init_image.width,
-            "height": init_image.height,
-        }
+        metadata = build_generation_metadata(
+            generation_time=generation_time,
+            model_key=model_key,
+            prompt=prompt,
+            negative_prompt=negative_prompt,
+            num_inference_steps=num_inference_steps,
+            guidance_scale=guidance_scale,
+            seed=seed,
+            width=init_image.width,
+            height=init_image.height,
+        )
 
-        # Add energy metadata to PNG
-        pnginfo = add_energy_metadata(image, metadata)
-
-        # Save PNG for UI/preview
-        filename = f"{job_id}.png"
-        filepath = os.path.join(settings.output_dir, filename)
-        image.save(filepath, pnginfo=pnginfo)
-
-        # Also save JPEG with EXIF for downloads
-        jpeg_filename = f"{job_id}.jpg"
-        jpeg_filepath = os.path.join(settings.output_dir, jpeg_filename)
-
-        # Convert to RGB if needed (JPEG doesn't support RGBA)
-        jpeg_image = image
-        if image.mode in ('RGBA', 'LA', 'P'):
-            rgb_image = Image.new('RGB', image.size, (255, 255, 255))
-            if image.mode == 'P':
-                image_temp = image.convert('RGBA')
-            else:
-                image_temp = image
-            rgb_image.paste(image_temp, mask=image_temp.split()[-1] if image_temp.mode in ('RGBA', 'LA') else None)
-            jpeg_image = rgb_image
-
-        # Save clean JPEG with EXIF (for paid users)
-        exif_bytes = add_energy_metadata_jpeg(metadata)
-        jpeg_image.save(jpeg_filepath, format="JPEG", quality=95, exif=exif_bytes)
-
-        # Also save watermarked version (for free tier users)
-        watermarked_filename = f"{job_id}_watermark.jpg"
-        watermarked_filepath = os.path.join(settings.output_dir, watermarked_filename)
-        watermarked_image = add_watermark(jpeg_image, metadata)
-        watermarked_image.save(watermarked_filepath, format="JPEG", quality=95, exif=exif_bytes)
-
-        # Convert to base64 (PNG for preview)
-        buffered = BytesIO()
-        image.save(buffered, format="PNG", pnginfo=pnginfo)
-        image_base64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
+        # Write PNG, JPEG and watermarked JPEG outputs
+        image_url = save_image_outputs(job_id, image, metadata)
+        result_cache.store(cache_key, job_id, round(generation_time, 2))
 
         # Update job status
-        jobs[job_id].update({
-            "status": "completed",
-            "image_url": f"/images/{filename}",
-            "image_base64": image_base64,
-            "generation_time": round(generation_time, 2),
-            "message": "Img2img generated successfully",
-            "progress_percent": 100,
-        })
+        update_job(
+            job_id,
+            status="completed",
+            image_url=image_url,
+            generation_time=round(generation_time, 2),
+            message="Img2img generated successfully",
+            progress_percent=100,
+        )
 
         logger.info(f"Img2img job {job_id} completed in {generation_time:.2f}s")
 
+    except GenerationCancelled:
+        logger.info(f"Job {job_id} cancelled")
+        update_job(job_id, status="cancelled", message="Job cancelled")
+
     except Exception as e:
         logger.error(f"Img2img job {job_id} failed: {e}")
-        jobs[job_id].update({
-            "status": "failed",
-            "message": f"Img2img generation failed: {str(e)}",
-        })
+        update_job(
+            job_id,
+            status="failed",
+            message=f"Img2img generation failed: {str(e)}",
+        )
+
+    finally:
+        admission.release_uploads(job_id)
 
 
 def generate_inpaint_task(
@@ -573,27 +1121,31 @@ def generate_inpaint_task(
     blur_mask: bool,
     blur_factor: int,
     lora_specs: list | None = None,
+    cache_key: str | None = None,
 ):
-    """Background task for inpainting generation."""
+    """Inference worker task for inpainting generation."""
     try:
         logger.info(f"Starting inpaint generation for job {job_id} with model {model_key}")
         if lora_specs:
             logger.info(f"  LoRAs: {lora_specs}")
-        jobs[job_id]["status"] = "processing"
-        jobs[job_id]["progress_percent"] = 0
-
         import time
         start_time = time.time()
 
+        update_job(job_id, status="processing", progress_percent=0, started_at=start_time)
+
         # Convert model_key to model_id
         model_id = settings.get_model_id_from_key(model_key)
 
+        # Only time warm runs; a cold start also includes the pipeline load
+        was_warm = inference.is_pipeline_loaded(model_id, "inpaint")
+
         # Progress callback to update job status
         def update_progress(progress: float):
-            jobs[job_id]["progress_percent"] = round(progress, 1)
+            update_job(job_id, progress_percent=round(progress, 1))
 
         # Generate inpainted image
-        image = sd_model.generate_image_inpaint(
+        image = inference.call(
+            "generate_image_inpaint",
             init_image=init_image,
             mask_image=mask_image,
             prompt=prompt,
@@ -606,127 +1158,494 @@ def generate_inpaint_task(
             blur_mask=blur_mask,
             blur_factor=blur_factor,
             progress_callback=update_progress,
+            cancel_check=lambda: job_queue.is_cancelled(job_id),
+            **preview_hooks([job_id]),
             lora_specs=lora_specs,
         )
 
         generation_time = time.time() - start_time
-
-        # Calculate energy consumption (65W base, adjust for concurrent jobs)
-        energy_wh = round((65.0 * (generation_time / 3600.0)), 2)
-
-        # Determine energy source based on time of day
-        # TODO: Replace with dragon_minds_os API call
-        hour = datetime.now().hour
-        energy_source = "Solar" if 6 <= hour < 18 else "Stored Solar"
+        step_timings.record_latency(model_key, generation_time)
+        if was_warm:
+            step_timings.record(
+                model_key,
+                "inpaint",
+                init_image.width,
+                init_image.height,
+                effective_steps(num_inference_steps, strength),
+                generation_time,
+                lora_count=len(lora_specs or []),
+            )
 
         # Prepare metadata
-        metadata = {
-            "unit": "DW1.24",
-            "generation_time": round(generation_time, 2),
-            "energy_wh": energy_wh,
-            "energy_source": energy_source,
-            "timestamp": datetime.utcnow().isoformat(),
-            "model_key": model_key,
-            "prompt": prompt,
-            "negative_prompt": negative_prompt,
-            "num_inference_steps": num_inference_steps,
-            "guidance_scale": guidance_scale,
-            "seed": seed if seed else "random",
-            "width": init_image.width,
-            "height": init_image.height,
-        }
+        metadata = build_generation_metadata(
+            generation_time=generation_time,
+            model_key=model_key,
+            prompt=prompt,
+            negative_prompt=negative_prompt,
+            num_inference_steps=num_inference_steps,
+            guidance_scale=guidance_scale,
+            seed=seed,
+            width=init_image.width,
+            height=init_image.height,
+        )
 
-        # Add energy metadata to PNG
-        pnginfo = add_energy_metadata(image, metadata)
-
-        # Save PNG for UI/preview
-        filename = f"{job_id}.png"
-        filepath = os.path.join(settings.output_dir, filename)
-        image.save(filepath, pnginfo=pnginfo)
-
-        # Also save JPEG with EXIF for downloads
-        jpeg_filename = f"{job_id}.jpg"
-        jpeg_filepath = os.path.join(settings.output_dir, jpeg_filename)
-
-        # Convert to RGB if needed (JPEG doesn't support RGBA)
-        jpeg_image = image
-        if image.mode in ('RGBA', 'LA', 'P'):
-            rgb_image = Image.new('RGB', image.size, (255, 255, 255))
-            if image.mode == 'P':
-                image_temp = image.convert('RGBA')
-            else:
-                image_temp = image
-            rgb_image.paste(image_temp, mask=image_temp.split()[-1] if image_temp.mode in ('RGBA', 'LA') else None)
-            jpeg_image = rgb_image
-
-        # Save clean JPEG with EXIF (for paid users)
-        exif_bytes = add_energy_metadata_jpeg(metadata)
-        jpeg_image.save(jpeg_filepath, format="JPEG", quality=95, exif=exif_bytes)
-
-        # Also save watermarked version (for free tier users)
-        watermarked_filename = f"{job_id}_watermark.jpg"
-        watermarked_filepath = os.path.join(settings.output_dir, watermarked_filename)
-        watermarked_image = add_watermark(jpeg_image, metadata)
-        watermarked_image.save(watermarked_filepath, format="JPEG", quality=95, exif=exif_bytes)
-
-        # Convert to base64 (PNG for preview)
-        buffered = BytesIO()
-        image.save(buffered, format="PNG", pnginfo=pnginfo)
-        image_base64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
+        # Write PNG, JPEG and watermarked JPEG outputs
+        image_url = save_image_outputs(job_id, image, metadata)
+        result_cache.store(cache_key, job_id, round(generation_time, 2))
 
         # Update job status
-        jobs[job_id].update({
-            "status": "completed",
-            "image_url": f"/images/{filename}",
-            "image_base64": image_base64,
-            "generation_time": round(generation_time, 2),
-            "message": "Inpaint generated successfully",
-            "progress_percent": 100,
-        })
+        update_job(
+            job_id,
+            status="completed",
+            image_url=image_url,
+            generation_time=round(generation_time, 2),
+            message="Inpaint generated successfully",
+            progress_percent=100,
+        )
 
         logger.info(f"Inpaint job {job_id} completed in {generation_time:.2f}s")
 
+    except GenerationCancelled:
+        logger.info(f"Job {job_id} cancelled")
+        update_job(job_id, status="cancelled", message="Job cancelled")
+
     except Exception as e:
         logger.error(f"Inpaint job {job_id} failed: {e}")
-        jobs[job_id].update({
-            "status": "failed",
-            "message": f"Inpaint generation failed: {str(e)}",
-        })
+        update_job(
+            job_id,
+            status="failed",
+            message=f"Inpaint generation failed: {str(e)}",
+        )
 
+    finally:
+        admission.release_uploads(job_id)
 
-@app.get("/", tags=["General"])
-async def root():
-    """Root endpoint."""
-    return {
-        "message": "Dragon Wings AI Image Generator API",
-        "version": "1.0.0",
-        "docs": "/docs",
-        "health": "/api/health",
-    }
+
+def resolve_model_id(model_key: str) -> str:
+    """
+    Convert a model key to its Hugging Face model ID for request validation.
+
+    Raises:
+        HTTPException: 400 if the model key is unknown
+    """
+    try:
+        return settings.get_model_id_from_key(model_key)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def admit_job():
+    """
+    Refuse a new job if the queue is too backed up to start it soon.
+
+    Raises:
+        HTTPException: 429 with a Retry-After header if the estimated wait is too long
+    """
+    backlog = shared_queue.backlog_seconds() if shared_queue is not None else job_queue.backlog_seconds()
+    try:
+        admission.check_wait(backlog)
+    except AdmissionRejected as e:
+        logger.warning(f"Rejected job: {e}")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+def reserve_uploads(job_id: str, count: int):
+    """
+    Reserve room for a job's decoded upload images before reading them.
+
+    Raises:
+        HTTPException: 429 with a Retry-After header if too many uploads are held
+    """
+    try:
+        admission.reserve_uploads(job_id, count, retry_after=step_timings.default_step_seconds * settings.default_steps)
+    except AdmissionRejected as e:
+        logger.warning(f"Rejected job {job_id}: {e}")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+# Largest accepted upload image, and the size of the chunks it is read in
+MAX_UPLOAD_MB = 10
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+def read_upload(upload: UploadFile, name: str) -> bytes:
+    """
+    Read an uploaded image in chunks, refusing it once it passes MAX_UPLOAD_MB.
+
+    Uploads with a declared size over the limit are refused without reading
+    them; others are never read further than one chunk past the limit.
+
+    Args:
+        upload: The uploaded file
+        name: Form field name, for the error message
+
+    Raises:
+        HTTPException: 400 if the upload is too large
+    """
+    max_bytes = MAX_UPLOAD_MB * 1024 * 1024
+    too_large = HTTPException(
+        status_code=400,
+        detail=f"{name} too large. Max size: {MAX_UPLOAD_MB}MB",
+    )
+    if upload.size is not None and upload.size > max_bytes:
+        raise too_large
+    chunks = []
+    total = 0
+    while chunk := upload.file.read(UPLOAD_CHUNK_BYTES):
+        total += len(chunk)
+        if total > max_bytes:
+            raise too_large
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def serve_cached_result(
+    cache_key: str | None,
+    prompt: str,
+    cache_mode: str,
+    callback: dict | None = None,
+) -> GenerateResponse | None:
+    """
+    Complete a request immediately from the result cache.
+
+    Args:
+        cache_key: Key from versioned_cache_key (None for unseeded requests)
+        prompt: Prompt stored on the new job record
+        cache_mode: 'use' to look up the cache, 'bypass' to always generate
+        callback: Webhook fields from callback_fields (the webhook fires at once)
+
+    Returns:
+        Response for a completed job, or None on a miss or bypass
+    """
+    if cache_key is None:
+        return None
+    if cache_mode == "bypass":
+        result_cache.record_bypass()
+        return None
+
+    job_id = str(uuid.uuid4())
+    cached = result_cache.lookup(cache_key, job_id)
+    if cached is None:
+        return None
+
+    job_store.create(job_id, {
+        "status": "completed",
+        "prompt": prompt,
+        "message": "Served from result cache",
+        "progress_percent": 100,
+        **cached,
+        **callback_record(job_id, callback),
+    })
+    logger.info(f"Job {job_id} served from result cache")
+    notify_webhook(job_id)
+    return GenerateResponse(**job_store.get(job_id))
+
+
+def validate_cache_mode(cache_mode: str):
+    """
+    Validate the per-request cache option of form-based endpoints.
+
+    Raises:
+        HTTPException: 400 if the value is not 'use' or 'bypass'
+    """
+    if cache_mode not in ("use", "bypass"):
+        raise HTTPException(
+            status_code=400,
+            detail="cache must be 'use' or 'bypass'",
+        )
+
+
+def attach_duplicate(
+    fingerprint: str | None,
+    prompt: str,
+    callback: dict | None = None,
+) -> GenerateResponse | None:
+    """
+    Attach a request to an identical in-flight job instead of queueing it.
+
+    Args:
+        fingerprint: Request fingerprint from request_fingerprint (None never attaches)
+        prompt: Prompt stored on the new job record
+        callback: Webhook fields from callback_fields
+
+    Returns:
+        Response for the new (attached) job, or None if there is nothing to attach to
+    """
+    job_id = str(uuid.uuid4())
+
+    def create_record(leader_id: str):
+        leader = job_store.get(leader_id) or {}
+        job_store.create(job_id, {
+            "status": leader.get("status", "queued"),
+            "prompt": prompt,
+            "message": f"Sharing result of identical job {leader_id}",
+            "progress_percent": leader.get("progress_percent"),
+            "estimated_seconds": leader.get("estimated_seconds"),
+            "started_at": leader.get("started_at"),
+            "coalesced_with": leader_id,
+            **callback_record(job_id, callback),
+        })
+
+    leader_id = coalescer.attach(fingerprint, job_id, on_attach=create_record)
+    if leader_id is None:
+        return None
+
+    logger.info(f"Job {job_id} attached to identical in-flight job {leader_id}")
+    return GenerateResponse(**job_store.get(job_id))
+
+
+def enqueue_job(job: QueuedJob, fingerprint: str | None = None):
+    """Submit a job to the inference queue, rejecting it if the queue is full.
+
+    With a shared queue the job is handed to whichever worker node leases
+    it. Identical requests are then not coalesced, since the node running
+    the job cannot update duplicates attached on this node.
+
+    Args:
+        job: The queued job; its record must already exist in the job store
+        fingerprint: Request fingerprint; identical later requests attach to this job
+
+    Raises:
+        HTTPException: 503 if the queue is at its depth limit
+    """
+    try:
+        if shared_queue is not None:
+            # The node that finishes the job sends its webhook; the queue stores the secret encrypted
+            job.callback_secret = webhook_dispatcher.pop_secret(job.job_id)
+            shared_queue.put(job)
+            # Upload images now wait on shared storage instead of in memory
+            admission.release_uploads(job.job_id)
+        else:
+            coalescer.register(fingerprint, job.job_id)
+            job_queue.submit(job)
+    except QueueFullError as e:
+        job_store.delete(job.job_id)
+        webhook_dispatcher.pop_secret(job.job_id)
+        admission.release_uploads(job.job_id)
+        # Duplicates that attached in the meantime fail with it
+        for subscriber_id in coalescer.finish(job.job_id):
+            job_store.update(subscriber_id, status="failed", message=str(e))
+            notify_webhook(subscriber_id)
+        logger.warning(f"Rejected job {job.job_id}: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+# Task functions by name, for jobs handed between nodes through the shared queue
+TASKS = {
+    task.__name__: task
+    for task in (generate_image_task, generate_sweep_task, generate_img2img_task, generate_inpaint_task)
+}
+
+
+def bind_task(job: QueuedJob) -> QueuedJob:
+    """Replace the task name of a job leased from the shared queue with the function."""
+    if job.task not in TASKS:
+        raise ValueError(f"Unknown task: {job.task}")
+    job.task = TASKS[job.task]
+    webhook_dispatcher.remember_secret(job.job_id, job.callback_secret)
+    if job.task is generate_image_task:
+        job.batch_task = generate_image_batch_task
+        job.batch_key = txt2img_batch_key(
+            job.kwargs["model_key"],
+            job.kwargs["width"],
+            job.kwargs["height"],
+            job.kwargs["num_inference_steps"],
+            job.kwargs["guidance_scale"],
+            job.kwargs["lora_specs"],
+        )
+    return job
+
+
+# Feeds shared-queue jobs to this node's inference workers (worker nodes only)
+queue_node = None
+if shared_queue is not None and settings.node_role != "api":
+    queue_node = QueueNode(
+        shared=shared_queue,
+        local=job_queue,
+        node_id=node_id,
+        bind_task=bind_task,
+        on_dropped=lambda job_id, status, message: update_job(job_id, status=status, message=message),
+        heartbeat_seconds=settings.heartbeat_seconds,
+    )
+
+
+def queue_wait_estimates() -> dict[str, tuple[int, float]]:
+    """
+    Queue position and wait of every queued job, from one snapshot of the queue order.
+
+    For endpoints reporting many jobs at once; see job_eta.
+    """
+    waits = shared_queue.wait_estimates() if shared_queue is not None else {}
+    waits.update(job_queue.wait_estimates())
+    return waits
+
+
+def job_eta(job: dict, waits: dict[str, tuple[int, float]] | None = None) -> tuple[int | None, float | None]:
+    """
+    Queue position and estimated seconds until a job finishes.
+
+    Queued jobs wait for the work ahead of them and then run for their
+    estimated time. Running jobs blend the estimate with their observed
+    progress rate. Finished jobs have no ETA.
+
+    Args:
+        job: Job record from the job store
+        waits: Snapshot from queue_wait_estimates, to look up many jobs
+            without ordering the queue for each
+
+    Returns:
+        (queue_position, eta_seconds); either may be None
+    """
+    import time
+
+    estimated_seconds = job.get("estimated_seconds") or 0.0
+    if job["status"] == "queued":
+        leader_id = coalescer.leader_of(job["job_id"])
+        if waits is not None:
+            wait = waits.get(leader_id) or waits.get(job["job_id"])
+        else:
+            wait = job_queue.wait_estimate(leader_id)
+            if wait is None and shared_queue is not None:
+                wait = shared_queue.wait_estimate(job["job_id"])
+        if wait is None:
+            # Queued by another API process; only the job's own run time is known
+            return None, round(estimated_seconds, 1)
+        position, wait_seconds = wait
+        return position, round(wait_seconds + estimated_seconds, 1)
+    if job["status"] == "processing":
+        elapsed = time.time() - (job.get("started_at") or time.time())
+        return None, round(predict_remaining(estimated_seconds, elapsed, job.get("progress_percent")), 1)
+    return None, None
+
+
+def job_snapshot(job: dict) -> dict:
+    """Public view of a job record, as sent by the status and event endpoints."""
+    queue_position, eta_seconds = job_eta(job)
+    return {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "message": job.get("message"),
+        "progress_percent": job.get("progress_percent"),
+        "queue_position": queue_position,
+        "eta_seconds": eta_seconds,
+        "image_url": job.get("image_url"),
+        "generation_time": job.get("generation_time"),
+        "images": job.get("images"),
+        "contact_sheet_url": job.get("contact_sheet_url"),
+    }
+
+
+async def stream_job_events(job_ids: list[str]):
+    """
+    Yield Server-Sent Events for jobs until every one of them has finished.
+
+    Each job first gets a ``status`` event with its current state. After
+    that it gets ``status`` on every state transition, ``progress`` when
+    its progress, queue position or message changes (ETA included), and a
+    final ``result`` event. Updates are pushed by update_job. The store is
+    also re-read every STORE_CHECK_SECONDS, which catches jobs run by other
+    processes or nodes.
+    """
+    import time
+
+    subscription = event_broker.subscribe(job_ids)
+    last_sent: dict[str, dict] = {}
+    pending = set(job_ids)
+
+    def next_event(job_id: str) -> str | None:
+        job = job_store.get(job_id)
+        if job is None:
+            pending.discard(job_id)
+            return format_sse("error", {"job_id": job_id, "message": f"Job {job_id} not found"})
+        snapshot = job_snapshot(job)
+        # ETA drifts with time alone; it is re-sent with the next real change
+        comparable = {key: value for key, value in snapshot.items() if key != "eta_seconds"}
+        previous = last_sent.get(job_id)
+        if previous == comparable:
+            return None
+        last_sent[job_id] = comparable
+        if job["status"] in FINISHED_STATUSES:
+            pending.discard(job_id)
+            return format_sse("result", snapshot)
+        if previous is None or previous["status"] != snapshot["status"]:
+            return format_sse("status", snapshot)
+        return format_sse("progress", snapshot)
+
+    try:
+        for job_id in job_ids:
+            message = await run_in_threadpool(next_event, job_id)
+            if message:
+                yield message
+        last_message = time.time()
+        while pending:
+            try:
+                job_id, _ = await asyncio.wait_for(subscription.queue.get(), timeout=STORE_CHECK_SECONDS)
+                changed = [job_id]
+            except asyncio.TimeoutError:
+                changed = list(pending)
+            for job_id in changed:
+                if job_id not in pending:
+                    continue
+                message = await run_in_threadpool(next_event, job_id)
+                if message:
+                    yield message
+                    last_message = time.time()
+            if time.time() - last_message >= KEEPALIVE_SECONDS:
+                yield ": keepalive\n\n"
+                last_message = time.time()
+    finally:
+        event_broker.unsubscribe(subscription)
+
+
+# Headers that keep proxies from buffering or caching event streams
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+@app.get("/", tags=["General"])
+async def root():
+    """Root endpoint."""
+    return {
+        "message": "Dragon Wings AI Image Generator API",
+        "version": "1.0.0",
+        "docs": "/docs",
+        "health": "/api/health",
+    }
 
 
 @app.get("/api/health", response_model=HealthResponse, tags=["General"])
-async def health_check():
-    """Health check endpoint."""
-    return HealthResponse(
+async def health_check(require_ready: bool = False):
+    """
+    Health check endpoint.
+
+    Args:
+        require_ready: Answer 503 until startup preloading has finished, for
+            load balancer readiness checks (liveness checks should omit it)
+    """
+    health = HealthResponse(
         status="healthy",
-        model_loaded=sd_model.is_loaded,
+        model_loaded=inference.is_loaded,
         model_id=settings.model_id,
         device=settings.device,
         version="1.0.0",
+        ready=preloader.is_ready,
+        readiness=preloader.readiness,
+        preload=preloader.stats(),
     )
+    if require_ready and not health.ready:
+        return JSONResponse(status_code=503, content=health.model_dump())
+    return health
 
 
-@app.post("/api/generate", response_model=GenerateResponse, tags=["Generation"])
-async def generate_image(
-    request: GenerateRequest,
-    background_tasks: BackgroundTasks,
-):
+def validate_txt2img(request: GenerateRequest | SweepRequest) -> tuple[str, list | None, dict]:
     """
-    Generate an image from a text prompt.
+    Validate a txt2img request and resolve its model, LoRAs and webhook.
 
-    The generation happens asynchronously in the background.
-    Use the returned job_id to check status via /api/status/{job_id}.
+    Returns:
+        (model_id, lora_specs, callback) where lora_specs is a list of
+        {key, weight} or None and callback comes from callback_fields
+
+    Raises:
+        HTTPException: 400 if the dimensions, model, LoRAs or callback URL are invalid
     """
     # Validate dimensions (must be multiple of 8)
     if request.width % 8 != 0 or request.height % 8 != 0:
@@ -735,6 +1654,11 @@ async def generate_image(
             detail="Width and height must be multiples of 8",
         )
 
+    model_id = resolve_model_id(request.model_key)
+
+    # Reject unusable webhook targets before anything is queued
+    callback = callback_fields(request.callback_url, request.callback_secret)
+
     # Validate LoRA compatibility and convert to lora_specs format
     lora_specs = None
     if request.loras:
@@ -757,39 +1681,372 @@ async def generate_image(
                 "weight": weight,
             })
 
+    return model_id, lora_specs, callback
+
+
+def submit_txt2img(
+    request: GenerateRequest,
+    model_id: str,
+    lora_specs: list | None,
+    callback: dict,
+    admit: bool = True,
+    batch_id: str | None = None,
+) -> GenerateResponse:
+    """
+    Serve a validated txt2img request from the cache, an identical job or a new job.
+
+    Args:
+        request: Request that passed validate_txt2img
+        model_id: Model ID from validate_txt2img
+        lora_specs: LoRA specs from validate_txt2img
+        callback: Webhook fields from validate_txt2img
+        admit: Apply admission control (batches admit once for all items)
+        batch_id: Batch the job belongs to, if any
+
+    Raises:
+        HTTPException: 429 if admission fails, 503 if the queue is full
+    """
+    # Share the result of an identical in-flight request instead of recomputing
+    fingerprint = request_fingerprint("txt2img", {
+        "model_key": request.model_key,
+        "prompt": request.prompt,
+        "negative_prompt": request.negative_prompt,
+        "num_inference_steps": request.num_inference_steps,
+        "guidance_scale": request.guidance_scale,
+        "width": request.width,
+        "height": request.height,
+        "seed": request.seed,
+        "loras": sorted((spec["key"], spec["weight"]) for spec in lora_specs or []),
+    })
+
+    # Seeded requests seen before are served from disk without running the model
+    cache_key = versioned_cache_key(
+        fingerprint, "txt2img", request.model_key, [spec["key"] for spec in lora_specs or []]
+    )
+    cached = serve_cached_result(cache_key, request.prompt, request.cache, callback)
+    if cached is not None:
+        return cached
+
+    duplicate = attach_duplicate(fingerprint, request.prompt, callback)
+    if duplicate is not None:
+        return duplicate
+
+    if admit:
+        admit_job()
+
+    steps = effective_steps(request.num_inference_steps)
+    estimated_seconds = step_timings.estimate(
+        request.model_key, "txt2img", request.width, request.height, steps, lora_count=len(lora_specs or [])
+    )
+    cost = job_cost(request.model_key, steps, request.width, request.height)
+
     # Generate unique job ID
     job_id = str(uuid.uuid4())
 
     # Initialize job status
-    jobs[job_id] = {
-        "job_id": job_id,
-        "status": "pending",
+    job_store.create(job_id, {
+        "status": "queued",
         "prompt": request.prompt,
         "message": "Job queued for processing",
-    }
-
-    # Queue background task
-    background_tasks.add_task(
-        generate_image_task,
+        "model_key": request.model_key,
+        "mode": "txt2img",
+        "estimated_seconds": estimated_seconds,
+        "cost": cost,
+        "owner": request.owner,
+        "tier": request.tier,
+        "batch_id": batch_id,
+        **callback_record(job_id, callback),
+    })
+
+    # Hand off to the inference queue
+    enqueue_job(QueuedJob(
         job_id=job_id,
-        prompt=request.prompt,
-        model_key=request.model_key,
-        negative_prompt=request.negative_prompt,
-        num_inference_steps=request.num_inference_steps,
-        guidance_scale=request.guidance_scale,
-        width=request.width,
-        height=request.height,
-        seed=request.seed,
-        lora_specs=lora_specs,
-    )
+        task=generate_image_task,
+        kwargs={
+            "prompt": request.prompt,
+            "model_key": request.model_key,
+            "negative_prompt": request.negative_prompt,
+            "num_inference_steps": request.num_inference_steps,
+            "guidance_scale": request.guidance_scale,
+            "width": request.width,
+            "height": request.height,
+            "seed": request.seed,
+            "lora_specs": lora_specs,
+            "cache_key": cache_key,
+        },
+        batch_key=txt2img_batch_key(
+            request.model_key,
+            request.width,
+            request.height,
+            request.num_inference_steps,
+            request.guidance_scale,
+            lora_specs,
+        ),
+        batch_task=generate_image_batch_task,
+        model_id=model_id,
+        mode="txt2img",
+        estimated_seconds=estimated_seconds,
+        cost=cost,
+        owner=request.owner,
+        tier=request.tier,
+    ), fingerprint=fingerprint)
 
     logger.info(f"Job {job_id} queued: '{request.prompt[:50]}...' (model: {request.model_key})")
 
-    return GenerateResponse(**jobs[job_id])
+    return GenerateResponse(**job_store.get(job_id))
+
+
+def batch_status(job_statuses: list[str]) -> str:
+    """Aggregate status of a batch from its child job statuses."""
+    unfinished = [status for status in job_statuses if status not in FINISHED_STATUSES]
+    if unfinished:
+        return "queued" if len(unfinished) == len(job_statuses) and set(unfinished) == {"queued"} else "processing"
+    if all(status == "completed" for status in job_statuses):
+        return "completed"
+    if all(status == "cancelled" for status in job_statuses):
+        return "cancelled"
+    if any(status == "completed" for status in job_statuses):
+        return "partial"
+    return "failed"
+
+
+@app.post("/api/generate", response_model=GenerateResponse, tags=["Generation"])
+def generate_image(request: GenerateRequest, x_identity_token: str | None = Header(None)):
+    """
+    Generate an image from a text prompt.
+
+    The generation happens asynchronously in the background.
+    Use the returned job_id to check status via /api/status/{job_id}.
+    """
+    request.owner, request.tier = trusted_identity(request.owner, request.tier, x_identity_token)
+    model_id, lora_specs, callback = validate_txt2img(request)
+    return submit_txt2img(request, model_id, lora_specs, callback)
+
+
+@app.post("/api/generate_batch", response_model=BatchResponse, tags=["Generation"])
+def generate_batch(request: BatchGenerateRequest, x_identity_token: str | None = Header(None)):
+    """
+    Submit many text-to-image prompts in one request.
+
+    Each item becomes a child job, with unset fields taken from ``defaults``
+    and then from the usual GenerateRequest defaults. Every item is
+    validated before any is queued. Children are queued grouped by model
+    and batch key, so compatible items run together in batched pipeline
+    calls while their model is loaded. Poll /api/batches/{batch_id} for
+    aggregate progress, or each child via /api/status/{job_id}.
+    """
+    if len(request.items) > settings.max_batch_request_items:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch has {len(request.items)} items; the limit is {settings.max_batch_request_items}",
+        )
+
+    defaults = request.defaults.model_dump(exclude_none=True) if request.defaults else {}
+    prepared = []
+    for index, item in enumerate(request.items):
+        try:
+            child = GenerateRequest(**{**defaults, **item.model_dump(exclude_none=True)})
+            child.owner, child.tier = trusted_identity(child.owner, child.tier, x_identity_token)
+            # Validated once, after merging the defaults (including any callback)
+            model_id, lora_specs, callback = validate_txt2img(child)
+        except ValidationError as e:
+            errors = "; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors())
+            raise HTTPException(status_code=422, detail=f"Item {index}: {errors}")
+        except HTTPException as e:
+            raise HTTPException(status_code=e.status_code, detail=f"Item {index}: {e.detail}")
+        prepared.append((child, model_id, lora_specs, callback))
+
+    queue_depth = shared_queue.depth if shared_queue is not None else job_queue.depth
+    if queue_depth + len(prepared) > settings.max_queue_size:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Queue cannot take {len(prepared)} more jobs ({queue_depth} of {settings.max_queue_size} waiting). Try again later.",
+        )
+    admit_job()
+
+    batch_id = str(uuid.uuid4())
+    job_ids: list[str | None] = [None] * len(prepared)
+    order = sorted(
+        range(len(prepared)),
+        key=lambda index: (prepared[index][0].model_key, repr(txt2img_batch_key(
+            prepared[index][0].model_key,
+            prepared[index][0].width,
+            prepared[index][0].height,
+            prepared[index][0].num_inference_steps,
+            prepared[index][0].guidance_scale,
+            prepared[index][2],
+        ))),
+    )
+    for index in order:
+        child, model_id, lora_specs, callback = prepared[index]
+        try:
+            job_ids[index] = submit_txt2img(
+                child, model_id, lora_specs, callback, admit=False, batch_id=batch_id
+            ).job_id
+        except HTTPException as e:
+            # Lost a race for queue space; record the item as failed so the batch stays complete
+            job_ids[index] = str(uuid.uuid4())
+            job_store.create(job_ids[index], {
+                "status": "failed",
+                "prompt": child.prompt,
+                "message": str(e.detail),
+                "batch_id": batch_id,
+            })
+
+    job_store.create(batch_id, {
+        "status": "queued",
+        "kind": "batch",
+        "job_ids": job_ids,
+        "message": f"Batch of {len(job_ids)} jobs",
+    })
+    logger.info(f"Batch {batch_id} queued with {len(job_ids)} job(s)")
+
+    return BatchResponse(batch_id=batch_id, status="queued", job_ids=job_ids)
+
+
+@app.get("/api/batches/{batch_id}", response_model=BatchStatusResponse, tags=["Generation"])
+def get_batch_status(batch_id: str):
+    """
+    Check the aggregate status of a batch.
+
+    Progress is the mean over child jobs (finished children count as 100%)
+    and the ETA is that of the last child expected to finish.
+    """
+    batch = job_store.get(batch_id)
+    if batch is None or batch.get("kind") != "batch":
+        raise HTTPException(
+            status_code=404,
+            detail=f"Batch {batch_id} not found",
+        )
+
+    records = job_store.get_many(batch["job_ids"])
+    jobs = []
+    for job_id in batch["job_ids"]:
+        job = records.get(job_id)
+        if job is None:
+            # Expired before the batch record
+            jobs.append(StatusResponse(job_id=job_id, status="expired", message="Job expired"))
+            continue
+        queue_position, eta_seconds = job_eta(job)
+        jobs.append(StatusResponse(
+            job_id=job_id,
+            status=job["status"],
+            image_url=job.get("image_url"),
+            message=job.get("message"),
+            generation_time=job.get("generation_time"),
+            progress_percent=job.get("progress_percent"),
+            queue_position=queue_position,
+            eta_seconds=eta_seconds,
+        ))
+
+    statuses = ["completed" if job.status == "expired" else job.status for job in jobs]
+    status = batch_status(statuses)
+    counts: dict[str, int] = {}
+    for job in jobs:
+        counts[job.status] = counts.get(job.status, 0) + 1
+    progress = [
+        100.0 if job.status in FINISHED_STATUSES or job.status == "expired" else (job.progress_percent or 0.0)
+        for job in jobs
+    ]
+    etas = [job.eta_seconds for job in jobs if job.eta_seconds is not None]
+
+    if status != batch["status"]:
+        # Keep the record current; once every child has finished it expires like a job
+        job_store.update(batch_id, status=status)
+
+    return BatchStatusResponse(
+        batch_id=batch_id,
+        status=status,
+        total=len(jobs),
+        counts=counts,
+        progress_percent=round(sum(progress) / len(progress), 1),
+        eta_seconds=max(etas) if etas else None,
+        jobs=jobs,
+    )
+
+
+@app.post("/api/generate_sweep", response_model=GenerateResponse, tags=["Generation"])
+def generate_sweep(request: SweepRequest, x_identity_token: str | None = Header(None)):
+    """
+    Render one prompt over several seeds, optionally across a guidance/steps grid.
+
+    Every combination of ``guidance_scales`` and ``steps`` is a grid cell.
+    Each cell renders all seeds in one batched pipeline call, with the
+    prompt encoded once for the whole sweep, which costs much less than
+    submitting each seed separately. When the job completes, its status
+    lists every image with its seed and settings, plus a contact sheet if
+    requested.
+    """
+    request.owner, request.tier = trusted_identity(request.owner, request.tier, x_identity_token)
+    model_id, lora_specs, callback = validate_txt2img(request)
+
+    grid = [
+        {"num_inference_steps": steps, "guidance_scale": guidance_scale}
+        for steps in request.steps or [settings.default_steps]
+        for guidance_scale in request.guidance_scales or [settings.default_guidance_scale]
+    ]
+    image_count = len(grid) * len(request.seeds)
+    if image_count > settings.max_sweep_images:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Sweep would render {image_count} images; the limit is {settings.max_sweep_images}",
+        )
+
+    admit_job()
+
+    steps = sum(effective_steps(cell["num_inference_steps"]) for cell in grid) * len(request.seeds)
+    estimated_seconds = step_timings.estimate(
+        request.model_key, "txt2img", request.width, request.height, steps, lora_count=len(lora_specs or [])
+    )
+    cost = job_cost(request.model_key, steps, request.width, request.height)
+
+    # Generate unique job ID
+    job_id = str(uuid.uuid4())
+
+    # Initialize job status
+    job_store.create(job_id, {
+        "status": "queued",
+        "prompt": request.prompt,
+        "message": f"Sweep of {image_count} images queued for processing",
+        "model_key": request.model_key,
+        "mode": "txt2img",
+        "estimated_seconds": estimated_seconds,
+        "cost": cost,
+        "owner": request.owner,
+        "tier": request.tier,
+        **callback_record(job_id, callback),
+    })
+
+    # Hand off to the inference queue
+    enqueue_job(QueuedJob(
+        job_id=job_id,
+        task=generate_sweep_task,
+        kwargs={
+            "prompt": request.prompt,
+            "model_key": request.model_key,
+            "negative_prompt": request.negative_prompt,
+            "seeds": request.seeds,
+            "grid": grid,
+            "width": request.width,
+            "height": request.height,
+            "lora_specs": lora_specs,
+            "contact_sheet": request.contact_sheet,
+        },
+        model_id=model_id,
+        mode="txt2img",
+        estimated_seconds=estimated_seconds,
+        cost=cost,
+        owner=request.owner,
+        tier=request.tier,
+    ))
+
+    logger.info(f"Sweep job {job_id} queued: '{request.prompt[:50]}...' ({image_count} images, model: {request.model_key})")
+
+    return GenerateResponse(**job_store.get(job_id))
 
 
 @app.post("/api/generate_img2img", response_model=GenerateResponse, tags=["Generation"])
-async def generate_img2img(
+def generate_img2img(
     init_image: UploadFile = File(...),
     prompt: str = Form(...),
     model_key: str = Form("sd-v1-5"),
@@ -798,7 +2055,12 @@ async def generate_img2img(
     num_inference_steps: int = Form(50),
     guidance_scale: float = Form(7.5),
     seed: int | None = Form(None),
-    background_tasks: BackgroundTasks = None,
+    cache: str = Form("use"),
+    owner: str | None = Form(None),
+    tier: str | None = Form(None),
+    callback_url: str | None = Form(None),
+    callback_secret: str | None = Form(None),
+    x_identity_token: str | None = Header(None),
 ):
     """
     Generate an image from an initial image and text prompt (img2img).
@@ -814,7 +2076,17 @@ async def generate_img2img(
         num_inference_steps: Number of denoising steps (10-100)
         guidance_scale: How closely to follow prompt (1.0-20.0)
         seed: Random seed for reproducibility
+        cache: Result cache for seeded requests ('use' or 'bypass')
+        owner: Submitting user/account, for fair scheduling and usage (trusted callers only)
+        tier: Owner's tier (free, maker, pro, enterprise; trusted callers only)
+        callback_url: URL to POST the result to when the job finishes
+        callback_secret: Secret for the webhook's HMAC-SHA256 signature
+        x_identity_token: Identity token that lets a trusted caller set owner and tier
     """
+    validate_cache_mode(cache)
+    callback = callback_fields(callback_url, callback_secret)
+    owner, tier = trusted_identity(owner, tier, x_identity_token)
+
     # Validate file type (including iPhone HEIC)
     allowed_types = ["image/png", "image/jpeg", "image/jpg", "image/webp", "image/heic", "image/heif"]
     if init_image.content_type not in allowed_types:
@@ -830,57 +2102,97 @@ async def generate_img2img(
             detail="Strength must be between 0.0 and 1.0",
         )
 
-    # Read and process uploaded image
+    model_id = resolve_model_id(model_key)
+
+    # Generate unique job ID
+    job_id = str(uuid.uuid4())
+
+    # Hold a slot for the upload before reading it, until the job finishes
+    reserve_uploads(job_id, 1)
     try:
-        image_bytes = await init_image.read()
-        init_img = Image.open(BytesIO(image_bytes))
+        image_bytes = read_upload(init_image, "init_image")
 
-        # Validate image size (max 10MB)
-        max_size_mb = 10
-        if len(image_bytes) > max_size_mb * 1024 * 1024:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Image too large. Max size: {max_size_mb}MB",
-            )
+        # Share the result of an identical in-flight request instead of recomputing
+        fingerprint = request_fingerprint("img2img", {
+            "model_key": model_key,
+            "prompt": prompt,
+            "negative_prompt": negative_prompt or None,
+            "strength": strength,
+            "num_inference_steps": num_inference_steps,
+            "guidance_scale": guidance_scale,
+            "seed": seed,
+        }, images=[image_bytes])
 
+        # Seeded requests seen before are served from disk without running the model
+        cache_key = versioned_cache_key(fingerprint, "img2img", model_key, [])
+        served = serve_cached_result(cache_key, prompt, cache, callback) or attach_duplicate(fingerprint, prompt, callback)
+        if served is not None:
+            admission.release_uploads(job_id)
+            return served
+
+        admit_job()
+    except HTTPException:
+        admission.release_uploads(job_id)
+        raise
+
+    # Process uploaded image
+    try:
+        init_img = Image.open(BytesIO(image_bytes))
     except Exception as e:
+        admission.release_uploads(job_id)
         raise HTTPException(
             status_code=400,
             detail=f"Invalid image file: {str(e)}",
         )
 
-    # Generate unique job ID
-    job_id = str(uuid.uuid4())
+    steps = effective_steps(num_inference_steps, strength)
+    estimated_seconds = step_timings.estimate(model_key, "img2img", init_img.width, init_img.height, steps)
+    cost = job_cost(model_key, steps, init_img.width, init_img.height)
 
     # Initialize job status
-    jobs[job_id] = {
-        "job_id": job_id,
-        "status": "pending",
+    job_store.create(job_id, {
+        "status": "queued",
         "prompt": prompt,
         "message": "Img2img job queued for processing",
-    }
-
-    # Queue background task
-    background_tasks.add_task(
-        generate_img2img_task,
+        "model_key": model_key,
+        "mode": "img2img",
+        "estimated_seconds": estimated_seconds,
+        "cost": cost,
+        "owner": owner,
+        "tier": tier,
+        **callback_record(job_id, callback),
+    })
+
+    # Hand off to the inference queue
+    enqueue_job(QueuedJob(
         job_id=job_id,
-        init_image=init_img,
-        prompt=prompt,
-        model_key=model_key,
-        strength=strength,
-        negative_prompt=negative_prompt if negative_prompt else None,
-        num_inference_steps=num_inference_steps,
-        guidance_scale=guidance_scale,
-        seed=seed,
-    )
+        task=generate_img2img_task,
+        kwargs={
+            "init_image": init_img,
+            "prompt": prompt,
+            "model_key": model_key,
+            "strength": strength,
+            "negative_prompt": negative_prompt if negative_prompt else None,
+            "num_inference_steps": num_inference_steps,
+            "guidance_scale": guidance_scale,
+            "seed": seed,
+            "cache_key": cache_key,
+        },
+        model_id=model_id,
+        mode="img2img",
+        estimated_seconds=estimated_seconds,
+        cost=cost,
+        owner=owner,
+        tier=tier,
+    ), fingerprint=fingerprint)
 
     logger.info(f"Img2img job {job_id} queued: '{prompt[:50]}...', model={model_key}, strength={strength}")
 
-    return GenerateResponse(**jobs[job_id])
+    return GenerateResponse(**job_store.get(job_id))
 
 
 @app.post("/api/generate_inpaint", response_model=GenerateResponse, tags=["Generation"])
-async def generate_inpaint(
+def generate_inpaint(
     init_image: UploadFile = File(..., description="Source image to edit"),
     mask_image: UploadFile = File(..., description="Mask image (white=inpaint, black=preserve)"),
     prompt: str = Form(..., description="Text description of what to paint in masked region"),
@@ -893,7 +2205,12 @@ async def generate_inpaint(
     blur_mask: bool = Form(True, description="Whether to blur mask edges"),
     blur_factor: int = Form(33, description="Gaussian blur radius for mask"),
     loras: str | None = Form(None, description="JSON array of LoRA specs [{key, weight}]"),
-    background_tasks: BackgroundTasks = None,
+    cache: str = Form("use", description="Result cache for seeded requests: use or bypass"),
+    owner: str | None = Form(None, description="Submitting user/account, for fair scheduling and usage (trusted callers only)"),
+    tier: str | None = Form(None, description="Owner's tier (free, maker, pro, enterprise; trusted callers only)"),
+    callback_url: str | None = Form(None, description="URL to POST the result to when the job finishes"),
+    callback_secret: str | None = Form(None, description="Secret for the webhook's HMAC-SHA256 signature"),
+    x_identity_token: str | None = Header(None, description="Identity token that lets a trusted caller set owner and tier"),
 ):
     """
     Generate an image using inpainting (selective region editing).
@@ -917,9 +2234,20 @@ async def generate_inpaint(
         blur_mask: Whether to blur mask edges for smoother blending
         blur_factor: Gaussian blur radius for mask (0-100)
         loras: JSON array of LoRA specs, e.g., '[{"key": "watercolor", "weight": 0.8}]'
+        cache: Result cache for seeded requests ('use' or 'bypass')
+        owner: Submitting user/account, for fair scheduling and usage (trusted callers only)
+        tier: Owner's tier (free, maker, pro, enterprise; trusted callers only)
+        callback_url: URL to POST the result to when the job finishes
+        callback_secret: Secret for the webhook's HMAC-SHA256 signature
+        x_identity_token: Identity token that lets a trusted caller set owner and tier
     """
     import json
 
+    model_id = resolve_model_id(model_key)
+    validate_cache_mode(cache)
+    callback = callback_fields(callback_url, callback_secret)
+    owner, tier = trusted_identity(owner, tier, x_identity_token)
+
     # Validate model supports inpainting
     if not settings.supports_inpaint(model_key):
         raise HTTPException(
@@ -980,89 +2308,436 @@ async def generate_inpaint(
                 detail="Invalid loras format. Must be valid JSON array.",
             )
 
-    # Read and process uploaded images
-    try:
-        init_bytes = await init_image.read()
-        mask_bytes = await mask_image.read()
+    # Generate unique job ID
+    job_id = str(uuid.uuid4())
 
-        # Validate sizes (max 10MB each)
-        max_size_mb = 10
-        if len(init_bytes) > max_size_mb * 1024 * 1024:
-            raise HTTPException(
-                status_code=400,
-                detail=f"init_image too large. Max size: {max_size_mb}MB",
-            )
-        if len(mask_bytes) > max_size_mb * 1024 * 1024:
-            raise HTTPException(
-                status_code=400,
-                detail=f"mask_image too large. Max size: {max_size_mb}MB",
-            )
+    # Hold slots for the source and mask before reading them, until the job finishes
+    reserve_uploads(job_id, 2)
+    try:
+        init_bytes = read_upload(init_image, "init_image")
+        mask_bytes = read_upload(mask_image, "mask_image")
 
-        init_img = Image.open(BytesIO(init_bytes))
-        mask_img = Image.open(BytesIO(mask_bytes))
+        # Share the result of an identical in-flight request instead of recomputing
+        fingerprint = request_fingerprint("inpaint", {
+            "model_key": model_key,
+            "prompt": prompt,
+            "negative_prompt": negative_prompt or None,
+            "strength": strength,
+            "num_inference_steps": num_inference_steps,
+            "guidance_scale": guidance_scale,
+            "seed": seed,
+            "blur_mask": blur_mask,
+            "blur_factor": blur_factor,
+            "loras": sorted((spec["key"], spec["weight"]) for spec in lora_specs or []),
+        }, images=[init_bytes, mask_bytes])
+
+        # Seeded requests seen before are served from disk without running the model
+        cache_key = versioned_cache_key(
+            fingerprint, "inpaint", model_key, [spec["key"] for spec in lora_specs or []]
+        )
+        served = serve_cached_result(cache_key, prompt, cache, callback) or attach_duplicate(fingerprint, prompt, callback)
+        if served is not None:
+            admission.release_uploads(job_id)
+            return served
 
+        admit_job()
     except HTTPException:
+        admission.release_uploads(job_id)
         raise
+
+    # Process uploaded images
+    try:
+        init_img = Image.open(BytesIO(init_bytes))
+        mask_img = Image.open(BytesIO(mask_bytes))
     except Exception as e:
+        admission.release_uploads(job_id)
         raise HTTPException(
             status_code=400,
             detail=f"Invalid image file: {str(e)}",
         )
 
-    # Generate unique job ID
-    job_id = str(uuid.uuid4())
+    steps = effective_steps(num_inference_steps, strength)
+    estimated_seconds = step_timings.estimate(
+        model_key, "inpaint", init_img.width, init_img.height, steps, lora_count=len(lora_specs or [])
+    )
+    cost = job_cost(model_key, steps, init_img.width, init_img.height)
 
     # Initialize job status
-    jobs[job_id] = {
-        "job_id": job_id,
-        "status": "pending",
+    job_store.create(job_id, {
+        "status": "queued",
         "prompt": prompt,
         "message": "Inpaint job queued for processing",
-    }
-
-    # Queue background task
-    background_tasks.add_task(
-        generate_inpaint_task,
+        "model_key": model_key,
+        "mode": "inpaint",
+        "estimated_seconds": estimated_seconds,
+        "cost": cost,
+        "owner": owner,
+        "tier": tier,
+        **callback_record(job_id, callback),
+    })
+
+    # Hand off to the inference queue
+    enqueue_job(QueuedJob(
         job_id=job_id,
-        init_image=init_img,
-        mask_image=mask_img,
-        prompt=prompt,
-        model_key=model_key,
-        strength=strength,
-        negative_prompt=negative_prompt if negative_prompt else None,
-        num_inference_steps=num_inference_steps,
-        guidance_scale=guidance_scale,
-        seed=seed,
-        blur_mask=blur_mask,
-        blur_factor=blur_factor,
-        lora_specs=lora_specs,
-    )
+        task=generate_inpaint_task,
+        kwargs={
+            "init_image": init_img,
+            "mask_image": mask_img,
+            "prompt": prompt,
+            "model_key": model_key,
+            "strength": strength,
+            "negative_prompt": negative_prompt if negative_prompt else None,
+            "num_inference_steps": num_inference_steps,
+            "guidance_scale": guidance_scale,
+            "seed": seed,
+            "blur_mask": blur_mask,
+            "blur_factor": blur_factor,
+            "lora_specs": lora_specs,
+            "cache_key": cache_key,
+        },
+        model_id=model_id,
+        mode="inpaint",
+        estimated_seconds=estimated_seconds,
+        cost=cost,
+        owner=owner,
+        tier=tier,
+    ), fingerprint=fingerprint)
 
     logger.info(f"Inpaint job {job_id} queued: '{prompt[:50]}...', model={model_key}, strength={strength}, blur={blur_mask}")
 
-    return GenerateResponse(**jobs[job_id])
+    return GenerateResponse(**job_store.get(job_id))
 
 
 @app.get("/api/status/{job_id}", response_model=StatusResponse, tags=["Generation"])
-async def get_status(job_id: str):
-    """Check the status of a generation job."""
-    if job_id not in jobs:
+def get_status(
+    job_id: str,
+    include: str | None = Query(None, description="Comma-separated extra fields to include (image_base64)"),
+):
+    """
+    Check the status of a generation job.
+
+    Pass ``?include=image_base64`` to receive the finished PNG inline. It is
+    read from disk on demand rather than kept in memory.
+    """
+    job = job_store.get(job_id)
+    if job is None:
         raise HTTPException(
             status_code=404,
             detail=f"Job {job_id} not found",
         )
 
-    job = jobs[job_id]
+    include_fields = {field.strip() for field in include.split(",")} if include else set()
+    image_base64 = None
+    if "image_base64" in include_fields and job.get("image_url"):
+        image_base64 = read_image_base64(job["image_url"])
+
+    queue_position, eta_seconds = job_eta(job)
+
     return StatusResponse(
         job_id=job["job_id"],
         status=job["status"],
         image_url=job.get("image_url"),
+        image_base64=image_base64,
         message=job.get("message"),
         generation_time=job.get("generation_time"),
         progress_percent=job.get("progress_percent"),
+        queue_position=queue_position,
+        eta_seconds=eta_seconds,
+        images=job.get("images"),
+        contact_sheet_url=job.get("contact_sheet_url"),
     )
 
 
+def bulk_status_etag(
+    job_ids: list[str],
+    records: dict[str, dict],
+    waits: dict[str, tuple[int, float]],
+) -> str:
+    """
+    ETag over the stored state of a set of jobs.
+
+    Built from each job's status, last update time and queue position, so
+    it is cheap to compute and changes whenever a listed field would. ETAs
+    are left out (they drift with time alone), hence a weak ETag.
+
+    Args:
+        job_ids: Requested job IDs, in request order
+        records: Job records by ID
+        waits: Snapshot from queue_wait_estimates
+    """
+    digest = hashlib.sha1()
+    for job_id in job_ids:
+        job = records.get(job_id)
+        if job is None:
+            digest.update(f"{job_id}:missing;".encode())
+            continue
+        queue_position = job_eta(job, waits)[0] if job["status"] == "queued" else None
+        digest.update(f"{job_id}:{job['status']}:{job['updated_at']}:{queue_position};".encode())
+    return f'W/"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag."""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag.removeprefix("W/") in (c.removeprefix("W/") for c in candidates)
+
+
+@app.post(
+    "/api/status/bulk",
+    response_model=BulkStatusResponse,
+    response_model_exclude_none=True,
+    tags=["Generation"],
+)
+def bulk_status(
+    request: BulkStatusRequest,
+    response: Response,
+    if_none_match: str | None = Header(None),
+):
+    """
+    Check up to MAX_BULK_STATUS_JOBS jobs in one call.
+
+    Returns compact records in request order, plus the IDs that are unknown
+    or expired. The response carries an ETag over the combined state; send
+    it back as If-None-Match and an unchanged set answers 304 with no body.
+    """
+    job_ids = list(dict.fromkeys(request.job_ids))
+    if len(job_ids) > settings.max_bulk_status_jobs:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Cannot check {len(job_ids)} jobs at once; the limit is {settings.max_bulk_status_jobs}",
+        )
+
+    records = job_store.get_many(job_ids)
+    # One snapshot of the queue order serves every job in the ETag and the body
+    waits = queue_wait_estimates() if any(job["status"] == "queued" for job in records.values()) else {}
+    etag = bulk_status_etag(job_ids, records, waits)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+
+    jobs = []
+    for job_id in job_ids:
+        job = records.get(job_id)
+        if job is None:
+            continue
+        queue_position, eta_seconds = job_eta(job, waits)
+        jobs.append(BulkStatusItem(
+            job_id=job_id,
+            status=job["status"],
+            progress_percent=job.get("progress_percent"),
+            queue_position=queue_position,
+            eta_seconds=eta_seconds,
+            image_url=job.get("image_url"),
+            generation_time=job.get("generation_time"),
+            message=job.get("message"),
+        ))
+
+    return BulkStatusResponse(jobs=jobs, missing=[job_id for job_id in job_ids if job_id not in records])
+
+
+@app.get("/api/jobs/{job_id}/events", tags=["Generation"])
+def job_events(job_id: str):
+    """
+    Stream a job's progress as Server-Sent Events instead of polling /api/status.
+
+    Events: ``status`` (current state, then each transition), ``progress``
+    (step progress, queue position and ETA) and ``result`` (final state with
+    image_url), after which the stream closes. Each event's data is the
+    same JSON object /api/status returns.
+    """
+    if job_store.get(job_id) is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Job {job_id} not found",
+        )
+    return StreamingResponse(stream_job_events([job_id]), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@app.get("/api/events", tags=["Generation"])
+def multiplexed_events(
+    job_ids: str | None = Query(None, description="Comma-separated job IDs to watch"),
+    batch_id: str | None = Query(None, description="Watch every job of a batch from /api/generate_batch"),
+):
+    """
+    Stream events for many jobs over one connection.
+
+    Same events as /api/jobs/{job_id}/events, each carrying its job_id. The
+    stream closes once every watched job has finished.
+    """
+    watched = [job_id.strip() for job_id in job_ids.split(",") if job_id.strip()] if job_ids else []
+    if batch_id:
+        batch = job_store.get(batch_id)
+        if batch is None or batch.get("kind") != "batch":
+            raise HTTPException(
+                status_code=404,
+                detail=f"Batch {batch_id} not found",
+            )
+        watched += batch["job_ids"]
+    watched = list(dict.fromkeys(watched))
+    if not watched:
+        raise HTTPException(status_code=400, detail="Pass job_ids or batch_id")
+    if len(watched) > MAX_STREAM_JOBS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Cannot watch {len(watched)} jobs on one stream; the limit is {MAX_STREAM_JOBS}",
+        )
+    return StreamingResponse(stream_job_events(watched), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@app.websocket("/api/jobs/{job_id}/previews")
+async def job_previews(
+    websocket: WebSocket,
+    job_id: str,
+    every: int = Query(settings.preview_interval_steps, ge=1, le=MAX_INTERVAL_STEPS),
+):
+    """
+    Push live latent previews of a running job over a WebSocket.
+
+    Every ``every`` denoising steps (or less often, see app.previews) the
+    current latents are projected to small JPEG thumbnails and sent as
+    ``{"type": "preview", "step", "total_steps", "images": [data URLs]}``.
+    The cadence backs off when the client cannot keep up, and the client
+    may send ``{"every": n}`` to change it. A final ``{"type": "result",
+    ...}`` message carries the /api/status fields, then the socket closes.
+    """
+    import json
+    import time
+
+    if await run_in_threadpool(job_store.get, job_id) is None:
+        await websocket.close(code=1008, reason=f"Job {job_id} not found")
+        return
+    await websocket.accept()
+    subscription = preview_hub.subscribe(job_id, every)
+    disconnected = asyncio.Event()
+
+    async def receive_controls():
+        try:
+            while True:
+                try:
+                    message = json.loads(await websocket.receive_text())
+                    subscription.set_min_interval(int(message["every"]))
+                except (ValueError, TypeError, KeyError):
+                    continue
+        except WebSocketDisconnect:
+            disconnected.set()
+            subscription.ready.set()
+
+    receiver = asyncio.create_task(receive_controls())
+    try:
+        while not disconnected.is_set():
+            job = await run_in_threadpool(job_store.get, job_id)
+            if job is None or job["status"] in FINISHED_STATUSES:
+                if job is not None:
+                    await websocket.send_json({"type": "result", **job_snapshot(job)})
+                await websocket.close()
+                break
+            try:
+                preview = await asyncio.wait_for(subscription.next(), timeout=STORE_CHECK_SECONDS)
+            except asyncio.TimeoutError:
+                continue
+            if preview is None or disconnected.is_set():
+                continue
+            started = time.perf_counter()
+            await websocket.send_json(preview_message(job_id, preview))
+            subscription.record_send(time.perf_counter() - started)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        preview_hub.unsubscribe(subscription)
+
+
+@app.delete("/api/jobs/{job_id}", response_model=StatusResponse, tags=["Generation"])
+def cancel_job(job_id: str):
+    """
+    Cancel a generation job.
+
+    Queued jobs are removed from the queue immediately. Running jobs stop at
+    the next denoising step and then report status 'cancelled'; with a
+    shared queue, a job running on another node stops after that node's next
+    heartbeat. If identical requests share the job's work, only this request
+    is detached and the work continues for the others.
+    """
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Job {job_id} not found",
+        )
+
+    if job["status"] in FINISHED_STATUSES:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Job {job_id} already {job['status']}",
+        )
+
+    leader_id = coalescer.leader_of(job_id)
+    if coalescer.detach(job_id):
+        # Identical requests still want the result; only this one stops waiting
+        outcome = "detached"
+        job_store.update(job_id, status="cancelled", message="Job cancelled")
+        notify_webhook(job_id)
+    else:
+        outcome = job_queue.cancel(leader_id)
+        if outcome is None and shared_queue is not None:
+            outcome = shared_queue.request_cancel(leader_id)
+        if outcome == "cancelling":
+            update_job(leader_id, message="Cancellation requested, stopping at next step")
+        elif outcome == "removed":
+            admission.release_uploads(leader_id)
+            update_job(leader_id, status="cancelled", message="Job cancelled")
+        else:
+            # Not held by this process: it may have just finished, or been orphaned by a restart
+            job = job_store.get(job_id)
+            if job["status"] in FINISHED_STATUSES:
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"Job {job_id} already {job['status']}",
+                )
+            update_job(job_id, status="cancelled", message="Job cancelled")
+    logger.info(f"Job {job_id} cancel requested ({outcome or 'not in queue'})")
+
+    job = job_store.get(job_id)
+    return StatusResponse(
+        job_id=job["job_id"],
+        status=job["status"],
+        message=job.get("message"),
+        progress_percent=job.get("progress_percent"),
+    )
+
+
+@app.get("/api/queue", tags=["Generation"])
+def queue_stats():
+    """Queue depth, worker usage, model-affinity counters and inference worker health."""
+    return {
+        **job_queue.stats(),
+        "estimated_wait_seconds": round(job_queue.backlog_seconds(), 1),
+        "admission": admission.stats(),
+        "coalescing": coalescer.stats(),
+        "result_cache": result_cache.stats(),
+        "step_timings": step_timings.snapshot(),
+        "inference": inference.stats(),
+        "shared_queue": shared_queue.stats() if shared_queue is not None else None,
+        "webhooks": webhook_dispatcher.stats(),
+        "events": event_broker.stats(),
+        "previews": preview_hub.stats(),
+    }
+
+
+@app.get("/api/usage", tags=["Generation"])
+async def usage_stats():
+    """Measured compute-seconds consumed per owner (lifetime, last 24h and decayed)."""
+    return {"policy": job_queue.policy.name, "owners": usage_tracker.all_usage()}
+
+
+@app.get("/api/usage/{owner}", tags=["Generation"])
+async def owner_usage(owner: str):
+    """Measured compute-seconds consumed by one owner."""
+    return usage_tracker.owner_usage(owner)
+
+
 @app.get("/api/loras", tags=["LoRA"])
 async def list_loras(model_key: str | None = None):
     """
@@ -1133,7 +2808,8 @@ async def list_models():
             continue
         models_with_keys[key] = {
             "key": key,
-            **config
+            **config,
+            "latency": step_timings.model_latency(key),
         }
 
     return {
@@ -1145,6 +2821,19 @@ async def list_models():
     }
 
 
+@app.get("/api/models/cache", tags=["General"])
+async def model_cache_stats():
+    """Loaded pipelines with their measured sizes, plus cache hit/miss/eviction counters.
+
+    One entry per inference process; worker processes report their cache as
+    of their last finished request.
+    """
+    return {
+        "budget_gb": settings.model_cache_budget_gb,
+        "processes": inference.cache_stats(),
+    }
+
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
     """Global exception handler."""
@@ -0,0 +1,357 @@
+"""Memory-budgeted LRU cache of loaded diffusers pipelines."""
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+GB = 1024 ** 3
+
+# (model_id, mode); inpaint pipelines are keyed by their base model ID
+PipelineKey = Tuple[str, str]
+
+# (device, data pointer) of one tensor storage
+StorageKey = Tuple[str, int]
+
+
+def pipeline_storages(pipeline) -> Dict[StorageKey, int]:
+    """Measure the tensor storages held by a pipeline's modules.
+
+    Parameters and buffers of every torch module among the pipeline's
+    components are counted. Storages are keyed by device and data pointer,
+    so tied weights, and weights shared with other pipelines, can be
+    counted once.
+
+    Args:
+        pipeline: A diffusers pipeline (anything with a ``components`` dict)
+
+    Returns:
+        {(device, data_ptr): nbytes}
+    """
+    storages = {}
+    for component in getattr(pipeline, "components", {}).values():
+        if not callable(getattr(component, "parameters", None)):
+            continue
+        for tensor in itertools.chain(component.parameters(), component.buffers()):
+            storage = tensor.untyped_storage()
+            storages[(str(tensor.device), storage.data_ptr())] = storage.nbytes()
+    return storages
+
+
+@dataclass
+class CacheEntry:
+    """A cached pipeline and the storages it keeps resident."""
+
+    pipeline: Any
+    storages: Dict[StorageKey, int]
+    loaded_at: float
+    last_used: float
+    uses: int = 0
+
+    @property
+    def size_bytes(self) -> int:
+        return sum(self.storages.values())
+
+
+class ModelCache:
+    """Loaded pipelines, evicted least recently used first to fit a memory budget.
+
+    Sizes are measured from the parameter and buffer storages of each
+    pipeline once it is loaded. Before a load, room is made for the size
+    measured the last time that pipeline was loaded, or for the caller's
+    prior (the model's ``ram_required_gb``) if it never was. Storages shared
+    between pipelines count once towards the budget, and evicting a
+    pipeline only frees the storages no other cached pipeline uses.
+
+    Pipelines pinned by running generations are never evicted. If pinned
+    pipelines alone exceed the budget, the cache stays over budget until
+    they are released; loads are never refused.
+
+    Loads go through ``load``, which runs one load per pipeline at a time:
+    callers that miss while it is in progress wait for the same load, and
+    share its failure if it fails. Loads of different pipelines, and
+    generations on pipelines already cached, never wait for each other.
+    """
+
+    def __init__(
+        self,
+        budget_bytes: int,
+        on_evict: Optional[Callable[[str, str, Any], None]] = None,
+        release_memory: Optional[Callable[[], None]] = None,
+    ):
+        """
+        Args:
+            budget_bytes: Memory allowed for cached pipelines; 0 means unlimited
+            on_evict: Called as on_evict(model_id, mode, pipeline) after an eviction
+            release_memory: Called once evicted pipelines are no longer referenced
+                (e.g. to run the garbage collector and empty the CUDA cache)
+        """
+        self.budget_bytes = budget_bytes
+        self.on_evict = on_evict
+        self.release_memory = release_memory
+        self._entries: "OrderedDict[PipelineKey, CacheEntry]" = OrderedDict()  # Least recently used first
+        self._pins: Dict[PipelineKey, int] = {}
+        self._measured: Dict[PipelineKey, int] = {}  # Last measured size of every pipeline ever loaded
+        self._loading: Dict[PipelineKey, Future] = {}  # Loads in progress
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+        self.loads = 0
+        self.load_failures = 0
+        self.load_waits = 0  # Misses that waited for a load already in progress
+
+    def __contains__(self, key: PipelineKey) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def keys(self) -> List[PipelineKey]:
+        """Cached (model_id, mode) pairs, least recently used first."""
+        with self._lock:
+            return list(self._entries)
+
+    def get(self, model_id: str, mode: str) -> Optional[Any]:
+        """Look up a pipeline for use, counting a hit or miss.
+
+        Returns:
+            The pipeline, or None if it has to be loaded
+        """
+        key = (model_id, mode)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry.uses += 1
+            entry.last_used = time.time()
+            self._entries.move_to_end(key)
+            return entry.pipeline
+
+    def peek(self, model_id: str, mode: str) -> Optional[Any]:
+        """Look up a pipeline without counting it as a use."""
+        with self._lock:
+            entry = self._entries.get((model_id, mode))
+            return entry.pipeline if entry is not None else None
+
+    def load(self, model_id: str, mode: str, loader: Callable[[], None]):
+        """Load a missing pipeline, once however many callers need it at the same time.
+
+        The first caller runs loader (which should put the pipeline in the
+        cache); callers arriving while it runs block until it finishes.
+
+        Args:
+            model_id: Model the pipeline is loaded for
+            mode: Pipeline mode
+            loader: Loads and caches the pipeline
+
+        Raises:
+            Whatever loader raised, in the first caller and every waiter
+        """
+        key = (model_id, mode)
+        with self._lock:
+            future = self._loading.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._loading[key] = future
+                self.loads += 1
+            else:
+                self.load_waits += 1
+        if not leader:
+            logger.info(f"Waiting for the {mode} pipeline of {model_id} already being loaded")
+            future.result()
+            return
+
+        try:
+            loader()
+        except BaseException as e:
+            with self._lock:
+                self.load_failures += 1
+                del self._loading[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._loading[key]
+        future.set_result(None)
+
+    @property
+    def is_loading(self) -> bool:
+        """Whether any pipeline load is in progress."""
+        with self._lock:
+            return bool(self._loading)
+
+    def wait_for_load(self, model_id: str, mode: str):
+        """Wait for a load of this pipeline in progress, if any (its failure is ignored)."""
+        with self._lock:
+            future = self._loading.get((model_id, mode))
+        if future is not None:
+            try:
+                future.result()
+            except BaseException:
+                pass
+
+    def reserve(self, model_id: str, mode: str, prior_bytes: int):
+        """Evict pipelines to make room for one about to be loaded.
+
+        Args:
+            model_id: Model the pipeline is loaded for
+            mode: Pipeline mode
+            prior_bytes: Expected size if this pipeline was never measured
+        """
+        key = (model_id, mode)
+        with self._lock:
+            expected = self._measured.get(key, prior_bytes)
+            evicted = self._evict(expected, protect=key)
+        self._after_evict(evicted)
+
+    def put(self, model_id: str, mode: str, pipeline):
+        """Cache a loaded pipeline, measuring its size and evicting to fit the budget."""
+        key = (model_id, mode)
+        storages = pipeline_storages(pipeline)
+        now = time.time()
+        with self._lock:
+            entry = CacheEntry(pipeline=pipeline, storages=storages, loaded_at=now, last_used=now)
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._measured[key] = entry.size_bytes
+            evicted = self._evict(0, protect=key)
+            resident = self._resident_bytes()
+        logger.info(
+            f"Cached {mode} pipeline for {model_id}: {entry.size_bytes / GB:.2f} GB "
+            f"({resident / GB:.2f} GB resident)"
+        )
+        self._after_evict(evicted)
+
+    def remove(self, model_id: str, mode: Optional[str] = None) -> int:
+        """Drop a model's pipelines (one mode, or all of them).
+
+        Returns:
+            Number of pipelines removed
+        """
+        with self._lock:
+            keys = [key for key in self._entries if key[0] == model_id and mode in (None, key[1])]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def clear(self):
+        """Drop every cached pipeline."""
+        with self._lock:
+            self._entries.clear()
+
+    @contextmanager
+    def pin(self, model_id: str, mode: str) -> Iterator[None]:
+        """Keep a pipeline from being evicted while a generation uses it.
+
+        The pipeline does not have to be cached yet; a pin taken before a
+        load also protects the freshly loaded pipeline.
+        """
+        key = (model_id, mode)
+        with self._lock:
+            self._pins[key] = self._pins.get(key, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._pins[key] -= 1
+                if not self._pins[key]:
+                    del self._pins[key]
+
+    def resident_bytes(self) -> int:
+        """Bytes held by cached pipelines, counting shared storages once."""
+        with self._lock:
+            return self._resident_bytes()
+
+    def _resident_bytes(self, exclude: Optional[PipelineKey] = None) -> int:
+        storages = {}
+        for key, entry in self._entries.items():
+            if key != exclude:
+                storages.update(entry.storages)
+        return sum(storages.values())
+
+    def _evict(self, incoming_bytes: int, protect: PipelineKey) -> List[Tuple[PipelineKey, CacheEntry, int]]:
+        """Evict unpinned pipelines, oldest use first, until incoming_bytes fit (lock held)."""
+        evicted = []
+        if self.budget_bytes <= 0:
+            return evicted
+        resident = self._resident_bytes()
+        for key in list(self._entries):
+            if resident + incoming_bytes <= self.budget_bytes:
+                break
+            if key == protect or key in self._pins:
+                continue
+            entry = self._entries.pop(key)
+            remaining = self._resident_bytes()
+            freed = resident - remaining
+            resident = remaining
+            self.evictions += 1
+            self.evicted_bytes += freed
+            evicted.append((key, entry, freed))
+        if resident + incoming_bytes > self.budget_bytes:
+            logger.warning(
+                f"Model cache over budget: {(resident + incoming_bytes) / GB:.2f} GB needed, "
+                f"{self.budget_bytes / GB:.2f} GB allowed ({len(self._pins)} pipeline(s) pinned)"
+            )
+        return evicted
+
+    def _after_evict(self, evicted: List[Tuple[PipelineKey, CacheEntry, int]]):
+        """Log evictions and run the eviction hooks (outside the lock)."""
+        if not evicted:
+            return
+        while evicted:
+            (model_id, mode), entry, freed = evicted.pop(0)
+            logger.info(
+                f"Evicted {mode} pipeline for {model_id} "
+                f"(idle {time.time() - entry.last_used:.0f}s, freed {freed / GB:.2f} GB)"
+            )
+            if self.on_evict:
+                try:
+                    self.on_evict(model_id, mode, entry.pipeline)
+                except Exception as e:
+                    logger.warning(f"Eviction hook failed for {model_id} ({mode}): {e}")
+            del entry
+        if self.release_memory:
+            self.release_memory()
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache contents (least recently used first), memory use and counters."""
+        with self._lock:
+            now = time.time()
+            resident = self._resident_bytes()
+            return {
+                "budget_bytes": self.budget_bytes,
+                "resident_bytes": resident,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "evicted_bytes": self.evicted_bytes,
+                "loads": self.loads,
+                "load_failures": self.load_failures,
+                "load_waits": self.load_waits,
+                "loading": [{"model_id": model_id, "mode": mode} for model_id, mode in self._loading],
+                "pipelines": [
+                    {
+                        "model_id": model_id,
+                        "mode": mode,
+                        "size_bytes": entry.size_bytes,
+                        "unique_bytes": resident - self._resident_bytes(exclude=(model_id, mode)),
+                        "pinned": self._pins.get((model_id, mode), 0),
+                        "uses": entry.uses,
+                        "idle_seconds": round(now - entry.last_used, 1),
+                        "age_seconds": round(now - entry.loaded_at, 1),
+                    }
+                    for (model_id, mode), entry in self._entries.items()
+                ],
+            }
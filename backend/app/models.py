@@ -1,7 +1,11 @@
 """Stable Diffusion model management."""
+import functools
+import gc
+import inspect
 import os
 import logging
-from typing import Optional, List, Dict, Any
+from contextlib import contextmanager
+from typing import Optional, List, Dict, Any, Iterator
 from PIL import Image
 import torch
 
@@ -32,11 +36,34 @@ from diffusers import (
     FluxPipeline,
 )
 from PIL import ImageFilter
+from .adapters import AdapterGates, adapter_key
 from .config import settings, LORA_CONFIGS, INPAINT_DEFAULTS
+from .dedup import ComponentDeduplicator
+from .inference import GenerationCancelled
+from .model_cache import GB, ModelCache
+from .previews import PreviewSampler
+from .sharing import derive_pipeline
 
 logger = logging.getLogger(__name__)
 
 
+def pins_pipeline(mode: str):
+    """Pin the (model_id, mode) pipeline in the model cache while a generation method runs."""
+
+    def decorator(method):
+        signature = inspect.signature(method)
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            model_id = signature.bind(self, *args, **kwargs).arguments.get("model_id") or settings.model_id
+            with self.model_cache.pin(model_id, mode):
+                return method(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
 class StableDiffusionModel:
     """Manages the Stable Diffusion model lifecycle with multi-model support."""
 
@@ -53,12 +80,20 @@ class StableDiffusionModel:
     ]
 
     def __init__(self):
-        # Cache for loaded models: {model_id: {"txt2img": pipe, "img2img": pipe}}
-        self.model_cache = {}
+        # Loaded pipelines by (model_id, mode), evicted LRU to fit the memory budget
+        self.model_cache = ModelCache(
+            budget_bytes=int(settings.model_cache_budget_gb * GB),
+            on_evict=self._on_evict,
+            release_memory=self._release_memory,
+        )
+        # Shares identical text encoders/VAEs/UNets between models
+        self.deduplicator = ComponentDeduplicator(settings.model_dedup_components_list)
         self.device = settings.device
         self.current_model_id = settings.model_id
         # Track loaded LoRAs: {model_id: {lora_key: adapter_name}}
         self.loaded_loras: Dict[str, Dict[str, str]] = {}
+        # Keeps modules shared between pipelines on one LoRA set per generation
+        self.adapter_gates = AdapterGates()
 
     def _is_sdxl_model(self, model_id: str) -> bool:
         """Check if the model is an SDXL model."""
@@ -68,6 +103,14 @@ class StableDiffusionModel:
         """Check if the model is a FLUX model."""
         return any(flux_id in model_id for flux_id in self.FLUX_MODEL_IDS)
 
+    def _model_family(self, model_id: str) -> str:
+        """Latent family of a model ('sd15', 'sdxl' or 'flux'), for previews."""
+        if self._is_flux_model(model_id):
+            return "flux"
+        if self._is_sdxl_model(model_id):
+            return "sdxl"
+        return "sd15"
+
     def _get_model_key_from_id(self, model_id: str) -> Optional[str]:
         """Get the model key from a model ID by searching MODEL_CONFIGS."""
         from .config import MODEL_CONFIGS
@@ -76,6 +119,70 @@ class StableDiffusionModel:
                 return key
         return None
 
+    def _prior_bytes(self, model_id: str) -> int:
+        """Expected pipeline size before it was ever measured (the model's ram_required_gb)."""
+        from .config import MODEL_CONFIGS
+        model_key = self._get_model_key_from_id(model_id)
+        if not model_key:
+            return 0
+        return int(MODEL_CONFIGS[model_key].get("ram_required_gb", 0) * GB)
+
+    def _on_evict(self, model_id: str, mode: str, pipeline):
+        """Forget the LoRAs loaded onto an evicted pipeline, unless another cached pipeline shares them."""
+        name = getattr(pipeline.config, "_name_or_path", None)
+        still_cached = any(
+            getattr(getattr(self.model_cache.peek(*key), "config", None), "_name_or_path", None) == name
+            for key in self.model_cache.keys()
+        )
+        if name and not still_cached:
+            self.loaded_loras.pop(name, None)
+
+    def _release_memory(self):
+        """Return memory freed by evicted pipelines to the allocator."""
+        gc.collect()
+        if self.device == "cuda":
+            torch.cuda.empty_cache()
+
+    def _get_pipeline(self, model_id: str, mode: str):
+        """Return a cached pipeline, loading it on a cache miss.
+
+        Concurrent misses on one pipeline share a single load (see
+        ModelCache.load), so two requests for a cold model do not run two
+        from_pretrained calls side by side.
+        """
+        pipe = self.model_cache.get(model_id, mode)
+        if pipe is None:
+            loaders = {
+                "txt2img": self.load_model,
+                "img2img": self.load_img2img_model,
+                "inpaint": self.load_inpaint_model,
+            }
+            # txt2img and img2img are built from each other's modules, so let a
+            # sibling load already in progress finish rather than load the weights twice
+            sibling = {"txt2img": "img2img", "img2img": "txt2img"}.get(mode)
+            if sibling:
+                self.model_cache.wait_for_load(model_id, sibling)
+            self.model_cache.load(model_id, mode, lambda: loaders[mode](model_id))
+            pipe = self.model_cache.peek(model_id, mode)
+        return pipe
+
+    def _derive_pipeline(self, pipeline_class, source, model_id: str):
+        """Build a pipeline around another pipeline's modules, sharing their weights.
+
+        Used to switch a model between txt2img and img2img without a second
+        from_pretrained (see sharing.derive_pipeline).
+
+        Args:
+            pipeline_class: Pipeline to build (e.g. StableDiffusionImg2ImgPipeline)
+            source: Loaded pipeline of the same model whose modules are reused
+            model_id: Hugging Face model ID, recorded as the pipeline's name
+
+        Returns:
+            The new pipeline
+        """
+        scheduler = DPMSolverMultistepScheduler.from_config(source.scheduler.config)
+        return derive_pipeline(pipeline_class, source, model_id, scheduler)
+
     def load_lora(
         self,
         pipeline,
@@ -206,6 +313,11 @@ class StableDiffusionModel:
 
         # Apply the loaded LoRAs
         if adapter_names:
+            try:
+                # A previous generation without LoRAs may have disabled them
+                pipeline.enable_lora()
+            except Exception as e:
+                logger.debug(f"enable_lora not needed or failed: {e}")
             try:
                 pipeline.set_adapters(adapter_names, adapter_weights=adapter_weights)
                 logger.info(
@@ -224,15 +336,48 @@ class StableDiffusionModel:
 
         return trigger_words
 
+    @contextmanager
+    def _lora_scope(self, pipeline, lora_specs: Optional[List[Dict[str, Any]]], model_id: str) -> Iterator[List[str]]:
+        """Apply a generation's LoRAs and keep them until it finishes.
+
+        Derived pipelines share their UNet/transformer and text encoders, so
+        adapters set for one generation would change another running on the
+        same modules. Generations wanting other adapters wait (see
+        AdapterGates.hold); without LoRAs any active ones are disabled.
+
+        Args:
+            pipeline: Pipeline about to generate
+            lora_specs: List of dicts with 'key' and optional 'weight' keys, or None
+            model_id: Model the pipeline belongs to, for compatibility checks
+
+        Yields:
+            Trigger words to prepend to the prompt (if any)
+        """
+        model_key = None
+        if lora_specs:
+            model_key = self._get_model_key_from_id(model_id)
+            if not model_key:
+                logger.warning(f"Could not determine model_key for {model_id}, skipping LoRA application")
+                lora_specs = None
+        with self.adapter_gates.hold(
+            pipeline,
+            adapter_key(lora_specs),
+            lambda: self.apply_loras(pipeline, lora_specs or [], model_key),
+        ) as trigger_words:
+            yield trigger_words
+
     def load_model(self, model_id: str = None):
         """Load the Stable Diffusion model into memory.
 
+        If the model's img2img pipeline is already loaded, the txt2img
+        pipeline is built from its modules instead of being loaded again.
+
         Args:
             model_id: Hugging Face model ID. If None, uses settings.model_id.
         """
         model_id = model_id or settings.model_id
 
-        if model_id in self.model_cache and "txt2img" in self.model_cache[model_id]:
+        if (model_id, "txt2img") in self.model_cache:
             logger.info(f"Model {model_id} already loaded (txt2img)")
             return
 
@@ -275,7 +420,14 @@ class StableDiffusionModel:
             if not is_sdxl and not is_flux:
                 load_kwargs["safety_checker"] = None
 
-            pipe = pipeline_class.from_pretrained(model_id, **load_kwargs)
+            source = None if is_flux else self.model_cache.peek(model_id, "img2img")
+            if source is not None:
+                # Reuse the img2img modules: one copy of the weights and no cold load
+                logger.info(f"Building txt2img pipeline from the loaded img2img pipeline of {model_id}")
+                pipe = self._derive_pipeline(pipeline_class, source, model_id)
+            else:
+                self.model_cache.reserve(model_id, "txt2img", self._prior_bytes(model_id))
+                pipe = pipeline_class.from_pretrained(model_id, **load_kwargs)
 
             # Move to device
             if self.device == "cuda":
@@ -285,6 +437,10 @@ class StableDiffusionModel:
             else:
                 pipe = pipe.to("cpu")
 
+            if source is None:
+                # On the device, so the shared storage is the one generation uses
+                self.deduplicator.deduplicate(model_id, "txt2img", pipe)
+
             # Configure scheduler (only for SD models, FLUX uses its own)
             if not is_flux:
                 # Use faster scheduler (DPM-Solver++)
@@ -310,9 +466,7 @@ class StableDiffusionModel:
                         logger.warning(f"Could not enable xformers: {e}")
 
             # Cache the loaded model
-            if model_id not in self.model_cache:
-                self.model_cache[model_id] = {}
-            self.model_cache[model_id]["txt2img"] = pipe
+            self.model_cache.put(model_id, "txt2img", pipe)
             self.current_model_id = model_id
 
             logger.info(f"Model {model_id} loaded successfully (txt2img)")
@@ -333,6 +487,9 @@ class StableDiffusionModel:
         seed: Optional[int] = None,
         progress_callback: Optional[callable] = None,
         lora_specs: Optional[List[Dict[str, Any]]] = None,
+        cancel_check: Optional[callable] = None,
+        preview_callback: Optional[callable] = None,
+        preview_interval: Optional[callable] = None,
     ):
         """
         Generate an image from a text prompt.
@@ -349,15 +506,85 @@ class StableDiffusionModel:
             progress_callback: Callback function for progress updates
             lora_specs: Optional list of LoRA specifications, each with 'key' and optional 'weight'
                        e.g., [{"key": "thangka", "weight": 0.8}]
+            cancel_check: Optional callable returning True to abort at the next step
+            preview_callback: Optional callable receiving latent previews (see app.previews)
+            preview_interval: Optional callable giving the steps wanted between previews
 
         Returns:
             PIL Image object
+
+        Raises:
+            GenerationCancelled: If cancel_check returned True
+        """
+        return self.generate_image_batch(
+            prompts=[prompt],
+            model_id=model_id,
+            negative_prompts=[negative_prompt],
+            num_inference_steps=num_inference_steps,
+            guidance_scale=guidance_scale,
+            width=width,
+            height=height,
+            seeds=[seed],
+            progress_callback=progress_callback,
+            lora_specs=lora_specs,
+            cancel_check=cancel_check,
+            preview_callback=preview_callback,
+            preview_interval=preview_interval,
+        )[0]
+
+    @pins_pipeline("txt2img")
+    def generate_image_batch(
+        self,
+        prompts: List[str],
+        model_id: str = None,
+        negative_prompts: Optional[List[Optional[str]]] = None,
+        num_inference_steps: int = None,
+        guidance_scale: float = None,
+        width: int = None,
+        height: int = None,
+        seeds: Optional[List[Optional[int]]] = None,
+        progress_callback: Optional[callable] = None,
+        lora_specs: Optional[List[Dict[str, Any]]] = None,
+        cancel_check: Optional[callable] = None,
+        preview_callback: Optional[callable] = None,
+        preview_interval: Optional[callable] = None,
+    ) -> List[Image.Image]:
+        """
+        Generate several images from text prompts in one batched pipeline call.
+
+        All samples share the model, size, step count, guidance scale and LoRA
+        set; prompts, negative prompts and seeds are per sample. Each seeded
+        sample gets its own torch.Generator, so it reproduces the image a
+        batch-size-1 call with the same seed would produce.
+
+        Args:
+            prompts: Text descriptions, one per image
+            model_id: Hugging Face model ID. If None, uses settings.model_id.
+            negative_prompts: What to avoid, one per image (None entries use the default)
+            num_inference_steps: Number of denoising steps (quality vs speed)
+            guidance_scale: How closely to follow the prompt (7-12 recommended)
+            width: Image width in pixels (must be multiple of 8)
+            height: Image height in pixels (must be multiple of 8)
+            seeds: Random seeds, one per image (None entries are random)
+            progress_callback: Callback function for progress updates
+            lora_specs: Optional list of LoRA specifications, each with 'key' and optional 'weight'
+            cancel_check: Optional callable returning True to abort at the next step
+            preview_callback: Optional callable receiving latent previews (see app.previews)
+            preview_interval: Optional callable giving the steps wanted between previews
+
+        Returns:
+            List of PIL Image objects in the same order as prompts
+
+        Raises:
+            GenerationCancelled: If cancel_check returned True
         """
         model_id = model_id or settings.model_id
+        batch_size = len(prompts)
+        negative_prompts = list(negative_prompts or [None] * batch_size)
+        seeds = list(seeds or [None] * batch_size)
 
         # Load model if not already cached
-        if model_id not in self.model_cache or "txt2img" not in self.model_cache[model_id]:
-            self.load_model(model_id)
+        pipe = self._get_pipeline(model_id, "txt2img")
 
         # Check model type for appropriate defaults
         is_flux = self._is_flux_model(model_id)
@@ -371,7 +598,7 @@ class StableDiffusionModel:
             width = width or 1024
             height = height or 1024
             # FLUX doesn't use negative prompts
-            negative_prompt = None
+            negative_prompts = None
             # FLUX doesn't support LoRAs in the same way
             if lora_specs:
                 logger.warning("LoRAs are not supported with FLUX models. Ignoring lora_specs.")
@@ -382,101 +609,286 @@ class StableDiffusionModel:
             guidance_scale = guidance_scale or settings.default_guidance_scale
             width = width or 1024
             height = height or 1024
-            if not negative_prompt:
-                negative_prompt = DEFAULT_NEGATIVE_PROMPT
+            negative_prompts = [negative or DEFAULT_NEGATIVE_PROMPT for negative in negative_prompts]
         else:
             num_inference_steps = num_inference_steps or settings.default_steps
             guidance_scale = guidance_scale or settings.default_guidance_scale
             width = width or settings.default_width
             height = height or settings.default_height
-            if not negative_prompt:
-                negative_prompt = DEFAULT_NEGATIVE_PROMPT
+            negative_prompts = [negative or DEFAULT_NEGATIVE_PROMPT for negative in negative_prompts]
 
         logger.info(
-            f"Generating image: prompt='{prompt[:50]}...', "
+            f"Generating image: prompt='{prompts[0][:50]}...', batch={batch_size}, "
             f"steps={num_inference_steps}, guidance={guidance_scale}, "
-            f"size={width}x{height}, seed={seed}, loras={lora_specs}"
+            f"size={width}x{height}, seeds={seeds}, loras={lora_specs}"
         )
 
         try:
-            # Set seed for reproducibility
+            # Set seeds for reproducibility (one generator per sample)
             generator = None
-            if seed is not None:
-                generator = torch.Generator(device=self.device).manual_seed(seed)
+            if any(seed is not None for seed in seeds):
+                generator = []
+                for seed in seeds:
+                    sample_generator = torch.Generator(device=self.device)
+                    if seed is not None:
+                        sample_generator.manual_seed(seed)
+                    else:
+                        sample_generator.seed()
+                    generator.append(sample_generator)
+                if batch_size == 1:
+                    generator = generator[0]
+
+            # Apply LoRAs (or none) and keep them in place until the call returns
+            with self._lora_scope(pipe, lora_specs, model_id) as trigger_words:
+                # Prepend trigger words to prompt if any
+                if trigger_words:
+                    trigger_prefix = ", ".join(trigger_words) + ", "
+                    prompts = [trigger_prefix + prompt for prompt in prompts]
+                    logger.info(f"Prepended trigger words to prompt: {trigger_prefix}")
+
+                previews = None
+                if preview_callback:
+                    previews = PreviewSampler(
+                        self._model_family(model_id), width, height, preview_callback, preview_interval
+                    )
+
+                # Create a wrapper callback for diffusers format
+                # Note: DPMSolverMultistepScheduler can have off-by-one errors in timestep indexing
+                # during callbacks, so we wrap in try-except to handle edge cases gracefully
+                def step_callback(pipe_instance, step, timestep, callback_kwargs):
+                    if cancel_check and cancel_check():
+                        raise GenerationCancelled(f"Cancelled at step {step + 1}/{num_inference_steps}")
+                    try:
+                        if progress_callback:
+                            progress = (step + 1) / num_inference_steps * 100
+                            progress_callback(progress)
+                    except (IndexError, RuntimeError) as e:
+                        # Gracefully handle scheduler index overflow (known DPM++ bug)
+                        logger.debug(f"Callback step {step} handled: {e}")
+                    if previews:
+                        previews(step, num_inference_steps, callback_kwargs.get("latents"))
+                    return callback_kwargs
+
+                # Generate images - FLUX uses different parameters
+                if is_flux:
+                    result = pipe(
+                        prompt=prompts,
+                        num_inference_steps=num_inference_steps,
+                        guidance_scale=guidance_scale,
+                        width=width,
+                        height=height,
+                        generator=generator,
+                        callback_on_step_end=step_callback if progress_callback or cancel_check or previews else None,
+                    )
+                else:
+                    result = pipe(
+                        prompt=prompts,
+                        negative_prompt=negative_prompts,
+                        num_inference_steps=num_inference_steps,
+                        guidance_scale=guidance_scale,
+                        width=width,
+                        height=height,
+                        generator=generator,
+                        callback_on_step_end=step_callback if progress_callback or cancel_check or previews else None,
+                    )
+
+            images = result.images
+            logger.info(f"Generated {len(images)} image(s) successfully")
+
+            return images
+
+        except GenerationCancelled as e:
+            logger.info(f"Generation cancelled: {e}")
+            raise
+        except Exception as e:
+            logger.error(f"Failed to generate image: {e}")
+            raise
 
-            # Get the cached pipeline
-            pipe = self.model_cache[model_id]["txt2img"]
+    @pins_pipeline("txt2img")
+    def generate_image_sweep(
+        self,
+        prompt: str,
+        model_id: str = None,
+        negative_prompt: Optional[str] = None,
+        grid: Optional[List[Dict[str, Any]]] = None,
+        width: int = None,
+        height: int = None,
+        seeds: Optional[List[int]] = None,
+        progress_callback: Optional[callable] = None,
+        lora_specs: Optional[List[Dict[str, Any]]] = None,
+        cancel_check: Optional[callable] = None,
+        preview_callback: Optional[callable] = None,
+        preview_interval: Optional[callable] = None,
+    ) -> List[Image.Image]:
+        """
+        Generate one prompt over several seeds and guidance/step settings.
 
-            # Apply LoRAs if specified (not supported for FLUX)
-            trigger_words = []
-            if lora_specs and not is_flux:
-                # Determine model_key for compatibility check
-                model_key = self._get_model_key_from_id(model_id)
-                if model_key:
-                    trigger_words = self.apply_loras(pipe, lora_specs, model_key)
-                else:
-                    logger.warning(f"Could not determine model_key for {model_id}, skipping LoRA application")
-
-            # Prepend trigger words to prompt if any
-            if trigger_words:
-                trigger_prefix = ", ".join(trigger_words) + ", "
-                prompt = trigger_prefix + prompt
-                logger.info(f"Prepended trigger words to prompt: {trigger_prefix}")
-
-            # Create a wrapper callback for diffusers format
-            # Note: DPMSolverMultistepScheduler can have off-by-one errors in timestep indexing
-            # during callbacks, so we wrap in try-except to handle edge cases gracefully
-            def step_callback(pipe_instance, step, timestep, callback_kwargs):
-                try:
-                    if progress_callback:
-                        progress = (step + 1) / num_inference_steps * 100
-                        progress_callback(progress)
-                except (IndexError, RuntimeError) as e:
-                    # Gracefully handle scheduler index overflow (known DPM++ bug)
-                    logger.debug(f"Callback step {step} handled: {e}")
-                return callback_kwargs
-
-            # Generate image - FLUX uses different parameters
+        The prompt is encoded once. Each grid cell then runs a single pipeline
+        call in which every seed is one sample of the batch
+        (num_images_per_prompt), so the UNet sees all seeds in one forward
+        pass per step. Each sample has its own seeded generator, so it
+        reproduces the image a single /api/generate call with that seed and
+        settings would produce.
+
+        Args:
+            prompt: Text description of the image to generate
+            model_id: Hugging Face model ID. If None, uses settings.model_id.
+            negative_prompt: What to avoid in the image
+            grid: Cells to render, each {"num_inference_steps": int, "guidance_scale": float}
+            width: Image width in pixels (must be multiple of 8)
+            height: Image height in pixels (must be multiple of 8)
+            seeds: Random seeds, one image per seed in every cell
+            progress_callback: Callback function for progress updates (over the whole grid)
+            lora_specs: Optional list of LoRA specifications, each with 'key' and optional 'weight'
+            cancel_check: Optional callable returning True to abort at the next step
+            preview_callback: Optional callable receiving latent previews (see app.previews)
+            preview_interval: Optional callable giving the steps wanted between previews
+
+        Returns:
+            List of PIL Image objects, cell by cell, seeds in order within each cell
+
+        Raises:
+            GenerationCancelled: If cancel_check returned True
+        """
+        model_id = model_id or settings.model_id
+        seeds = list(seeds or [None])
+        grid = grid or [{"num_inference_steps": None, "guidance_scale": None}]
+
+        # Load model if not already cached
+        pipe = self._get_pipeline(model_id, "txt2img")
+
+        is_flux = self._is_flux_model(model_id)
+        is_sdxl = self._is_sdxl_model(model_id)
+        default_steps = 4 if is_flux else settings.default_steps
+        default_size = 1024 if is_flux or is_sdxl else settings.default_width
+        width = width or default_size
+        height = height or default_size
+        negative_prompt = None if is_flux else (negative_prompt or DEFAULT_NEGATIVE_PROMPT)
+        if is_flux and lora_specs:
+            logger.warning("LoRAs are not supported with FLUX models. Ignoring lora_specs.")
+            lora_specs = None
+
+        cells = []
+        for cell in grid:
+            steps = cell.get("num_inference_steps") or default_steps
             if is_flux:
-                result = pipe(
-                    prompt=prompt,
-                    num_inference_steps=num_inference_steps,
-                    guidance_scale=guidance_scale,
-                    width=width,
-                    height=height,
-                    generator=generator,
-                    # FLUX doesn't support callback_on_step_end in the same way
-                )
+                guidance = cell["guidance_scale"] if cell.get("guidance_scale") is not None else 0.0
             else:
-                result = pipe(
-                    prompt=prompt,
-                    negative_prompt=negative_prompt,
-                    num_inference_steps=num_inference_steps,
-                    guidance_scale=guidance_scale,
-                    width=width,
-                    height=height,
-                    generator=generator,
-                    callback_on_step_end=step_callback if progress_callback else None,
-                )
+                guidance = cell.get("guidance_scale") or settings.default_guidance_scale
+            cells.append((steps, guidance))
+        total_steps = sum(steps for steps, _ in cells)
 
-            image = result.images[0]
-            logger.info("Image generated successfully")
-
-            return image
+        logger.info(
+            f"Generating sweep: prompt='{prompt[:50]}...', seeds={seeds}, "
+            f"cells={cells}, size={width}x{height}, loras={lora_specs}"
+        )
 
+        try:
+            # Apply LoRAs (or none) and keep them in place for every cell
+            with self._lora_scope(pipe, lora_specs, model_id) as trigger_words:
+                if trigger_words:
+                    prompt = ", ".join(trigger_words) + ", " + prompt
+
+                # Encode the prompt once for every cell; the pipeline repeats the
+                # embeddings for each seed in the batch
+                if is_flux:
+                    # FLUX runs CLIP and T5 on every call given a text prompt
+                    prompt_embeds, pooled_embeds, _ = pipe.encode_prompt(
+                        prompt=prompt,
+                        prompt_2=None,
+                        device=self.device,
+                        num_images_per_prompt=1,
+                    )
+                    prompt_kwargs: Dict[str, Any] = {
+                        "prompt_embeds": prompt_embeds,
+                        "pooled_prompt_embeds": pooled_embeds,
+                    }
+                else:
+                    encoded = pipe.encode_prompt(
+                        prompt=prompt,
+                        device=self.device,
+                        num_images_per_prompt=1,
+                        do_classifier_free_guidance=True,
+                        negative_prompt=negative_prompt,
+                    )
+                    if is_sdxl:
+                        prompt_embeds, negative_embeds, pooled_embeds, negative_pooled_embeds = encoded
+                        prompt_kwargs = {
+                            "prompt_embeds": prompt_embeds,
+                            "negative_prompt_embeds": negative_embeds,
+                            "pooled_prompt_embeds": pooled_embeds,
+                            "negative_pooled_prompt_embeds": negative_pooled_embeds,
+                        }
+                    else:
+                        prompt_embeds, negative_embeds = encoded
+                        prompt_kwargs = {"prompt_embeds": prompt_embeds, "negative_prompt_embeds": negative_embeds}
+
+                previews = None
+                if preview_callback:
+                    previews = PreviewSampler(
+                        self._model_family(model_id), width, height, preview_callback, preview_interval
+                    )
+
+                images = []
+                steps_done = 0
+                for steps, guidance in cells:
+                    generator = []
+                    for seed in seeds:
+                        sample_generator = torch.Generator(device=self.device)
+                        if seed is not None:
+                            sample_generator.manual_seed(seed)
+                        else:
+                            sample_generator.seed()
+                        generator.append(sample_generator)
+
+                    def step_callback(pipe_instance, step, timestep, callback_kwargs, steps=steps, offset=steps_done):
+                        if cancel_check and cancel_check():
+                            raise GenerationCancelled(f"Cancelled at step {offset + step + 1}/{total_steps}")
+                        try:
+                            if progress_callback:
+                                progress_callback((offset + step + 1) / total_steps * 100)
+                        except (IndexError, RuntimeError) as e:
+                            # Gracefully handle scheduler index overflow (known DPM++ bug)
+                            logger.debug(f"Callback step {step} handled: {e}")
+                        if previews:
+                            previews(offset + step, total_steps, callback_kwargs.get("latents"))
+                        return callback_kwargs
+
+                    result = pipe(
+                        **prompt_kwargs,
+                        num_images_per_prompt=len(seeds),
+                        num_inference_steps=steps,
+                        guidance_scale=guidance,
+                        width=width,
+                        height=height,
+                        generator=generator,
+                        callback_on_step_end=step_callback if progress_callback or cancel_check or previews else None,
+                    )
+                    images.extend(result.images)
+                    steps_done += steps
+
+            logger.info(f"Generated sweep of {len(images)} image(s) successfully")
+            return images
+
+        except GenerationCancelled as e:
+            logger.info(f"Generation cancelled: {e}")
+            raise
         except Exception as e:
-            logger.error(f"Failed to generate image: {e}")
+            logger.error(f"Failed to generate sweep: {e}")
             raise
 
     def load_img2img_model(self, model_id: str = None):
         """Load the img2img pipeline (shares weights with txt2img).
 
+        If the txt2img pipeline is already loaded, the img2img pipeline is
+        built from its modules instead of being loaded again.
+
         Args:
             model_id: Hugging Face model ID. If None, uses settings.model_id.
         """
         model_id = model_id or settings.model_id
 
-        if model_id in self.model_cache and "img2img" in self.model_cache[model_id]:
+        if (model_id, "img2img") in self.model_cache:
             logger.info(f"Model {model_id} already loaded (img2img)")
             return
 
@@ -506,7 +918,14 @@ class StableDiffusionModel:
             if not is_sdxl:
                 load_kwargs["safety_checker"] = None
 
-            img2img_pipe = pipeline_class.from_pretrained(model_id, **load_kwargs)
+            source = self.model_cache.peek(model_id, "txt2img")
+            if source is not None:
+                # Reuse the txt2img modules: one copy of the weights and no cold load
+                logger.info(f"Building img2img pipeline from the loaded txt2img pipeline of {model_id}")
+                img2img_pipe = self._derive_pipeline(pipeline_class, source, model_id)
+            else:
+                self.model_cache.reserve(model_id, "img2img", self._prior_bytes(model_id))
+                img2img_pipe = pipeline_class.from_pretrained(model_id, **load_kwargs)
 
             # Move to device
             if self.device == "cuda":
@@ -516,6 +935,10 @@ class StableDiffusionModel:
             else:
                 img2img_pipe = img2img_pipe.to("cpu")
 
+            if source is None:
+                # On the device, so the shared storage is the one generation uses
+                self.deduplicator.deduplicate(model_id, "img2img", img2img_pipe)
+
             # Use same scheduler as txt2img
             # Remove problematic config options for compatibility (same as txt2img)
             scheduler_config = dict(img2img_pipe.scheduler.config)
@@ -533,9 +956,7 @@ class StableDiffusionModel:
                         logger.warning(f"Could not enable xformers for img2img: {e}")
 
             # Cache the loaded model
-            if model_id not in self.model_cache:
-                self.model_cache[model_id] = {}
-            self.model_cache[model_id]["img2img"] = img2img_pipe
+            self.model_cache.put(model_id, "img2img", img2img_pipe)
             self.current_model_id = model_id
 
             logger.info(f"Model {model_id} loaded successfully (img2img)")
@@ -556,7 +977,7 @@ class StableDiffusionModel:
         """
         model_id = model_id or settings.model_id
 
-        if model_id in self.model_cache and "inpaint" in self.model_cache[model_id]:
+        if (model_id, "inpaint") in self.model_cache:
             logger.info(f"Model {model_id} already loaded (inpaint)")
             return
 
@@ -599,6 +1020,7 @@ class StableDiffusionModel:
             if not is_sdxl:
                 load_kwargs["safety_checker"] = None
 
+            self.model_cache.reserve(model_id, "inpaint", self._prior_bytes(model_id))
             inpaint_pipe = pipeline_class.from_pretrained(inpaint_model_id, **load_kwargs)
 
             # Move to device
@@ -609,6 +1031,9 @@ class StableDiffusionModel:
             else:
                 inpaint_pipe = inpaint_pipe.to("cpu")
 
+            # On the device, so the shared storage is the one generation uses
+            self.deduplicator.deduplicate(model_id, "inpaint", inpaint_pipe)
+
             # Use DPM-Solver++ scheduler for faster inference
             scheduler_config = dict(inpaint_pipe.scheduler.config)
             scheduler_config.pop("final_sigmas_type", None)
@@ -625,9 +1050,7 @@ class StableDiffusionModel:
                         logger.warning(f"Could not enable xformers for inpaint: {e}")
 
             # Cache under the BASE model ID so we can look it up consistently
-            if model_id not in self.model_cache:
-                self.model_cache[model_id] = {}
-            self.model_cache[model_id]["inpaint"] = inpaint_pipe
+            self.model_cache.put(model_id, "inpaint", inpaint_pipe)
             self.current_model_id = model_id
 
             logger.info(f"Inpaint model loaded successfully for {model_id}")
@@ -636,6 +1059,7 @@ class StableDiffusionModel:
             logger.error(f"Failed to load inpaint pipeline: {e}")
             raise
 
+    @pins_pipeline("img2img")
     def generate_image_from_image(
         self,
         init_image: Image.Image,
@@ -648,6 +1072,9 @@ class StableDiffusionModel:
         seed: Optional[int] = None,
         progress_callback: Optional[callable] = None,
         lora_specs: Optional[List[Dict[str, Any]]] = None,
+        cancel_check: Optional[callable] = None,
+        preview_callback: Optional[callable] = None,
+        preview_interval: Optional[callable] = None,
     ):
         """
         Generate an image from an initial image and prompt (img2img).
@@ -664,15 +1091,20 @@ class StableDiffusionModel:
             progress_callback: Callback function for progress updates
             lora_specs: Optional list of LoRA specifications, each with 'key' and optional 'weight'
                        e.g., [{"key": "thangka", "weight": 0.8}]
+            cancel_check: Optional callable returning True to abort at the next step
+            preview_callback: Optional callable receiving latent previews (see app.previews)
+            preview_interval: Optional callable giving the steps wanted between previews
 
         Returns:
             PIL Image object
+
+        Raises:
+            GenerationCancelled: If cancel_check returned True
         """
         model_id = model_id or settings.model_id
 
         # Load model if not already cached
-        if model_id not in self.model_cache or "img2img" not in self.model_cache[model_id]:
-            self.load_img2img_model(model_id)
+        img2img_pipe = self._get_pipeline(model_id, "img2img")
 
         # Use defaults if not specified
         num_inference_steps = num_inference_steps or settings.default_steps
@@ -719,55 +1151,57 @@ class StableDiffusionModel:
             if seed is not None:
                 generator = torch.Generator(device=self.device).manual_seed(seed)
 
-            # Get the cached pipeline
-            img2img_pipe = self.model_cache[model_id]["img2img"]
-
-            # Apply LoRAs if specified
-            trigger_words = []
-            if lora_specs:
-                # Determine model_key for compatibility check
-                model_key = self._get_model_key_from_id(model_id)
-                if model_key:
-                    trigger_words = self.apply_loras(img2img_pipe, lora_specs, model_key)
-                else:
-                    logger.warning(f"Could not determine model_key for {model_id}, skipping LoRA application")
-
-            # Prepend trigger words to prompt if any
-            if trigger_words:
-                trigger_prefix = ", ".join(trigger_words) + ", "
-                prompt = trigger_prefix + prompt
-                logger.info(f"Prepended trigger words to prompt: {trigger_prefix}")
-
-            # Create a wrapper callback for diffusers format
-            # Note: DPMSolverMultistepScheduler can have off-by-one errors in timestep indexing
-            # during callbacks, so we wrap in try-except to handle edge cases gracefully
-            def step_callback(pipe_instance, step, timestep, callback_kwargs):
-                try:
-                    if progress_callback:
-                        progress = (step + 1) / num_inference_steps * 100
-                        progress_callback(progress)
-                except (IndexError, RuntimeError) as e:
-                    # Gracefully handle scheduler index overflow (known DPM++ bug)
-                    logger.debug(f"Callback step {step} handled: {e}")
-                return callback_kwargs
-
-            # Generate image
-            result = img2img_pipe(
-                prompt=prompt,
-                image=init_image,
-                strength=strength,
-                negative_prompt=negative_prompt,
-                num_inference_steps=num_inference_steps,
-                guidance_scale=guidance_scale,
-                generator=generator,
-                callback_on_step_end=step_callback if progress_callback else None,
-            )
+            # Apply LoRAs (or none) and keep them in place until the call returns
+            with self._lora_scope(img2img_pipe, lora_specs, model_id) as trigger_words:
+                # Prepend trigger words to prompt if any
+                if trigger_words:
+                    trigger_prefix = ", ".join(trigger_words) + ", "
+                    prompt = trigger_prefix + prompt
+                    logger.info(f"Prepended trigger words to prompt: {trigger_prefix}")
+
+                previews = None
+                if preview_callback:
+                    previews = PreviewSampler(
+                        self._model_family(model_id), *init_image.size, preview_callback, preview_interval
+                    )
+
+                # Create a wrapper callback for diffusers format
+                # Note: DPMSolverMultistepScheduler can have off-by-one errors in timestep indexing
+                # during callbacks, so we wrap in try-except to handle edge cases gracefully
+                def step_callback(pipe_instance, step, timestep, callback_kwargs):
+                    if cancel_check and cancel_check():
+                        raise GenerationCancelled(f"Cancelled at step {step + 1}/{num_inference_steps}")
+                    try:
+                        if progress_callback:
+                            progress = (step + 1) / num_inference_steps * 100
+                            progress_callback(progress)
+                    except (IndexError, RuntimeError) as e:
+                        # Gracefully handle scheduler index overflow (known DPM++ bug)
+                        logger.debug(f"Callback step {step} handled: {e}")
+                    if previews:
+                        previews(step, num_inference_steps, callback_kwargs.get("latents"))
+                    return callback_kwargs
+
+                # Generate image
+                result = img2img_pipe(
+                    prompt=prompt,
+                    image=init_image,
+                    strength=strength,
+                    negative_prompt=negative_prompt,
+                    num_inference_steps=num_inference_steps,
+                    guidance_scale=guidance_scale,
+                    generator=generator,
+                    callback_on_step_end=step_callback if progress_callback or cancel_check or previews else None,
+                )
 
             image = result.images[0]
             logger.info("Img2img generation successful")
 
             return image
 
+        except GenerationCancelled as e:
+            logger.info(f"Generation cancelled: {e}")
+            raise
         except Exception as e:
             logger.error(f"Failed to generate img2img: {e}")
             raise
@@ -815,6 +1249,7 @@ class StableDiffusionModel:
 
         return mask
 
+    @pins_pipeline("inpaint")
     def generate_image_inpaint(
         self,
         init_image: Image.Image,
@@ -830,6 +1265,9 @@ class StableDiffusionModel:
         blur_factor: int = None,
         progress_callback: Optional[callable] = None,
         lora_specs: Optional[List[Dict[str, Any]]] = None,
+        cancel_check: Optional[callable] = None,
+        preview_callback: Optional[callable] = None,
+        preview_interval: Optional[callable] = None,
     ):
         """
         Generate an image using inpainting (selective region editing).
@@ -848,15 +1286,20 @@ class StableDiffusionModel:
             blur_factor: Gaussian blur radius for mask
             progress_callback: Callback function for progress updates
             lora_specs: Optional list of LoRA specifications
+            cancel_check: Optional callable returning True to abort at the next step
+            preview_callback: Optional callable receiving latent previews (see app.previews)
+            preview_interval: Optional callable giving the steps wanted between previews
 
         Returns:
             PIL Image object with inpainted result
+
+        Raises:
+            GenerationCancelled: If cancel_check returned True
         """
         model_id = model_id or settings.model_id
 
         # Load inpainting model if not already cached
-        if model_id not in self.model_cache or "inpaint" not in self.model_cache[model_id]:
-            self.load_inpaint_model(model_id)
+        inpaint_pipe = self._get_pipeline(model_id, "inpaint")
 
         # Use defaults from config
         strength = strength if strength is not None else INPAINT_DEFAULTS["strength"]
@@ -922,52 +1365,55 @@ class StableDiffusionModel:
             if seed is not None:
                 generator = torch.Generator(device=self.device).manual_seed(seed)
 
-            # Get the cached inpainting pipeline
-            inpaint_pipe = self.model_cache[model_id]["inpaint"]
-
-            # Apply LoRAs if specified
-            trigger_words = []
-            if lora_specs:
-                model_key = self._get_model_key_from_id(model_id)
-                if model_key:
-                    trigger_words = self.apply_loras(inpaint_pipe, lora_specs, model_key)
-                else:
-                    logger.warning(f"Could not determine model_key for {model_id}, skipping LoRA application")
-
-            # Prepend trigger words to prompt if any
-            if trigger_words:
-                trigger_prefix = ", ".join(trigger_words) + ", "
-                prompt = trigger_prefix + prompt
-                logger.info(f"Prepended trigger words to prompt: {trigger_prefix}")
-
-            # Create progress callback
-            def step_callback(pipe_instance, step, timestep, callback_kwargs):
-                try:
-                    if progress_callback:
-                        progress = (step + 1) / num_inference_steps * 100
-                        progress_callback(progress)
-                except (IndexError, RuntimeError) as e:
-                    logger.debug(f"Callback step {step} handled: {e}")
-                return callback_kwargs
-
-            # Generate inpainted image
-            result = inpaint_pipe(
-                prompt=prompt,
-                image=init_image,
-                mask_image=processed_mask,
-                negative_prompt=negative_prompt,
-                num_inference_steps=num_inference_steps,
-                guidance_scale=guidance_scale,
-                strength=strength,
-                generator=generator,
-                callback_on_step_end=step_callback if progress_callback else None,
-            )
+            # Apply LoRAs (or none) and keep them in place until the call returns
+            with self._lora_scope(inpaint_pipe, lora_specs, model_id) as trigger_words:
+                # Prepend trigger words to prompt if any
+                if trigger_words:
+                    trigger_prefix = ", ".join(trigger_words) + ", "
+                    prompt = trigger_prefix + prompt
+                    logger.info(f"Prepended trigger words to prompt: {trigger_prefix}")
+
+                previews = None
+                if preview_callback:
+                    previews = PreviewSampler(
+                        self._model_family(model_id), width, height, preview_callback, preview_interval
+                    )
+
+                # Create progress callback
+                def step_callback(pipe_instance, step, timestep, callback_kwargs):
+                    if cancel_check and cancel_check():
+                        raise GenerationCancelled(f"Cancelled at step {step + 1}/{num_inference_steps}")
+                    try:
+                        if progress_callback:
+                            progress = (step + 1) / num_inference_steps * 100
+                            progress_callback(progress)
+                    except (IndexError, RuntimeError) as e:
+                        logger.debug(f"Callback step {step} handled: {e}")
+                    if previews:
+                        previews(step, num_inference_steps, callback_kwargs.get("latents"))
+                    return callback_kwargs
+
+                # Generate inpainted image
+                result = inpaint_pipe(
+                    prompt=prompt,
+                    image=init_image,
+                    mask_image=processed_mask,
+                    negative_prompt=negative_prompt,
+                    num_inference_steps=num_inference_steps,
+                    guidance_scale=guidance_scale,
+                    strength=strength,
+                    generator=generator,
+                    callback_on_step_end=step_callback if progress_callback or cancel_check or previews else None,
+                )
 
             image = result.images[0]
             logger.info("Inpaint generation successful")
 
             return image
 
+        except GenerationCancelled as e:
+            logger.info(f"Generation cancelled: {e}")
+            raise
         except Exception as e:
             logger.error(f"Failed to generate inpaint: {e}")
             raise
@@ -980,9 +1426,8 @@ class StableDiffusionModel:
         """
         if model_id:
             # Unload specific model
-            if model_id in self.model_cache:
+            if self.model_cache.remove(model_id):
                 logger.info(f"Unloading model: {model_id}")
-                del self.model_cache[model_id]
                 # Also clear LoRA tracking for this model
                 if model_id in self.loaded_loras:
                     del self.loaded_loras[model_id]
@@ -1001,11 +1446,27 @@ class StableDiffusionModel:
         if self.device == "cuda":
             torch.cuda.empty_cache()
 
+    def is_pipeline_loaded(self, model_id: str, mode: str) -> bool:
+        """Check if a pipeline is already cached.
+
+        Args:
+            model_id: Hugging Face model ID (the base model ID for inpaint)
+            mode: Pipeline mode ('txt2img', 'img2img' or 'inpaint')
+
+        Returns:
+            True if the pipeline can be used without loading
+        """
+        return (model_id, mode) in self.model_cache
+
     @property
     def is_loaded(self) -> bool:
         """Check if any model is currently loaded."""
         return len(self.model_cache) > 0
 
+    def cache_stats(self) -> Dict[str, Any]:
+        """Model cache contents and counters, with the bytes saved by component deduplication."""
+        return {**self.model_cache.stats(), "dedup": self.deduplicator.stats()}
+
 
 # Global model instance
 sd_model = StableDiffusionModel()
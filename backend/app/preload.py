@@ -0,0 +1,197 @@
+"""Warm preloading of configured pipelines at startup, with readiness tracking."""
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from PIL import Image
+
+from .config import MODEL_CONFIGS, settings
+
+logger = logging.getLogger(__name__)
+
+PRELOAD_MODES = ("txt2img", "img2img", "inpaint")
+
+# Warm-up generations are this small: enough to run every kernel once
+WARMUP_SIZE = 256
+WARMUP_PROMPT = "a dragon with wings"
+
+
+@dataclass
+class PreloadEntry:
+    """One pipeline to load at startup."""
+
+    model_key: str
+    mode: str = "txt2img"
+    loras: List[str] = field(default_factory=list)
+    status: str = "pending"  # pending, loading, ready or failed
+    error: Optional[str] = None
+    seconds: Optional[float] = None
+
+
+def parse_preload_models(spec: str) -> List[PreloadEntry]:
+    """Parse the preload_models setting.
+
+    Entries are comma-separated ``model_key[:mode+mode][:lora+lora]``, with
+    modes defaulting to txt2img; for example
+    ``sd-v1-5:txt2img+img2img:watercolor,sdxl``.
+
+    Args:
+        spec: The setting's value
+
+    Returns:
+        One entry per (model, mode)
+
+    Raises:
+        ValueError: On unknown models, modes or LoRAs, LoRAs the model cannot
+            use, or inpaint on a model without inpainting support
+    """
+    entries = []
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        parts = [part.strip() for part in item.split(":")]
+        if len(parts) > 3:
+            raise ValueError(f"Bad preload entry '{item}': expected model_key[:modes][:loras]")
+        model_key = parts[0]
+        modes = [mode for mode in (parts[1] if len(parts) > 1 else "").split("+") if mode] or ["txt2img"]
+        loras = [lora for lora in (parts[2] if len(parts) > 2 else "").split("+") if lora]
+
+        if model_key not in MODEL_CONFIGS:
+            raise ValueError(f"Unknown model '{model_key}' in preload_models")
+        for mode in modes:
+            if mode not in PRELOAD_MODES:
+                raise ValueError(f"Unknown mode '{mode}' for '{model_key}' in preload_models")
+            if mode == "inpaint" and not settings.supports_inpaint(model_key):
+                raise ValueError(f"Model '{model_key}' does not support inpainting (preload_models)")
+        for lora in loras:
+            if not settings.is_lora_compatible(lora, model_key):
+                raise ValueError(f"LoRA '{lora}' is not compatible with '{model_key}' (preload_models)")
+
+        entries.extend(PreloadEntry(model_key=model_key, mode=mode, loras=loras) for mode in modes)
+    return entries
+
+
+def warmup_call(entry: PreloadEntry, steps: int) -> tuple:
+    """The generation method and arguments that load and warm up an entry's pipeline.
+
+    Returns:
+        (method name, kwargs) for inference.call_each
+    """
+    kwargs: Dict[str, Any] = {
+        "prompt": WARMUP_PROMPT,
+        "model_id": settings.get_model_id_from_key(entry.model_key),
+        "num_inference_steps": max(1, steps),
+        "seed": 0,
+        "lora_specs": [{"key": lora} for lora in entry.loras] or None,
+    }
+    if entry.mode == "txt2img":
+        return "generate_image", {**kwargs, "width": WARMUP_SIZE, "height": WARMUP_SIZE}
+
+    # Full strength, so even a single step survives the strength scaling of the schedule
+    init_image = Image.new("RGB", (WARMUP_SIZE, WARMUP_SIZE), (128, 128, 128))
+    if entry.mode == "img2img":
+        return "generate_image_from_image", {**kwargs, "init_image": init_image, "strength": 1.0}
+    mask_image = Image.new("L", (WARMUP_SIZE, WARMUP_SIZE), 255)
+    return "generate_image_inpaint", {
+        **kwargs,
+        "init_image": init_image,
+        "mask_image": mask_image,
+        "strength": 1.0,
+    }
+
+
+class Preloader:
+    """Loads configured pipelines in the background and reports readiness.
+
+    Each entry is loaded by a tiny warm-up generation in every inference
+    process, which also performs one-time kernel and allocator setup.
+    Readiness is ``starting`` until every entry has been tried, then
+    ``ready``, or ``degraded`` if any failed. A degraded node still serves;
+    its missing pipelines load on first use, as they would without preloading.
+    """
+
+    def __init__(self, entries: List[PreloadEntry], warmup_steps: int):
+        self.entries = entries
+        self.warmup_steps = warmup_steps
+        self._thread: Optional[threading.Thread] = None
+        self._done = threading.Event()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def start(self, backend):
+        """Start loading in a background thread.
+
+        Args:
+            backend: Inference backend (see app.inference) to load through
+        """
+        if self._thread is not None:
+            return
+        self.started_at = time.time()
+        if not self.entries:
+            self._finish()
+            return
+        logger.info(f"Preloading {len(self.entries)} pipeline(s) in the background")
+        self._thread = threading.Thread(target=self._run, args=(backend,), name="preload", daemon=True)
+        self._thread.start()
+
+    def _run(self, backend):
+        for entry in self.entries:
+            entry.status = "loading"
+            start = time.time()
+            method, kwargs = warmup_call(entry, self.warmup_steps)
+            try:
+                backend.call_each(method, **kwargs)
+                entry.status = "ready"
+                logger.info(f"Preloaded {entry.model_key} ({entry.mode}) in {time.time() - start:.1f}s")
+            except Exception as e:
+                entry.status = "failed"
+                entry.error = f"{type(e).__name__}: {e}"
+                logger.error(f"Preloading {entry.model_key} ({entry.mode}) failed: {e}")
+            entry.seconds = round(time.time() - start, 1)
+        self._finish()
+
+    def _finish(self):
+        self.finished_at = time.time()
+        self._done.set()
+        logger.info(f"Preloading finished: {self.readiness}")
+
+    @property
+    def readiness(self) -> str:
+        """starting, ready or degraded.
+
+        A node that never starts preloading (an API-only node of a shared
+        queue runs no models) is ready from the start.
+        """
+        if self.started_at is not None and not self._done.is_set():
+            return "starting"
+        if any(entry.status == "failed" for entry in self.entries):
+            return "degraded"
+        return "ready"
+
+    @property
+    def is_ready(self) -> bool:
+        """Whether the node should receive traffic."""
+        return self.readiness != "starting"
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Status of each preload entry."""
+        return [
+            {
+                "model_key": entry.model_key,
+                "mode": entry.mode,
+                "loras": entry.loras,
+                "status": entry.status,
+                "seconds": entry.seconds,
+                "error": entry.error,
+            }
+            for entry in self.entries
+        ]
+
+
+# Global preloader
+preloader = Preloader(
+    entries=parse_preload_models(settings.preload_models),
+    warmup_steps=settings.preload_warmup_steps,
+)
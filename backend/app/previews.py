@@ -0,0 +1,377 @@
+"""Live latent previews: cheap latent-to-RGB projection and WebSocket fan-out.
+
+The projection (PreviewSampler) runs wherever the pipelines run, inside the
+diffusers step callback. The hub (PreviewHub) lives in the API process and
+hands previews to WebSocket clients. This module must not import torch at
+module level; the API process imports it in ``process`` inference mode.
+"""
+import asyncio
+import base64
+import io
+import logging
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from PIL import Image
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Linear maps from each family's latent channels to RGB in [-1, 1], fitted
+# against VAE decodes (the factors ComfyUI's latent previewer uses).
+# One row per latent channel: [r, g, b].
+LATENT_RGB_FACTORS: Dict[str, Dict[str, Any]] = {
+    "sd15": {
+        "weight": [
+            [0.3512, 0.2297, 0.3227],
+            [0.3250, 0.4974, 0.2350],
+            [-0.2829, 0.1762, 0.2721],
+            [-0.2120, -0.2616, -0.7177],
+        ],
+        "bias": [0.0, 0.0, 0.0],
+    },
+    "sdxl": {
+        "weight": [
+            [0.3651, 0.4232, 0.4341],
+            [-0.2533, -0.0042, 0.1068],
+            [0.1076, 0.1111, -0.0362],
+            [-0.3165, -0.2492, -0.2188],
+        ],
+        "bias": [0.1084, -0.0175, -0.0011],
+    },
+    "flux": {
+        "weight": [
+            [-0.0346, 0.0244, 0.0681],
+            [0.0034, 0.0210, 0.0687],
+            [0.0275, -0.0668, -0.0433],
+            [-0.0174, 0.0160, 0.0617],
+            [0.0859, 0.0721, 0.0329],
+            [0.0004, 0.0383, 0.0115],
+            [0.0405, 0.0861, 0.0915],
+            [-0.0236, -0.0185, -0.0259],
+            [-0.0245, 0.0250, 0.1180],
+            [0.1008, 0.0755, -0.0421],
+            [-0.0515, 0.0201, 0.0011],
+            [0.0428, -0.0012, -0.0036],
+            [0.0817, 0.0765, 0.0749],
+            [-0.1264, -0.0522, -0.1103],
+            [-0.0280, -0.0881, -0.0499],
+            [-0.1262, -0.0982, -0.0778],
+        ],
+        "bias": [-0.0329, -0.0718, -0.0851],
+    },
+}
+
+# Latents are 1/8 of the image size, so previews are 64px (SD 1.5) to 128px
+# (SDXL, FLUX); larger latents are downscaled to this
+PREVIEW_MAX_SIZE = 128
+PREVIEW_JPEG_QUALITY = 70
+
+# Bounds of the adaptive cadence, in denoising steps between previews
+MAX_INTERVAL_STEPS = 32
+
+# Weight of the newest measurement in the cost and step-time averages
+EMA_ALPHA = 0.3
+
+
+def unpack_flux_latents(latents, width: int, height: int):
+    """Turn FLUX's packed (batch, tokens, 64) latents into (batch, 16, h, w).
+
+    FLUX packs each 2x2 patch of its 16-channel latent into one token.
+    """
+    batch, _, channels = latents.shape
+    latent_height = 2 * (height // 16)
+    latent_width = 2 * (width // 16)
+    latents = latents.view(batch, latent_height // 2, latent_width // 2, channels // 4, 2, 2)
+    latents = latents.permute(0, 3, 1, 4, 2, 5)
+    return latents.reshape(batch, channels // 4, latent_height, latent_width)
+
+
+def latents_to_previews(
+    latents,
+    family: str,
+    width: int,
+    height: int,
+    max_size: int = PREVIEW_MAX_SIZE,
+    quality: int = PREVIEW_JPEG_QUALITY,
+) -> List[bytes]:
+    """Project latents to RGB thumbnails without running the VAE.
+
+    Args:
+        latents: Latent tensor from the step callback, one sample per batch entry
+        family: Model family ('sd15', 'sdxl' or 'flux')
+        width: Image width (needed to unpack FLUX latents)
+        height: Image height (needed to unpack FLUX latents)
+        max_size: Longest side of a thumbnail
+        quality: JPEG quality
+
+    Returns:
+        One JPEG per sample
+    """
+    import torch
+
+    factors = LATENT_RGB_FACTORS[family]
+    with torch.no_grad():
+        if latents.ndim == 3:
+            latents = unpack_flux_latents(latents, width, height)
+        latents = latents.float()
+        weight = torch.tensor(factors["weight"], device=latents.device).t()
+        bias = torch.tensor(factors["bias"], device=latents.device)
+        rgb = torch.nn.functional.linear(latents.movedim(1, -1), weight, bias)
+        pixels = ((rgb + 1.0) / 2.0).clamp(0, 1).mul(255).to(torch.uint8).cpu().numpy()
+
+    previews = []
+    for sample in pixels:
+        image = Image.fromarray(sample)
+        if max(image.size) > max_size:
+            image.thumbnail((max_size, max_size))
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=quality)
+        previews.append(buffer.getvalue())
+    return previews
+
+
+class PreviewSampler:
+    """Decides on which steps to project latents, and measures what it costs.
+
+    Called from a pipeline's step callback. ``interval()`` gives the cadence
+    the watching clients asked for (0 when nobody watches, which makes a
+    step cost one call). On top of that the sampler enforces a cost budget:
+    previews are spaced so that projection and encoding stay under
+    ``max_cost_fraction`` of denoising time.
+    """
+
+    def __init__(
+        self,
+        family: str,
+        width: int,
+        height: int,
+        callback: Callable[[Dict[str, Any]], None],
+        interval: Optional[Callable[[], int]] = None,
+        max_cost_fraction: float = settings.preview_max_cost_fraction,
+    ):
+        self.family = family
+        self.width = width
+        self.height = height
+        self.callback = callback
+        self.interval = interval
+        self.max_cost_fraction = max_cost_fraction
+        self.step_seconds: Optional[float] = None
+        self.cost_seconds: Optional[float] = None
+        self.budget_interval = 1
+        self._last_step_end: Optional[float] = None
+        self._last_preview_step: Optional[int] = None
+        self._failed = False
+
+    def __call__(self, step: int, total_steps: int, latents):
+        """Handle one denoising step (``step`` counts from 0)."""
+        now = time.perf_counter()
+        if self._last_step_end is not None:
+            self.step_seconds = _ema(self.step_seconds, now - self._last_step_end)
+        try:
+            self._maybe_preview(step, total_steps, latents)
+        except Exception as e:
+            # Previews are best effort and must never fail a generation
+            if not self._failed:
+                logger.warning(f"Latent preview failed, disabling for this request: {e}")
+            self._failed = True
+        self._last_step_end = time.perf_counter()
+
+    def _maybe_preview(self, step: int, total_steps: int, latents):
+        requested = self.interval() if self.interval else settings.preview_interval_steps
+        if requested <= 0 or latents is None or self._failed or step + 1 >= total_steps:
+            # The final image follows right after the last step
+            return
+        every = max(requested, self.budget_interval)
+        since = step + 1 if self._last_preview_step is None else step - self._last_preview_step
+        if since < every:
+            return
+
+        started = time.perf_counter()
+        images = latents_to_previews(latents, self.family, self.width, self.height)
+        cost = time.perf_counter() - started
+        self.cost_seconds = _ema(self.cost_seconds, cost)
+        self._last_preview_step = step
+        if self.step_seconds:
+            self.budget_interval = min(
+                MAX_INTERVAL_STEPS,
+                max(1, math.ceil(self.cost_seconds / (self.max_cost_fraction * self.step_seconds))),
+            )
+        self.callback({
+            "step": step + 1,
+            "total_steps": total_steps,
+            "every": every,
+            "images": images,
+            "cost_ms": round(cost * 1000, 2),
+            "step_ms": round(self.step_seconds * 1000, 2) if self.step_seconds else None,
+        })
+
+
+def _ema(average: Optional[float], value: float) -> float:
+    return value if average is None else (1 - EMA_ALPHA) * average + EMA_ALPHA * value
+
+
+class PreviewSubscription:
+    """One WebSocket client's latest undelivered preview and its cadence.
+
+    Only the newest preview is kept: a client that falls behind skips
+    frames rather than queueing them. The cadence adapts to the client's
+    bandwidth: a preview replaced before it could be sent doubles the
+    interval, and sends that finish well within the time between previews
+    shorten it again, down to the interval the client asked for.
+    """
+
+    def __init__(self, job_id: str, loop: asyncio.AbstractEventLoop, min_interval: int):
+        self.job_id = job_id
+        self.loop = loop
+        self.min_interval = min_interval
+        self.interval = min_interval
+        self.latest: Optional[Dict[str, Any]] = None
+        self.finished = False
+        self.ready = asyncio.Event()
+        self.sent = 0
+        self.dropped = 0
+        self._last_offer: Optional[float] = None
+        self._gap_seconds: Optional[float] = None
+
+    def set_min_interval(self, steps: int):
+        """Change the cadence the client asked for."""
+        self.min_interval = max(1, min(MAX_INTERVAL_STEPS, steps))
+        self.interval = max(self.interval, self.min_interval)
+
+    def _offer(self, preview: Dict[str, Any]):
+        """Store a new preview (runs on the subscriber's loop)."""
+        now = time.monotonic()
+        if self._last_offer is not None:
+            self._gap_seconds = _ema(self._gap_seconds, now - self._last_offer)
+        self._last_offer = now
+        if self.latest is not None:
+            self.dropped += 1
+            self.interval = min(MAX_INTERVAL_STEPS, self.interval * 2)
+        self.latest = preview
+        self.ready.set()
+
+    def _finish(self):
+        self.finished = True
+        self.ready.set()
+
+    async def next(self) -> Optional[Dict[str, Any]]:
+        """Wait for the next preview; None once the job has finished."""
+        await self.ready.wait()
+        self.ready.clear()
+        preview, self.latest = self.latest, None
+        return preview
+
+    def record_send(self, seconds: float):
+        """Adapt the cadence after a preview took ``seconds`` to send."""
+        self.sent += 1
+        if self._gap_seconds and seconds < 0.25 * self._gap_seconds and self.interval > self.min_interval:
+            self.interval -= 1
+
+
+class PreviewHub:
+    """Routes previews from generation threads to WebSocket subscribers.
+
+    ``interval`` tells a running generation how often to produce previews
+    for a set of jobs: the shortest interval any watcher currently accepts,
+    or 0 when nobody is watching so no projection work is done.
+    """
+
+    def __init__(self):
+        self._by_job: Dict[str, List[PreviewSubscription]] = {}
+        self._lock = threading.Lock()
+        self.published = 0
+        self._closed_sent = 0  # Totals of subscriptions that have ended
+        self._closed_dropped = 0
+        self.cost_ms: Optional[float] = None
+        self.step_ms: Optional[float] = None
+        self.cost_fraction: Optional[float] = None
+
+    def subscribe(self, job_id: str, min_interval: int) -> PreviewSubscription:
+        """Start receiving previews of a job (call from the event loop)."""
+        subscription = PreviewSubscription(job_id, asyncio.get_running_loop(), min_interval)
+        subscription.set_min_interval(min_interval)
+        with self._lock:
+            self._by_job.setdefault(job_id, []).append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: PreviewSubscription):
+        with self._lock:
+            subscribers = self._by_job.get(subscription.job_id, [])
+            if subscription in subscribers:
+                subscribers.remove(subscription)
+                self._closed_sent += subscription.sent
+                self._closed_dropped += subscription.dropped
+            if not subscribers:
+                self._by_job.pop(subscription.job_id, None)
+
+    def interval(self, job_ids: Iterable[str]) -> int:
+        """Steps between previews wanted for any of the jobs (0: none)."""
+        with self._lock:
+            intervals = [s.interval for job_id in job_ids for s in self._by_job.get(job_id, ())]
+        return min(intervals) if intervals else 0
+
+    def publish(self, job_id: str, preview: Dict[str, Any]):
+        """Hand a preview to everyone watching the job (thread-safe)."""
+        with self._lock:
+            subscribers = list(self._by_job.get(job_id, ()))
+            self.published += 1
+            self.cost_ms = _ema(self.cost_ms, preview["cost_ms"])
+            if preview.get("step_ms"):
+                self.step_ms = _ema(self.step_ms, preview["step_ms"])
+                self.cost_fraction = _ema(
+                    self.cost_fraction, preview["cost_ms"] / (preview["every"] * preview["step_ms"])
+                )
+        for subscription in subscribers:
+            self._call(subscription, subscription._offer, preview)
+
+    def finish(self, job_id: str):
+        """Wake the job's subscribers so they send the result and close."""
+        with self._lock:
+            subscribers = list(self._by_job.get(job_id, ()))
+        for subscription in subscribers:
+            self._call(subscription, subscription._finish)
+
+    @staticmethod
+    def _call(subscription: PreviewSubscription, method, *args):
+        try:
+            subscription.loop.call_soon_threadsafe(method, *args)
+        except RuntimeError:
+            # The subscriber's loop has closed; it unsubscribes on the way out
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        """Open preview streams and measured preview cost."""
+        with self._lock:
+            subscriptions = [s for subscribers in self._by_job.values() for s in subscribers]
+            return {
+                "subscriptions": len(subscriptions),
+                "published": self.published,
+                "sent": self._closed_sent + sum(s.sent for s in subscriptions),
+                "dropped": self._closed_dropped + sum(s.dropped for s in subscriptions),
+                "cost_ms": round(self.cost_ms, 2) if self.cost_ms is not None else None,
+                "step_ms": round(self.step_ms, 2) if self.step_ms is not None else None,
+                "cost_fraction": round(self.cost_fraction, 4) if self.cost_fraction is not None else None,
+            }
+
+
+def preview_message(job_id: str, preview: Dict[str, Any]) -> Dict[str, Any]:
+    """WebSocket message for a preview, with thumbnails as JPEG data URLs."""
+    return {
+        "type": "preview",
+        "job_id": job_id,
+        "step": preview["step"],
+        "total_steps": preview["total_steps"],
+        "every": preview["every"],
+        "images": [
+            "data:image/jpeg;base64," + base64.b64encode(image).decode("ascii")
+            for image in preview["images"]
+        ],
+    }
+
+
+# Global preview hub
+preview_hub = PreviewHub()
@@ -0,0 +1,218 @@
+"""Content-addressed on-disk cache of finished generation outputs."""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .config import settings, MODEL_CONFIGS, LORA_CONFIGS
+
+logger = logging.getLogger(__name__)
+
+# Bump to invalidate every entry when the output format changes
+CACHE_FORMAT_VERSION = 1
+
+# Output files written per job by save_image_outputs, as (suffix, extension)
+OUTPUT_FILES = ((".png", "png"), (".jpg", "jpg"), ("_watermark.jpg", "watermark.jpg"))
+
+
+def _lora_version(lora_key: str) -> Dict[str, Any]:
+    """Identify the exact LoRA weights a key currently resolves to."""
+    config = LORA_CONFIGS.get(lora_key, {})
+    version = {"lora_id": config.get("lora_id"), "trigger_words": config.get("trigger_words")}
+    local_path = config.get("local_path")
+    if local_path and os.path.exists(local_path):
+        stat = os.stat(local_path)
+        version["local_file"] = {"path": local_path, "size": stat.st_size, "mtime": int(stat.st_mtime)}
+    return version
+
+
+def versioned_cache_key(
+    fingerprint: Optional[str],
+    mode: str,
+    model_key: str,
+    lora_keys: List[str],
+) -> Optional[str]:
+    """Extend a request fingerprint with the model and LoRA versions it ran on.
+
+    Changing a model's config, a LoRA source or a local LoRA file, or the
+    model precision yields a different key, so stale entries are never
+    served.
+
+    Args:
+        fingerprint: Request fingerprint from request_fingerprint (None if not cacheable)
+        mode: txt2img, img2img or inpaint
+        model_key: Model used for the request
+        lora_keys: LoRA keys applied to the request
+
+    Returns:
+        Hex SHA-256 cache key, or None if the request is not cacheable
+    """
+    if fingerprint is None:
+        return None
+    versions = {
+        "format": CACHE_FORMAT_VERSION,
+        "fingerprint": fingerprint,
+        "model": MODEL_CONFIGS.get(model_key),
+        "inpaint_model": settings.get_inpaint_config(model_key) if mode == "inpaint" else None,
+        "precision": settings.model_precision,
+        "loras": {key: _lora_version(key) for key in sorted(lora_keys)},
+    }
+    return hashlib.sha256(json.dumps(versions, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """Stores generated outputs under their cache key, evicting LRU by bytes.
+
+    Each entry is a directory holding the PNG, JPEG and watermarked JPEG
+    exactly as written for the original job, plus a small metadata file.
+    Hits are linked (or copied) into the output directory under the new job
+    ID. Recency is kept in memory and persisted through file mtimes, so the
+    LRU order survives restarts.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, output_dir: str):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.output_dir = output_dir
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # key -> bytes, oldest first
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._load_index()
+
+    def _entry_dir(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / key
+
+    def _load_index(self):
+        """Rebuild the LRU index from the cache directory."""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        found = []
+        for meta_path in self.cache_dir.glob("*/*/meta.json"):
+            entry_dir = meta_path.parent
+            size = sum(f.stat().st_size for f in entry_dir.iterdir() if f.is_file())
+            found.append((meta_path.stat().st_mtime, entry_dir.name, size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._bytes += size
+        if found:
+            logger.info(f"Result cache: {len(found)} entries, {self._bytes / 1024 / 1024:.1f}MB")
+
+    def lookup(self, key: Optional[str], job_id: str) -> Optional[Dict[str, Any]]:
+        """Materialize a cached result as a new job's output files.
+
+        Args:
+            key: Cache key (None always misses without counting)
+            job_id: Job that receives the cached outputs
+
+        Returns:
+            Dict with image_url and the original generation_time, or None on a miss
+        """
+        if key is None:
+            return None
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        entry_dir = self._entry_dir(key)
+        try:
+            meta_path = entry_dir / "meta.json"
+            with open(meta_path) as f:
+                meta = json.load(f)
+            for suffix, name in OUTPUT_FILES:
+                _link_or_copy(entry_dir / name, os.path.join(self.output_dir, f"{job_id}{suffix}"))
+            os.utime(meta_path)
+        except OSError as e:
+            logger.warning(f"Result cache entry {key} unreadable, dropping it: {e}")
+            self._remove(key)
+            return None
+
+        return {"image_url": f"/images/{job_id}.png", "generation_time": meta.get("generation_time")}
+
+    def store(self, key: Optional[str], job_id: str, generation_time: float):
+        """Copy a finished job's output files into the cache.
+
+        Args:
+            key: Cache key (None is ignored)
+            job_id: Job whose outputs were written by save_image_outputs
+            generation_time: Seconds the original generation took
+        """
+        if key is None or self.max_bytes <= 0:
+            return
+        entry_dir = self._entry_dir(key)
+        try:
+            entry_dir.mkdir(parents=True, exist_ok=True)
+            for suffix, name in OUTPUT_FILES:
+                _link_or_copy(os.path.join(self.output_dir, f"{job_id}{suffix}"), entry_dir / name)
+            with open(entry_dir / "meta.json", "w") as f:
+                json.dump({"job_id": job_id, "generation_time": generation_time}, f)
+            size = sum(f.stat().st_size for f in entry_dir.iterdir() if f.is_file())
+        except OSError as e:
+            logger.warning(f"Could not cache result of job {job_id}: {e}")
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            return
+
+        with self._lock:
+            self._bytes += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+            evicted = []
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                old_key, old_size = self._entries.popitem(last=False)
+                self._bytes -= old_size
+                self.evictions += 1
+                evicted.append(old_key)
+        for old_key in evicted:
+            shutil.rmtree(self._entry_dir(old_key), ignore_errors=True)
+
+    def record_bypass(self):
+        """Count a request that skipped the lookup (cache: bypass)."""
+        with self._lock:
+            self.bypassed += 1
+
+    def _remove(self, key: str):
+        with self._lock:
+            self._bytes -= self._entries.pop(key, 0)
+        shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache size and hit/miss counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            }
+
+
+def _link_or_copy(src, dst):
+    """Hard-link a file, falling back to a copy across filesystems."""
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+# Global result cache
+result_cache = ResultCache(
+    cache_dir=settings.result_cache_dir,
+    max_bytes=settings.result_cache_max_mb * 1024 * 1024,
+    output_dir=settings.output_dir,
+)
@@ -0,0 +1,154 @@
+"""Queue ordering policies for the inference job queue."""
+from typing import Dict, List, Optional, Sequence
+
+from .config import settings, MODEL_CONFIGS
+from .usage import UsageTracker, ANONYMOUS_OWNER, parse_tier_weights, usage_tracker
+
+# Resolution at which a model's cost_factor applies; cost scales with pixel count
+REFERENCE_PIXELS = 512 * 512
+
+
+def job_cost(model_key: str, steps: int, width: int, height: int) -> float:
+    """Relative compute cost of a job: steps x resolution x model cost factor.
+
+    One unit is roughly one SD 1.5 denoising step at 512x512.
+
+    Args:
+        model_key: Model identifier (e.g., 'sd-v1-5')
+        steps: Denoising steps actually run (see timings.effective_steps)
+        width: Image width
+        height: Image height
+
+    Returns:
+        Cost in SD 1.5 512x512 step units
+    """
+    cost_factor = MODEL_CONFIGS.get(model_key, {}).get("cost_factor", 1.0)
+    return steps * (width * height / REFERENCE_PIXELS) * cost_factor
+
+
+class SchedulingPolicy:
+    """Orders queued jobs; the queue runs the first job of ``order()``.
+
+    Jobs must have ``cost`` and ``enqueued_at`` attributes (see QueuedJob).
+    """
+
+    name = "base"
+
+    def order(self, pending: Sequence, now: float) -> List[int]:
+        """Indices into ``pending``, best candidate first."""
+        raise NotImplementedError
+
+
+class FifoPolicy(SchedulingPolicy):
+    """Run jobs in arrival order."""
+
+    name = "fifo"
+
+    def order(self, pending: Sequence, now: float) -> List[int]:
+        return list(range(len(pending)))
+
+
+class ShortestJobFirstPolicy(SchedulingPolicy):
+    """Run the cheapest job first, aging waiting jobs to prevent starvation.
+
+    A job's priority is ``cost - aging_rate * seconds_waited`` (lower runs
+    first), so an expensive job overtakes newly arrived cheap ones once it
+    has waited about ``cost / aging_rate`` seconds longer than them. Ties
+    keep arrival order.
+    """
+
+    name = "sjf"
+
+    def __init__(self, aging_rate: float):
+        self.aging_rate = aging_rate
+
+    def priority(self, job, now: float) -> float:
+        return job.cost - self.aging_rate * (now - job.enqueued_at)
+
+    def order(self, pending: Sequence, now: float) -> List[int]:
+        return sorted(range(len(pending)), key=lambda index: (self.priority(pending[index], now), index))
+
+
+class FairSharePolicy(SchedulingPolicy):
+    """Weighted fair queuing across owners on measured compute-seconds.
+
+    An owner's virtual time starts at its recent compute-seconds (see
+    UsageTracker) divided by its tier weight. Walking the queue in the inner
+    policy's order, each job advances its owner's virtual time by its
+    estimated seconds / weight and is tagged with the result; the lowest tag
+    runs first. Owners that used little recently go first, and a tier with
+    twice the weight gets about twice the compute when both are busy.
+    """
+
+    def __init__(
+        self,
+        inner: SchedulingPolicy,
+        usage: UsageTracker,
+        tier_weights: Dict[str, float],
+        default_weight: float = 1.0,
+    ):
+        self.inner = inner
+        self.usage = usage
+        self.tier_weights = tier_weights
+        self.default_weight = default_weight
+        self.name = f"fair+{inner.name}"
+
+    def weight(self, tier: Optional[str]) -> float:
+        return max(1e-6, self.tier_weights.get(tier or "", self.default_weight))
+
+    def order(self, pending: Sequence, now: float) -> List[int]:
+        inner_order = self.inner.order(pending, now)
+        virtual_time: Dict[str, float] = {}
+        tags = {}
+        for rank, index in enumerate(inner_order):
+            job = pending[index]
+            owner = getattr(job, "owner", None) or ANONYMOUS_OWNER
+            weight = self.weight(getattr(job, "tier", None))
+            if owner not in virtual_time:
+                virtual_time[owner] = self.usage.decayed_usage(owner) / weight
+            virtual_time[owner] += (getattr(job, "estimated_seconds", 0.0) or job.cost) / weight
+            tags[index] = (virtual_time[owner], rank)
+        return sorted(inner_order, key=lambda index: tags[index])
+
+
+def create_policy(
+    name: str,
+    aging_rate: float,
+    fair_share: bool = False,
+    usage: Optional[UsageTracker] = None,
+    tier_weights: Optional[Dict[str, float]] = None,
+) -> SchedulingPolicy:
+    """Create a scheduling policy by name.
+
+    Args:
+        name: 'fifo' or 'sjf'
+        aging_rate: Cost units a job's priority improves per second waited (sjf only)
+        fair_share: Wrap the policy in per-owner weighted fair queuing
+        usage: Compute accounting used by fair share
+        tier_weights: Fair-share weight per tier (unlisted tiers get 1.0)
+
+    Returns:
+        A SchedulingPolicy instance
+
+    Raises:
+        ValueError: If the policy name is unknown
+    """
+    if name == "fifo":
+        policy = FifoPolicy()
+    elif name == "sjf":
+        policy = ShortestJobFirstPolicy(aging_rate)
+    else:
+        raise ValueError(f"Unknown scheduling policy: {name}. Available: fifo, sjf")
+    if fair_share:
+        policy = FairSharePolicy(policy, usage or usage_tracker, tier_weights or {})
+    return policy
+
+
+# Global policy instance
+scheduling_policy = create_policy(
+    settings.scheduling_policy,
+    settings.sjf_aging_rate,
+    fair_share=settings.fair_share,
+    usage=usage_tracker,
+    tier_weights=parse_tier_weights(settings.tier_weights),
+)
@@ -1,6 +1,6 @@
 """Pydantic schemas for request/response validation."""
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Annotated, Any, Optional, List, Dict, Literal
 from fastapi import UploadFile
 
 
@@ -31,6 +31,11 @@ class GenerateRequest(BaseModel):
     height: Optional[int] = Field(512, ge=256, le=1024, description="Image height (multiple of 8)")
     seed: Optional[int] = Field(None, ge=0, description="Random seed for reproducibility")
     loras: Optional[List[LoraSpec]] = Field(None, max_length=3, description="LoRA adapters to apply (max 3)")
+    cache: Optional[Literal["use", "bypass"]] = Field("use", description="Result cache for seeded requests: use or bypass")
+    owner: Optional[str] = Field(None, max_length=100, description="Submitting user/account, for fair scheduling and usage (needs X-Identity-Token)")
+    tier: Optional[str] = Field(None, max_length=50, description="Owner's tier (free, maker, pro, enterprise; needs X-Identity-Token)")
+    callback_url: Optional[str] = Field(None, max_length=2000, description="URL to POST the result to when the job finishes")
+    callback_secret: Optional[str] = Field(None, max_length=256, description="Secret for the webhook's HMAC-SHA256 signature")
 
     class Config:
         json_schema_extra = {
@@ -46,6 +51,43 @@ class GenerateRequest(BaseModel):
         }
 
 
+class SweepRequest(BaseModel):
+    """Request schema for rendering one prompt over several seeds and settings.
+
+    Every combination of ``guidance_scales`` and ``steps`` is one grid cell,
+    and each cell renders every seed in a single batched pipeline call.
+    """
+
+    prompt: str = Field(..., min_length=1, max_length=1000, description="Text description of the image")
+    model_key: Optional[str] = Field("sd-v1-5", description="Model key (sd-v1-5, sd-v2-1, sdxl)")
+    negative_prompt: Optional[str] = Field(None, max_length=1000, description="What to avoid in the image")
+    seeds: List[Annotated[int, Field(ge=0)]] = Field(..., min_length=1, description="Seeds to render in every grid cell")
+    guidance_scales: Optional[List[Annotated[float, Field(ge=1.0, le=20.0)]]] = Field(
+        None, min_length=1, description="Guidance values to sweep (default: 7.5)"
+    )
+    steps: Optional[List[Annotated[int, Field(ge=10, le=100)]]] = Field(
+        None, min_length=1, description="Step counts to sweep (default: 30)"
+    )
+    width: Optional[int] = Field(512, ge=256, le=1024, description="Image width (multiple of 8)")
+    height: Optional[int] = Field(512, ge=256, le=1024, description="Image height (multiple of 8)")
+    loras: Optional[List[LoraSpec]] = Field(None, max_length=3, description="LoRA adapters to apply (max 3)")
+    contact_sheet: bool = Field(True, description="Also render one image tiling every result with its settings")
+    owner: Optional[str] = Field(None, max_length=100, description="Submitting user/account, for fair scheduling and usage (needs X-Identity-Token)")
+    tier: Optional[str] = Field(None, max_length=50, description="Owner's tier (free, maker, pro, enterprise; needs X-Identity-Token)")
+    callback_url: Optional[str] = Field(None, max_length=2000, description="URL to POST the result to when the job finishes")
+    callback_secret: Optional[str] = Field(None, max_length=256, description="Secret for the webhook's HMAC-SHA256 signature")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "prompt": "A golden dragon perched on a castle tower, highly detailed",
+                "seeds": [1, 2, 3, 4],
+                "guidance_scales": [5.0, 7.5, 10.0],
+                "contact_sheet": True,
+            }
+        }
+
+
 class Img2ImgRequest(BaseModel):
     """Request schema for image-to-image generation.
 
@@ -60,6 +102,11 @@ class Img2ImgRequest(BaseModel):
     num_inference_steps: Optional[int] = Field(50, ge=10, le=100, description="Number of denoising steps")
     guidance_scale: Optional[float] = Field(7.5, ge=1.0, le=20.0, description="Prompt adherence strength")
     seed: Optional[int] = Field(None, ge=0, description="Random seed for reproducibility")
+    cache: Optional[Literal["use", "bypass"]] = Field("use", description="Result cache for seeded requests: use or bypass")
+    owner: Optional[str] = Field(None, max_length=100, description="Submitting user/account, for fair scheduling and usage (needs X-Identity-Token)")
+    tier: Optional[str] = Field(None, max_length=50, description="Owner's tier (free, maker, pro, enterprise; needs X-Identity-Token)")
+    callback_url: Optional[str] = Field(None, max_length=2000, description="URL to POST the result to when the job finishes")
+    callback_secret: Optional[str] = Field(None, max_length=256, description="Secret for the webhook's HMAC-SHA256 signature")
 
     class Config:
         json_schema_extra = {
@@ -91,6 +138,11 @@ class InpaintRequest(BaseModel):
     blur_mask: Optional[bool] = Field(True, description="Whether to blur mask edges for smoother blending")
     blur_factor: Optional[int] = Field(33, ge=0, le=100, description="Gaussian blur radius for mask edges")
     loras: Optional[List[LoraSpec]] = Field(None, max_length=3, description="LoRA adapters to apply (max 3)")
+    cache: Optional[Literal["use", "bypass"]] = Field("use", description="Result cache for seeded requests: use or bypass")
+    owner: Optional[str] = Field(None, max_length=100, description="Submitting user/account, for fair scheduling and usage (needs X-Identity-Token)")
+    tier: Optional[str] = Field(None, max_length=50, description="Owner's tier (free, maker, pro, enterprise; needs X-Identity-Token)")
+    callback_url: Optional[str] = Field(None, max_length=2000, description="URL to POST the result to when the job finishes")
+    callback_secret: Optional[str] = Field(None, max_length=256, description="Secret for the webhook's HMAC-SHA256 signature")
 
     class Config:
         json_schema_extra = {
@@ -112,7 +164,7 @@ class GenerateResponse(BaseModel):
     """Response schema for successful image generation."""
 
     job_id: str = Field(..., description="Unique identifier for this generation job")
-    status: str = Field(..., description="Job status: pending, processing, completed, failed")
+    status: str = Field(..., description="Job status: queued, processing, completed, failed, cancelled")
     image_url: Optional[str] = Field(None, description="URL to the generated image (when completed)")
     image_base64: Optional[str] = Field(None, description="Base64-encoded image data (when completed)")
     message: Optional[str] = Field(None, description="Status message or error description")
@@ -125,9 +177,102 @@ class StatusResponse(BaseModel):
     job_id: str
     status: str
     image_url: Optional[str] = None
+    image_base64: Optional[str] = Field(None, description="Base64-encoded PNG (only with ?include=image_base64)")
     message: Optional[str] = None
     generation_time: Optional[float] = None
     progress_percent: Optional[float] = Field(None, description="Generation progress 0-100")
+    queue_position: Optional[int] = Field(None, description="1-based position in the queue (when queued)")
+    eta_seconds: Optional[float] = Field(None, description="Estimated seconds until the job finishes (queued or processing)")
+    images: Optional[List[Dict[str, Any]]] = Field(None, description="Sweep results: image_url with its seed and settings")
+    contact_sheet_url: Optional[str] = Field(None, description="URL of the sweep's contact sheet (if requested)")
+
+
+class BatchDefaults(BaseModel):
+    """Settings shared by every item of a batch (see GenerateRequest for ranges)."""
+
+    model_key: Optional[str] = None
+    negative_prompt: Optional[str] = None
+    num_inference_steps: Optional[int] = None
+    guidance_scale: Optional[float] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    seed: Optional[int] = None
+    loras: Optional[List[LoraSpec]] = None
+    cache: Optional[Literal["use", "bypass"]] = None
+    owner: Optional[str] = None
+    tier: Optional[str] = None
+    callback_url: Optional[str] = None
+    callback_secret: Optional[str] = None
+
+
+class BatchGenerateItem(BatchDefaults):
+    """One prompt of a batch; fields left unset come from the batch defaults."""
+
+    prompt: str = Field(..., min_length=1, max_length=1000, description="Text description of the image")
+
+
+class BatchGenerateRequest(BaseModel):
+    """Request schema for submitting many text-to-image prompts at once."""
+
+    items: List[BatchGenerateItem] = Field(..., min_length=1, description="Prompts to generate, each becoming a child job")
+    defaults: Optional[BatchDefaults] = Field(None, description="Settings applied to items that do not set them")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "defaults": {"model_key": "sd-v1-5", "num_inference_steps": 30, "width": 512, "height": 512},
+                "items": [
+                    {"prompt": "A red dragon on a mountain peak", "seed": 1},
+                    {"prompt": "A blue dragon over the sea", "seed": 2},
+                ],
+            }
+        }
+
+
+class BatchResponse(BaseModel):
+    """Response schema for a submitted batch."""
+
+    batch_id: str = Field(..., description="Identifier for the batch as a whole")
+    status: str = Field(..., description="Aggregate status: queued, processing, completed, partial, failed, cancelled")
+    job_ids: List[str] = Field(..., description="Child job IDs, in item order")
+
+
+class BatchStatusResponse(BaseModel):
+    """Response schema for batch status check."""
+
+    batch_id: str
+    status: str = Field(..., description="Aggregate status: queued, processing, completed, partial, failed, cancelled")
+    total: int
+    counts: Dict[str, int] = Field(..., description="Number of child jobs per status")
+    progress_percent: float = Field(..., description="Mean progress of the child jobs 0-100")
+    eta_seconds: Optional[float] = Field(None, description="Estimated seconds until the last child job finishes")
+    jobs: List[StatusResponse] = Field(..., description="Child job statuses, in item order")
+
+
+class BulkStatusRequest(BaseModel):
+    """Request schema for checking many jobs in one call."""
+
+    job_ids: List[str] = Field(..., min_length=1, description="Job IDs to check")
+
+
+class BulkStatusItem(BaseModel):
+    """Compact status of one job; fields that do not apply are omitted."""
+
+    job_id: str
+    status: str
+    progress_percent: Optional[float] = None
+    queue_position: Optional[int] = None
+    eta_seconds: Optional[float] = None
+    image_url: Optional[str] = None
+    generation_time: Optional[float] = None
+    message: Optional[str] = None
+
+
+class BulkStatusResponse(BaseModel):
+    """Response schema for bulk status check."""
+
+    jobs: List[BulkStatusItem] = Field(..., description="Statuses of the known jobs, in request order")
+    missing: List[str] = Field(default_factory=list, description="Requested job IDs that are unknown or expired")
 
 
 class HealthResponse(BaseModel):
@@ -138,6 +283,13 @@ class HealthResponse(BaseModel):
     model_id: str = Field(..., description="Currently configured model")
     device: str = Field(..., description="Device being used (cpu, cuda, mps)")
     version: str = Field(..., description="API version")
+    ready: bool = Field(True, description="Whether startup preloading has finished (gate traffic on this)")
+    readiness: str = Field(
+        "ready", description="starting (preloading models), ready, or degraded (a preload failed)"
+    )
+    preload: List[Dict[str, Any]] = Field(
+        default_factory=list, description="Status of each configured preload"
+    )
 
 
 class ErrorResponse(BaseModel):
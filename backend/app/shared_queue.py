@@ -0,0 +1,907 @@
+"""Job queue shared between API and worker nodes, backed by SQLite or Redis."""
+import base64
+import io
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from PIL import Image
+
+from .config import settings
+from .job_queue import JobQueue, QueuedJob, QueueFullError
+from .job_store import redis_client
+from .scheduling import SchedulingPolicy, FifoPolicy, scheduling_policy
+
+logger = logging.getLogger(__name__)
+
+# Pending jobs considered per lease or wait estimate, oldest first
+SCAN_LIMIT = 500
+
+# How often an idle worker node polls the shared queue for work
+POLL_INTERVAL_SECONDS = 0.5
+
+
+@dataclass
+class _Candidate:
+    """A pending job as seen by the scheduling policy (duck-types QueuedJob)."""
+
+    job_id: str
+    enqueued_at: float
+    estimated_seconds: float
+    cost: float
+    owner: Optional[str]
+    tier: Optional[str]
+
+
+
+
+class SharedQueue:
+    """Interface for a job queue that several nodes use at once.
+
+    API nodes ``put`` jobs; worker nodes ``lease`` them in scheduling-policy
+    order. A lease expires unless its node renews it with ``heartbeat``, after
+    which the job is delivered to another node, up to ``max_attempts`` times.
+    Only data is shared: the task is recorded by function name (the leasing
+    node binds it again, see QueueNode's ``bind_task``) and upload images are
+    stored by the backend as PNGs. Nodes also record themselves on each
+    heartbeat, which gives the worker count for wait estimates.
+
+    A job's webhook signing secret is stored encrypted with ``secret_key`` (a
+    Fernet key every node shares), never in plain text. Without a key the
+    queue cannot carry secrets, and ``put`` refuses jobs that have one.
+    """
+
+    # Backend name reported in stats and logs
+    backend = ""
+
+    def __init__(
+        self,
+        max_queue_size: int,
+        lease_seconds: float,
+        max_attempts: int,
+        policy: Optional[SchedulingPolicy] = None,
+        secret_key: str = "",
+    ):
+        self.max_queue_size = max_queue_size
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.policy = policy or FifoPolicy()
+        self._fernet = None
+        if secret_key:
+            from cryptography.fernet import Fernet
+
+            self._fernet = Fernet(secret_key)
+
+    @property
+    def carries_secrets(self) -> bool:
+        """Whether jobs with a webhook signing secret can be shared (a secret key is set)."""
+        return self._fernet is not None
+
+    def _seal(self, secret: Optional[str]) -> Optional[str]:
+        """Encrypt a webhook signing secret for the shared payload."""
+        if secret is None:
+            return None
+        if self._fernet is None:
+            raise ValueError("Webhook secrets need SHARED_QUEUE_SECRET_KEY to travel through the shared queue")
+        return self._fernet.encrypt(secret.encode()).decode("ascii")
+
+    def _unseal(self, job_id: str, sealed: Optional[str]) -> Optional[str]:
+        """Decrypt a secret sealed by _seal (None if this node cannot)."""
+        if sealed is None:
+            return None
+        from cryptography.fernet import InvalidToken
+
+        try:
+            return self._fernet.decrypt(sealed.encode("ascii")).decode()
+        except (AttributeError, InvalidToken):
+            logger.error(f"Cannot decrypt the webhook secret of job {job_id}: check SHARED_QUEUE_SECRET_KEY on every node")
+            return None
+
+    def put(self, job: QueuedJob):
+        """Add a job for any worker node to lease.
+
+        Args:
+            job: The job to share; its kwargs must be JSON-serializable apart from PIL images
+
+        Raises:
+            QueueFullError: If max_queue_size jobs are already waiting
+            ValueError: If the job has a webhook secret and no secret key is set
+        """
+        raise NotImplementedError
+
+    def lease(self, node_id: str, limit: int) -> Tuple[List[QueuedJob], List[Tuple[str, str, str]]]:
+        """Lease up to ``limit`` jobs for a node, best candidate first.
+
+        Jobs whose lease expired are leased again, unless they have used up
+        their delivery attempts or were cancelled while their node was gone;
+        those are dropped and returned so the caller can finish their records.
+
+        Args:
+            node_id: Leasing node
+            limit: Maximum number of jobs to lease
+
+        Returns:
+            (jobs carrying their task's name in place of the function,
+            [(job_id, status, message)] of dropped jobs)
+        """
+        raise NotImplementedError
+
+    def heartbeat(self, node_id: str, workers: int, job_ids: Set[str]) -> Set[str]:
+        """Renew a node's leases and record the node as alive.
+
+        Args:
+            node_id: Renewing node
+            workers: The node's inference worker count
+            job_ids: Jobs the node still holds
+
+        Returns:
+            Job IDs among ``job_ids`` whose cancellation was requested
+        """
+        raise NotImplementedError
+
+    def complete(self, job_id: str, node_id: str):
+        """Remove a job its node has finished (no-op if it was re-delivered elsewhere)."""
+        raise NotImplementedError
+
+    def release(self, job_id: str, node_id: str):
+        """Hand a leased job that never started back to the queue."""
+        raise NotImplementedError
+
+    def request_cancel(self, job_id: str) -> Optional[str]:
+        """Cancel a shared job from any node.
+
+        Returns:
+            'removed' if it was still waiting, 'cancelling' if a node holds it
+            (that node stops it after its next heartbeat), or None if the
+            shared queue does not hold the job
+        """
+        raise NotImplementedError
+
+    @property
+    def depth(self) -> int:
+        """Number of jobs waiting for a node to lease them."""
+        raise NotImplementedError
+
+    def backlog_seconds(self) -> float:
+        """Estimated seconds of waiting work per live worker across all nodes."""
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        """Shared queue depth, leases and live nodes."""
+        raise NotImplementedError
+
+    def _pending(self) -> List[_Candidate]:
+        """Up to SCAN_LIMIT waiting jobs, oldest first."""
+        raise NotImplementedError
+
+    def _live_workers(self, now: float) -> int:
+        """Inference workers of the nodes that sent a heartbeat within the lease time (at least 1)."""
+        raise NotImplementedError
+
+    def wait_estimate(self, job_id: str) -> Optional[Tuple[int, float]]:
+        """Position in lease order and estimated seconds until a waiting job is leased.
+
+        Returns:
+            (1-based position, seconds), or None if the job is not waiting here
+        """
+        return self.wait_estimates().get(job_id)
+
+    def wait_estimates(self) -> Dict[str, Tuple[int, float]]:
+        """wait_estimate of every waiting job, from one read of the queue.
+
+        Returns:
+            {job_id: (1-based position, seconds)}
+        """
+        now = time.time()
+        pending = self._pending()
+        workers = self._live_workers(now)
+        estimates = {}
+        ahead = 0.0
+        for rank, index in enumerate(self.policy.order(pending, now)):
+            estimates[pending[index].job_id] = (rank + 1, ahead / workers)
+            ahead += pending[index].estimated_seconds
+        return estimates
+
+    @staticmethod
+    def _encode_kwargs(kwargs: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, bytes]]:
+        """Replace image arguments with references to uploads.
+
+        Returns:
+            (kwargs with each image replaced by {"__image__": name}, {name: PNG bytes})
+        """
+        encoded, uploads = {}, {}
+        for name, value in kwargs.items():
+            if isinstance(value, Image.Image):
+                buffer = io.BytesIO()
+                value.save(buffer, format="PNG")
+                uploads[name] = buffer.getvalue()
+                encoded[name] = {"__image__": name}
+            else:
+                encoded[name] = value
+        return encoded, uploads
+
+    def _decode_kwargs(self, job_id: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Load the uploads referenced by _encode_kwargs back into images."""
+        decoded = {}
+        for name, value in kwargs.items():
+            if isinstance(value, dict) and "__image__" in value:
+                with Image.open(io.BytesIO(self._load_upload(job_id, value["__image__"]))) as image:
+                    image.load()
+                    decoded[name] = image.copy()
+            else:
+                decoded[name] = value
+        return decoded
+
+    def _load_upload(self, job_id: str, name: str) -> bytes:
+        """PNG bytes of a job's upload."""
+        raise NotImplementedError
+
+    def _payload(self, job: QueuedJob, kwargs: Dict[str, Any]) -> str:
+        """Serialize the parts of a job the scheduling policy does not look at."""
+        return json.dumps({
+            "task": job.task.__name__,
+            "mode": job.mode,
+            "model_id": job.model_id,
+            "kwargs": kwargs,
+            "callback_secret": self._seal(job.callback_secret),
+        })
+
+    def _to_job(self, node_id: str, candidate: _Candidate, attempts: int, payload: Dict[str, Any]) -> QueuedJob:
+        """Rebuild a leased job (its task is still the function's name)."""
+        if attempts > 1:
+            logger.warning(f"Re-delivering job {candidate.job_id} to {node_id} (attempt {attempts})")
+        return QueuedJob(
+            job_id=candidate.job_id,
+            task=payload["task"],
+            kwargs=self._decode_kwargs(candidate.job_id, payload["kwargs"]),
+            enqueued_at=candidate.enqueued_at,
+            model_id=payload["model_id"],
+            mode=payload["mode"],
+            estimated_seconds=candidate.estimated_seconds,
+            cost=candidate.cost,
+            owner=candidate.owner,
+            tier=candidate.tier,
+            callback_secret=self._unseal(candidate.job_id, payload.get("callback_secret")),
+        )
+
+
+class SQLiteSharedQueue(SharedQueue):
+    """Shared queue in a SQLite file, for nodes on one host.
+
+    The database uses WAL mode, whose shared-memory index does not work across
+    machines or on network filesystems such as NFS: use it for several server
+    processes on one machine (e.g. one per GPU) and for tests, and
+    RedisSharedQueue for nodes on several hosts. Upload images are written to
+    ``upload_dir``, which every node must be able to read.
+    """
+
+    backend = "sqlite"
+
+    def __init__(
+        self,
+        path: str,
+        upload_dir: str,
+        max_queue_size: int,
+        lease_seconds: float,
+        max_attempts: int,
+        policy: Optional[SchedulingPolicy] = None,
+        secret_key: str = "",
+    ):
+        super().__init__(max_queue_size, lease_seconds, max_attempts, policy, secret_key)
+        self.path = path
+        self.upload_dir = Path(upload_dir)
+        self._local = threading.local()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.upload_dir.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS shared_jobs (
+                job_id TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                node_id TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                enqueued_at REAL NOT NULL,
+                estimated_seconds REAL NOT NULL,
+                cost REAL NOT NULL,
+                owner TEXT,
+                tier TEXT,
+                payload TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_shared_jobs_state ON shared_jobs (state, enqueued_at);
+            CREATE TABLE IF NOT EXISTS nodes (
+                node_id TEXT PRIMARY KEY,
+                workers INTEGER NOT NULL,
+                last_seen REAL NOT NULL
+            );
+            """
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        """Get this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=10000")
+            self._local.conn = conn
+        return conn
+
+    def _upload_path(self, job_id: str, name: str) -> Path:
+        return self.upload_dir / f"{job_id}.{name}.png"
+
+    def _load_upload(self, job_id: str, name: str) -> bytes:
+        return self._upload_path(job_id, name).read_bytes()
+
+    def _remove_uploads(self, job_id: str):
+        for path in self.upload_dir.glob(f"{job_id}.*.png"):
+            path.unlink(missing_ok=True)
+
+    def put(self, job: QueuedJob):
+        kwargs, uploads = self._encode_kwargs(job.kwargs)
+        payload = self._payload(job, kwargs)
+        for name, data in uploads.items():
+            self._upload_path(job.job_id, name).write_bytes(data)
+        conn = self._conn()
+        # Count and insert in one write transaction, so concurrent puts cannot overfill the queue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            depth = conn.execute("SELECT COUNT(*) FROM shared_jobs WHERE state = 'pending'").fetchone()[0]
+            if depth < self.max_queue_size:
+                conn.execute(
+                    "INSERT INTO shared_jobs (job_id, state, enqueued_at, estimated_seconds, cost, owner, tier, payload) "
+                    "VALUES (?, 'pending', ?, ?, ?, ?, ?, ?)",
+                    (job.job_id, job.enqueued_at, job.estimated_seconds, job.cost, job.owner, job.tier, payload),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            self._remove_uploads(job.job_id)
+            raise
+        if depth >= self.max_queue_size:
+            self._remove_uploads(job.job_id)
+            raise QueueFullError(f"Queue is full ({self.max_queue_size} jobs waiting). Try again later.")
+
+    def lease(self, node_id: str, limit: int) -> Tuple[List[QueuedJob], List[Tuple[str, str, str]]]:
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            dropped = []
+            for job_id, attempts, cancel_requested in conn.execute(
+                "SELECT job_id, attempts, cancel_requested FROM shared_jobs "
+                "WHERE state = 'leased' AND lease_expires < ? AND (attempts >= ? OR cancel_requested = 1)",
+                (now, self.max_attempts),
+            ).fetchall():
+                if cancel_requested:
+                    dropped.append((job_id, "cancelled", "Job cancelled"))
+                else:
+                    dropped.append((job_id, "failed", f"Generation failed: worker node lost {attempts} time(s)"))
+                conn.execute("DELETE FROM shared_jobs WHERE job_id = ?", (job_id,))
+
+            leased = []
+            if limit > 0:
+                candidates = [
+                    _Candidate(*row) for row in conn.execute(
+                        "SELECT job_id, enqueued_at, estimated_seconds, cost, owner, tier FROM shared_jobs "
+                        "WHERE state = 'pending' OR (state = 'leased' AND lease_expires < ?) "
+                        "ORDER BY enqueued_at LIMIT ?",
+                        (now, SCAN_LIMIT),
+                    ).fetchall()
+                ]
+                for index in self.policy.order(candidates, now)[:limit]:
+                    candidate = candidates[index]
+                    row = conn.execute(
+                        "UPDATE shared_jobs SET state = 'leased', node_id = ?, lease_expires = ?, "
+                        "attempts = attempts + 1 WHERE job_id = ? RETURNING attempts, payload",
+                        (node_id, now + self.lease_seconds, candidate.job_id),
+                    ).fetchone()
+                    leased.append((candidate, row[0], json.loads(row[1])))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        for job_id, _, _ in dropped:
+            self._remove_uploads(job_id)
+        jobs = [self._to_job(node_id, candidate, attempts, payload) for candidate, attempts, payload in leased]
+        return jobs, dropped
+
+    def heartbeat(self, node_id: str, workers: int, job_ids: Set[str]) -> Set[str]:
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO nodes (node_id, workers, last_seen) VALUES (?, ?, ?) "
+            "ON CONFLICT(node_id) DO UPDATE SET workers = excluded.workers, last_seen = excluded.last_seen",
+            (node_id, workers, now),
+        )
+        cancelled = set()
+        for job_id in job_ids:
+            row = conn.execute(
+                "UPDATE shared_jobs SET lease_expires = ? WHERE job_id = ? AND node_id = ? AND state = 'leased' "
+                "RETURNING cancel_requested",
+                (now + self.lease_seconds, job_id, node_id),
+            ).fetchone()
+            if row is not None and row[0]:
+                cancelled.add(job_id)
+        return cancelled
+
+    def complete(self, job_id: str, node_id: str):
+        cursor = self._conn().execute(
+            "DELETE FROM shared_jobs WHERE job_id = ? AND node_id = ?", (job_id, node_id)
+        )
+        if cursor.rowcount:
+            self._remove_uploads(job_id)
+
+    def release(self, job_id: str, node_id: str):
+        self._conn().execute(
+            "UPDATE shared_jobs SET state = 'pending', node_id = NULL, lease_expires = NULL, "
+            "attempts = MAX(0, attempts - 1) WHERE job_id = ? AND node_id = ?",
+            (job_id, node_id),
+        )
+
+    def request_cancel(self, job_id: str) -> Optional[str]:
+        conn = self._conn()
+        cursor = conn.execute("DELETE FROM shared_jobs WHERE job_id = ? AND state = 'pending'", (job_id,))
+        if cursor.rowcount:
+            self._remove_uploads(job_id)
+            return "removed"
+        cursor = conn.execute("UPDATE shared_jobs SET cancel_requested = 1 WHERE job_id = ?", (job_id,))
+        return "cancelling" if cursor.rowcount else None
+
+    @property
+    def depth(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM shared_jobs WHERE state = 'pending'").fetchone()[0]
+
+    def _live_workers(self, now: float) -> int:
+        row = self._conn().execute(
+            "SELECT COALESCE(SUM(workers), 0) FROM nodes WHERE last_seen >= ?", (now - self.lease_seconds,)
+        ).fetchone()
+        return max(1, row[0])
+
+    def _pending(self) -> List[_Candidate]:
+        return [
+            _Candidate(*row) for row in self._conn().execute(
+                "SELECT job_id, enqueued_at, estimated_seconds, cost, owner, tier FROM shared_jobs "
+                "WHERE state = 'pending' ORDER BY enqueued_at LIMIT ?",
+                (SCAN_LIMIT,),
+            ).fetchall()
+        ]
+
+    def backlog_seconds(self) -> float:
+        now = time.time()
+        row = self._conn().execute(
+            "SELECT COALESCE(SUM(estimated_seconds), 0) FROM shared_jobs WHERE state = 'pending'"
+        ).fetchone()
+        return row[0] / self._live_workers(now)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        conn = self._conn()
+        counts = dict(conn.execute("SELECT state, COUNT(*) FROM shared_jobs GROUP BY state").fetchall())
+        leases = dict(conn.execute(
+            "SELECT node_id, COUNT(*) FROM shared_jobs WHERE state = 'leased' GROUP BY node_id"
+        ).fetchall())
+        nodes = {
+            node_id: {"workers": workers, "last_seen_seconds_ago": round(now - last_seen, 1), "leased": leases.get(node_id, 0)}
+            for node_id, workers, last_seen in conn.execute(
+                "SELECT node_id, workers, last_seen FROM nodes WHERE last_seen >= ?", (now - self.lease_seconds,)
+            ).fetchall()
+        }
+        return {
+            "backend": self.backend,
+            "pending": counts.get("pending", 0),
+            "leased": counts.get("leased", 0),
+            "lease_seconds": self.lease_seconds,
+            "max_delivery_attempts": self.max_attempts,
+            "nodes": nodes,
+        }
+
+
+class RedisSharedQueue(SharedQueue):
+    """Shared queue on a Redis server, for nodes on any number of hosts.
+
+    Each job is a hash under ``<prefix>queue:job:<job_id>``; waiting jobs are
+    in a sorted set scored by enqueue time and leased jobs in one scored by
+    lease expiry, and upload images are stored in Redis next to the job, so
+    nodes share nothing but the server (and OUTPUT_DIR for the results).
+    Every change that depends on what it read is a transaction guarded by
+    WATCH, retried if another node changed those keys first.
+
+    Args:
+        client: Redis client created with decode_responses=True
+        prefix: Prefix of every key, so several deployments can share a server
+    """
+
+    backend = "redis"
+
+    # Job hash fields read for scheduling and lease expiry
+    _FIELDS = ("enqueued_at", "estimated_seconds", "cost", "owner", "tier", "state", "attempts", "cancel_requested")
+
+    def __init__(
+        self,
+        client,
+        max_queue_size: int,
+        lease_seconds: float,
+        max_attempts: int,
+        policy: Optional[SchedulingPolicy] = None,
+        prefix: str = "sd:",
+        secret_key: str = "",
+    ):
+        super().__init__(max_queue_size, lease_seconds, max_attempts, policy, secret_key)
+        self._redis = client
+        self.prefix = prefix
+        self._pending_key = f"{prefix}queue:pending"
+        self._leased_key = f"{prefix}queue:leased"
+        self._nodes_key = f"{prefix}queue:nodes"
+
+    def _job_key(self, job_id: str) -> str:
+        return f"{self.prefix}queue:job:{job_id}"
+
+    def _upload_key(self, job_id: str) -> str:
+        return f"{self.prefix}queue:upload:{job_id}"
+
+    def _load_upload(self, job_id: str, name: str) -> bytes:
+        data = self._redis.hget(self._upload_key(job_id), name)
+        if data is None:
+            raise FileNotFoundError(f"Upload {name} of job {job_id} is gone")
+        return base64.b64decode(data)
+
+    def _read(self, job_ids: List[str], fields: Tuple[str, ...]) -> List[List[Optional[str]]]:
+        """Read fields of several job hashes in one round trip."""
+        pipe = self._redis.pipeline(transaction=False)
+        for job_id in job_ids:
+            pipe.hmget(self._job_key(job_id), *fields)
+        return pipe.execute()
+
+    def _candidates(self, job_ids: List[str]) -> List[Tuple[_Candidate, str, int, bool]]:
+        """(candidate, state, attempts, cancel_requested) of the jobs that still exist."""
+        rows = []
+        for job_id, row in zip(job_ids, self._read(job_ids, self._FIELDS)):
+            enqueued_at, estimated_seconds, cost, owner, tier, state, attempts, cancel_requested = row
+            if state is None:
+                continue
+            candidate = _Candidate(
+                job_id, float(enqueued_at), float(estimated_seconds), float(cost), owner or None, tier or None
+            )
+            rows.append((candidate, state, int(attempts), cancel_requested == "1"))
+        return rows
+
+    def put(self, job: QueuedJob):
+        kwargs, uploads = self._encode_kwargs(job.kwargs)
+        key = self._job_key(job.job_id)
+        fields = {
+            "state": "pending",
+            "node_id": "",
+            "attempts": 0,
+            "cancel_requested": 0,
+            "enqueued_at": job.enqueued_at,
+            "estimated_seconds": job.estimated_seconds,
+            "cost": job.cost,
+            "owner": job.owner or "",
+            "tier": job.tier or "",
+            "payload": self._payload(job, kwargs),
+        }
+
+        # Count and insert in one transaction, so concurrent puts cannot overfill the queue
+        def insert(pipe) -> bool:
+            if pipe.zcard(self._pending_key) >= self.max_queue_size:
+                return False
+            pipe.multi()
+            pipe.hset(key, mapping=fields)
+            pipe.zadd(self._pending_key, {job.job_id: job.enqueued_at})
+            if uploads:
+                pipe.hset(self._upload_key(job.job_id), mapping={
+                    name: base64.b64encode(data).decode("ascii") for name, data in uploads.items()
+                })
+            return True
+
+        if not self._redis.transaction(insert, self._pending_key, value_from_callable=True):
+            raise QueueFullError(f"Queue is full ({self.max_queue_size} jobs waiting). Try again later.")
+
+    def lease(self, node_id: str, limit: int) -> Tuple[List[QueuedJob], List[Tuple[str, str, str]]]:
+        def take(pipe):
+            now = time.time()
+            job_ids = pipe.zrangebyscore(self._leased_key, "-inf", f"({now}")
+            if limit > 0:
+                job_ids += pipe.zrange(self._pending_key, 0, SCAN_LIMIT - 1)
+            if not job_ids:
+                return [], []
+            # Watched before reading, so changes by other nodes after this read abort the lease
+            pipe.watch(*[self._job_key(job_id) for job_id in job_ids])
+
+            dropped, candidates, attempts = [], [], {}
+            for candidate, state, tries, cancel_requested in self._candidates(job_ids):
+                if state == "leased" and cancel_requested:
+                    dropped.append((candidate.job_id, "cancelled", "Job cancelled"))
+                elif state == "leased" and tries >= self.max_attempts:
+                    dropped.append((candidate.job_id, "failed", f"Generation failed: worker node lost {tries} time(s)"))
+                elif limit > 0:
+                    candidates.append(candidate)
+                    attempts[candidate.job_id] = tries
+            candidates.sort(key=lambda candidate: candidate.enqueued_at)
+            candidates = candidates[:SCAN_LIMIT]
+            chosen = [candidates[index] for index in self.policy.order(candidates, now)[:limit]] if limit > 0 else []
+            payloads = [row[0] for row in self._read([candidate.job_id for candidate in chosen], ("payload",))]
+
+            pipe.multi()
+            for job_id, _, _ in dropped:
+                pipe.delete(self._job_key(job_id), self._upload_key(job_id))
+                pipe.zrem(self._leased_key, job_id)
+            leased = []
+            for candidate, payload in zip(chosen, payloads):
+                expires = now + self.lease_seconds
+                tries = attempts[candidate.job_id] + 1
+                pipe.hset(self._job_key(candidate.job_id), mapping={"state": "leased", "node_id": node_id, "attempts": tries})
+                pipe.zrem(self._pending_key, candidate.job_id)
+                pipe.zadd(self._leased_key, {candidate.job_id: expires})
+                leased.append((candidate, tries, json.loads(payload)))
+            return leased, dropped
+
+        leased, dropped = self._redis.transaction(
+            take, self._pending_key, self._leased_key, value_from_callable=True
+        )
+        jobs = [self._to_job(node_id, candidate, attempts, payload) for candidate, attempts, payload in leased]
+        return jobs, dropped
+
+    def heartbeat(self, node_id: str, workers: int, job_ids: Set[str]) -> Set[str]:
+        now = time.time()
+        self._redis.hset(self._nodes_key, node_id, json.dumps({"workers": workers, "last_seen": now}))
+        cancelled = set()
+        for job_id in job_ids:
+            key = self._job_key(job_id)
+
+            def renew(pipe) -> bool:
+                holder, state, cancel_requested = pipe.hmget(key, "node_id", "state", "cancel_requested")
+                if holder != node_id or state != "leased":
+                    return False
+                pipe.multi()
+                pipe.zadd(self._leased_key, {job_id: time.time() + self.lease_seconds})
+                return cancel_requested == "1"
+
+            if self._redis.transaction(renew, key, value_from_callable=True):
+                cancelled.add(job_id)
+        return cancelled
+
+    def complete(self, job_id: str, node_id: str):
+        key = self._job_key(job_id)
+
+        def remove(pipe):
+            if pipe.hget(key, "node_id") != node_id:
+                return
+            pipe.multi()
+            pipe.delete(key, self._upload_key(job_id))
+            pipe.zrem(self._leased_key, job_id)
+            pipe.zrem(self._pending_key, job_id)
+
+        self._redis.transaction(remove, key)
+
+    def release(self, job_id: str, node_id: str):
+        key = self._job_key(job_id)
+
+        def requeue(pipe):
+            holder, attempts, enqueued_at = pipe.hmget(key, "node_id", "attempts", "enqueued_at")
+            if holder != node_id:
+                return
+            pipe.multi()
+            pipe.hset(key, mapping={"state": "pending", "node_id": "", "attempts": max(0, int(attempts) - 1)})
+            pipe.zrem(self._leased_key, job_id)
+            pipe.zadd(self._pending_key, {job_id: float(enqueued_at)})
+
+        self._redis.transaction(requeue, key)
+
+    def request_cancel(self, job_id: str) -> Optional[str]:
+        key = self._job_key(job_id)
+
+        def cancel(pipe) -> Optional[str]:
+            state = pipe.hget(key, "state")
+            if state is None:
+                return None
+            pipe.multi()
+            if state == "pending":
+                pipe.delete(key, self._upload_key(job_id))
+                pipe.zrem(self._pending_key, job_id)
+                return "removed"
+            pipe.hset(key, "cancel_requested", 1)
+            return "cancelling"
+
+        return self._redis.transaction(cancel, key, value_from_callable=True)
+
+    @property
+    def depth(self) -> int:
+        return self._redis.zcard(self._pending_key)
+
+    def _nodes(self, now: float) -> Dict[str, Dict[str, Any]]:
+        """Nodes that sent a heartbeat within the lease time."""
+        nodes = {node_id: json.loads(raw) for node_id, raw in self._redis.hgetall(self._nodes_key).items()}
+        return {node_id: node for node_id, node in nodes.items() if node["last_seen"] >= now - self.lease_seconds}
+
+    def _live_workers(self, now: float) -> int:
+        return max(1, sum(node["workers"] for node in self._nodes(now).values()))
+
+    def _pending(self) -> List[_Candidate]:
+        job_ids = self._redis.zrange(self._pending_key, 0, SCAN_LIMIT - 1)
+        return [candidate for candidate, _, _, _ in self._candidates(job_ids)]
+
+    def backlog_seconds(self) -> float:
+        now = time.time()
+        job_ids = self._redis.zrange(self._pending_key, 0, -1)
+        total = sum(float(row[0]) for row in self._read(job_ids, ("estimated_seconds",)) if row[0] is not None)
+        return total / self._live_workers(now)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        leased_ids = self._redis.zrange(self._leased_key, 0, -1)
+        leases: Dict[str, int] = {}
+        for (holder,) in self._read(leased_ids, ("node_id",)):
+            if holder:
+                leases[holder] = leases.get(holder, 0) + 1
+        nodes = {
+            node_id: {
+                "workers": node["workers"],
+                "last_seen_seconds_ago": round(now - node["last_seen"], 1),
+                "leased": leases.get(node_id, 0),
+            }
+            for node_id, node in self._nodes(now).items()
+        }
+        return {
+            "backend": self.backend,
+            "pending": self.depth,
+            "leased": len(leased_ids),
+            "lease_seconds": self.lease_seconds,
+            "max_delivery_attempts": self.max_attempts,
+            "nodes": nodes,
+        }
+
+
+class QueueNode:
+    """Feeds a node's local JobQueue with jobs leased from the shared queue.
+
+    Leases only as many jobs as the local workers can start (plus room for
+    one batch), renews the leases of every job the local queue still holds,
+    stops jobs cancelled from other nodes, and completes jobs once the local
+    queue has let go of them.
+
+    Args:
+        shared: The shared queue
+        local: This node's job queue
+        node_id: Name of this node in leases and stats
+        bind_task: Replaces a leased job's task name with the function (and sets its batch key)
+        on_dropped: Called with (job_id, status, message) for jobs finished without running
+        heartbeat_seconds: How often leases are renewed
+    """
+
+    def __init__(
+        self,
+        shared: SharedQueue,
+        local: JobQueue,
+        node_id: str,
+        bind_task: Callable[[QueuedJob], QueuedJob],
+        on_dropped: Callable[[str, str, str], None],
+        heartbeat_seconds: float,
+    ):
+        self.shared = shared
+        self.local = local
+        self.node_id = node_id
+        self.bind_task = bind_task
+        self.on_dropped = on_dropped
+        self.heartbeat_seconds = heartbeat_seconds
+        self._held: Set[str] = set()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start leasing work (idempotent)."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="shared-queue-node", daemon=True)
+        self._thread.start()
+        logger.info(f"Node {self.node_id} leasing from the shared {self.shared.backend} queue")
+
+    def stop(self):
+        """Stop leasing and hand jobs that have not started back to the shared queue."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        for job_id in list(self._held):
+            if self.local.cancel(job_id) == "removed":
+                self.shared.release(job_id, self.node_id)
+                self._held.discard(job_id)
+
+    def _capacity(self) -> int:
+        busy = self.local.depth + self.local.running_count
+        return self.local.num_workers + self.local.max_batch_size - 1 - busy
+
+    def _run(self):
+        last_heartbeat = 0.0
+        while not self._stop.is_set():
+            try:
+                for job_id in [job_id for job_id in self._held if not self.local.holds(job_id)]:
+                    self.shared.complete(job_id, self.node_id)
+                    self._held.discard(job_id)
+
+                if time.time() - last_heartbeat >= self.heartbeat_seconds:
+                    last_heartbeat = time.time()
+                    for job_id in self.shared.heartbeat(self.node_id, self.local.num_workers, set(self._held)):
+                        if self.local.cancel(job_id) == "removed":
+                            self.on_dropped(job_id, "cancelled", "Job cancelled")
+
+                jobs, dropped = self.shared.lease(self.node_id, self._capacity())
+                for job_id, status, message in dropped:
+                    self.on_dropped(job_id, status, message)
+                for job in jobs:
+                    try:
+                        self.local.submit(self.bind_task(job))
+                        self._held.add(job.job_id)
+                    except QueueFullError:
+                        self.shared.release(job.job_id, self.node_id)
+            except Exception as e:
+                logger.error(f"Shared queue node {self.node_id} error: {e}")
+            self._stop.wait(POLL_INTERVAL_SECONDS)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"node_id": self.node_id, "held": len(self._held)}
+
+
+def create_shared_queue(backend: str) -> Optional[SharedQueue]:
+    """Create the shared queue for the configured backend.
+
+    Args:
+        backend: 'local' (no shared queue), 'sqlite' (nodes on one host) or
+            'redis' (nodes on any host, at settings.redis_url)
+
+    Returns:
+        A SharedQueue, or None for the local backend
+
+    Raises:
+        ValueError: If the backend is unknown, or its job store cannot be read by every node
+    """
+    if backend == "local":
+        return None
+    if backend == "sqlite":
+        if settings.job_store_backend == "memory":
+            raise ValueError("QUEUE_BACKEND=sqlite needs JOB_STORE_BACKEND=sqlite or redis so every node sees job status")
+        logger.info(f"Using shared SQLite queue at {settings.shared_queue_path}")
+        return SQLiteSharedQueue(
+            path=settings.shared_queue_path,
+            upload_dir=settings.shared_upload_dir,
+            max_queue_size=settings.max_queue_size,
+            lease_seconds=settings.lease_seconds,
+            max_attempts=settings.max_delivery_attempts,
+            policy=scheduling_policy,
+            secret_key=settings.shared_queue_secret_key,
+        )
+    if backend == "redis":
+        if settings.job_store_backend != "redis":
+            raise ValueError("QUEUE_BACKEND=redis needs JOB_STORE_BACKEND=redis so nodes on every host see job status")
+        logger.info("Using shared Redis queue")
+        return RedisSharedQueue(
+            redis_client(settings.redis_url),
+            max_queue_size=settings.max_queue_size,
+            lease_seconds=settings.lease_seconds,
+            max_attempts=settings.max_delivery_attempts,
+            policy=scheduling_policy,
+            prefix=settings.redis_key_prefix,
+            secret_key=settings.shared_queue_secret_key,
+        )
+    raise ValueError(f"Unknown queue backend: {backend}. Available: local, sqlite, redis")
+
+
+# This node's name in leases and stats
+node_id = settings.node_id or f"{socket.gethostname()}:{os.getpid()}"
+
+# Global shared queue (None when the queue is local to this process)
+shared_queue = create_shared_queue(settings.queue_backend)
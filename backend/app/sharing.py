@@ -0,0 +1,34 @@
+"""Pipelines built around another pipeline's modules.
+
+This module must not import torch or diffusers, so the sharing logic can be
+tested with stub pipelines.
+"""
+import inspect
+from typing import Any
+
+
+def derive_pipeline(pipeline_class, source, model_id: str, scheduler: Any):
+    """Build a pipeline around another pipeline's modules, sharing their weights.
+
+    Only the scheduler is new, since schedulers keep per-run state and both
+    pipelines may be generating at once. Modules the new pipeline does not
+    take are left out.
+
+    Args:
+        pipeline_class: Pipeline to build (e.g. StableDiffusionImg2ImgPipeline)
+        source: Loaded pipeline of the same model whose modules are reused
+        model_id: Hugging Face model ID, recorded as the pipeline's name
+        scheduler: Fresh scheduler for the new pipeline
+
+    Returns:
+        The new pipeline
+    """
+    accepted = inspect.signature(pipeline_class.__init__).parameters
+    components = {name: module for name, module in source.components.items() if name in accepted}
+    components["scheduler"] = scheduler
+    if "requires_safety_checker" in accepted and components.get("safety_checker") is None:
+        components["requires_safety_checker"] = False
+    pipe = pipeline_class(**components)
+    # Same name as the source, so LoRAs loaded into the shared UNet are tracked once
+    pipe.register_to_config(_name_or_path=model_id)
+    return pipe
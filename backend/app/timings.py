@@ -0,0 +1,180 @@
+"""Measured generation timings used to estimate how long jobs will take."""
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from .config import settings
+
+# Resolution at which default_step_seconds applies; other sizes scale by pixel count
+REFERENCE_PIXELS = 512 * 512
+
+# Extra cost per applied LoRA, relative to a plain step, until measured
+LORA_STEP_OVERHEAD = 0.1
+
+# Generation times kept per model for latency percentiles
+LATENCY_WINDOW = 200
+
+
+def effective_steps(num_inference_steps: int, strength: Optional[float] = None) -> int:
+    """Number of denoising steps a pipeline actually runs.
+
+    img2img and inpaint skip the first (1 - strength) of the schedule.
+
+    Args:
+        num_inference_steps: Requested steps
+        strength: Denoising strength for img2img/inpaint, None for txt2img
+
+    Returns:
+        Steps that will be run (at least 1)
+    """
+    if strength is None:
+        return max(1, num_inference_steps)
+    return max(1, int(num_inference_steps * strength))
+
+
+def _percentile(sorted_values, fraction: float) -> float:
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class StepTimings:
+    """Rolling seconds-per-step estimates keyed by model, mode, resolution and LoRA count.
+
+    Each key keeps an exponentially weighted moving average so the estimate
+    follows the hardware as it warms up or gets busier. Unmeasured keys fall
+    back to the same model and mode at another resolution or LoRA count,
+    then to the same model in any mode, and finally to
+    ``default_step_seconds``, scaling by pixel count and LoRA count each time.
+
+    Per-model generation times are also kept in a sliding window for
+    latency percentiles.
+    """
+
+    def __init__(self, default_step_seconds: float, alpha: float = 0.2):
+        self.default_step_seconds = default_step_seconds
+        self.alpha = alpha
+        self._step_seconds: Dict[Tuple[str, str, int, int, int], float] = {}
+        self._samples: Dict[Tuple[str, str, int, int, int], int] = {}
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        model_key: str,
+        mode: str,
+        width: int,
+        height: int,
+        steps: int,
+        seconds: float,
+        lora_count: int = 0,
+    ):
+        """Add a measured warm generation to the rolling average.
+
+        Args:
+            model_key: Model identifier (e.g., 'sd-v1-5')
+            mode: txt2img, img2img or inpaint
+            width: Image width
+            height: Image height
+            steps: Denoising steps actually run (see effective_steps)
+            seconds: Wall-clock time of the pipeline call for one image
+            lora_count: Number of LoRAs applied
+        """
+        if steps <= 0 or seconds <= 0:
+            return
+        key = (model_key, mode, width, height, lora_count)
+        sample = seconds / steps
+        with self._lock:
+            previous = self._step_seconds.get(key)
+            self._step_seconds[key] = sample if previous is None else previous + self.alpha * (sample - previous)
+            self._samples[key] = self._samples.get(key, 0) + 1
+
+    def record_latency(self, model_key: str, seconds: float):
+        """Add a job's generation time (warm or cold) to the model's latency window."""
+        with self._lock:
+            self._latencies.setdefault(model_key, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+
+    def step_seconds(self, model_key: str, mode: str, width: int, height: int, lora_count: int = 0) -> float:
+        """Estimated seconds per denoising step."""
+        pixels = width * height
+        lora_factor = 1 + LORA_STEP_OVERHEAD * lora_count
+        with self._lock:
+            exact = self._step_seconds.get((model_key, mode, width, height, lora_count))
+            if exact is not None:
+                return exact
+            for same_mode in (True, False):
+                nearby = [
+                    value * pixels / (key[2] * key[3]) * lora_factor / (1 + LORA_STEP_OVERHEAD * key[4])
+                    for key, value in self._step_seconds.items()
+                    if key[0] == model_key and (key[1] == mode or not same_mode)
+                ]
+                if nearby:
+                    return sum(nearby) / len(nearby)
+        return self.default_step_seconds * pixels / REFERENCE_PIXELS * lora_factor
+
+    def estimate(
+        self,
+        model_key: str,
+        mode: str,
+        width: int,
+        height: int,
+        steps: int,
+        lora_count: int = 0,
+    ) -> float:
+        """Estimated seconds to generate one image."""
+        return self.step_seconds(model_key, mode, width, height, lora_count) * steps
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current per-key averages, for monitoring."""
+        with self._lock:
+            return {
+                f"{model_key}/{mode}/{width}x{height}/loras={lora_count}": {
+                    "step_seconds": round(value, 4),
+                    "samples": self._samples[(model_key, mode, width, height, lora_count)],
+                }
+                for (model_key, mode, width, height, lora_count), value in self._step_seconds.items()
+            }
+
+    def model_latency(self, model_key: str) -> Optional[Dict[str, Any]]:
+        """Latency percentiles and step timings measured for one model.
+
+        Returns:
+            Dict of stats, or None if the model has not generated anything yet
+        """
+        with self._lock:
+            window = sorted(self._latencies.get(model_key, ()))
+            step_values = [value for key, value in self._step_seconds.items() if key[0] == model_key]
+        if not window:
+            return None
+        return {
+            "samples": len(window),
+            "mean_seconds": round(sum(window) / len(window), 2),
+            "p50_seconds": round(_percentile(window, 0.5), 2),
+            "p95_seconds": round(_percentile(window, 0.95), 2),
+            "mean_step_seconds": round(sum(step_values) / len(step_values), 4) if step_values else None,
+        }
+
+
+def predict_remaining(estimated_seconds: float, elapsed: float, progress_percent: Optional[float]) -> float:
+    """Predict the remaining run time of a running job.
+
+    Blends the prior estimate with the rate observed so far, trusting the
+    observed rate more as the job progresses.
+
+    Args:
+        estimated_seconds: Prior estimate of the job's total run time
+        elapsed: Seconds since the job started
+        progress_percent: Reported progress 0-100 (None if not reported yet)
+
+    Returns:
+        Estimated seconds until the job finishes
+    """
+    prior = max(0.0, estimated_seconds - elapsed)
+    if not progress_percent or progress_percent <= 0:
+        return prior
+    weight = min(progress_percent, 100.0) / 100.0
+    observed = elapsed * (100.0 - progress_percent) / progress_percent
+    return max(0.0, weight * observed + (1 - weight) * prior)
+
+
+# Global timings instance
+step_timings = StepTimings(default_step_seconds=settings.default_step_seconds)
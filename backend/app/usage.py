@@ -0,0 +1,110 @@
+"""Per-owner compute accounting for fair scheduling and quotas."""
+import math
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from .config import settings
+
+# Jobs without an owner are accounted (and scheduled) together under this name
+ANONYMOUS_OWNER = "anonymous"
+
+# Hourly buckets kept per owner for the rolling 24h total
+BUCKET_SECONDS = 3600
+WINDOW_BUCKETS = 24
+
+
+class UsageTracker:
+    """Measured compute-seconds consumed per owner.
+
+    Keeps a lifetime total, hourly buckets for a rolling 24h window (for
+    quota enforcement), and an exponentially decayed total with a
+    ``half_life_seconds`` half-life that the fair-share scheduler uses, so
+    old usage stops counting against an owner.
+    """
+
+    def __init__(self, half_life_seconds: float):
+        self.half_life_seconds = half_life_seconds
+        self._owners: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _decay(self, entry: Dict[str, Any], now: float):
+        """Bring an owner's decayed total forward to ``now`` (lock held)."""
+        if self.half_life_seconds > 0:
+            entry["decayed"] *= math.pow(0.5, (now - entry["decayed_at"]) / self.half_life_seconds)
+        entry["decayed_at"] = now
+
+    def record(self, owner: Optional[str], tier: Optional[str], compute_seconds: float):
+        """Charge an owner for a finished (or failed) generation.
+
+        Args:
+            owner: Owner identifier (None is accounted as anonymous)
+            tier: The owner's tier at submission time
+            compute_seconds: Measured worker seconds spent on the job
+        """
+        owner = owner or ANONYMOUS_OWNER
+        now = time.time()
+        bucket = int(now // BUCKET_SECONDS)
+        with self._lock:
+            entry = self._owners.setdefault(owner, {
+                "total": 0.0, "jobs": 0, "decayed": 0.0, "decayed_at": now, "buckets": {}, "tier": tier,
+            })
+            self._decay(entry, now)
+            entry["decayed"] += compute_seconds
+            entry["total"] += compute_seconds
+            entry["jobs"] += 1
+            entry["tier"] = tier or entry["tier"]
+            entry["buckets"][bucket] = entry["buckets"].get(bucket, 0.0) + compute_seconds
+            for old in [b for b in entry["buckets"] if b <= bucket - WINDOW_BUCKETS]:
+                del entry["buckets"][old]
+
+    def decayed_usage(self, owner: Optional[str]) -> float:
+        """Recent compute-seconds for an owner, decayed by age."""
+        owner = owner or ANONYMOUS_OWNER
+        with self._lock:
+            entry = self._owners.get(owner)
+            if entry is None:
+                return 0.0
+            self._decay(entry, time.time())
+            return entry["decayed"]
+
+    def owner_usage(self, owner: str) -> Dict[str, Any]:
+        """Compute consumption of one owner (zeros if unknown)."""
+        now = time.time()
+        oldest_bucket = int(now // BUCKET_SECONDS) - WINDOW_BUCKETS + 1
+        with self._lock:
+            entry = self._owners.get(owner)
+            if entry is None:
+                return {"owner": owner, "tier": None, "jobs": 0, "compute_seconds": 0.0,
+                        "compute_seconds_24h": 0.0, "recent_compute_seconds": 0.0}
+            self._decay(entry, now)
+            return {
+                "owner": owner,
+                "tier": entry["tier"],
+                "jobs": entry["jobs"],
+                "compute_seconds": round(entry["total"], 2),
+                "compute_seconds_24h": round(
+                    sum(seconds for b, seconds in entry["buckets"].items() if b >= oldest_bucket), 2
+                ),
+                "recent_compute_seconds": round(entry["decayed"], 2),
+            }
+
+    def all_usage(self) -> Dict[str, Dict[str, Any]]:
+        """Compute consumption of every owner seen since startup."""
+        with self._lock:
+            owners = list(self._owners)
+        return {owner: self.owner_usage(owner) for owner in owners}
+
+
+def parse_tier_weights(spec: str) -> Dict[str, float]:
+    """Parse 'free:1,pro:4' into {'free': 1.0, 'pro': 4.0}."""
+    weights = {}
+    for item in spec.split(","):
+        if ":" in item:
+            tier, weight = item.split(":", 1)
+            weights[tier.strip()] = float(weight)
+    return weights
+
+
+# Global usage tracker
+usage_tracker = UsageTracker(half_life_seconds=settings.fair_share_half_life_seconds)
@@ -0,0 +1,362 @@
+"""Signed completion webhooks with a bounded retry queue."""
+import hashlib
+import heapq
+import hmac
+import ipaddress
+import itertools
+import json
+import logging
+import random
+import socket
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import httpx
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Request headers of a delivery
+SIGNATURE_HEADER = "X-Dragon-Signature"
+TIMESTAMP_HEADER = "X-Dragon-Timestamp"
+EVENT_HEADER = "X-Dragon-Event"
+DELIVERY_HEADER = "X-Dragon-Delivery"
+
+# Receivers should reject signatures older than this (replay protection)
+SIGNATURE_TOLERANCE_SECONDS = 300
+
+
+def sign_payload(secret: str, timestamp: str, body: bytes) -> str:
+    """HMAC-SHA256 signature of a delivery, as sent in the signature header.
+
+    The timestamp is signed with the body so a captured delivery cannot be
+    replayed later with a fresh timestamp.
+
+    Args:
+        secret: Shared secret given with the request
+        timestamp: Unix time of the attempt, as sent in the timestamp header
+        body: Raw request body
+
+    Returns:
+        'sha256=<hex digest>'
+    """
+    message = timestamp.encode() + b"." + body
+    return "sha256=" + hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+def verify_signature(
+    secret: str,
+    timestamp: str,
+    body: bytes,
+    signature: str,
+    tolerance_seconds: float = SIGNATURE_TOLERANCE_SECONDS,
+) -> bool:
+    """Check a delivery's signature and age (for receivers)."""
+    try:
+        age = abs(time.time() - float(timestamp))
+    except (TypeError, ValueError):
+        return False
+    if age > tolerance_seconds:
+        return False
+    return hmac.compare_digest(sign_payload(secret, timestamp, body), signature or "")
+
+
+class CallbackURLRejected(ValueError):
+    """Raised for a callback URL the backend must not send requests to."""
+
+
+def is_public_address(address) -> bool:
+    """Whether an IP address is globally routable.
+
+    Private, loopback, link-local (including the 169.254.169.254 cloud
+    metadata service), shared, reserved and multicast addresses are not,
+    nor are IPv6 addresses mapping one of them.
+    """
+    if address.version == 6 and address.ipv4_mapped is not None:
+        address = address.ipv4_mapped
+    return address.is_global and not address.is_multicast
+
+
+def check_callback_url(url: str, allowed_hosts: List[str]):
+    """Validate a callback URL before accepting a job.
+
+    With an allowlist, only its hosts are accepted. Without one, any host
+    is accepted except loopback names and non-public IP addresses; host
+    names are resolved and checked again on every delivery attempt (see
+    pin_public_address), since DNS can point them anywhere.
+
+    Args:
+        url: URL given with the request
+        allowed_hosts: Permitted host names; empty allows any public host
+
+    Raises:
+        CallbackURLRejected: If the URL is not http(s) or its host is not allowed
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise CallbackURLRejected("callback_url must be an absolute http(s) URL")
+    host = parsed.hostname
+    if allowed_hosts:
+        if host not in allowed_hosts:
+            raise CallbackURLRejected(f"callback_url host {host} is not allowed")
+        return
+    if host == "localhost" or host.endswith(".localhost"):
+        raise CallbackURLRejected(f"callback_url host {host} is not a public address")
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return
+    if not is_public_address(address):
+        raise CallbackURLRejected(f"callback_url host {host} is not a public address")
+
+
+def pin_public_address(url: str) -> Tuple[httpx.URL, str]:
+    """Resolve a callback URL's host and pin the request to a checked address.
+
+    Every address the host resolves to must be public. The request then
+    goes to that address rather than to the name, so the name cannot be
+    re-resolved to an internal address between the check and the connection.
+
+    Args:
+        url: Callback URL whose host is not in the allowlist
+
+    Returns:
+        (URL with its host replaced by the address, original host name for
+        the Host header and TLS server name)
+
+    Raises:
+        CallbackURLRejected: If the host resolves to a non-public address
+        OSError: If the host cannot be resolved
+    """
+    target = httpx.URL(url)
+    port = target.port or (443 if target.scheme == "https" else 80)
+    addresses = [
+        ipaddress.ip_address(info[4][0].split("%")[0])
+        for info in socket.getaddrinfo(target.host, port, type=socket.SOCK_STREAM)
+    ]
+    for address in addresses:
+        if not is_public_address(address):
+            raise CallbackURLRejected(f"callback_url host {target.host} resolves to non-public address {address}")
+    if not addresses:
+        raise OSError(f"No address for callback_url host {target.host}")
+    return target.copy_with(host=str(addresses[0])), target.host
+
+
+@dataclass
+class Delivery:
+    """One webhook to deliver, retried until it succeeds or runs out of attempts."""
+
+    url: str
+    secret: Optional[str]
+    event: str
+    payload: Dict[str, Any]
+    delivery_id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    attempts: int = 0
+    last_error: Optional[str] = None
+
+
+class WebhookDispatcher:
+    """Delivers webhooks from a bounded in-memory queue on worker threads.
+
+    A failed attempt (network error, timeout, 429 or 5xx) is retried after
+    an exponential backoff with jitter, up to ``max_attempts`` attempts;
+    other 4xx responses, and hosts that resolve to non-public addresses,
+    are not retried. Hosts in ``allowed_hosts`` are trusted and may be
+    internal; redirects are never followed. Deliveries waiting for a retry
+    count against ``max_queue_size``; when the queue is full new deliveries
+    are dropped and counted rather than blocking the job workers. Every
+    attempt of a delivery carries the same delivery ID, so receivers can
+    discard duplicates.
+
+    Signing secrets are held here, keyed by job ID, rather than in job
+    records, which status endpoints return and the SQLite and Redis job
+    stores persist. A shared queue carries them to other nodes only
+    encrypted (see SharedQueue).
+    """
+
+    def __init__(
+        self,
+        max_queue_size: int,
+        max_attempts: int,
+        timeout_seconds: float,
+        backoff_seconds: float,
+        max_backoff_seconds: float,
+        num_workers: int = 2,
+        allowed_hosts: Optional[List[str]] = None,
+    ):
+        self.max_queue_size = max_queue_size
+        self.max_attempts = max(1, max_attempts)
+        self.timeout_seconds = timeout_seconds
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.num_workers = max(1, num_workers)
+        self.allowed_hosts = allowed_hosts or []
+        self._secrets: Dict[str, str] = {}  # job_id -> signing secret of its pending webhook
+        self._pending: List = []  # Heap of (due_at, seq, Delivery)
+        self._in_flight = 0
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._stopping = False
+        self.delivered = 0
+        self.failed = 0
+        self.dropped = 0
+        self.retries = 0
+
+    def start(self):
+        """Start the delivery threads."""
+        if self._threads:
+            return
+        self._stopping = False
+        for index in range(self.num_workers):
+            thread = threading.Thread(target=self._run, name=f"webhook-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the delivery threads; undelivered webhooks are abandoned."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        if self._pending:
+            logger.warning(f"Abandoning {len(self._pending)} undelivered webhook(s) on shutdown")
+
+    def remember_secret(self, job_id: str, secret: Optional[str]):
+        """Keep a job's webhook signing secret until its webhook is sent."""
+        if secret:
+            with self._cond:
+                self._secrets[job_id] = secret
+
+    def pop_secret(self, job_id: str) -> Optional[str]:
+        """Take a job's webhook signing secret (None if it has none)."""
+        with self._cond:
+            return self._secrets.pop(job_id, None)
+
+    def enqueue(self, url: str, secret: Optional[str], event: str, payload: Dict[str, Any]) -> bool:
+        """Queue a webhook for delivery.
+
+        Returns:
+            False if the queue was full and the webhook was dropped
+        """
+        delivery = Delivery(url=url, secret=secret, event=event, payload=payload)
+        with self._cond:
+            if len(self._pending) + self._in_flight >= self.max_queue_size:
+                self.dropped += 1
+                logger.warning(f"Webhook queue full; dropped {event} for {url}")
+                return False
+            heapq.heappush(self._pending, (time.time(), next(self._seq), delivery))
+            self._cond.notify()
+        return True
+
+    def _run(self):
+        """Deliver due webhooks until stopped."""
+        with httpx.Client(timeout=self.timeout_seconds) as client:
+            while True:
+                with self._cond:
+                    while not self._stopping:
+                        if self._pending and self._pending[0][0] <= time.time():
+                            break
+                        wait = self._pending[0][0] - time.time() if self._pending else None
+                        self._cond.wait(wait)
+                    if self._stopping:
+                        return
+                    _, _, delivery = heapq.heappop(self._pending)
+                    self._in_flight += 1
+                try:
+                    self._attempt(client, delivery)
+                finally:
+                    with self._cond:
+                        self._in_flight -= 1
+
+    def _attempt(self, client: httpx.Client, delivery: Delivery):
+        """Make one delivery attempt, scheduling a retry if it should be retried."""
+        delivery.attempts += 1
+        body = json.dumps(delivery.payload, default=str).encode()
+        timestamp = str(int(time.time()))
+        headers = {
+            "Content-Type": "application/json",
+            "User-Agent": "DragonWings-Webhook/1.0",
+            EVENT_HEADER: delivery.event,
+            DELIVERY_HEADER: delivery.delivery_id,
+            TIMESTAMP_HEADER: timestamp,
+        }
+        if delivery.secret:
+            headers[SIGNATURE_HEADER] = sign_payload(delivery.secret, timestamp, body)
+
+        retry = True
+        try:
+            url, extensions = delivery.url, {}
+            host = urlparse(delivery.url).hostname
+            if host not in self.allowed_hosts:
+                url, host = pin_public_address(delivery.url)
+                headers["Host"] = httpx.URL(delivery.url).netloc.decode("ascii")
+                extensions = {"sni_hostname": host}
+            response = client.post(url, content=body, headers=headers, extensions=extensions)
+            if response.is_success:
+                with self._cond:
+                    self.delivered += 1
+                logger.info(
+                    f"Delivered {delivery.event} webhook {delivery.delivery_id} "
+                    f"(attempt {delivery.attempts})"
+                )
+                return
+            delivery.last_error = f"HTTP {response.status_code}"
+            retry = response.status_code == 429 or response.status_code >= 500
+        except CallbackURLRejected as e:
+            delivery.last_error = str(e)
+            retry = False
+        except (httpx.HTTPError, OSError) as e:
+            delivery.last_error = f"{type(e).__name__}: {e}"
+
+        if not retry or delivery.attempts >= self.max_attempts:
+            with self._cond:
+                self.failed += 1
+            logger.error(
+                f"Giving up on {delivery.event} webhook {delivery.delivery_id} to {delivery.url} "
+                f"after {delivery.attempts} attempt(s): {delivery.last_error}"
+            )
+            return
+
+        delay = min(self.max_backoff_seconds, self.backoff_seconds * 2 ** (delivery.attempts - 1))
+        delay *= random.uniform(0.5, 1.0)
+        logger.warning(
+            f"Webhook {delivery.delivery_id} attempt {delivery.attempts} failed "
+            f"({delivery.last_error}); retrying in {delay:.1f}s"
+        )
+        with self._cond:
+            self.retries += 1
+            heapq.heappush(self._pending, (time.time() + delay, next(self._seq), delivery))
+            self._cond.notify()
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and delivery outcomes."""
+        with self._cond:
+            return {
+                "pending": len(self._pending),
+                "in_flight": self._in_flight,
+                "max_queue_size": self.max_queue_size,
+                "delivered": self.delivered,
+                "failed": self.failed,
+                "dropped": self.dropped,
+                "retries": self.retries,
+            }
+
+
+# Global webhook dispatcher
+webhook_dispatcher = WebhookDispatcher(
+    max_queue_size=settings.webhook_max_queue_size,
+    max_attempts=settings.webhook_max_attempts,
+    timeout_seconds=settings.webhook_timeout_seconds,
+    backoff_seconds=settings.webhook_backoff_seconds,
+    max_backoff_seconds=settings.webhook_max_backoff_seconds,
+    num_workers=settings.webhook_workers,
+    allowed_hosts=settings.webhook_allowed_hosts_list,
+)
@@ -1,35 +1,38 @@
 import httpx
 import json
-import time
 
 job_id = "83d0d263-2755-4607-9294-940a869f94f3"
-url = f"http://localhost:8000/api/status/{job_id}"
+url = f"http://localhost:8000/api/jobs/{job_id}/events"
 
-print(f"🔍 Checking status for job: {job_id}\n")
+print(f"🔍 Watching job: {job_id}\n")
 
-for attempt in range(120):  # Check for up to 4 minutes (model download + generation)
-    try:
-        response = httpx.get(url, timeout=5.0)
-        result = response.json()
-        
-        status = result.get("status")
-        print(f"[{attempt+1}] Status: {status}", end="")
-        
-        if status == "completed":
-            print(f"\n\n✅ Image generated successfully!")
-            print(f"   Image URL: {result.get('image_url')}")
-            print(f"   Generation time: {result.get('generation_time')}s")
-            break
-        elif status == "failed":
-            print(f"\n\n❌ Generation failed!")
-            print(f"   Message: {result.get('message')}")
-            break
-        elif status == "processing":
-            print(" - Generating image...")
-        else:
-            print(" - Queued/pending...")
-        
-        time.sleep(2)
-    except Exception as e:
-        print(f"\n⚠️  Error: {e}")
-        time.sleep(2)
+# Server-Sent Events: the server pushes updates, no polling needed
+try:
+    with httpx.stream("GET", url, timeout=httpx.Timeout(5.0, read=None)) as response:
+        if response.status_code != 200:
+            print(f"⚠️  Error: {response.status_code} {response.read().decode()}")
+        event = None
+        for line in response.iter_lines():
+            if line.startswith("event:"):
+                event = line.split(":", 1)[1].strip()
+                continue
+            if not line.startswith("data:"):
+                continue
+            result = json.loads(line.split(":", 1)[1])
+            status = result.get("status")
+
+            if event == "result" and status == "completed":
+                print(f"\n✅ Image generated successfully!")
+                print(f"   Image URL: {result.get('image_url')}")
+                print(f"   Generation time: {result.get('generation_time')}s")
+            elif event == "result":
+                print(f"\n❌ Generation {status}!")
+                print(f"   Message: {result.get('message')}")
+            elif status == "processing":
+                print(f"Status: {status} - Generating image... {result.get('progress_percent') or 0}%")
+            else:
+                eta = result.get("eta_seconds")
+                print(f"Status: {status} - Queued at position {result.get('queue_position')}"
+                      + (f", ~{eta:.0f}s to go" if eta is not None else ""))
+except Exception as e:
+    print(f"\n⚠️  Error: {e}")
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""Check that a model's txt2img and img2img pipelines share one set of weights.
+
+Loads the txt2img pipeline, then the img2img pipeline (or the reverse with
+--reverse). Reports load times, the storage shared by the two pipelines and
+the model cache's resident bytes, and exits non-zero if any weight is held
+twice.
+
+Usage:
+    python scripts/check_shared_weights.py                  # Default model (settings.model_id)
+    python scripts/check_shared_weights.py --model sdxl     # By model key
+    python scripts/check_shared_weights.py --reverse        # Load img2img first
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.config import settings
+from app.model_cache import GB, pipeline_storages
+from app.models import sd_model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check weight sharing between txt2img and img2img pipelines")
+    parser.add_argument("--model", default=None, help="Model key (e.g. sd-v1-5, sdxl); default settings.model_id")
+    parser.add_argument("--reverse", action="store_true", help="Load img2img first, then txt2img")
+    args = parser.parse_args()
+
+    model_id = settings.get_model_id_from_key(args.model) if args.model else settings.model_id
+    loaders = [("txt2img", sd_model.load_model), ("img2img", sd_model.load_img2img_model)]
+    if args.reverse:
+        loaders.reverse()
+
+    print(f"🐉 Model: {model_id} on {settings.device}\n")
+    for mode, load in loaders:
+        start = time.time()
+        load(model_id)
+        print(f"   Loaded {mode} in {time.time() - start:.2f}s")
+
+    txt2img = pipeline_storages(sd_model.model_cache.peek(model_id, "txt2img"))
+    img2img = pipeline_storages(sd_model.model_cache.peek(model_id, "img2img"))
+    shared = txt2img.keys() & img2img.keys()
+    only_txt2img = sum(size for key, size in txt2img.items() if key not in shared)
+    only_img2img = sum(size for key, size in img2img.items() if key not in shared)
+
+    print(f"\n   txt2img weights:  {sum(txt2img.values()) / GB:.2f} GB")
+    print(f"   img2img weights:  {sum(img2img.values()) / GB:.2f} GB")
+    print(f"   Shared:           {sum(txt2img[key] for key in shared) / GB:.2f} GB ({len(shared)} storages)")
+    print(f"   Resident (cache): {sd_model.model_cache.resident_bytes() / GB:.2f} GB")
+
+    if only_txt2img or only_img2img:
+        print(
+            f"\n❌ Weights held twice: {only_txt2img / GB:.2f} GB only in txt2img, "
+            f"{only_img2img / GB:.2f} GB only in img2img"
+        )
+        sys.exit(1)
+    print("\n✅ txt2img and img2img share every weight")
+
+
+if __name__ == "__main__":
+    main()
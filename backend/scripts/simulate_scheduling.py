@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""Compare queue scheduling policies by replaying a job mix.
+
+Replays job arrivals against N simulated workers under each policy from
+app/scheduling.py and reports mean and p95 latency (arrival to finish),
+overall and per model. Batching and model affinity are not simulated.
+
+Usage:
+    python scripts/simulate_scheduling.py                       # Synthetic mix
+    python scripts/simulate_scheduling.py --jobs-db ./jobs.db   # Replay the SQLite job store
+    python scripts/simulate_scheduling.py --trace mix.jsonl     # Replay a JSONL trace
+    python scripts/simulate_scheduling.py --workers 1 --aging-rates 0.5,2
+
+A trace line looks like:
+    {"arrival": 12.5, "model_key": "sdxl", "steps": 37, "width": 1024, "height": 1024}
+with an optional "service_seconds"; without it the run time is
+cost x --seconds-per-unit.
+"""
+import heapq
+import json
+import random
+import sqlite3
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Add parent directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.config import settings
+from app.scheduling import FifoPolicy, SchedulingPolicy, ShortestJobFirstPolicy, job_cost
+
+
+@dataclass
+class SimJob:
+    """A job in the simulation (duck-types QueuedJob for the policies)."""
+
+    label: str
+    enqueued_at: float
+    cost: float
+    service_seconds: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+
+# Synthetic mix: (weight, model_key, steps actually run, width, height)
+SYNTHETIC_MIX = [
+    (0.40, "sd-v1-5", 30, 512, 512),
+    (0.20, "sd-v1-5", 10, 512, 512),  # Drafts
+    (0.15, "flux-schnell", 4, 1024, 1024),
+    (0.15, "sdxl", 37, 1024, 1024),  # 50-step img2img at strength 0.75
+    (0.10, "dreamshaper", 30, 512, 768),
+]
+
+
+def synthetic_jobs(count: int, load: float, workers: int, seconds_per_unit: float, seed: int) -> List[SimJob]:
+    """Generate Poisson arrivals from SYNTHETIC_MIX at the given utilization."""
+    rng = random.Random(seed)
+    weights = [entry[0] for entry in SYNTHETIC_MIX]
+    mean_service = sum(w * job_cost(m, s, wd, h) * seconds_per_unit for w, m, s, wd, h in SYNTHETIC_MIX)
+    arrival_rate = load * workers / mean_service
+    jobs, now = [], 0.0
+    for _ in range(count):
+        now += rng.expovariate(arrival_rate)
+        _, model_key, steps, width, height = rng.choices(SYNTHETIC_MIX, weights)[0]
+        cost = job_cost(model_key, steps, width, height)
+        jobs.append(SimJob(model_key, now, cost, cost * seconds_per_unit))
+    return jobs
+
+
+def trace_jobs(path: str, seconds_per_unit: float) -> List[SimJob]:
+    """Load a JSONL trace."""
+    jobs = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            cost = job_cost(entry["model_key"], entry["steps"], entry["width"], entry["height"])
+            service = entry.get("service_seconds") or cost * seconds_per_unit
+            jobs.append(SimJob(entry["model_key"], float(entry["arrival"]), cost, service))
+    return jobs
+
+
+def job_store_jobs(path: str, seconds_per_unit: float) -> List[SimJob]:
+    """Load recorded jobs from a SQLite job store (see app/job_store.py).
+
+    Uses the measured generation_time where the job completed, else the
+    estimate made at submission.
+    """
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT created_at, data FROM jobs ORDER BY created_at").fetchall()
+    conn.close()
+    jobs = []
+    for created_at, data in rows:
+        record = json.loads(data)
+        if "cost" not in record:
+            continue  # Cache hits, attached duplicates and jobs recorded before costs existed
+        service = record.get("generation_time") or record.get("estimated_seconds") or record["cost"] * seconds_per_unit
+        jobs.append(SimJob(record.get("model_key", "?"), created_at, record["cost"], service))
+    return jobs
+
+
+def simulate(jobs: List[SimJob], policy: SchedulingPolicy, workers: int) -> List[SimJob]:
+    """Run the jobs through ``workers`` servers in the order the policy picks.
+
+    Returns:
+        Copies of the jobs with started_at/finished_at filled in
+    """
+    arrivals = sorted(
+        (SimJob(job.label, job.enqueued_at, job.cost, job.service_seconds) for job in jobs),
+        key=lambda job: job.enqueued_at,
+    )
+    pending: List[SimJob] = []
+    running: list = []  # heap of (finish time, sequence, job)
+    finished: List[SimJob] = []
+    next_arrival, sequence, now = 0, 0, 0.0
+
+    while next_arrival < len(arrivals) or pending or running:
+        if pending and len(running) < workers:
+            job = pending.pop(policy.order(pending, now)[0])
+            job.started_at = now
+            heapq.heappush(running, (now + job.service_seconds, sequence, job))
+            sequence += 1
+            continue
+        arrival_time = arrivals[next_arrival].enqueued_at if next_arrival < len(arrivals) else float("inf")
+        finish_time = running[0][0] if running else float("inf")
+        if arrival_time <= finish_time:
+            now = arrival_time
+            pending.append(arrivals[next_arrival])
+            next_arrival += 1
+        else:
+            now, _, job = heapq.heappop(running)
+            job.finished_at = now
+            finished.append(job)
+    return finished
+
+
+def latency_stats(latencies: List[float]) -> Dict[str, float]:
+    """Mean, p95 and max of a list of latencies."""
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    return {"mean": sum(ordered) / len(ordered), "p95": p95, "max": ordered[-1]}
+
+
+def report(name: str, finished: List[SimJob]):
+    """Print overall and per-model latency for one policy."""
+    overall = latency_stats([job.finished_at - job.enqueued_at for job in finished])
+    print(f"\n{name}")
+    print(f"  {'all':<18} mean {overall['mean']:8.1f}s  p95 {overall['p95']:8.1f}s  max {overall['max']:8.1f}s")
+    for label in sorted({job.label for job in finished}):
+        stats = latency_stats([job.finished_at - job.enqueued_at for job in finished if job.label == label])
+        print(f"  {label:<18} mean {stats['mean']:8.1f}s  p95 {stats['p95']:8.1f}s  max {stats['max']:8.1f}s")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare scheduling policies on a job mix")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--jobs-db", help="Replay jobs recorded in a SQLite job store")
+    source.add_argument("--trace", help="Replay a JSONL trace")
+    parser.add_argument("--workers", type=int, default=settings.max_concurrent_jobs, help="Simulated workers")
+    parser.add_argument("--aging-rates", default="0.25,1,4", help="Comma-separated SJF aging rates to compare")
+    parser.add_argument(
+        "--seconds-per-unit",
+        type=float,
+        default=settings.default_step_seconds,
+        help="Run time of one cost unit when no measured time is available",
+    )
+    parser.add_argument("--jobs", type=int, default=2000, help="Synthetic jobs to generate")
+    parser.add_argument("--load", type=float, default=0.85, help="Synthetic utilization (0-1)")
+    parser.add_argument("--seed", type=int, default=0, help="Synthetic random seed")
+
+    args = parser.parse_args()
+
+    if args.jobs_db:
+        jobs = job_store_jobs(args.jobs_db, args.seconds_per_unit)
+    elif args.trace:
+        jobs = trace_jobs(args.trace, args.seconds_per_unit)
+    else:
+        jobs = synthetic_jobs(args.jobs, args.load, args.workers, args.seconds_per_unit, args.seed)
+
+    if not jobs:
+        print("No jobs to replay")
+        sys.exit(1)
+
+    print(f"Replaying {len(jobs)} jobs on {args.workers} worker(s)")
+    policies: List[SchedulingPolicy] = [FifoPolicy()]
+    policies += [ShortestJobFirstPolicy(float(rate)) for rate in args.aging_rates.split(",")]
+    for policy in policies:
+        name = policy.name if isinstance(policy, FifoPolicy) else f"{policy.name} (aging {policy.aging_rate}/s)"
+        report(name, simulate(jobs, policy, args.workers))
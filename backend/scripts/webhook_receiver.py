@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""Local stand-in for a completion webhook receiver.
+
+Listens for the backend's job webhooks, checks their HMAC signature and
+prints each delivery. It can fail the first attempts of every delivery,
+which exercises the backend's retries and backoff.
+
+Usage:
+    python scripts/webhook_receiver.py                          # Listen on :9000
+    python scripts/webhook_receiver.py --secret s3cret          # Verify signatures
+    python scripts/webhook_receiver.py --fail-first 2           # 503 the first 2 attempts
+    python scripts/webhook_receiver.py --port 9100 --log deliveries.jsonl
+
+Start the backend with WEBHOOK_ALLOWED_HOSTS=localhost (loopback callbacks are
+refused otherwise), then submit a job with the receiver as its callback:
+    curl -X POST localhost:8000/api/generate -H 'Content-Type: application/json' \\
+      -d '{"prompt": "a dragon", "callback_url": "http://localhost:9000/hook", "callback_secret": "s3cret"}'
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.webhooks import (
+    DELIVERY_HEADER,
+    EVENT_HEADER,
+    SIGNATURE_HEADER,
+    TIMESTAMP_HEADER,
+    verify_signature,
+)
+
+
+def make_handler(secret: str | None, fail_first: int, log_path: Path | None):
+    """Build a request handler class bound to the receiver options."""
+    attempts: dict[str, int] = {}
+    lock = threading.Lock()
+
+    class WebhookHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            delivery_id = self.headers.get(DELIVERY_HEADER, "?")
+            with lock:
+                attempts[delivery_id] = attempts.get(delivery_id, 0) + 1
+                attempt = attempts[delivery_id]
+
+            if secret is not None and not verify_signature(
+                secret,
+                self.headers.get(TIMESTAMP_HEADER),
+                body,
+                self.headers.get(SIGNATURE_HEADER),
+            ):
+                print(f"❌ {delivery_id} attempt {attempt}: bad or missing signature")
+                self._respond(401)
+                return
+
+            if attempt <= fail_first:
+                print(f"⚠️  {delivery_id} attempt {attempt}: failing on purpose (503)")
+                self._respond(503)
+                return
+
+            payload = json.loads(body)
+            print(
+                f"✅ {self.headers.get(EVENT_HEADER)} {payload.get('job_id')} "
+                f"(delivery {delivery_id}, attempt {attempt})"
+            )
+            print(f"   Status: {payload.get('status')} - {payload.get('message')}")
+            if payload.get("image_url"):
+                print(f"   Image URL: {payload['image_url']}")
+            if payload.get("generation_time") is not None:
+                print(f"   Generation time: {payload['generation_time']}s, queued {payload.get('queue_seconds')}s")
+            if log_path:
+                with open(log_path, "a") as f:
+                    f.write(json.dumps({"received_at": time.time(), "attempt": attempt, **payload}) + "\n")
+            self._respond(200)
+
+        def _respond(self, status: int):
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    return WebhookHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local webhook receiver for testing job callbacks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--secret", default=None, help="Verify signatures with this secret")
+    parser.add_argument("--fail-first", type=int, default=0, help="Answer 503 to the first N attempts of each delivery")
+    parser.add_argument("--log", type=Path, default=None, help="Append accepted payloads to this JSONL file")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args.secret, args.fail_first, args.log))
+    print(f"🎣 Listening for webhooks on http://{args.host}:{args.port}/ (Ctrl+C to stop)\n")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""Shared test setup.
+
+Settings are read from the environment when app.config is first imported,
+so the test environment is fixed here, before any test module imports the
+app: in-process inference, in-memory job store, local queue and scratch
+directories for outputs and caches.
+"""
+import os
+import tempfile
+
+_scratch = tempfile.mkdtemp(prefix="dragon-wings-tests-")
+for name, value in {
+    "INFERENCE_PROCESSES": "0",
+    "JOB_STORE_BACKEND": "memory",
+    "QUEUE_BACKEND": "local",
+    "PRELOAD_MODELS": "",
+    "OUTPUT_DIR": os.path.join(_scratch, "generated_images"),
+    "RESULT_CACHE_DIR": os.path.join(_scratch, "result_cache"),
+    "SHARED_UPLOAD_DIR": os.path.join(_scratch, "shared_uploads"),
+}.items():
+    os.environ[name] = value
+os.makedirs(os.environ["OUTPUT_DIR"], exist_ok=True)
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+from app.job_store import MemoryJobStore
+
+
+@pytest.fixture
+def job_store(monkeypatch):
+    """A fresh in-memory job store behind the API."""
+    store = MemoryJobStore(ttl_seconds=3600)
+    monkeypatch.setattr(main, "job_store", store)
+    return store
+
+
+@pytest.fixture
+def client(job_store):
+    """API client; the lifespan (inference workers, queue, preloading) is not started."""
+    return TestClient(main.app)
@@ -0,0 +1,133 @@
+"""Tests for keeping shared modules on one LoRA set per generation (no torch needed)."""
+import threading
+import time
+import types
+
+from app.adapters import NO_ADAPTERS, AdapterGates, adapter_key
+
+
+class StubModule:
+    """Module whose active adapters are switched in place, like a diffusers UNet."""
+
+    def __init__(self):
+        self.active = NO_ADAPTERS
+
+
+def stub_pipeline(unet, text_encoder):
+    """Pipeline whose set_adapters/disable_lora act on its (possibly shared) modules."""
+    pipeline = types.SimpleNamespace(unet=unet, text_encoder=text_encoder, applies=0)
+
+    def set_adapters(key):
+        pipeline.applies += 1
+        unet.active = text_encoder.active = key
+
+    pipeline.set_adapters = set_adapters
+    return pipeline
+
+
+def generate(gates, pipeline, lora_specs, seen, steps=20):
+    """Run a fake generation, recording the adapters the modules had at each step."""
+    key = adapter_key(lora_specs)
+    with gates.hold(pipeline, key, lambda: pipeline.set_adapters(key) or [f"trigger {key}"]) as words:
+        for _ in range(steps):
+            seen.append((key, pipeline.unet.active, pipeline.text_encoder.active, words))
+            time.sleep(0.001)
+
+
+def test_adapter_key_ignores_specs_without_a_key():
+    assert adapter_key(None) == adapter_key([]) == NO_ADAPTERS
+    assert adapter_key([{"key": "thangka", "weight": 0.8}, {"weight": 1.0}]) == (("thangka", 0.8),)
+    assert adapter_key([{"key": "thangka", "weight": 0.8}]) != adapter_key([{"key": "thangka", "weight": 0.5}])
+
+
+def test_pipelines_sharing_modules_run_different_loras_concurrently():
+    gates = AdapterGates()
+    unet, text_encoder = StubModule(), StubModule()
+    # txt2img and img2img of one model share the UNet and text encoder
+    txt2img, img2img = stub_pipeline(unet, text_encoder), stub_pipeline(unet, text_encoder)
+    loras = [
+        (txt2img, [{"key": "thangka", "weight": 0.8}]),
+        (img2img, [{"key": "watercolor", "weight": 1.0}]),
+        (txt2img, None),
+        (img2img, [{"key": "thangka", "weight": 0.5}]),
+    ]
+    seen = []
+    threads = [
+        threading.Thread(target=generate, args=(gates, pipeline, specs, seen))
+        for _ in range(3)
+        for pipeline, specs in loras
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(seen) == len(threads) * 20
+    for key, unet_active, text_encoder_active, words in seen:
+        # Every step saw its own adapters on both shared modules, and its own trigger words
+        assert unet_active == text_encoder_active == key
+        assert words == [f"trigger {key}"]
+
+
+def test_same_loras_share_modules_without_reapplying():
+    gates = AdapterGates()
+    unet, text_encoder = StubModule(), StubModule()
+    txt2img, img2img = stub_pipeline(unet, text_encoder), stub_pipeline(unet, text_encoder)
+    specs = [{"key": "thangka", "weight": 0.8}]
+    inside = threading.Barrier(2, timeout=5)
+    key = adapter_key(specs)
+
+    def hold(pipeline):
+        with gates.hold(pipeline, key, lambda: pipeline.set_adapters(key)):
+            inside.wait()  # Both generations are inside at once
+
+    threads = [threading.Thread(target=hold, args=(pipeline,)) for pipeline in (txt2img, img2img)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not inside.broken
+    assert txt2img.applies + img2img.applies == 1
+
+    # No LoRAs on modules that have none needs no apply either
+    fresh = stub_pipeline(StubModule(), StubModule())
+    with gates.hold(fresh, NO_ADAPTERS, lambda: fresh.set_adapters(NO_ADAPTERS)):
+        pass
+    assert fresh.applies == 0
+
+
+def test_failed_apply_is_retried():
+    gates = AdapterGates()
+    pipeline = stub_pipeline(StubModule(), StubModule())
+    key = adapter_key([{"key": "thangka", "weight": 0.8}])
+
+    def broken():
+        raise RuntimeError("adapter load failed")
+
+    try:
+        with gates.hold(pipeline, key, broken):
+            raise AssertionError("entered after a failed apply")
+    except RuntimeError:
+        pass
+    with gates.hold(pipeline, key, lambda: pipeline.set_adapters(key)):
+        assert pipeline.unet.active == key
+    assert pipeline.applies == 1
+
+
+def test_partly_shared_pipelines_do_not_deadlock():
+    gates = AdapterGates()
+    shared_unet = StubModule()
+    # Two models sharing only a deduplicated UNet, each with its own text encoder
+    first, second = stub_pipeline(shared_unet, StubModule()), stub_pipeline(shared_unet, StubModule())
+    seen = []
+    threads = [
+        threading.Thread(target=generate, args=(gates, pipeline, [{"key": name, "weight": 1.0}], seen, 5))
+        for _ in range(5)
+        for pipeline, name in ((first, "a"), (second, "b"))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    assert not any(thread.is_alive() for thread in threads)
+    assert all(unet_active == key for key, unet_active, _, _ in seen)
@@ -0,0 +1,268 @@
+"""Tests for job records created by the API without running a model."""
+import inspect
+from io import BytesIO
+
+import pytest
+from fastapi import HTTPException, UploadFile
+from PIL import Image
+
+from app import job_queue as job_queue_module
+from app import main
+from app.admission import AdmissionController
+from app.job_queue import JobQueue, QueuedJob, QueueFullError
+
+
+def test_cache_hit_record_expires(client, job_store, monkeypatch):
+    # A cache hit's record is created already completed
+    monkeypatch.setattr(
+        main.result_cache,
+        "lookup",
+        lambda key, job_id: {"image_url": f"/images/{job_id}.png", "generation_time": 1.5},
+    )
+    request = {"prompt": "a dragon", "seed": 42, "num_inference_steps": 10}
+
+    first = client.post("/api/generate", json=request)
+    assert first.status_code == 200
+    first_id = first.json()["job_id"]
+    record = job_store.get(first_id)
+    assert record["status"] == "completed"
+    assert record["finished_at"] is not None
+
+    # The next write runs the periodic purge, which removes the hit once it expires
+    record["finished_at"] -= job_store.ttl_seconds + 1
+    job_store._jobs[first_id] = record
+    job_store._last_purge = 0
+    second = client.post("/api/generate", json=request)
+    assert second.status_code == 200
+    assert job_store.get(first_id) is None
+    assert job_store.get(second.json()["job_id"])["status"] == "completed"
+
+
+def test_partially_admitted_batch(client, job_store, monkeypatch):
+    submitted = []
+
+    def submit(job):
+        # The queue fills up between the batch's depth check and its second item
+        if submitted:
+            raise QueueFullError("Queue is full")
+        submitted.append(job.job_id)
+
+    monkeypatch.setattr(main.job_queue, "submit", submit)
+    response = client.post("/api/generate_batch", json={
+        "items": [{"prompt": "a red dragon"}, {"prompt": "a blue dragon"}],
+        "defaults": {"num_inference_steps": 10},
+    })
+    assert response.status_code == 200
+    admitted_id, rejected_id = response.json()["job_ids"]
+    assert submitted == [admitted_id]
+
+    rejected = job_store.get(rejected_id)
+    assert rejected["status"] == "failed"
+    assert rejected["message"] == "Queue is full"
+    assert rejected["finished_at"] is not None
+    assert job_store.get(admitted_id)["status"] == "queued"
+
+    batch = client.get(f"/api/batches/{response.json()['batch_id']}").json()
+    assert [job["status"] for job in batch["jobs"]] == ["queued", "failed"]
+
+    # The rejected item expires with the TTL; the purge must not trip over it
+    job_store._jobs[rejected_id]["finished_at"] -= job_store.ttl_seconds + 1
+    assert job_store.purge_expired() == 1
+    assert job_store.get(rejected_id) is None
+    assert job_store.get(admitted_id) is not None
+
+
+def submit_with_identity(client, monkeypatch, headers):
+    monkeypatch.setattr(main.job_queue, "submit", lambda job: None)
+    response = client.post(
+        "/api/generate",
+        json={"prompt": "a dragon", "num_inference_steps": 10, "owner": "user-7", "tier": "enterprise"},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    return response.json()["job_id"]
+
+
+def test_owner_and_tier_ignored_without_identity_token(client, job_store, monkeypatch):
+    monkeypatch.setattr(main.settings, "identity_token", "rails-token")
+    for headers in ({}, {"X-Identity-Token": "guess"}):
+        record = job_store.get(submit_with_identity(client, monkeypatch, headers))
+        assert record["owner"] is None
+        assert record["tier"] is None
+
+
+def test_owner_and_tier_ignored_when_no_token_configured(client, job_store, monkeypatch):
+    monkeypatch.setattr(main.settings, "identity_token", "")
+    record = job_store.get(submit_with_identity(client, monkeypatch, {"X-Identity-Token": ""}))
+    assert (record["owner"], record["tier"]) == (None, None)
+
+
+def test_owner_and_tier_from_trusted_caller(client, job_store, monkeypatch):
+    monkeypatch.setattr(main.settings, "identity_token", "rails-token")
+    record = job_store.get(submit_with_identity(client, monkeypatch, {"X-Identity-Token": "rails-token"}))
+    assert (record["owner"], record["tier"]) == ("user-7", "enterprise")
+
+
+def test_bulk_status_orders_queue_once(client, job_store, monkeypatch):
+    queue = JobQueue(num_workers=1, max_queue_size=10)
+    monkeypatch.setattr(main, "job_queue", queue)
+    orderings = []
+    ordered = queue._ordered
+    monkeypatch.setattr(queue, "_ordered", lambda now: orderings.append(now) or ordered(now))
+
+    job_ids = [f"job-{index}" for index in range(4)]
+    for job_id in job_ids:
+        job_store.create(job_id, {"status": "queued", "estimated_seconds": 10.0})
+        queue.submit(QueuedJob(job_id=job_id, task=lambda: None, estimated_seconds=10.0))
+    job_store.create("done", {"status": "completed"})
+
+    response = client.post("/api/status/bulk", json={"job_ids": job_ids + ["done", "gone"]})
+    assert response.status_code == 200
+    assert len(orderings) == 1
+    jobs = {job["job_id"]: job for job in response.json()["jobs"]}
+    assert [jobs[job_id]["queue_position"] for job_id in job_ids] == [1, 2, 3, 4]
+    assert [jobs[job_id]["eta_seconds"] for job_id in job_ids] == [10.0, 20.0, 30.0, 40.0]
+    assert "queue_position" not in jobs["done"]
+    assert response.json()["missing"] == ["gone"]
+
+    # The ETag sees the same positions as the body
+    etag = response.headers["ETag"]
+    assert client.post(
+        "/api/status/bulk", json={"job_ids": job_ids + ["done", "gone"]}, headers={"If-None-Match": etag}
+    ).status_code == 304
+    # Positions move when the queue does, even though no record changed
+    queue.cancel("job-0")
+    assert client.post(
+        "/api/status/bulk", json={"job_ids": job_ids + ["done", "gone"]}, headers={"If-None-Match": etag}
+    ).status_code == 200
+
+
+def test_queue_positions_reuse_order_until_queue_changes(monkeypatch):
+    queue = JobQueue(num_workers=1, max_queue_size=10)
+    orderings = []
+    ordered = queue._ordered
+    monkeypatch.setattr(queue, "_ordered", lambda now: orderings.append(now) or ordered(now))
+    for index in range(3):
+        queue.submit(QueuedJob(job_id=f"job-{index}", task=lambda: None, estimated_seconds=10.0))
+
+    # Polling every job's position and wait sorts the queue once
+    assert [queue.position(f"job-{index}") for index in range(3)] == [1, 2, 3]
+    assert queue.wait_estimate("job-2") == (3, 20.0)
+    assert queue.position("gone") is None
+    assert len(orderings) == 1
+
+    # Any change to the queue is seen by the next lookup
+    queue.cancel("job-0")
+    assert queue.position("job-2") == 2
+    queue.submit(QueuedJob(job_id="job-3", task=lambda: None))
+    assert queue.position("job-3") == 3
+    assert len(orderings) == 3
+
+    # A cached order is also dropped once it is ORDER_CACHE_SECONDS old
+    monkeypatch.setattr(job_queue_module, "ORDER_CACHE_SECONDS", 0.0)
+    queue.position("job-3")
+    assert len(orderings) == 4
+
+
+def png_bytes(size=(64, 64)):
+    buffer = BytesIO()
+    Image.new("RGB", size, (10, 20, 30)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_img2img_upload_over_limit_is_refused(client, job_store, monkeypatch):
+    admission = AdmissionController(max_wait_seconds=0, max_upload_images=8)
+    monkeypatch.setattr(main, "admission", admission)
+    monkeypatch.setattr(main, "MAX_UPLOAD_MB", 1)
+    monkeypatch.setattr(main, "UPLOAD_CHUNK_BYTES", 64 * 1024)
+
+    oversized = png_bytes() + b"\0" * (1024 * 1024)
+    response = client.post(
+        "/api/generate_img2img",
+        data={"prompt": "a dragon"},
+        files={"init_image": ("dragon.png", oversized, "image/png")},
+    )
+    assert response.status_code == 400
+    assert "too large" in response.json()["detail"]
+    assert admission.upload_images_held == 0
+    assert job_store.list_jobs() == []
+
+
+def test_inpaint_upload_reserved_before_reading(client, job_store, monkeypatch):
+    monkeypatch.setattr(main, "admission", AdmissionController(max_wait_seconds=0, max_upload_images=1))
+
+    def read_upload(upload, name):
+        raise AssertionError("upload read without a reservation")
+
+    monkeypatch.setattr(main, "read_upload", read_upload)
+    response = client.post(
+        "/api/generate_inpaint",
+        data={"prompt": "a dragon"},
+        files={
+            "init_image": ("dragon.png", png_bytes(), "image/png"),
+            "mask_image": ("mask.png", png_bytes(), "image/png"),
+        },
+    )
+    assert response.status_code == 429
+    assert "Retry-After" in response.headers
+
+
+def test_img2img_cache_hit_releases_reservation(client, job_store, monkeypatch):
+    admission = AdmissionController(max_wait_seconds=0, max_upload_images=8)
+    monkeypatch.setattr(main, "admission", admission)
+    monkeypatch.setattr(
+        main.result_cache,
+        "lookup",
+        lambda key, job_id: {"image_url": f"/images/{job_id}.png", "generation_time": 1.5},
+    )
+    response = client.post(
+        "/api/generate_img2img",
+        data={"prompt": "a dragon", "seed": "7"},
+        files={"init_image": ("dragon.png", png_bytes(), "image/png")},
+    )
+    assert response.status_code == 200
+    assert job_store.get(response.json()["job_id"])["status"] == "completed"
+    assert admission.upload_images_held == 0
+
+
+class CountingFile(BytesIO):
+    """File that records how many bytes were read from it."""
+
+    bytes_read = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.bytes_read += len(data)
+        return data
+
+
+def test_read_upload_stops_at_limit_without_declared_size(monkeypatch):
+    monkeypatch.setattr(main, "MAX_UPLOAD_MB", 1)
+    monkeypatch.setattr(main, "UPLOAD_CHUNK_BYTES", 64 * 1024)
+    file = CountingFile(b"x" * (8 * 1024 * 1024))
+    with pytest.raises(HTTPException) as raised:
+        main.read_upload(UploadFile(file), "init_image")
+    assert raised.value.status_code == 400
+    assert file.bytes_read <= 1024 * 1024 + 64 * 1024
+
+    small = png_bytes()
+    assert main.read_upload(UploadFile(BytesIO(small)), "init_image") == small
+
+
+@pytest.mark.parametrize("path", [
+    "/api/generate",
+    "/api/generate_batch",
+    "/api/generate_sweep",
+    "/api/generate_img2img",
+    "/api/generate_inpaint",
+    "/api/status/{job_id}",
+    "/api/status/bulk",
+    "/api/batches/{batch_id}",
+    "/api/jobs/{job_id}",
+    "/api/queue",
+])
+def test_job_store_handlers_run_in_threadpool(path):
+    # Job store and shared queue calls block, so these must not run on the event loop
+    endpoints = [route.endpoint for route in main.app.routes if getattr(route, "path", None) == path]
+    assert endpoints
+    assert not any(inspect.iscoroutinefunction(endpoint) for endpoint in endpoints)
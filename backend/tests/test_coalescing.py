@@ -0,0 +1,87 @@
+"""Tests for sharing the work of identical in-flight requests."""
+from app import main
+from app.coalescing import InFlightRegistry, request_fingerprint
+from app.job_queue import JobQueue
+
+PARAMS = {"model_key": "sd-v1-5", "prompt": "a dragon", "seed": 42, "num_inference_steps": 30}
+
+
+def test_request_fingerprint():
+    assert request_fingerprint("txt2img", {**PARAMS, "seed": None}) is None
+    assert request_fingerprint("txt2img", {k: v for k, v in PARAMS.items() if k != "seed"}) is None
+
+    fingerprint = request_fingerprint("txt2img", PARAMS)
+    assert fingerprint == request_fingerprint("txt2img", dict(reversed(list(PARAMS.items()))))
+    assert fingerprint != request_fingerprint("img2img", PARAMS)
+    assert fingerprint != request_fingerprint("txt2img", {**PARAMS, "seed": 43})
+    with_image = request_fingerprint("img2img", PARAMS, images=[b"a"])
+    assert with_image != request_fingerprint("img2img", PARAMS, images=[b"b"])
+
+
+def test_attach_fans_out_to_subscribers():
+    registry = InFlightRegistry()
+    attached = []
+    assert registry.attach("fp", "dup", on_attach=attached.append) is None  # Nothing in flight yet
+
+    registry.register("fp", "leader")
+    registry.register("fp", "other")  # A second leader for the same fingerprint is ignored
+    assert registry.attach("fp", "dup-1", on_attach=attached.append) == "leader"
+    assert registry.attach("fp", "dup-2", on_attach=attached.append) == "leader"
+    assert attached == ["leader", "leader"]
+    assert registry.leader_of("dup-1") == "leader"
+    assert registry.subscribers("leader") == ["leader", "dup-1", "dup-2"]
+    assert registry.stats() == {"in_flight": 1, "attached": 2, "coalesced_total": 2}
+
+    assert registry.finish("leader") == ["leader", "dup-1", "dup-2"]
+    assert registry.leader_of("dup-1") == "dup-1"
+    assert registry.stats()["in_flight"] == 0
+    # Later identical requests start fresh work
+    assert registry.attach("fp", "dup-3", on_attach=attached.append) is None
+
+
+def test_unregistered_jobs_update_only_themselves():
+    registry = InFlightRegistry()
+    registry.register(None, "unseeded")
+    assert registry.subscribers("unseeded") == ["unseeded"]
+    assert registry.finish("unseeded") == ["unseeded"]
+    assert registry.detach("unseeded") is False
+
+
+def test_detach_until_last_subscriber():
+    registry = InFlightRegistry()
+    registry.register("fp", "leader")
+    registry.attach("fp", "dup", on_attach=lambda leader_id: None)
+
+    # The leader's own request can be cancelled while a duplicate still waits
+    assert registry.detach("leader") is True
+    assert registry.subscribers("leader") == ["dup"]
+    # The last subscriber cannot detach: its cancel stops the work
+    assert registry.detach("dup") is False
+    assert registry.finish("leader") == ["dup"]
+
+
+def test_cancelling_subscriber_keeps_leader_running(client, job_store, monkeypatch):
+    queue = JobQueue(num_workers=1, max_queue_size=10)
+    monkeypatch.setattr(main, "job_queue", queue)
+    monkeypatch.setattr(main, "coalescer", InFlightRegistry())
+    monkeypatch.setattr(main.result_cache, "lookup", lambda key, job_id: None)
+    request = {"prompt": "a dragon", "seed": 42, "num_inference_steps": 10}
+
+    leader_id = client.post("/api/generate", json=request).json()["job_id"]
+    subscriber_id = client.post("/api/generate", json=request).json()["job_id"]
+    assert subscriber_id != leader_id
+    assert job_store.get(subscriber_id)["coalesced_with"] == leader_id
+    assert queue.depth == 1
+
+    response = client.delete(f"/api/jobs/{subscriber_id}")
+    assert response.json()["status"] == "cancelled"
+    assert queue.holds(leader_id)
+    assert job_store.get(leader_id)["status"] == "queued"
+
+    # Updates from the leader's task no longer reach the detached job
+    main.update_job(leader_id, status="processing", progress_percent=50)
+    assert job_store.get(subscriber_id)["status"] == "cancelled"
+
+    # With no one else waiting, cancelling the leader stops the work
+    assert client.delete(f"/api/jobs/{leader_id}").json()["status"] == "cancelled"
+    assert not queue.holds(leader_id)
@@ -0,0 +1,218 @@
+"""Tests for content-hash sharing of component weights.
+
+The sharing and reporting logic is tested with stub modules and tensors;
+the tests marked needs_torch run it on real torch modules.
+"""
+import gc
+import itertools
+import types
+
+import pytest
+
+from app import dedup as dedup_module
+from app.dedup import ComponentDeduplicator, module_fingerprint, share_tensors, shared_bytes
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+needs_torch = pytest.mark.skipif(torch is None, reason="needs torch")
+
+_pointers = itertools.count(1)
+
+
+class StubStorage:
+    def __init__(self, nbytes):
+        self._nbytes = nbytes
+        self._ptr = next(_pointers)
+
+    def data_ptr(self):
+        return self._ptr
+
+    def nbytes(self):
+        return self._nbytes
+
+
+class StubTensor:
+    """Tensor whose .data can be pointed at another tensor's storage, like torch's."""
+
+    dtype = "float32"
+
+    def __init__(self, nbytes, device="cuda:0"):
+        self.shape = (nbytes // 4,)
+        self.device = device
+        self.storage = StubStorage(nbytes)
+
+    def untyped_storage(self):
+        return self.storage
+
+    @property
+    def data(self):
+        return self
+
+    @data.setter
+    def data(self, other):
+        self.storage, self.device = other.storage, other.device
+
+    def to(self, device):
+        """Move to a device, into fresh storage as torch does."""
+        self.storage, self.device = StubStorage(self.storage.nbytes()), device
+
+
+class StubModule:
+    def __init__(self, fingerprint, **sizes):
+        self.fingerprint = fingerprint
+        self.tensors = {name: StubTensor(nbytes) for name, nbytes in sizes.items()}
+
+    def named_parameters(self):
+        return list(self.tensors.items())
+
+    def named_buffers(self):
+        return []
+
+    def to(self, device):
+        for tensor in self.tensors.values():
+            tensor.to(device)
+        return self
+
+
+@pytest.fixture
+def stub_fingerprints(monkeypatch):
+    monkeypatch.setattr(dedup_module, "module_fingerprint", lambda module: module.fingerprint)
+
+
+def test_share_tensors_points_at_source_storage():
+    source = StubModule("clip", weight=400, bias=40)
+    module = StubModule("clip", weight=400, bias=40)
+    assert share_tensors(module, source) == 440
+    assert module.tensors["weight"].storage is source.tensors["weight"].storage
+    assert shared_bytes(module, source) == 440
+    # Already shared: nothing more to save
+    assert share_tensors(module, source) == 0
+
+    # Tensors on another device are left alone rather than shared across devices
+    elsewhere = StubModule("clip", weight=400, bias=40).to("cpu")
+    assert share_tensors(elsewhere, source) == 0
+    assert shared_bytes(elsewhere, source) == 0
+
+
+def test_stats_report_only_storage_still_shared(stub_fingerprints):
+    dedup = ComponentDeduplicator(["text_encoder", "vae"])
+    base = types.SimpleNamespace(text_encoder=StubModule("clip", weight=400), vae=StubModule("vae-a", weight=100))
+    twin = types.SimpleNamespace(text_encoder=StubModule("clip", weight=400), vae=StubModule("vae-b", weight=100))
+
+    assert dedup.deduplicate("base", "txt2img", base) == 0
+    assert dedup.deduplicate("twin", "txt2img", twin) == 400
+    assert dedup.stats()["pipelines"] == [{
+        "model_id": "twin",
+        "mode": "txt2img",
+        "bytes_saved": 400,
+        "components": {"text_encoder": {"shared_with": "base", "bytes": 400}},
+    }]
+
+    # Moving the twin to another device gives it fresh storage; the report follows
+    twin.text_encoder.to("cuda:1")
+    assert dedup.stats()["bytes_saved"] == 0
+    assert dedup.stats()["pipelines"] == []
+
+
+def test_stub_sharing_ends_when_holders_are_collected(stub_fingerprints):
+    dedup = ComponentDeduplicator(["text_encoder"])
+    base = types.SimpleNamespace(text_encoder=StubModule("clip", weight=400))
+    twin = types.SimpleNamespace(text_encoder=StubModule("clip", weight=400))
+    dedup.deduplicate("base", "txt2img", base)
+    dedup.deduplicate("twin", "txt2img", twin)
+    assert dedup.stats()["bytes_saved"] == 400
+
+    del base
+    gc.collect()
+    assert dedup.stats()["pipelines"] == []
+    again = types.SimpleNamespace(text_encoder=StubModule("clip", weight=400))
+    assert dedup.deduplicate("again", "txt2img", again) == 400
+    assert dedup.stats()["pipelines"][0]["components"]["text_encoder"]["shared_with"] == "twin"
+
+    del twin, again
+    gc.collect()
+    assert dedup.stats()["bytes_saved"] == 0
+    assert dedup._loaded == {}
+
+
+def encoder(seed):
+    torch.manual_seed(seed)
+    return torch.nn.Sequential(torch.nn.Linear(8, 16), torch.nn.LayerNorm(16), torch.nn.Linear(16, 4))
+
+
+def pipeline(seed):
+    return types.SimpleNamespace(text_encoder=encoder(seed), vae=None)
+
+
+def storage_ptrs(module):
+    return [tensor.untyped_storage().data_ptr() for tensor in module.state_dict().values()]
+
+
+def storage_bytes(module):
+    return sum(tensor.untyped_storage().nbytes() for tensor in module.state_dict().values())
+
+
+@needs_torch
+def test_fingerprint_matches_only_identical_modules():
+    assert module_fingerprint(encoder(0)) == module_fingerprint(encoder(0))
+    assert module_fingerprint(encoder(0)) != module_fingerprint(encoder(1))
+    # Same weights in another class are not interchangeable
+    first, second = torch.nn.Linear(4, 4), torch.nn.Linear(4, 4)
+    second.load_state_dict(first.state_dict())
+    wrapped = torch.nn.Sequential(second)
+    assert module_fingerprint(first) == module_fingerprint(second)
+    assert module_fingerprint(first) != module_fingerprint(wrapped)
+
+
+@needs_torch
+def test_shares_storage_only_on_fingerprint_match():
+    dedup = ComponentDeduplicator(["text_encoder", "vae"])
+    base, twin, other = pipeline(0), pipeline(0), pipeline(1)
+
+    assert dedup.deduplicate("base", "txt2img", base) == 0
+    saved = dedup.deduplicate("twin", "txt2img", twin)
+    assert saved == storage_bytes(twin.text_encoder)
+    assert storage_ptrs(twin.text_encoder) == storage_ptrs(base.text_encoder)
+    # The twin keeps its own layer objects; only the weights are shared
+    assert twin.text_encoder[0] is not base.text_encoder[0]
+
+    assert dedup.deduplicate("other", "txt2img", other) == 0
+    assert not set(storage_ptrs(other.text_encoder)) & set(storage_ptrs(base.text_encoder))
+
+    stats = dedup.stats()
+    assert stats["bytes_saved"] == saved
+    assert stats["pipelines"] == [{
+        "model_id": "twin",
+        "mode": "txt2img",
+        "bytes_saved": saved,
+        "components": {"text_encoder": {"shared_with": "base", "bytes": saved}},
+    }]
+
+
+@needs_torch
+def test_sharing_ends_when_holders_are_collected():
+    dedup = ComponentDeduplicator(["text_encoder"])
+    base, twin = pipeline(0), pipeline(0)
+    dedup.deduplicate("base", "txt2img", base)
+    dedup.deduplicate("twin", "txt2img", twin)
+    assert dedup.stats()["bytes_saved"] > 0
+
+    # Evicting the source leaves the twin as the only (and unshared) holder
+    del base
+    gc.collect()
+    assert dedup.stats()["bytes_saved"] == 0
+    assert dedup.stats()["pipelines"] == []
+
+    # A later identical load shares with the surviving copy
+    again = pipeline(0)
+    assert dedup.deduplicate("again", "txt2img", again) == storage_bytes(again.text_encoder)
+    assert storage_ptrs(again.text_encoder) == storage_ptrs(twin.text_encoder)
+    assert dedup.stats()["pipelines"][0]["components"]["text_encoder"]["shared_with"] == "twin"
+
+    del twin, again
+    gc.collect()
+    assert dedup.stats()["bytes_saved"] == 0
+    assert dedup._loaded == {}
@@ -0,0 +1,80 @@
+"""Tests for stall detection of inference worker processes."""
+import queue
+import threading
+import time
+
+import pytest
+
+from app import inference
+from app.inference import ProcessInference, WorkerCrashed
+
+
+class FakeWorker:
+    """Stands in for _WorkerProcess: messages are put in the request's inbox by hand."""
+
+    index = 0
+
+    def __init__(self):
+        self.inbox = queue.Queue()
+        self.last_heartbeat = self.last_loading = time.time()
+        self.killed = False
+
+    def register(self, request_id):
+        return self.inbox
+
+    def unregister(self, request_id):
+        pass
+
+    def send(self, message):
+        pass
+
+    def kill(self):
+        self.killed = True
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    monkeypatch.setattr(inference, "POLL_INTERVAL_SECONDS", 0.02)
+    return ProcessInference(num_processes=1, stall_timeout=0.3)
+
+
+def beat(worker, loading, seconds):
+    """Send heartbeats the way the reader thread records them, for a while."""
+    def run():
+        deadline = time.time() + seconds
+        while time.time() < deadline:
+            worker.last_heartbeat = time.time()
+            if loading:
+                worker.last_loading = worker.last_heartbeat
+            time.sleep(0.05)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_silent_load_is_not_a_stall(backend):
+    worker = FakeWorker()
+    beat(worker, loading=True, seconds=1.0)
+    threading.Timer(0.8, lambda: worker.inbox.put(("result", 1, "done"))).start()
+
+    assert backend._call_worker(worker, "generate_image") == "done"
+    assert not worker.killed
+
+
+def test_silence_outside_loads_is_a_stall(backend):
+    worker = FakeWorker()
+    beat(worker, loading=False, seconds=1.0)
+
+    with pytest.raises(WorkerCrashed, match="stalled"):
+        backend._call_worker(worker, "generate_image")
+    assert worker.killed
+
+
+def test_missing_heartbeats_restart_the_worker(backend):
+    worker = FakeWorker()
+    worker.last_loading = time.time() + 60  # Even mid-load
+
+    with pytest.raises(WorkerCrashed, match="no heartbeat"):
+        backend._call_worker(worker, "generate_image")
+    assert worker.killed
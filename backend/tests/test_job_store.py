@@ -0,0 +1,131 @@
+"""Tests for the in-memory, SQLite and Redis job stores."""
+import json
+import time
+
+import pytest
+
+from app.job_store import FINISHED_STATUSES, GET_MANY_CHUNK_SIZE, MemoryJobStore, RedisJobStore, SQLiteJobStore
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryJobStore(ttl_seconds=3600)
+    if request.param == "sqlite":
+        return SQLiteJobStore(str(tmp_path / "jobs.db"), ttl_seconds=3600)
+    fakeredis = pytest.importorskip("fakeredis")
+    return RedisJobStore(fakeredis.FakeRedis(decode_responses=True), ttl_seconds=3600)
+
+
+def expire(store, *job_ids):
+    """Age finished records past the TTL without sleeping."""
+    for job_id in job_ids:
+        if isinstance(store, MemoryJobStore):
+            store._jobs[job_id]["finished_at"] -= store.ttl_seconds + 1
+        elif isinstance(store, RedisJobStore):
+            record = store.get(job_id)
+            record["finished_at"] -= store.ttl_seconds + 1
+            store._redis.set(store._key(job_id), json.dumps(record))
+            store._redis.zadd(store._finished_key, {job_id: record["finished_at"]})
+        else:
+            store._conn().execute(
+                "UPDATE jobs SET finished_at = finished_at - ? WHERE job_id = ?",
+                (store.ttl_seconds + 1, job_id),
+            )
+
+
+def test_create_and_get(store):
+    store.create("a", {"status": "queued", "prompt": "a dragon", "progress_percent": 0})
+    record = store.get("a")
+    assert record["job_id"] == "a"
+    assert record["status"] == "queued"
+    assert record["prompt"] == "a dragon"
+    assert record["created_at"] == record["updated_at"]
+    assert record["finished_at"] is None
+    assert "a" in store
+    assert store.get("missing") is None
+
+
+def test_get_returns_a_copy(store):
+    store.create("a", {"status": "queued"})
+    store.get("a")["status"] = "completed"
+    assert store.get("a")["status"] == "queued"
+
+
+def test_get_many(store):
+    job_ids = [f"job-{index}" for index in range(GET_MANY_CHUNK_SIZE + 5)]
+    for job_id in job_ids:
+        store.create(job_id, {"status": "queued"})
+    records = store.get_many(job_ids + ["missing"])
+    assert set(records) == set(job_ids)
+    assert records["job-3"]["job_id"] == "job-3"
+
+
+def test_update_merges_fields_and_sets_finished_at(store):
+    store.create("a", {"status": "queued", "prompt": "a dragon"})
+    store.update("a", status="processing", progress_percent=50)
+    record = store.get("a")
+    assert record["status"] == "processing"
+    assert record["progress_percent"] == 50
+    assert record["prompt"] == "a dragon"
+    assert record["finished_at"] is None
+
+    store.update("a", status="completed", image_url="/images/a.png")
+    record = store.get("a")
+    assert record["finished_at"] is not None
+    assert record["image_url"] == "/images/a.png"
+
+    store.update("missing", status="completed")
+    assert store.get("missing") is None
+
+
+def test_list_jobs_newest_first_and_by_status(store):
+    for index, status in enumerate(["queued", "completed", "queued"]):
+        store.create(f"job-{index}", {"status": status})
+        time.sleep(0.001)
+    assert [job["job_id"] for job in store.list_jobs()] == ["job-2", "job-1", "job-0"]
+    assert [job["job_id"] for job in store.list_jobs(status="queued")] == ["job-2", "job-0"]
+    assert [job["job_id"] for job in store.list_jobs(limit=1)] == ["job-2"]
+
+    store.update("job-0", status="failed")
+    assert [job["job_id"] for job in store.list_jobs(status="failed")] == ["job-0"]
+
+
+def test_delete(store):
+    store.create("a", {"status": "queued"})
+    store.delete("a")
+    assert store.get("a") is None
+    assert store.list_jobs(status="queued") == []
+
+
+def test_purge_expired_keeps_unfinished_and_recent(store):
+    store.create("running", {"status": "processing"})
+    store.create("recent", {"status": "queued"})
+    store.create("old", {"status": "queued"})
+    store.update("recent", status="completed")
+    store.update("old", status="failed")
+    expire(store, "old")
+
+    assert store.purge_expired() == 1
+    assert store.get("old") is None
+    assert store.get("recent") is not None
+    assert store.get("running") is not None
+
+
+@pytest.mark.parametrize("status", FINISHED_STATUSES)
+def test_records_created_finished_expire(store, status):
+    # e.g. result cache hits (completed) or batch items that lost a race for queue space (failed)
+    store.create("a", {"status": status})
+    assert store.get("a")["finished_at"] is not None
+
+    expire(store, "a")
+    assert store.purge_expired() == 1
+    assert store.get("a") is None
+
+
+def test_periodic_purge_after_creating_finished_record(store):
+    store.create("cached", {"status": "completed"})
+    store._last_purge = 0  # Make the next write run the periodic purge
+    store.create("next", {"status": "queued"})
+    assert store.get("next")["status"] == "queued"
+    assert store.get("cached") is not None
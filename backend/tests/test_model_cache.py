@@ -0,0 +1,245 @@
+"""Tests for the memory-budgeted pipeline cache, with fake pipelines instead of torch."""
+import itertools
+import threading
+import time
+
+import pytest
+
+from app.model_cache import ModelCache, pipeline_storages
+
+_pointers = itertools.count(1)
+
+
+class FakeStorage:
+    def __init__(self, nbytes):
+        self._nbytes = nbytes
+        self._ptr = next(_pointers)
+
+    def data_ptr(self):
+        return self._ptr
+
+    def nbytes(self):
+        return self._nbytes
+
+
+class FakeTensor:
+    device = "cpu"
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def untyped_storage(self):
+        return self.storage
+
+
+class FakeModule:
+    """Has parameters() and buffers() like a torch module."""
+
+    def __init__(self, *storages):
+        self.tensors = [FakeTensor(storage) for storage in storages]
+
+    def parameters(self):
+        return iter(self.tensors)
+
+    def buffers(self):
+        return iter(())
+
+
+class FakePipeline:
+    def __init__(self, **components):
+        self.components = {"scheduler": object(), **components}
+
+
+def pipeline(*sizes):
+    return FakePipeline(unet=FakeModule(*(FakeStorage(size) for size in sizes)))
+
+
+def test_pipeline_storages_counts_shared_storage_once():
+    shared = FakeStorage(30)
+    pipe = FakePipeline(unet=FakeModule(shared, FakeStorage(10)), text_encoder=FakeModule(shared))
+    assert sorted(pipeline_storages(pipe).values()) == [10, 30]
+
+
+def test_evicts_least_recently_used_first():
+    evicted = []
+    cache = ModelCache(budget_bytes=100, on_evict=lambda model_id, mode, pipe: evicted.append(model_id))
+    cache.put("a", "txt2img", pipeline(40))
+    cache.put("b", "txt2img", pipeline(40))
+    assert cache.get("a", "txt2img") is not None  # a is now the most recently used
+
+    cache.put("c", "txt2img", pipeline(40))
+    assert evicted == ["b"]
+    assert cache.keys() == [("a", "txt2img"), ("c", "txt2img")]
+    assert cache.resident_bytes() == 80
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["evicted_bytes"] == 40
+
+
+def test_reserve_makes_room_for_measured_or_prior_size():
+    cache = ModelCache(budget_bytes=100)
+    cache.put("a", "txt2img", pipeline(50))
+    cache.put("b", "txt2img", pipeline(30))
+
+    # Never measured: the caller's prior decides
+    cache.reserve("c", "txt2img", prior_bytes=40)
+    assert cache.keys() == [("b", "txt2img")]
+
+    # Measured before: the prior is ignored
+    cache.reserve("a", "txt2img", prior_bytes=1000)
+    assert cache.keys() == [("b", "txt2img")]
+
+
+def test_pinned_pipelines_survive_eviction():
+    released = []
+    cache = ModelCache(budget_bytes=100, release_memory=lambda: released.append(True))
+    cache.put("a", "txt2img", pipeline(60))
+    with cache.pin("a", "txt2img"):
+        cache.put("b", "txt2img", pipeline(60))
+        # Over budget, but nothing evictable: both stay until the pin is released
+        assert cache.keys() == [("a", "txt2img"), ("b", "txt2img")]
+        assert cache.stats()["pipelines"][0]["pinned"] == 1
+        assert released == []
+
+    cache.put("c", "txt2img", pipeline(10))
+    assert ("a", "txt2img") not in cache
+    assert released == [True]
+
+
+def test_pin_taken_before_load_protects_new_pipeline():
+    cache = ModelCache(budget_bytes=100)
+    cache.put("a", "txt2img", pipeline(60))
+    with cache.pin("b", "img2img"):
+        cache.put("b", "img2img", pipeline(60))
+        cache.put("c", "txt2img", pipeline(10))
+        assert ("b", "img2img") in cache
+        assert ("a", "txt2img") not in cache
+
+
+def test_shared_storages_count_once_and_unique_bytes():
+    shared = FakeStorage(70)
+    cache = ModelCache(budget_bytes=100)
+    cache.put("sd", "txt2img", FakePipeline(unet=FakeModule(shared, FakeStorage(10))))
+    cache.put("sd", "img2img", FakePipeline(unet=FakeModule(shared, FakeStorage(5))))
+
+    # 70 + 10 + 5 fits, although the two pipelines measure 80 + 75
+    assert len(cache) == 2
+    assert cache.resident_bytes() == 85
+    pipelines = {entry["mode"]: entry for entry in cache.stats()["pipelines"]}
+    assert pipelines["txt2img"]["size_bytes"] == 80
+    assert pipelines["txt2img"]["unique_bytes"] == 10
+    assert pipelines["img2img"]["unique_bytes"] == 5
+
+    # Evicting one mode only frees what the other does not share
+    cache.put("other", "txt2img", pipeline(20))
+    assert cache.keys() == [("sd", "img2img"), ("other", "txt2img")]
+    assert cache.stats()["evicted_bytes"] == 10
+    assert cache.resident_bytes() == 95
+
+
+def test_unlimited_budget_never_evicts():
+    cache = ModelCache(budget_bytes=0)
+    for model_id in "abc":
+        cache.put(model_id, "txt2img", pipeline(10 ** 12))
+    assert len(cache) == 3
+
+
+def test_hits_misses_and_remove():
+    cache = ModelCache(budget_bytes=0)
+    assert cache.get("a", "txt2img") is None
+    cache.put("a", "txt2img", pipeline(1))
+    cache.put("a", "img2img", pipeline(1))
+    assert cache.get("a", "txt2img") is not None
+    assert cache.peek("a", "img2img") is not None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+    assert cache.remove("a", "img2img") == 1
+    assert cache.remove("a") == 1
+    assert len(cache) == 0
+
+
+
+def wait_for_waiters(cache, count):
+    deadline = time.time() + 5
+    while cache.stats()["load_waits"] < count and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def run_concurrent_loads(cache, loader, callers):
+    """Threads that each load the same pipeline; only the first (the leader) is started."""
+    outcomes = []
+
+    def load():
+        try:
+            cache.load("a", "txt2img", loader)
+            outcomes.append(None)
+        except Exception as e:
+            outcomes.append(e)
+
+    threads = [threading.Thread(target=load) for _ in range(callers)]
+    threads[0].start()
+    return threads, outcomes
+
+
+def test_concurrent_misses_load_once():
+    cache = ModelCache(budget_bytes=0)
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def loader():
+        calls.append(True)
+        started.set()
+        release.wait(5)
+        cache.put("a", "txt2img", pipeline(1))
+
+    threads, outcomes = run_concurrent_loads(cache, loader, 4)
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    wait_for_waiters(cache, 3)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert calls == [True]
+    assert outcomes == [None] * 4
+    stats = cache.stats()
+    assert (stats["loads"], stats["load_waits"], stats["loading"]) == (1, 3, [])
+    assert ("a", "txt2img") in cache
+
+
+def test_waiters_receive_leader_exception():
+    cache = ModelCache(budget_bytes=0)
+    started = threading.Event()
+    release = threading.Event()
+    failure = RuntimeError("CUDA out of memory")
+
+    def loader():
+        started.set()
+        release.wait(5)
+        raise failure
+
+    threads, outcomes = run_concurrent_loads(cache, loader, 4)
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    wait_for_waiters(cache, 3)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    # The leader and every waiter see the same exception, from a single attempt
+    assert len(outcomes) == 4
+    assert all(outcome is failure for outcome in outcomes)
+    stats = cache.stats()
+    assert (stats["loads"], stats["load_failures"], stats["load_waits"]) == (1, 1, 3)
+    assert stats["loading"] == []
+    assert ("a", "txt2img") not in cache
+
+    # wait_for_load ignores a failure, and the next miss tries again
+    cache.wait_for_load("a", "txt2img")
+    cache.load("a", "txt2img", lambda: cache.put("a", "txt2img", pipeline(1)))
+    assert ("a", "txt2img") in cache
+    assert cache.stats()["loads"] == 2
+
@@ -0,0 +1,96 @@
+"""Tests for pipeline construction in the model manager (needs torch and diffusers)."""
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("diffusers")
+
+from diffusers import DPMSolverMultistepScheduler  # noqa: E402
+
+from app.model_cache import pipeline_storages  # noqa: E402
+from app.models import StableDiffusionModel  # noqa: E402
+
+
+class TinyPipeline:
+    """Stand-in for a diffusers pipeline: registered modules and a config."""
+
+    def __init__(self, unet, vae, text_encoder, scheduler, safety_checker=None, requires_safety_checker=True):
+        self.unet = unet
+        self.vae = vae
+        self.text_encoder = text_encoder
+        self.scheduler = scheduler
+        self.safety_checker = safety_checker
+        self.config = {"requires_safety_checker": requires_safety_checker}
+
+    @property
+    def components(self):
+        return {
+            "unet": self.unet,
+            "vae": self.vae,
+            "text_encoder": self.text_encoder,
+            "scheduler": self.scheduler,
+            "safety_checker": self.safety_checker,
+        }
+
+    def register_to_config(self, **kwargs):
+        self.config.update(kwargs)
+
+
+class TinyImg2ImgPipeline(TinyPipeline):
+    pass
+
+
+def tiny_pipeline():
+    text_encoder = torch.nn.Embedding(16, 8)
+    unet = torch.nn.Sequential(torch.nn.Conv2d(4, 8, 3), torch.nn.BatchNorm2d(8), torch.nn.Conv2d(8, 4, 1))
+    vae = torch.nn.Sequential(torch.nn.Conv2d(3, 4, 1), torch.nn.Conv2d(4, 3, 1))
+    return TinyPipeline(unet, vae, text_encoder, DPMSolverMultistepScheduler())
+
+
+def test_derived_pipeline_shares_every_storage():
+    source = tiny_pipeline()
+    derived = StableDiffusionModel()._derive_pipeline(TinyImg2ImgPipeline, source, "tiny/model")
+
+    assert isinstance(derived, TinyImg2ImgPipeline)
+    source_storages = pipeline_storages(source)
+    assert source_storages  # Parameters and buffers were found
+    assert pipeline_storages(derived).keys() == source_storages.keys()
+
+    # Only the scheduler is new, and the derived pipeline is named after the model
+    assert derived.unet is source.unet
+    assert derived.scheduler is not source.scheduler
+    assert derived.scheduler.config.num_train_timesteps == source.scheduler.config.num_train_timesteps
+    assert derived.config["_name_or_path"] == "tiny/model"
+    assert derived.config["requires_safety_checker"] is False
+
+
+class CountingFluxPipeline:
+    """FLUX stand-in that counts prompt encodings and records each call's arguments."""
+
+    def __init__(self):
+        self.encodings = 0
+        self.calls = []
+
+    def encode_prompt(self, prompt, prompt_2, device, num_images_per_prompt):
+        self.encodings += 1
+        return torch.zeros(1, 4, 8), torch.zeros(1, 8), torch.zeros(4, 3)
+
+    def __call__(self, **kwargs):
+        self.calls.append(kwargs)
+        return type("Output", (), {"images": [object()] * kwargs["num_images_per_prompt"]})()
+
+
+def test_flux_sweep_encodes_prompt_once(monkeypatch):
+    model = StableDiffusionModel()
+    pipe = CountingFluxPipeline()
+    monkeypatch.setattr(model, "_get_pipeline", lambda model_id, mode: pipe)
+    grid = [{"num_inference_steps": steps, "guidance_scale": 0.0} for steps in (1, 2, 4)]
+
+    images = model.generate_image_sweep(
+        "a dragon", model_id="black-forest-labs/FLUX.1-schnell", grid=grid, seeds=[1, 2]
+    )
+    assert len(images) == 6
+    assert pipe.encodings == 1
+    assert len(pipe.calls) == 3
+    # Every cell reuses the same embeddings instead of the text prompt
+    assert all("prompt" not in call for call in pipe.calls)
+    assert all(call["prompt_embeds"] is pipe.calls[0]["prompt_embeds"] for call in pipe.calls)
@@ -0,0 +1,100 @@
+"""Tests for queue ordering policies."""
+from dataclasses import dataclass
+from typing import Optional
+
+import pytest
+
+from app.scheduling import (
+    FairSharePolicy,
+    FifoPolicy,
+    ShortestJobFirstPolicy,
+    create_policy,
+    job_cost,
+)
+from app.usage import UsageTracker
+
+
+@dataclass
+class Job:
+    job_id: str
+    cost: float
+    enqueued_at: float = 0.0
+    estimated_seconds: float = 0.0
+    owner: Optional[str] = None
+    tier: Optional[str] = None
+
+
+def run_order(policy, pending, now=100.0):
+    return [pending[index].job_id for index in policy.order(pending, now)]
+
+
+def test_job_cost_scales_with_steps_resolution_and_model():
+    assert job_cost("sd-v1-5", 30, 512, 512) == 30
+    assert job_cost("sd-v1-5", 30, 1024, 1024) == 120
+    assert job_cost("sd-v1-5", 15, 512, 512) == 15
+    # SDXL steps cost more at the same resolution; unknown models count as SD 1.5
+    assert job_cost("sdxl", 30, 512, 512) == 75
+    assert job_cost("no-such-model", 30, 512, 512) == 30
+
+
+def test_fifo_keeps_arrival_order():
+    pending = [Job("a", cost=90), Job("b", cost=10), Job("c", cost=50)]
+    assert run_order(FifoPolicy(), pending) == ["a", "b", "c"]
+
+
+def test_sjf_runs_cheapest_first_and_keeps_arrival_order_on_ties():
+    pending = [Job("a", cost=90), Job("b", cost=10), Job("c", cost=50), Job("d", cost=10)]
+    assert run_order(ShortestJobFirstPolicy(aging_rate=0.0), pending) == ["b", "d", "c", "a"]
+
+
+def test_sjf_aging_prevents_starvation():
+    policy = ShortestJobFirstPolicy(aging_rate=1.0)
+    expensive = Job("expensive", cost=120, enqueued_at=0.0)
+
+    # Cheap jobs that just arrived go first while the expensive one is young
+    cheap = Job("cheap", cost=10, enqueued_at=50.0)
+    assert run_order(policy, [expensive, cheap], now=50.0) == ["cheap", "expensive"]
+
+    # Once it has waited about its cost longer, it overtakes every new cheap arrival
+    cheap = Job("cheap", cost=10, enqueued_at=130.0)
+    assert run_order(policy, [expensive, cheap], now=130.0) == ["expensive", "cheap"]
+
+
+def test_fair_share_interleaves_owners_by_weight():
+    usage = UsageTracker(half_life_seconds=3600)
+    policy = FairSharePolicy(FifoPolicy(), usage, {"free": 1, "pro": 2})
+    pending = [Job(f"free-{index}", cost=1, estimated_seconds=10, owner="f", tier="free") for index in range(4)]
+    pending += [Job(f"pro-{index}", cost=1, estimated_seconds=10, owner="p", tier="pro") for index in range(4)]
+
+    order = run_order(policy, pending)
+    # The pro owner gets two jobs for each of the free owner's
+    assert order[:3] == ["pro-0", "free-0", "pro-1"]
+    assert order.index("pro-3") < order.index("free-2")
+
+
+def test_fair_share_favours_owners_with_little_recent_usage():
+    usage = UsageTracker(half_life_seconds=3600)
+    usage.record("heavy", None, 600.0)
+    policy = FairSharePolicy(FifoPolicy(), usage, {})
+    pending = [
+        Job("heavy-job", cost=1, estimated_seconds=10, owner="heavy"),
+        Job("light-job", cost=1, estimated_seconds=10, owner="light"),
+    ]
+    assert run_order(policy, pending) == ["light-job", "heavy-job"]
+
+
+def test_create_policy():
+    assert isinstance(create_policy("fifo", aging_rate=1.0), FifoPolicy)
+    sjf = create_policy("sjf", aging_rate=2.5)
+    assert isinstance(sjf, ShortestJobFirstPolicy)
+    assert sjf.aging_rate == 2.5
+
+    fair = create_policy("sjf", aging_rate=1.0, fair_share=True, usage=UsageTracker(60), tier_weights={"pro": 4})
+    assert isinstance(fair, FairSharePolicy)
+    assert isinstance(fair.inner, ShortestJobFirstPolicy)
+    assert fair.name == "fair+sjf"
+    assert fair.weight("pro") == 4
+    assert fair.weight(None) == 1.0
+
+    with pytest.raises(ValueError):
+        create_policy("lottery", aging_rate=1.0)
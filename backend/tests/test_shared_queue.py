@@ -0,0 +1,209 @@
+"""Tests for the SQLite and Redis queues shared between nodes."""
+import json
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from app.job_queue import QueuedJob, QueueFullError
+from app.shared_queue import RedisSharedQueue, SQLiteSharedQueue
+
+
+def generate_image_task(**kwargs):
+    pass
+
+
+SECRET_KEY = "WVx5qk6RM5zZ_3mQ2wS9V1r3yYp1rQy0Zk3cE8FhJ0U="
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def queue(request, tmp_path):
+    options = {"max_queue_size": 3, "lease_seconds": 60, "max_attempts": 2, "secret_key": SECRET_KEY}
+    if request.param == "sqlite":
+        return SQLiteSharedQueue(path=str(tmp_path / "queue.db"), upload_dir=str(tmp_path / "uploads"), **options)
+    fakeredis = pytest.importorskip("fakeredis")
+    return RedisSharedQueue(fakeredis.FakeRedis(decode_responses=True), **options)
+
+
+def make_job(job_id, **kwargs):
+    return QueuedJob(job_id=job_id, task=generate_image_task, kwargs=kwargs, model_id="model", mode="txt2img")
+
+
+def expire_leases(queue):
+    """Age every lease past its expiry without sleeping."""
+    if isinstance(queue, SQLiteSharedQueue):
+        queue._conn().execute("UPDATE shared_jobs SET lease_expires = ? WHERE state = 'leased'", (time.time() - 1,))
+    else:
+        for job_id in queue._redis.zrange(queue._leased_key, 0, -1):
+            queue._redis.zadd(queue._leased_key, {job_id: time.time() - 1})
+
+
+def has_uploads(queue, job_id):
+    if isinstance(queue, SQLiteSharedQueue):
+        return any(queue.upload_dir.glob(f"{job_id}.*"))
+    return queue._redis.exists(queue._upload_key(job_id)) > 0
+
+
+def test_put_and_lease(queue):
+    queue.put(make_job("a", prompt="a dragon", init_image=Image.new("RGB", (8, 8), (255, 0, 0))))
+    queue.put(make_job("b"))
+    assert queue.depth == 2
+
+    jobs, dropped = queue.lease("node-1", limit=1)
+    assert dropped == []
+    assert [job.job_id for job in jobs] == ["a"]
+    assert jobs[0].task == "generate_image_task"
+    assert jobs[0].kwargs["prompt"] == "a dragon"
+    assert jobs[0].kwargs["init_image"].getpixel((0, 0)) == (255, 0, 0)
+    assert queue.depth == 1
+
+    # A live lease is not handed to another node
+    jobs, _ = queue.lease("node-2", limit=5)
+    assert [job.job_id for job in jobs] == ["b"]
+
+    queue.complete("a", "node-1")
+    assert not has_uploads(queue, "a")
+    assert queue.stats()["leased"] == 1
+
+
+def test_put_rejects_when_full(queue):
+    for job_id in "abc":
+        queue.put(make_job(job_id))
+    with pytest.raises(QueueFullError):
+        queue.put(make_job("d", init_image=Image.new("RGB", (8, 8))))
+    assert queue.depth == 3
+    assert not has_uploads(queue, "d")
+
+
+def test_concurrent_puts_never_overfill(queue):
+    rejected = []
+
+    def put(job_id):
+        try:
+            queue.put(make_job(job_id))
+        except QueueFullError:
+            rejected.append(job_id)
+
+    threads = [threading.Thread(target=put, args=(f"job-{index}",)) for index in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert queue.depth == 3
+    assert len(rejected) == 9
+
+
+def test_heartbeat_keeps_lease(queue):
+    queue.put(make_job("a"))
+    queue.lease("node-1", limit=1)
+    expire_leases(queue)
+    queue.heartbeat("node-1", workers=1, job_ids={"a"})
+
+    jobs, dropped = queue.lease("node-2", limit=1)
+    assert jobs == [] and dropped == []
+
+
+def test_expired_lease_is_redelivered(queue):
+    queue.put(make_job("a"))
+    queue.lease("node-1", limit=1)
+    expire_leases(queue)
+
+    jobs, dropped = queue.lease("node-2", limit=1)
+    assert [job.job_id for job in jobs] == ["a"]
+    assert dropped == []
+
+    # The first node's late completion does not remove the re-delivered job
+    queue.complete("a", "node-1")
+    assert queue.stats()["leased"] == 1
+    queue.complete("a", "node-2")
+    assert queue.stats()["leased"] == 0
+
+
+def test_job_fails_after_max_attempts(queue):
+    queue.put(make_job("a", init_image=Image.new("RGB", (8, 8))))
+    for node in ("node-1", "node-2"):
+        jobs, dropped = queue.lease(node, limit=1)
+        assert [job.job_id for job in jobs] == ["a"]
+        expire_leases(queue)
+
+    jobs, dropped = queue.lease("node-3", limit=1)
+    assert jobs == []
+    assert dropped == [("a", "failed", "Generation failed: worker node lost 2 time(s)")]
+    assert queue.stats()["pending"] == queue.stats()["leased"] == 0
+    assert not has_uploads(queue, "a")
+
+
+def test_cancel_of_abandoned_job_is_dropped(queue):
+    queue.put(make_job("a"))
+    queue.lease("node-1", limit=1)
+    assert queue.request_cancel("a") == "cancelling"
+    expire_leases(queue)
+
+    jobs, dropped = queue.lease("node-2", limit=1)
+    assert jobs == []
+    assert dropped == [("a", "cancelled", "Job cancelled")]
+
+
+def test_release_returns_job_without_using_an_attempt(queue):
+    queue.put(make_job("a"))
+    queue.lease("node-1", limit=1)
+    queue.release("a", "node-1")
+    assert queue.depth == 1
+
+    queue.lease("node-2", limit=1)
+    expire_leases(queue)
+    jobs, dropped = queue.lease("node-3", limit=1)
+    assert [job.job_id for job in jobs] == ["a"]
+    assert dropped == []
+
+
+def stored_payload(queue, job_id):
+    """The job's payload as it sits in the database."""
+    if isinstance(queue, SQLiteSharedQueue):
+        return queue._conn().execute("SELECT payload FROM shared_jobs WHERE job_id = ?", (job_id,)).fetchone()[0]
+    return queue._redis.hget(queue._job_key(job_id), "payload")
+
+
+def test_callback_secret_travels_encrypted(queue):
+    job = make_job("a")
+    job.callback_secret = "s3cret-signing-key"
+    queue.put(job)
+    payload = stored_payload(queue, "a")
+    assert "s3cret-signing-key" not in payload
+    assert json.loads(payload)["callback_secret"] is not None
+
+    jobs, _ = queue.lease("node-1", limit=1)
+    assert jobs[0].callback_secret == "s3cret-signing-key"
+
+
+def test_callback_secret_refused_without_key(tmp_path):
+    queue = SQLiteSharedQueue(
+        path=str(tmp_path / "queue.db"), upload_dir=str(tmp_path / "uploads"),
+        max_queue_size=3, lease_seconds=60, max_attempts=2,
+    )
+    assert not queue.carries_secrets
+    job = make_job("a", init_image=Image.new("RGB", (8, 8)))
+    job.callback_secret = "s3cret"
+    with pytest.raises(ValueError):
+        queue.put(job)
+    assert queue.depth == 0
+    assert not has_uploads(queue, "a")
+
+
+def test_redis_nodes_share_only_the_server():
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    api, worker = (
+        RedisSharedQueue(fakeredis.FakeRedis(server=server, decode_responses=True), max_queue_size=3,
+                         lease_seconds=60, max_attempts=2)
+        for _ in range(2)
+    )
+    api.put(make_job("a", init_image=Image.new("RGB", (8, 8), (0, 0, 255))))
+    worker.heartbeat("worker-1", workers=2, job_ids=set())
+
+    jobs, _ = worker.lease("worker-1", limit=1)
+    assert jobs[0].kwargs["init_image"].getpixel((0, 0)) == (0, 0, 255)
+    assert api.stats()["nodes"]["worker-1"] == {"workers": 2, "last_seen_seconds_ago": 0.0, "leased": 1}
+    assert api.request_cancel("a") == "cancelling"
+    assert worker.heartbeat("worker-1", workers=2, job_ids={"a"}) == {"a"}
@@ -0,0 +1,99 @@
+"""Tests for deriving pipelines from another pipeline's modules, with stubs instead of torch."""
+import itertools
+import types
+
+from app.model_cache import pipeline_storages
+from app.sharing import derive_pipeline
+
+_pointers = itertools.count(1)
+
+
+class StubTensor:
+    device = "cpu"
+
+    def __init__(self, nbytes):
+        self.storage = types.SimpleNamespace(data_ptr=lambda ptr=next(_pointers): ptr, nbytes=lambda: nbytes)
+
+    def untyped_storage(self):
+        return self.storage
+
+
+class StubModule:
+    def __init__(self, *sizes):
+        self.tensors = [StubTensor(size) for size in sizes]
+
+    def parameters(self):
+        return iter(self.tensors)
+
+    def buffers(self):
+        return iter(())
+
+
+class StubPipeline:
+    """Registered modules and a config, like a diffusers pipeline."""
+
+    def __init__(self, unet, vae, text_encoder, scheduler, safety_checker=None, requires_safety_checker=True):
+        self.unet = unet
+        self.vae = vae
+        self.text_encoder = text_encoder
+        self.scheduler = scheduler
+        self.safety_checker = safety_checker
+        self.config = {"requires_safety_checker": requires_safety_checker}
+
+    @property
+    def components(self):
+        return {
+            "unet": self.unet,
+            "vae": self.vae,
+            "text_encoder": self.text_encoder,
+            "scheduler": self.scheduler,
+            "safety_checker": self.safety_checker,
+        }
+
+    def register_to_config(self, **kwargs):
+        self.config.update(kwargs)
+
+
+class StubImg2ImgPipeline(StubPipeline):
+    pass
+
+
+class StubUpscalePipeline:
+    """Takes fewer modules than the source has."""
+
+    def __init__(self, unet, vae, scheduler):
+        self.unet, self.vae, self.scheduler = unet, vae, scheduler
+        self.components = {"unet": unet, "vae": vae, "scheduler": scheduler}
+        self.config = {}
+
+    def register_to_config(self, **kwargs):
+        self.config.update(kwargs)
+
+
+def stub_pipeline():
+    return StubPipeline(StubModule(400, 40), StubModule(100), StubModule(200), scheduler=object())
+
+
+def test_derived_pipeline_shares_every_module_but_the_scheduler():
+    source = stub_pipeline()
+    scheduler = object()
+    derived = derive_pipeline(StubImg2ImgPipeline, source, "tiny/model", scheduler)
+
+    assert isinstance(derived, StubImg2ImgPipeline)
+    assert derived.unet is source.unet
+    assert derived.vae is source.vae
+    assert derived.text_encoder is source.text_encoder
+    assert derived.scheduler is scheduler
+    # Same storages, so the model cache counts the weights once
+    assert pipeline_storages(derived) == pipeline_storages(source)
+    assert sum(pipeline_storages(derived).values()) == 740
+    assert derived.config["_name_or_path"] == "tiny/model"
+    assert derived.config["requires_safety_checker"] is False
+
+
+def test_derived_pipeline_leaves_out_modules_it_does_not_take():
+    source = stub_pipeline()
+    derived = derive_pipeline(StubUpscalePipeline, source, "tiny/model", object())
+    assert derived.components.keys() == {"unet", "vae", "scheduler"}
+    assert derived.unet is source.unet
+    assert "requires_safety_checker" not in derived.config
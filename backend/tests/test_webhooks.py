@@ -0,0 +1,184 @@
+"""Tests for callback URL checks, delivery and signing secrets."""
+import socket
+
+import httpx
+import pytest
+
+from app import main
+from app.shared_queue import SQLiteSharedQueue
+from app.webhooks import (
+    SIGNATURE_HEADER,
+    TIMESTAMP_HEADER,
+    CallbackURLRejected,
+    Delivery,
+    WebhookDispatcher,
+    check_callback_url,
+    pin_public_address,
+    verify_signature,
+)
+
+
+def resolve_to(monkeypatch, *addresses):
+    def getaddrinfo(host, port, *args, **kwargs):
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (address, port)) for address in addresses]
+
+    monkeypatch.setattr(socket, "getaddrinfo", getaddrinfo)
+
+
+@pytest.mark.parametrize("url", [
+    "http://127.0.0.1/hook",
+    "http://localhost:3000/hook",
+    "http://api.localhost/hook",
+    "http://10.0.0.5/hook",
+    "http://192.168.1.10/hook",
+    "http://169.254.169.254/latest/meta-data/",
+    "http://[::1]/hook",
+    "http://[::ffff:127.0.0.1]/hook",
+    "http://0.0.0.0/hook",
+    "ftp://example.com/hook",
+    "/relative/hook",
+])
+def test_check_callback_url_rejects_internal_targets(url):
+    with pytest.raises(CallbackURLRejected):
+        check_callback_url(url, [])
+
+
+def test_check_callback_url_allowlist():
+    check_callback_url("https://example.com/hook", [])
+    check_callback_url("http://93.184.216.34/hook", [])
+    # Listed hosts are trusted even when internal
+    check_callback_url("http://localhost:3000/webhooks/generation", ["localhost"])
+    with pytest.raises(CallbackURLRejected):
+        check_callback_url("https://example.com/hook", ["localhost"])
+
+
+def test_pin_public_address(monkeypatch):
+    resolve_to(monkeypatch, "93.184.216.34")
+    url, host = pin_public_address("https://user:pw@hooks.example.com:8443/done?x=1")
+    assert str(url) == "https://user:pw@93.184.216.34:8443/done?x=1"
+    assert host == "hooks.example.com"
+
+
+def test_pin_public_address_rejects_rebinding(monkeypatch):
+    # Any internal address among the answers is refused
+    resolve_to(monkeypatch, "93.184.216.34", "169.254.169.254")
+    with pytest.raises(CallbackURLRejected):
+        pin_public_address("https://hooks.example.com/done")
+
+
+def make_dispatcher(**kwargs):
+    return WebhookDispatcher(
+        max_queue_size=10, max_attempts=3, timeout_seconds=1, backoff_seconds=1, max_backoff_seconds=1, **kwargs
+    )
+
+
+def test_delivery_goes_to_pinned_address(monkeypatch):
+    resolve_to(monkeypatch, "93.184.216.34")
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200)
+
+    dispatcher = make_dispatcher()
+    delivery = Delivery(url="https://hooks.example.com/done", secret="s3cret", event="job.completed", payload={"a": 1})
+    with httpx.Client(transport=httpx.MockTransport(handler)) as client:
+        dispatcher._attempt(client, delivery)
+
+    assert dispatcher.delivered == 1
+    request = requests[0]
+    assert request.url.host == "93.184.216.34"
+    assert request.headers["Host"] == "hooks.example.com"
+    assert request.extensions["sni_hostname"] == "hooks.example.com"
+    timestamp, signature = request.headers[TIMESTAMP_HEADER], request.headers[SIGNATURE_HEADER]
+    assert verify_signature("s3cret", timestamp, request.content, signature)
+
+
+def test_delivery_to_internal_address_fails_without_retry(monkeypatch):
+    resolve_to(monkeypatch, "10.0.0.5")
+    dispatcher = make_dispatcher()
+    delivery = Delivery(url="https://hooks.example.com/done", secret=None, event="job.completed", payload={})
+    with httpx.Client(transport=httpx.MockTransport(lambda request: pytest.fail("request sent"))) as client:
+        dispatcher._attempt(client, delivery)
+    assert dispatcher.failed == 1
+    assert dispatcher.retries == 0
+    assert "non-public address 10.0.0.5" in delivery.last_error
+
+
+def test_allowed_host_is_not_pinned():
+    requests = []
+    dispatcher = make_dispatcher(allowed_hosts=["localhost"])
+    delivery = Delivery(url="http://localhost:3000/webhooks/generation", secret=None, event="job.completed", payload={})
+    handler = lambda request: requests.append(request) or httpx.Response(204)
+    with httpx.Client(transport=httpx.MockTransport(handler)) as client:
+        dispatcher._attempt(client, delivery)
+    assert dispatcher.delivered == 1
+    assert requests[0].url.host == "localhost"
+
+
+def test_callback_secret_is_not_stored(client, job_store, monkeypatch):
+    monkeypatch.setattr(
+        main.result_cache,
+        "lookup",
+        lambda key, job_id: {"image_url": f"/images/{job_id}.png", "generation_time": 1.5},
+    )
+    sent = []
+    monkeypatch.setattr(main.webhook_dispatcher, "enqueue", lambda *args: sent.append(args))
+
+    response = client.post("/api/generate", json={
+        "prompt": "a dragon",
+        "seed": 42,
+        "callback_url": "https://hooks.example.com/done",
+        "callback_secret": "s3cret",
+    })
+    assert response.status_code == 200
+    record = job_store.get(response.json()["job_id"])
+    assert record["callback_url"] == "https://hooks.example.com/done"
+    assert "callback_secret" not in record
+    assert "s3cret" not in response.text
+
+    # The cache hit finished at once; its webhook was signed with the secret, which is then forgotten
+    url, secret, event, payload = sent[0]
+    assert (url, secret, event) == ("https://hooks.example.com/done", "s3cret", "job.completed")
+    assert main.webhook_dispatcher.pop_secret(record["job_id"]) is None
+
+
+def test_callback_url_to_metadata_service_is_refused(client):
+    response = client.post("/api/generate", json={
+        "prompt": "a dragon",
+        "callback_url": "http://169.254.169.254/latest/meta-data/",
+    })
+    assert response.status_code == 400
+
+
+def test_shared_queue_without_key_refuses_callback_secret(client, job_store, monkeypatch, tmp_path):
+    queue = SQLiteSharedQueue(
+        path=str(tmp_path / "queue.db"), upload_dir=str(tmp_path / "uploads"),
+        max_queue_size=3, lease_seconds=60, max_attempts=2,
+    )
+    monkeypatch.setattr(main, "shared_queue", queue)
+    request = {"prompt": "a dragon", "callback_url": "https://hooks.example.com/done", "callback_secret": "s3cret"}
+
+    response = client.post("/api/generate", json=request)
+    assert response.status_code == 400
+    assert "SHARED_QUEUE_SECRET_KEY" in response.json()["detail"]
+    assert queue.depth == 0
+
+
+def test_batch_validates_each_callback_once(client, job_store, monkeypatch):
+    monkeypatch.setattr(main.job_queue, "submit", lambda job: None)
+    checked = []
+    callback_fields = main.callback_fields
+    monkeypatch.setattr(
+        main, "callback_fields", lambda url, secret: checked.append(url) or callback_fields(url, secret)
+    )
+
+    response = client.post("/api/generate_batch", json={
+        "items": [{"prompt": "a red dragon"}, {"prompt": "a blue dragon", "callback_url": "https://b.example.com/"}],
+        "defaults": {"num_inference_steps": 10, "callback_url": "https://a.example.com/"},
+    })
+    assert response.status_code == 200
+    # One check per item, on the URL it ends up with after merging the defaults
+    assert checked == ["https://a.example.com/", "https://b.example.com/"]
+    records = [job_store.get(job_id) for job_id in response.json()["job_ids"]]
+    assert [record["callback_url"] for record in records] == checked
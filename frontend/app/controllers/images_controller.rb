@@ -56,7 +56,7 @@ class ImagesController < ApplicationController
       @view_mode = 'all'
     end
 
-    @pending_images = current_user.images.where(status: ['pending', 'processing']).recent
+    @pending_images = current_user.images.where(status: ['pending', 'queued', 'processing']).recent
   end
 
   # POST /images
@@ -88,7 +88,9 @@ class ImagesController < ApplicationController
           strength: @image.strength,
           num_inference_steps: @image.num_inference_steps || 50,
           guidance_scale: @image.guidance_scale || 7.5,
-          seed: @image.seed
+          seed: @image.seed,
+          owner: current_user.id.to_s,
+          tier: current_user.subscription_tier
         )
       else
         # Text-to-image generation (default)
@@ -103,7 +105,9 @@ class ImagesController < ApplicationController
           guidance_scale: @image.guidance_scale || 7.5,
           width: @image.width || 512,
           height: @image.height || 512,
-          loras: loras
+          loras: loras,
+          owner: current_user.id.to_s,
+          tier: current_user.subscription_tier
         )
       end
 
@@ -193,6 +197,8 @@ class ImagesController < ApplicationController
         image_url: @image.image_url,
         generation_complete: @image.generation_complete?,
         progress_percent: progress_percent,
+        queue_position: api_status['queue_position'],
+        eta_seconds: api_status['eta_seconds'],
         created_at: @image.created_at,
         updated_at: @image.updated_at
       }
@@ -202,6 +208,54 @@ class ImagesController < ApplicationController
     end
   end
 
+  # GET /images/statuses?ids=1,2,3
+  # Status of every pending image on the page in one backend call
+  def statuses
+    images = current_user.images.where(id: params[:ids].to_s.split(',')).where.not(job_id: nil).to_a
+    return render json: [] if images.empty?
+
+    cache_key = "sd_bulk_status/#{current_user.id}"
+    cached = Rails.cache.read(cache_key)
+
+    begin
+      result = StableDiffusionService.check_statuses(images.map(&:job_id), etag: cached&.dig(:etag))
+      if result
+        Rails.cache.write(cache_key, result, expires_in: 10.minutes)
+        images.each do |image|
+          api_status = result[:jobs][image.job_id]
+          next unless api_status
+          image.update(
+            status: api_status['status'],
+            image_url: api_status['image_url'],
+            metadata: api_status.except('status', 'job_id', 'image_url')
+          )
+        end
+      else
+        # Nothing changed on the backend since the last poll; records are already current
+        result = cached
+      end
+
+      render json: images.map { |image|
+        api_status = result[:jobs][image.job_id] || {}
+        {
+          id: image.id,
+          status: image.status,
+          status_display: image.status_display,
+          image_url: image.image_url,
+          generation_complete: image.generation_complete?,
+          progress_percent: api_status['progress_percent'],
+          queue_position: api_status['queue_position'],
+          eta_seconds: api_status['eta_seconds'],
+          created_at: image.created_at,
+          updated_at: image.updated_at
+        }
+      }
+
+    rescue StableDiffusionService::StatusCheckError => e
+      render json: { error: e.message }, status: :service_unavailable
+    end
+  end
+
   # POST /images/:id/toggle_favorite
   def toggle_favorite
     @image.update(favorite: !@image.favorite)
@@ -261,7 +315,9 @@ class ImagesController < ApplicationController
         blur_mask: params[:blur_mask] != 'false',
         blur_factor: params[:blur_factor]&.to_i || 33,
         seed: params[:seed]&.to_i,
-        loras: loras
+        loras: loras,
+        owner: current_user.id.to_s,
+        tier: current_user.subscription_tier
       )
 
       @new_image.job_id = api_response['job_id']
@@ -0,0 +1,52 @@
+class WebhooksController < ApplicationController
+  # Called by the backend, not a browser
+  skip_forgery_protection
+
+  SIGNATURE_TOLERANCE = 5.minutes
+
+  # POST /webhooks/generation
+  # Completion webhook from the backend (see SD_WEBHOOK_URL): updates the image without polling
+  def generation
+    body = request.raw_post
+
+    unless valid_signature?(body)
+      head :unauthorized
+      return
+    end
+
+    payload = JSON.parse(body)
+    image = Image.find_by(job_id: payload['job_id'])
+
+    # Unknown jobs are acknowledged so the backend stops retrying
+    if image
+      image_url = payload['image_url']
+      if image_url && !image_url.start_with?('http')
+        image_url = "#{StableDiffusionService.base_uri}#{image_url}"
+      end
+
+      image.update(
+        status: payload['status'],
+        image_url: image_url,
+        metadata: payload.except('event', 'status', 'job_id', 'image_url')
+      )
+    end
+
+    head :ok
+  rescue JSON::ParserError
+    head :bad_request
+  end
+
+  private
+
+  # Signature is HMAC-SHA256 over "<timestamp>.<body>" (see backend/app/webhooks.py)
+  def valid_signature?(body)
+    secret = StableDiffusionService::WEBHOOK_SECRET
+    return true if secret.blank?
+
+    timestamp = request.headers['X-Dragon-Timestamp'].to_s
+    return false if (Time.now.to_i - timestamp.to_i).abs > SIGNATURE_TOLERANCE
+
+    expected = "sha256=#{OpenSSL::HMAC.hexdigest('SHA256', secret, "#{timestamp}.#{body}")}"
+    ActiveSupport::SecurityUtils.secure_compare(expected, request.headers['X-Dragon-Signature'].to_s)
+  end
+end
@@ -9,9 +9,11 @@ class Image < ApplicationRecord
   # Status enum
   enum status: {
     pending: 'pending',
+    queued: 'queued',
     processing: 'processing',
     completed: 'completed',
-    failed: 'failed'
+    failed: 'failed',
+    cancelled: 'cancelled'
   }
 
   # Generation type enum
@@ -46,21 +48,23 @@ class Image < ApplicationRecord
 
   # Check if image generation is complete
   def generation_complete?
-    completed? || failed?
+    completed? || failed? || cancelled?
   end
 
   # Check if still processing
   def processing?
-    pending? || status == 'processing'
+    pending? || queued? || status == 'processing'
   end
 
   # Get display-friendly status
   def status_display
     case status
     when 'pending' then 'Queued'
+    when 'queued' then 'Queued'
     when 'processing' then 'Generating...'
     when 'completed' then 'Complete'
     when 'failed' then 'Failed'
+    when 'cancelled' then 'Cancelled'
     else 'Unknown'
     end
   end
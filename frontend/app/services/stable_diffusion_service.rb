@@ -6,8 +6,25 @@ class StableDiffusionService
   class GenerationError < ServiceError; end
   class StatusCheckError < ServiceError; end
 
+  # Completion webhooks: when SD_WEBHOOK_URL is set (pointing at WebhooksController),
+  # the backend POSTs each result back signed with SD_WEBHOOK_SECRET
+  WEBHOOK_URL = ENV['SD_WEBHOOK_URL']
+  WEBHOOK_SECRET = ENV['SD_WEBHOOK_SECRET']
+
+  # Lets the backend trust the owner and tier sent with each job (its IDENTITY_TOKEN)
+  IDENTITY_TOKEN = ENV['SD_IDENTITY_TOKEN']
+
+  def self.identity_headers
+    IDENTITY_TOKEN.present? ? { 'X-Identity-Token' => IDENTITY_TOKEN } : {}
+  end
+
+  def self.callback_params
+    return {} if WEBHOOK_URL.blank?
+    { 'callback_url' => WEBHOOK_URL, 'callback_secret' => WEBHOOK_SECRET }.compact
+  end
+
   # Generate a new image (text-to-image)
-  def self.generate(prompt:, model_key: 'sd-v1-5', negative_prompt: nil, num_inference_steps: 30, guidance_scale: 7.5, width: 512, height: 512, loras: nil)
+  def self.generate(prompt:, model_key: 'sd-v1-5', negative_prompt: nil, num_inference_steps: 30, guidance_scale: 7.5, width: 512, height: 512, loras: nil, owner: nil, tier: nil)
     body = {
       prompt: prompt,
       model_key: model_key,
@@ -15,8 +32,10 @@ class StableDiffusionService
       num_inference_steps: num_inference_steps,
       guidance_scale: guidance_scale,
       width: width,
-      height: height
-    }
+      height: height,
+      owner: owner,
+      tier: tier
+    }.merge(callback_params)
 
     # Add LoRA specs if provided (array of {key:, weight:} hashes)
     if loras.present?
@@ -26,7 +45,7 @@ class StableDiffusionService
     response = post(
       '/api/generate',
       body: body.to_json,
-      headers: { 'Content-Type' => 'application/json' },
+      headers: { 'Content-Type' => 'application/json' }.merge(identity_headers),
       timeout: 10
     )
 
@@ -40,7 +59,7 @@ class StableDiffusionService
   end
 
   # Generate image from image (image-to-image)
-  def self.generate_img2img(init_image_file:, prompt:, model_key: 'sd-v1-5', negative_prompt: nil, strength: 0.75, num_inference_steps: 50, guidance_scale: 7.5, seed: nil)
+  def self.generate_img2img(init_image_file:, prompt:, model_key: 'sd-v1-5', negative_prompt: nil, strength: 0.75, num_inference_steps: 50, guidance_scale: 7.5, seed: nil, owner: nil, tier: nil)
     # Build multipart form data
     # HTTParty requires multipart gem for file uploads
     require 'net/http'
@@ -70,6 +89,9 @@ class StableDiffusionService
       'guidance_scale' => guidance_scale.to_s
     }
     form_data['seed'] = seed.to_s if seed.present?
+    form_data['owner'] = owner.to_s if owner.present?
+    form_data['tier'] = tier.to_s if tier.present?
+    form_data.merge!(callback_params)
 
     form_data.each do |key, value|
       post_body << "--#{boundary}\r\n"
@@ -87,6 +109,7 @@ class StableDiffusionService
     request = Net::HTTP::Post.new(uri.request_uri)
     request.body = post_body.join
     request['Content-Type'] = "multipart/form-data; boundary=#{boundary}"
+    identity_headers.each { |name, value| request[name] = value }
 
     response = http.request(request)
 
@@ -100,7 +123,7 @@ class StableDiffusionService
   end
 
   # Generate image with inpainting (selective region editing)
-  def self.generate_inpaint(init_image_url:, mask_data:, prompt:, model_key: 'sd-v1-5', negative_prompt: nil, strength: 0.8, num_inference_steps: 30, guidance_scale: 7.5, blur_mask: true, blur_factor: 33, seed: nil, loras: nil)
+  def self.generate_inpaint(init_image_url:, mask_data:, prompt:, model_key: 'sd-v1-5', negative_prompt: nil, strength: 0.8, num_inference_steps: 30, guidance_scale: 7.5, blur_mask: true, blur_factor: 33, seed: nil, loras: nil, owner: nil, tier: nil)
     require 'net/http'
     require 'uri'
     require 'base64'
@@ -148,6 +171,9 @@ class StableDiffusionService
       'blur_factor' => blur_factor.to_s
     }
     form_data['seed'] = seed.to_s if seed.present?
+    form_data['owner'] = owner.to_s if owner.present?
+    form_data['tier'] = tier.to_s if tier.present?
+    form_data.merge!(callback_params)
 
     # Add LoRAs if present (as JSON array)
     if loras.present?
@@ -170,6 +196,7 @@ class StableDiffusionService
     request = Net::HTTP::Post.new(uri.request_uri)
     request.body = post_body.join
     request['Content-Type'] = "multipart/form-data; boundary=#{boundary}"
+    identity_headers.each { |name, value| request[name] = value }
 
     response = http.request(request)
 
@@ -208,6 +235,36 @@ class StableDiffusionService
     raise StatusCheckError, "Status check failed: #{e.message}"
   end
 
+  # Check status of many generation jobs in one call.
+  # Pass the etag returned by the previous call; returns nil if nothing changed since.
+  def self.check_statuses(job_ids, etag: nil)
+    headers = { 'Content-Type' => 'application/json' }
+    headers['If-None-Match'] = etag if etag.present?
+
+    response = post(
+      '/api/status/bulk',
+      body: { job_ids: job_ids }.to_json,
+      headers: headers,
+      timeout: 5
+    )
+
+    return nil if response.code == 304
+
+    if response.success?
+      jobs = response.parsed_response['jobs'].each do |data|
+        # Fix image URL to include backend host
+        if data['image_url'] && !data['image_url'].start_with?('http')
+          data['image_url'] = "#{base_uri}#{data['image_url']}"
+        end
+      end
+      { etag: response.headers['etag'], jobs: jobs.index_by { |data| data['job_id'] } }
+    else
+      raise StatusCheckError, "Failed to check statuses: #{response.code} - #{response.message}"
+    end
+  rescue HTTParty::Error, Timeout::Error => e
+    raise StatusCheckError, "Status check failed: #{e.message}"
+  end
+
   # Health check
   def self.healthy?
     response = get('/api/health', timeout: 3)
@@ -13,9 +13,13 @@ Rails.application.routes.draw do
     end
     collection do
       post :enhance_prompt
+      get :statuses
     end
   end
 
+  # Completion webhooks from the backend
+  post 'webhooks/generation', to: 'webhooks#generation'
+
   # Settings pages
   resources :models, only: [:index]
 